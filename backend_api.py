@@ -1,10 +1,14 @@
 from typing import List, Dict, Any
 import os
-import csv
+import re
+import sys
+import time
+import uuid
+import threading
 from datetime import datetime
 
 import chromadb
-from fastapi import FastAPI
+from fastapi import FastAPI, File, Header, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
@@ -19,6 +23,18 @@ except ImportError:
     firebase_available = False
     print("Firebase Admin SDK not available. Install with: pip install firebase-admin")
 
+# Add the scripts directory to the path for shared index helpers
+sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
+from adjacency_index import AdjacencyIndex
+from compressed_index import CompressedIndex
+from embedding_cache import EmbeddingCache
+from benefit_facts import FactIndex, DEFAULT_FACTS_PATH
+from index_versions import IndexPointer, record_path, DEFAULT_POINTER_PATH
+from ingestion_jobs import IngestionJobRunner, DEFAULT_PDF_DIR, DEFAULT_MAX_PENDING
+from ingestion_manifest import IngestionManifest, DEFAULT_MANIFEST_PATH
+from interaction_store import open_store, STORE_ENV
+from interaction_log import InteractionLogWriter, DEFAULT_LOG_DIR
+
 # Load environment variables
 load_dotenv()
 
@@ -43,6 +59,15 @@ if firebase_available:
         print(f"Failed to initialize Firebase: {e}")
         db = None
 
+# Where interactions are logged: Firestore by default; INTERACTION_STORE=sqlite[:path] or memory
+# keeps them local for offline development and load tests
+try:
+    interaction_store = open_store(os.environ.get(STORE_ENV), db)
+    print(f"Interaction store: {interaction_store.kind}")
+except RuntimeError as e:
+    print(f"Interaction store not available: {e}")
+    interaction_store = None
+
 try:
     import openai
     openai_available = True
@@ -50,79 +75,59 @@ except Exception:
     openai = None
     openai_available = False
 
-def log_interaction_to_firebase(interaction_data: Dict[str, Any]) -> str:
-    """Log interaction to Firebase Firestore"""
-    if not db:
-        print("Firebase not available, skipping Firebase logging")
+def log_interaction_to_store(interaction_data: Dict[str, Any]) -> str:
+    """Log interaction to the interaction store (Firestore unless INTERACTION_STORE says otherwise)"""
+    if not interaction_store:
+        print("Interaction store not available, skipping logging")
         return None
     
     try:
-        # Add server timestamp
-        interaction_data['created_at'] = firestore.SERVER_TIMESTAMP
-        
-        # Add to interactions collection
-        doc_ref = db.collection('interactions').add(interaction_data)
-        print(f"Interaction logged to Firebase: {doc_ref[1].id}")
-        return doc_ref[1].id
+        # The store stamps created_at (the server timestamp on Firestore)
+        doc_id = interaction_store.insert(interaction_data)
+        print(f"Interaction logged to {interaction_store.kind}: {doc_id}")
+        return doc_id
     except Exception as e:
-        print(f"Error logging interaction to Firebase: {e}")
+        print(f"Error logging interaction to {interaction_store.kind}: {e}")
         return None
 
+# Kept for callers that predate pluggable stores
+log_interaction_to_firebase = log_interaction_to_store
+
 def log_interaction_to_csv(question: str, answer: str, model: str, timestamp: datetime = None, error: str = None, contexts_used: int = 0):
     """Log all interactions to CSV for training purposes"""
     if timestamp is None:
         timestamp = datetime.now()
     
-    csv_file = "data/interaction_log.csv"
+    interaction_log.write({
+        'timestamp': timestamp.isoformat(),
+        'question': question,
+        'answer': answer,
+        'model': model,
+        'error': error or '',
+        'contexts_used': contexts_used,
+        'improved_response': '',
+        'improvement_notes': '',
+        'category': '',
+        'priority': ''
+    })
     
-    # Check if file exists and has headers
-    file_exists = os.path.exists(csv_file)
+    print(f"Interaction logged to CSV: {question[:50]}...")
     
-    with open(csv_file, 'a', newline='', encoding='utf-8') as file:
-        fieldnames = [
-            'timestamp', 'question', 'answer', 'model', 'error', 
-            'contexts_used', 'improved_response', 'improvement_notes', 
-            'category', 'priority'
-        ]
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        
-        # Write header if file is new
-        if not file_exists:
-            writer.writeheader()
-        
-        # Prepare row data
-        row_data = {
-            'timestamp': timestamp.isoformat(),
-            'question': question,
-            'answer': answer,
-            'model': model,
-            'error': error or '',
-            'contexts_used': contexts_used,
-            'improved_response': '',
-            'improvement_notes': '',
-            'category': '',
-            'priority': ''
-        }
-        
-        writer.writerow(row_data)
-        
-        print(f"Interaction logged to CSV: {question[:50]}...")
-        
-        # Also log to Firebase if available
-        firebase_data = {
-            'question': question,
-            'answer': answer,
-            'model': model,
-            'error': error,
-            'contexts_used': contexts_used,
-            'timestamp': timestamp,
-            'user_id': 'anonymous',
-            'improved_response': None,
-            'improvement_notes': None,
-            'category': None,
-            'priority': None
-        }
-        log_interaction_to_firebase(firebase_data)
+    # Also log to the interaction store if available
+    firebase_data = {
+        'question': question,
+        'answer': answer,
+        'model': model,
+        'error': error,
+        'contexts_used': contexts_used,
+        'timestamp': timestamp,
+        'user_id': 'anonymous',
+        'improved_response': None,
+        'improvement_notes': None,
+        'category': None,
+        'priority': None
+    }
+    log_interaction_to_store(firebase_data)
 
 # Initialize FastAPI app
 app = FastAPI(title="PSIP Plan Pal Backend", version="0.1.0")
@@ -144,7 +149,7 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_methods=["GET", "POST", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
 
@@ -154,10 +159,130 @@ app.add_middleware(
 CHROMA_PATH = os.environ.get("CHROMA_PATH", "./chroma_db")
 COLLECTION_NAME = os.environ.get("COLLECTION_NAME", "benefits_documents")
 EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+QUERY_EMBEDDING_CACHE_PATH = os.environ.get("QUERY_EMBEDDING_CACHE_PATH", "./data/query_embedding_cache.db")
+ADJACENCY_INDEX_PATH = os.environ.get("ADJACENCY_INDEX_PATH", "./chunk_adjacency.json")
+COMPRESSED_INDEX_PATH = os.environ.get("COMPRESSED_INDEX_PATH")
+COMPRESSED_SHORTLIST = int(os.environ.get("COMPRESSED_SHORTLIST", "50"))
+BENEFIT_FACTS_PATH = os.environ.get("BENEFIT_FACTS_PATH", os.path.join(".", DEFAULT_FACTS_PATH))
+INDEX_POINTER_PATH = os.environ.get("INDEX_POINTER_PATH", os.path.join(".", DEFAULT_POINTER_PATH))
+INDEX_WATCH_INTERVAL = float(os.environ.get("INDEX_WATCH_INTERVAL", "5"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", os.path.join(".", DEFAULT_PDF_DIR))
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "50"))
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", str(DEFAULT_MAX_PENDING)))
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "1"))
+INTERACTION_LOG_DIR = os.environ.get("INTERACTION_LOG_DIR", os.path.join(".", DEFAULT_LOG_DIR))
+INTERACTION_LOG_MAX_MB = float(os.environ.get("INTERACTION_LOG_MAX_MB", "16"))
+INTERACTION_LOG_COMPRESS = os.environ.get("INTERACTION_LOG_COMPRESS", "").lower() in ("1", "true", "yes")
 
 model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+# Repeated questions skip the model; kept apart from the ingestion cache so queries never evict chunks
+query_embedding_cache = EmbeddingCache(QUERY_EMBEDDING_CACHE_PATH) if QUERY_EMBEDDING_CACHE_PATH else None
 client = chromadb.PersistentClient(path=CHROMA_PATH)
-collection = client.get_or_create_collection(name=COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+
+class ServingIndex:
+    """One index version: its Chroma collection and the files built with it"""
+    def __init__(self, record: Dict[str, Any], collection, adjacency_index: AdjacencyIndex,
+                 fact_index: FactIndex, compressed_index: CompressedIndex = None):
+        self.record = record
+        self.version = record["version"] if record else None
+        self.collection = collection
+        self.adjacency_index = adjacency_index
+        self.fact_index = fact_index
+        self.compressed_index = compressed_index
+
+def load_fact_index(path: str) -> FactIndex:
+    """Structured cost-sharing facts for exact answers without retrieval or an LLM call"""
+    try:
+        facts = FactIndex.load(path)
+        print(f"Loaded {len(facts)} benefit facts from {path}")
+        return facts
+    except Exception as e:
+        print(f"Failed to load benefit facts, fact lookup disabled: {e}")
+        return FactIndex([])
+
+def load_compressed_index(path: str) -> CompressedIndex:
+    """Optional compressed first-pass index (int8/binary codes + float rescoring)"""
+    if not path:
+        return None
+    try:
+        index = CompressedIndex.load(path)
+        print(f"Loaded {index.mode} compressed index with {len(index.ids)} chunks from {path}")
+        return index
+    except Exception as e:
+        print(f"Failed to load compressed index, falling back to Chroma search: {e}")
+        return None
+
+def open_serving_index(record: Dict[str, Any] = None) -> ServingIndex:
+    """Open an index version (the unversioned collection for None) with its adjacency, facts and compressed index"""
+    if record is None:
+        collection = client.get_or_create_collection(name=COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+    else:
+        collection = client.get_collection(record["collection"])
+        if collection.count() == 0:
+            raise ValueError(f"Index version {record['version']} has no chunks")
+    return ServingIndex(
+        record,
+        collection,
+        AdjacencyIndex.load(record_path(record, "adjacency_index", ADJACENCY_INDEX_PATH)),
+        load_fact_index(record_path(record, "benefit_facts", BENEFIT_FACTS_PATH)),
+        load_compressed_index(record_path(record, "compressed_index", COMPRESSED_INDEX_PATH))
+    )
+
+def pointer_mtime() -> float:
+    return os.path.getmtime(INDEX_POINTER_PATH) if os.path.exists(INDEX_POINTER_PATH) else None
+
+# Requests read `active_index` once, so a reload never mixes two versions in one answer
+index_lock = threading.Lock()
+loaded_pointer_mtime = pointer_mtime()
+try:
+    active_index = open_serving_index(IndexPointer(INDEX_POINTER_PATH).active)
+except Exception as e:
+    print(f"Failed to open the active index version, serving {COLLECTION_NAME}: {e}")
+    active_index = open_serving_index(None)
+print(f"Serving index {active_index.collection.name} ({active_index.collection.count()} chunks)")
+
+# Uploads and deletions run in one low-priority worker process, never on the request path
+job_runner = IngestionJobRunner(pdf_dir=UPLOAD_DIR, max_pending=INGEST_MAX_PENDING, workers=INGEST_WORKERS)
+
+# Each worker process logs interactions to its own rotating segment (see scripts/interaction_log.py)
+interaction_log = InteractionLogWriter(INTERACTION_LOG_DIR, max_bytes=int(INTERACTION_LOG_MAX_MB * 1024 * 1024),
+                                       compress=INTERACTION_LOG_COMPRESS)
+
+def reload_index(force: bool = True) -> Dict[str, Any]:
+    """Swap in the version named by the index pointer; the current one keeps serving on failure
+
+    Without `force`, a pointer rewrite that leaves the active record as it is
+    (e.g. a build being started) keeps the loaded version.
+    """
+    global active_index, loaded_pointer_mtime
+    with index_lock:
+        loaded_pointer_mtime = pointer_mtime()
+        record = IndexPointer(INDEX_POINTER_PATH).active
+        previous_version = active_index.version
+        changed = force or record != active_index.record
+        if changed:
+            active_index = open_serving_index(record)
+        new_index = active_index
+    if changed:
+        print(f"Reloaded index: {previous_version} -> {new_index.version} ({new_index.collection.count()} chunks)")
+    return {
+        "version": new_index.version,
+        "previous_version": previous_version,
+        "collection": new_index.collection.name,
+        "chunks": new_index.collection.count()
+    }
+
+def watch_index_pointer() -> None:
+    """Reload whenever a build or rollback rewrites the index pointer"""
+    while True:
+        time.sleep(INDEX_WATCH_INTERVAL)
+        if pointer_mtime() == loaded_pointer_mtime:
+            continue
+        try:
+            reload_index(force=False)
+        except Exception as e:
+            print(f"Index reload failed, still serving {active_index.collection.name}: {e}")
 
 # OpenAI client (optional for answer generation)
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
@@ -181,6 +306,57 @@ class AskRequest(BaseModel):
     question: str
     n_context: int = 5
     model: str = "nelly-1.0"
+    expand_neighbors: bool = False
+    neighbor_window: int = 1
+    # Exact cost-sharing questions are answered from the benefit fact table; false forces retrieval
+    use_fact_lookup: bool = True
+
+def embed_query(text: str) -> List[float]:
+    """Embedding of a query, from the query embedding cache when the same text was asked before"""
+    if query_embedding_cache is None:
+        return model.encode(text).tolist()
+    return query_embedding_cache.encode([text], EMBEDDING_MODEL_NAME, model.encode)[0].tolist()
+
+def query_index(index: ServingIndex, query_embedding: List[float], n_results: int) -> Dict[str, Any]:
+    """Run a similarity search, returning results in Chroma's query() shape"""
+    if index.compressed_index is None:
+        return index.collection.query(query_embeddings=[query_embedding], n_results=n_results)
+    
+    hits = index.compressed_index.search(query_embedding, k=n_results, shortlist=COMPRESSED_SHORTLIST)
+    if not hits:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+    
+    found = index.collection.get(ids=[hit_id for hit_id, _ in hits], include=["documents", "metadatas"])
+    by_id = {cid: (doc, meta) for cid, doc, meta in zip(found['ids'], found['documents'], found['metadatas'])}
+    
+    # Keep compressed-index ranking; skip IDs no longer in the collection
+    ranked = [(hit_id, distance) for hit_id, distance in hits if hit_id in by_id]
+    return {
+        "ids": [[hit_id for hit_id, _ in ranked]],
+        "documents": [[by_id[hit_id][0] for hit_id, _ in ranked]],
+        "metadatas": [[by_id[hit_id][1] for hit_id, _ in ranked]],
+        "distances": [[distance for _, distance in ranked]]
+    }
+
+def expand_with_neighbors(index: ServingIndex, results: Dict[str, Any], window: int = 1) -> List[str]:
+    """Pull the chunks around each hit and merge contiguous spans into single contexts"""
+    hit_ids = results['ids'][0]
+    texts = dict(zip(hit_ids, results['documents'][0]))
+    adjacency_index = index.adjacency_index
+    
+    if not len(adjacency_index):
+        return results['documents'][0]
+    
+    # One ID lookup for every neighbor we don't already have
+    missing = []
+    for hit_id in hit_ids:
+        missing.extend(cid for cid in adjacency_index.neighbors(hit_id, window) if cid not in texts)
+    if missing:
+        neighbors = index.collection.get(ids=list(dict.fromkeys(missing)), include=["documents"])
+        texts.update(zip(neighbors['ids'], neighbors['documents']))
+    
+    spans = adjacency_index.merge_spans(hit_ids, texts, window)
+    return [span['text'] for span in spans]
 
 def build_rag_prompt(question: str, contexts: List[str]) -> str:
     """Build enhanced RAG prompt with better context understanding"""
@@ -233,6 +409,116 @@ def call_general_llm(question: str) -> Dict[str, Any]:
     except Exception as e:
         return {"error": f"General LLM call failed: {e}"}
 
+@app.on_event("startup")
+async def start_index_watcher():
+    if INDEX_WATCH_INTERVAL > 0:
+        threading.Thread(target=watch_index_pointer, daemon=True).start()
+    resumed = job_runner.resume_interrupted()
+    if resumed:
+        print(f"Requeued {len(resumed)} interrupted ingestion job(s)")
+
+@app.on_event("shutdown")
+async def stop_ingestion_worker():
+    job_runner.shutdown()
+    interaction_log.close()
+
+def require_admin(token: str) -> None:
+    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints require the X-Admin-Token header (set ADMIN_TOKEN)")
+
+@app.post("/admin/reload")
+def admin_reload(x_admin_token: str = Header(None)):
+    """Serve the index version currently named by the pointer file"""
+    require_admin(x_admin_token)
+    try:
+        return {"status": "reloaded", **reload_index()}
+    except Exception as e:
+        return {"error": f"Reload failed, still serving {active_index.collection.name}: {e}"}
+
+@app.post("/admin/rollback")
+def admin_rollback(x_admin_token: str = Header(None)):
+    """Re-activate the previous index version and serve it"""
+    require_admin(x_admin_token)
+    try:
+        IndexPointer(INDEX_POINTER_PATH).rollback()
+        return {"status": "rolled back", **reload_index()}
+    except Exception as e:
+        return {"error": f"Rollback failed, still serving {active_index.collection.name}: {e}"}
+
+def safe_pdf_name(filename: str) -> str:
+    """Reduce a client-supplied file name to a plain PDF name inside the upload directory"""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or ""))
+    if name.startswith(".") or not name.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Expected a .pdf file name")
+    return name
+
+@app.post("/documents", status_code=202)
+async def upload_document(file: UploadFile = File(...), x_admin_token: str = Header(None)):
+    """Save an uploaded PDF and queue it for background ingestion"""
+    require_admin(x_admin_token)
+    if job_runner.is_full():
+        raise HTTPException(status_code=429, detail="Too many ingestion jobs pending, try again later")
+    source_file = safe_pdf_name(file.filename)
+    
+    # Stream to a hidden temp file, then rename, so no reader sees a partial PDF
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    tmp_path = os.path.join(UPLOAD_DIR, f".{source_file}.{uuid.uuid4().hex}.upload")
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                block = await file.read(1024 * 1024)
+                if not block:
+                    break
+                if size == 0 and not block.startswith(b"%PDF-"):
+                    raise HTTPException(status_code=400, detail="Uploaded file is not a PDF")
+                size += len(block)
+                if size > MAX_UPLOAD_MB * 1024 * 1024:
+                    raise HTTPException(status_code=413, detail=f"PDF is larger than {MAX_UPLOAD_MB} MB")
+                out.write(block)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        os.replace(tmp_path, os.path.join(UPLOAD_DIR, source_file))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    job = job_runner.submit("add", source_file)
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "source_file": source_file,
+        "bytes": size,
+        "status_url": f"/documents/{job['job_id']}"
+    }
+
+@app.get("/documents/{job_id}")
+def get_document_job(job_id: str, x_admin_token: str = Header(None)):
+    """Progress and per-stage timings of an ingestion job"""
+    require_admin(x_admin_token)
+    job = job_runner.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.delete("/documents/{source_file}", status_code=202)
+def delete_document(source_file: str, x_admin_token: str = Header(None)):
+    """Queue removal of an ingested PDF and all of its chunks"""
+    require_admin(x_admin_token)
+    source_file = safe_pdf_name(source_file)
+    manifest_path = record_path(active_index.record, "manifest", DEFAULT_MANIFEST_PATH)
+    if source_file not in IngestionManifest.load(manifest_path).files:
+        raise HTTPException(status_code=404, detail=f"{source_file} has not been ingested")
+    if job_runner.is_full():
+        raise HTTPException(status_code=429, detail="Too many ingestion jobs pending, try again later")
+    job = job_runner.submit("delete", source_file)
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "source_file": source_file,
+        "status_url": f"/documents/{job['job_id']}"
+    }
+
 @app.get("/")
 async def root():
     return {"message": "PSIP Plan Pal Backend API", "status": "running"}
@@ -241,8 +527,12 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "chroma_collection": COLLECTION_NAME,
+        "chroma_collection": active_index.collection.name,
+        "index_version": active_index.version,
         "embedding_model": EMBEDDING_MODEL_NAME,
+        "adjacency_index_chunks": len(active_index.adjacency_index),
+        "compressed_index": active_index.compressed_index.mode if active_index.compressed_index else None,
+        "benefit_facts": len(active_index.fact_index),
         "openai_available": openai_client is not None
     }
 
@@ -251,13 +541,10 @@ async def search_documents(request: SearchRequest):
     """Search for similar documents using vector similarity"""
     try:
         # Get query embedding
-        query_embedding = model.encode(request.query).tolist()
+        query_embedding = embed_query(request.query)
         
-        # Search in ChromaDB
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=request.n_results
-        )
+        # Search in ChromaDB (or the compressed index when configured)
+        results = query_index(active_index, query_embedding, request.n_results)
         
         # Format results
         documents = []
@@ -283,18 +570,37 @@ async def ask_question(request: AskRequest):
     """Ask a question using RAG (Nelly 1.0) or general LLM (GPT-4)"""
     try:
         if request.model == "nelly-1.0":
+            index = active_index
+            # Exact cost-sharing questions are answered from the benefit fact table
+            fact_answer = index.fact_index.answer(request.question) if request.use_fact_lookup else None
+            if fact_answer:
+                log_interaction_to_csv(
+                    question=request.question,
+                    answer=fact_answer["answer"],
+                    model="nelly-1.0",
+                    contexts_used=len(fact_answer["facts"])
+                )
+                return {
+                    "question": request.question,
+                    "answer": fact_answer["answer"],
+                    "model": "nelly-1.0",
+                    "contexts_used": len(fact_answer["facts"]),
+                    "answered_from": "benefit_facts",
+                    "sources": [{"source_file": source_file, "page_number": page_number}
+                                for source_file, page_number in fact_answer["sources"]]
+                }
+            
             # RAG-based response using document context
-            query_embedding = model.encode(request.question).tolist()
+            query_embedding = embed_query(request.question)
             
             # Search for relevant context
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=request.n_context
-            )
+            results = query_index(index, query_embedding, request.n_context)
             
             contexts = []
             if results['documents'] and results['documents'][0]:
                 contexts = results['documents'][0]
+                if request.expand_neighbors:
+                    contexts = expand_with_neighbors(index, results, request.neighbor_window)
             
             if not contexts:
                 answer = "I don't have specific information about this in your plan documents. Please check your plan materials or contact your insurance provider."
@@ -5,6 +5,10 @@ Batch process response improvements with various filters and actions
 
 import os
 import sys
+import json
+import time
+import sqlite3
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import argparse
@@ -12,41 +16,177 @@ import argparse
 # Add the functions directory to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'functions'))
 
+sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
+
+from interaction_cache import interactions_since
+from xlsx_stream import StreamingWorkbook
+from quality_scoring import SCORING_FIELDS, score_frame, suggestion_texts
+from question_clusters import DEFAULT_MODEL, DEFAULT_THRESHOLD, cached_encoder, cluster_questions, cluster_priority
+
+# Interactions scored together in one vectorized pass
+SCORING_CHUNK = 10000
+
+class RankedRows:
+    """Rows spilled to a temporary SQLite file and read back by priority, highest first"""
+    
+    def __init__(self):
+        # An empty filename gives a private on-disk database that is deleted on close
+        self.conn = sqlite3.connect('')
+        self.conn.execute("CREATE TABLE rows (seq INTEGER PRIMARY KEY, priority REAL, question TEXT, cluster INTEGER, data TEXT)")
+        self.conn.create_function('cluster_priority', 2, cluster_priority)
+        self.count = 0
+    
+    def add(self, priority, row):
+        self.conn.execute("INSERT INTO rows (priority, question, data) VALUES (?, ?, ?)",
+                          (priority, row['question'], json.dumps(row)))
+        self.count += 1
+    
+    def __iter__(self):
+        # seq keeps equal priorities in arrival order, like a stable sort
+        for (data,) in self.conn.execute("SELECT data FROM rows ORDER BY priority DESC, seq"):
+            yield json.loads(data)
+    
+    def questions(self):
+        """(seqs, questions) of every row"""
+        rows = self.conn.execute("SELECT seq, question FROM rows ORDER BY seq").fetchall()
+        return [seq for seq, _ in rows], [question for _, question in rows]
+    
+    def set_clusters(self, seqs, labels):
+        self.conn.executemany("UPDATE rows SET cluster = ? WHERE seq = ?",
+                              zip((int(label) + 1 for label in labels), seqs))
+        self.conn.execute("CREATE INDEX rows_cluster ON rows (cluster, priority DESC, seq)")
+    
+    def representatives(self):
+        """The most urgent row of each cluster, with cluster_id/size/priority added, most urgent cluster first"""
+        query = """
+            SELECT data, cluster, size, cluster_priority(priority, size) AS rank_priority FROM (
+                SELECT data, cluster, priority, seq,
+                       ROW_NUMBER() OVER (PARTITION BY cluster ORDER BY priority DESC, seq) AS position,
+                       COUNT(*) OVER (PARTITION BY cluster) AS size
+                FROM rows
+            ) WHERE position = 1
+            ORDER BY rank_priority DESC, size DESC, seq
+        """
+        for data, cluster, size, rank_priority in self.conn.execute(query):
+            row = json.loads(data)
+            row.update(cluster_id=cluster, cluster_size=size, cluster_priority=round(rank_priority, 2))
+            yield row
+    
+    def members(self):
+        """[cluster_id, interaction id, question, representative Y/N] of every row, cluster by cluster"""
+        query = """
+            SELECT cluster, json_extract(data, '$.id'), question,
+                   ROW_NUMBER() OVER (PARTITION BY cluster ORDER BY priority DESC, seq) = 1
+            FROM rows ORDER BY cluster, priority DESC, seq
+        """
+        for cluster, doc_id, question, representative in self.conn.execute(query):
+            yield [cluster, doc_id, question, 'Y' if representative else 'N']
+    
+    def cluster_count(self):
+        return self.conn.execute("SELECT COUNT(DISTINCT cluster) FROM rows").fetchone()[0]
+    
+    def close(self):
+        self.conn.close()
+
+class BatchSummary:
+    """Priority breakdown and quality analysis, accumulated one row at a time"""
+    
+    def __init__(self):
+        self.count = 0
+        self.priorities = {}
+        self.quality_total = 0
+        self.low_quality = 0
+        self.medium_quality = 0
+        self.high_quality = 0
+        self.errors = 0
+        self.low_context = 0
+        self.high_priority = 0
+    
+    def add(self, row):
+        quality = row['calculated_quality']
+        priority = row['improvement_priority']
+        self.count += 1
+        self.priorities[priority] = self.priorities.get(priority, 0) + 1
+        self.quality_total += quality
+        if quality < 5:
+            self.low_quality += 1
+        elif quality <= 7:
+            self.medium_quality += 1
+        else:
+            self.high_quality += 1
+        if row['error'] != '':
+            self.errors += 1
+        if row['contexts_used'] < 3:
+            self.low_context += 1
+        if priority >= 8:
+            self.high_priority += 1
+    
+    @property
+    def average_quality(self):
+        return self.quality_total / self.count
+    
+    def priority_rows(self):
+        return sorted(self.priorities.items(), key=lambda item: (-item[1], -item[0]))
+    
+    def quality_rows(self):
+        return [
+            ['Total Responses', self.count],
+            ['Average Quality Score', f"{self.average_quality:.1f}"],
+            ['Low Quality (< 5)', self.low_quality],
+            ['Medium Quality (5-7)', self.medium_quality],
+            ['High Quality (> 7)', self.high_quality],
+            ['Error Rate', f"{self.errors / self.count * 100:.1f}%"],
+            ['Low Context Rate', f"{self.low_context / self.count * 100:.1f}%"]
+        ]
+
 def batch_export_by_criteria(
     output_file="batch_improvements.xlsx",
     days_back=7,
     quality_threshold=5,
     model_filter=None,
     error_only=False,
-    low_context_only=False
+    low_context_only=False,
+    offline=False,
+    store=None,
+    cluster=False,
+    cluster_threshold=DEFAULT_THRESHOLD,
+    embedding_model=DEFAULT_MODEL
 ):
-    """Export interactions based on specific criteria for improvement"""
+    """Export interactions based on specific criteria for improvement.
+    
+    With `cluster`, paraphrased questions are grouped and only the most
+    urgent interaction of each group is exported for review; a
+    Cluster_Members sheet lists every interaction of each group so an
+    approved improvement can be copied to all of them on import.
+    """
     try:
-        from backend_api import db
-        
-        if not db:
-            print("❌ Firebase not initialized")
-            return False
-        
         print(f"📊 Batch exporting interactions for improvement...")
         
         # Calculate date range
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days_back)
         
-        # Query Firebase
-        query = db.collection('interactions').where('timestamp', '>=', start_date)
+        # Sync new interactions into the local cache, then scan it (or scan a local store directly)
+        interactions = interactions_since(start_date, model_filter, offline, store=store)
         
-        if model_filter:
-            query = query.where('model', '==', model_filter)
+        # Process and filter data; rows wait on disk, not in memory, until they are written in priority order
+        ranked = RankedRows()
+        summary = BatchSummary()
         
-        interactions = query.order_by('timestamp', direction='DESCENDING').stream()
+        def add_scored(batch):
+            # Calculate quality scores and priorities for the whole chunk at once
+            df = pd.DataFrame.from_records([doc_data for _, doc_data in batch], columns=SCORING_FIELDS)
+            scores = score_frame(df, now=end_date)
+            for (doc_id, doc_data), quality_score, priority in zip(
+                    batch, scores['calculated_quality'], scores['improvement_priority']):
+                if quality_score >= quality_threshold:
+                    continue  # Skip high-quality responses
+                row = improvement_row(doc_id, doc_data, float(quality_score), float(priority))
+                summary.add(row)
+                ranked.add(row['improvement_priority'], row)
         
-        # Process and filter data
-        data = []
-        for doc in interactions:
-            doc_data = doc.to_dict()
-            
+        batch = []
+        for doc_id, doc_data in interactions:
             # Apply filters
             if error_only and not doc_data.get('error'):
                 continue
@@ -54,93 +194,56 @@ def batch_export_by_criteria(
             if low_context_only and doc_data.get('contexts_used', 0) >= 3:
                 continue
             
-            # Convert timestamps
-            timestamp = doc_data.get('timestamp')
-            if hasattr(timestamp, 'timestamp'):
-                timestamp = datetime.fromtimestamp(timestamp.timestamp())
-            elif isinstance(timestamp, str):
-                timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            batch.append((doc_id, doc_data))
+            if len(batch) >= SCORING_CHUNK:
+                add_scored(batch)
+                batch = []
+        if batch:
+            add_scored(batch)
+        
+        try:
+            if not summary.count:
+                print("❌ No interactions found matching criteria")
+                return False
             
-            # Calculate quality score based on various factors
-            quality_score = calculate_quality_score(doc_data)
+            rows = ranked
+            clusters = None
+            if cluster:
+                encode = cached_encoder(embedding_model)
+                seqs, questions = ranked.questions()
+                ranked.set_clusters(seqs, cluster_questions(questions, encode, cluster_threshold))
+                clusters = ranked.cluster_count()
+                print(f"🧩 {summary.count} interactions in {clusters} question clusters")
+                print(f"   {encode.cache.report()}")
+                rows = ranked.representatives()
             
-            if quality_score >= quality_threshold:
-                continue  # Skip high-quality responses
+            # Create Excel file with multiple sheets, streamed row by row
+            book = StreamingWorkbook(output_file)
+            sheet = None
+            for row in rows:
+                if sheet is None:
+                    sheet = book.add_sheet('Improvements', list(row), [20, 20, 60, 80])
+                sheet.append(row.values())
             
-            # Prepare row data
-            row = {
-                'id': doc.id,
-                'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else '',
-                'question': doc_data.get('question', ''),
-                'original_answer': doc_data.get('answer', ''),
-                'model': doc_data.get('model', ''),
-                'contexts_used': doc_data.get('contexts_used', 0),
-                'response_time': doc_data.get('response_time', ''),
-                'error': doc_data.get('error', ''),
-                'user_id': doc_data.get('user_id', ''),
-                'calculated_quality': quality_score,
-                'improvement_priority': get_improvement_priority(doc_data, quality_score),
-                
-                # Improvement columns
-                'improved_answer': '',
-                'improvement_notes': '',
-                'original_quality_score': '',
-                'improved_quality_score': '',
-                'needs_improvement': 'Y',
-                'improved_by': '',
-                'improvement_date': '',
-                'status': 'pending'
-            }
-            
-            data.append(row)
-        
-        if not data:
-            print("❌ No interactions found matching criteria")
-            return False
-        
-        # Sort by improvement priority
-        data.sort(key=lambda x: x['improvement_priority'], reverse=True)
-        
-        # Create DataFrame
-        df = pd.DataFrame(data)
-        
-        # Create Excel file with multiple sheets
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            # Main data sheet
-            df.to_excel(writer, sheet_name='Improvements', index=False)
+            if cluster:
+                book.add_table_sheet('Cluster_Members', ['cluster_id', 'id', 'question', 'representative'],
+                                     ranked.members(), [12, 25, 80, 15])
             
             # Priority breakdown
-            priority_breakdown = df['improvement_priority'].value_counts().reset_index()
-            priority_breakdown.columns = ['Priority', 'Count']
-            priority_breakdown.to_excel(writer, sheet_name='Priority_Breakdown', index=False)
+            book.add_table_sheet('Priority_Breakdown', ['Priority', 'Count'], summary.priority_rows())
             
             # Quality analysis
-            quality_analysis = {
-                'Metric': [
-                    'Total Responses',
-                    'Average Quality Score',
-                    'Low Quality (< 5)',
-                    'Medium Quality (5-7)',
-                    'High Quality (> 7)',
-                    'Error Rate',
-                    'Low Context Rate'
-                ],
-                'Value': [
-                    len(df),
-                    f"{df['calculated_quality'].mean():.1f}",
-                    (df['calculated_quality'] < 5).sum(),
-                    ((df['calculated_quality'] >= 5) & (df['calculated_quality'] <= 7)).sum(),
-                    (df['calculated_quality'] > 7).sum(),
-                    f"{(df['error'] != '').sum() / len(df) * 100:.1f}%",
-                    f"{(df['contexts_used'] < 3).sum() / len(df) * 100:.1f}%"
-                ]
-            }
-            quality_df = pd.DataFrame(quality_analysis)
-            quality_df.to_excel(writer, sheet_name='Quality_Analysis', index=False)
+            book.add_table_sheet('Quality_Analysis', ['Metric', 'Value'], summary.quality_rows(), [25, 15])
+            book.save()
+        finally:
+            ranked.close()
         
-        print(f"✅ Exported {len(data)} interactions to {output_file}")
-        print(f"📊 Average quality score: {df['calculated_quality'].mean():.1f}")
-        print(f"🎯 High priority items: {(df['improvement_priority'] >= 8).sum()}")
+        if clusters is not None:
+            print(f"✅ Exported {clusters} cluster representatives covering {summary.count} interactions to {output_file}")
+        else:
+            print(f"✅ Exported {summary.count} interactions to {output_file}")
+        print(f"📊 Average quality score: {summary.average_quality:.1f}")
+        print(f"🎯 High priority items: {summary.high_priority}")
         
         return True
         
@@ -148,6 +251,39 @@ def batch_export_by_criteria(
         print(f"❌ Error in batch export: {e}")
         return False
 
+def improvement_row(doc_id, doc_data, quality_score, priority):
+    """Row of the Improvements sheet for one interaction"""
+    # Convert timestamps
+    timestamp = doc_data.get('timestamp')
+    if hasattr(timestamp, 'timestamp'):
+        timestamp = datetime.fromtimestamp(timestamp.timestamp())
+    elif isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    
+    return {
+        'id': doc_id,
+        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else '',
+        'question': doc_data.get('question', ''),
+        'original_answer': doc_data.get('answer', ''),
+        'model': doc_data.get('model', ''),
+        'contexts_used': doc_data.get('contexts_used', 0),
+        'response_time': doc_data.get('response_time', ''),
+        'error': doc_data.get('error', ''),
+        'user_id': doc_data.get('user_id', ''),
+        'calculated_quality': quality_score,
+        'improvement_priority': priority,
+        
+        # Improvement columns
+        'improved_answer': '',
+        'improvement_notes': '',
+        'original_quality_score': '',
+        'improved_quality_score': '',
+        'needs_improvement': 'Y',
+        'improved_by': '',
+        'improvement_date': '',
+        'status': 'pending'
+    }
+
 def calculate_quality_score(doc_data):
     """Calculate quality score based on various factors"""
     score = 5  # Base score
@@ -189,8 +325,9 @@ def calculate_quality_score(doc_data):
     
     return max(1, min(10, score))  # Clamp between 1 and 10
 
-def get_improvement_priority(doc_data, quality_score):
+def get_improvement_priority(doc_data, quality_score, now=None):
     """Calculate improvement priority (1-10, higher = more urgent)"""
+    now = now or datetime.now()
     priority = 5  # Base priority
     
     # Quality score (lower quality = higher priority)
@@ -212,7 +349,7 @@ def get_improvement_priority(doc_data, quality_score):
     timestamp = doc_data.get('timestamp')
     if timestamp:
         if hasattr(timestamp, 'timestamp'):
-            hours_ago = (datetime.now() - datetime.fromtimestamp(timestamp.timestamp())).total_seconds() / 3600
+            hours_ago = (now - datetime.fromtimestamp(timestamp.timestamp())).total_seconds() / 3600
         else:
             hours_ago = 24  # Default if can't parse
         
@@ -234,16 +371,9 @@ def generate_improvement_suggestions(file_path):
         else:
             df = pd.read_csv(file_path)
         
-        # Generate suggestions for each row
-        suggestions = []
-        for idx, row in df.iterrows():
-            question = row['question']
-            original_answer = row['original_answer']
-            quality_score = row.get('calculated_quality', 5)
-            
-            # Generate suggestion based on quality issues
-            suggestion = generate_single_suggestion(question, original_answer, quality_score)
-            suggestions.append(suggestion)
+        # Generate suggestions based on quality issues, for all rows at once
+        quality = df['calculated_quality'] if 'calculated_quality' in df else pd.Series(5, index=df.index)
+        suggestions = suggestion_texts(df.rename(columns={'original_answer': 'answer'}), quality)
         
         # Add suggestions to DataFrame
         df['ai_suggestion'] = suggestions
@@ -303,6 +433,65 @@ def generate_single_suggestion(question, answer, quality_score):
     
     return " ".join(suggestions)
 
+def synthetic_interactions(count, seed=0):
+    """Random interaction documents covering every scoring branch, for benchmarks"""
+    rng = np.random.default_rng(seed)
+    now = datetime.now().astimezone()
+    # Amounts vary, so most answers are distinct; questions repeat like real traffic
+    answers = ['', 'Yes.', 'Please contact your insurance provider about {}.',
+               'Based on your plan documents, your deductible is ${}.',
+               'Based on your plan documents, ' * 12 + '${}', 'In-network specialist visits cost $40. ' * 20 + 'Your copay is ${}.']
+    questions = ['What is my deductible?', 'Do I need a referral for a specialist?',
+                 'How much is the copay for urgent care when I travel out of state with my family? ' * 2,
+                 'Is physical therapy covered?']
+    models = ['nelly-1.0', 'gpt-4', 'gpt-4o-mini']
+    errors = ['', '', '', 'timeout']
+    for i in range(count):
+        yield {
+            'answer': answers[rng.integers(len(answers))].format(rng.integers(10, 50000)),
+            'question': questions[rng.integers(len(questions))],
+            'model': models[rng.integers(len(models))],
+            'contexts_used': int(rng.integers(0, 6)),
+            'response_time': int(rng.choice([0, 800, 1999, 2000, 5000, 10000, 10001, 30000])),
+            'error': errors[rng.integers(len(errors))],
+            'timestamp': now - timedelta(hours=float(rng.uniform(0, 400)))
+        }
+
+def benchmark_scoring(count=1000000):
+    """Time per-document scoring against the vectorized engine and check they agree"""
+    docs = list(synthetic_interactions(count))
+    now = datetime.now()
+    print(f"⏱️  Scoring {count:,} synthetic interactions...")
+    
+    started = time.time()
+    expected_quality = [calculate_quality_score(doc) for doc in docs]
+    expected_priority = [get_improvement_priority(doc, q, now) for doc, q in zip(docs, expected_quality)]
+    loop_scoring = time.time() - started
+    started = time.time()
+    expected_suggestions = [generate_single_suggestion(doc['question'], doc['answer'], q)
+                            for doc, q in zip(docs, expected_quality)]
+    loop_suggestions = time.time() - started
+    
+    df = pd.DataFrame.from_records(docs, columns=SCORING_FIELDS)
+    started = time.time()
+    scores = score_frame(df, now=now)
+    vector_scoring = time.time() - started
+    started = time.time()
+    suggestions = suggestion_texts(df, scores['calculated_quality'])
+    vector_suggestions = time.time() - started
+    
+    identical = (
+        np.array_equal(scores['calculated_quality'].to_numpy(), np.array(expected_quality, dtype=float)) and
+        np.array_equal(scores['improvement_priority'].to_numpy(), np.array(expected_priority, dtype=float)) and
+        suggestions.tolist() == expected_suggestions
+    )
+    print(f"   Scores and priorities: {loop_scoring:.2f}s per document, {vector_scoring:.2f}s vectorized "
+          f"({loop_scoring / vector_scoring:.1f}x)")
+    print(f"   Suggestions:           {loop_suggestions:.2f}s per document, {vector_suggestions:.2f}s vectorized "
+          f"({loop_suggestions / vector_suggestions:.1f}x)")
+    print(f"   {'✅ Identical results' if identical else '❌ Results differ'}")
+    return identical
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Batch process response improvements')
     parser.add_argument('--export', action='store_true', help='Export interactions for improvement')
@@ -318,6 +507,18 @@ if __name__ == "__main__":
     parser.add_argument('--low-context-only', action='store_true', 
                        help='Export only interactions with low context usage')
     parser.add_argument('--suggestions', help='Generate AI suggestions for file')
+    parser.add_argument('--offline', action='store_true',
+                       help='Use the local interaction cache without syncing from Firebase')
+    parser.add_argument('--store', metavar='URL',
+                       help='Interaction store to read: firestore, sqlite[:path] or memory (default: $INTERACTION_STORE or firestore)')
+    parser.add_argument('--cluster', action='store_true',
+                       help='Export one representative per cluster of paraphrased questions')
+    parser.add_argument('--cluster-threshold', type=float, default=DEFAULT_THRESHOLD,
+                       help=f'Cosine similarity for two questions to share a cluster (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--embedding-model', default=DEFAULT_MODEL,
+                       help=f'Sentence embedding model for --cluster (default: {DEFAULT_MODEL})')
+    parser.add_argument('--benchmark-scoring', type=int, metavar='ROWS',
+                       help='Compare per-document and vectorized scoring on synthetic interactions')
     
     args = parser.parse_args()
     
@@ -327,7 +528,9 @@ if __name__ == "__main__":
     print("📊 Batch Response Improvement Tool")
     print("=" * 50)
     
-    if args.suggestions:
+    if args.benchmark_scoring:
+        success = benchmark_scoring(args.benchmark_scoring)
+    elif args.suggestions:
         success = generate_improvement_suggestions(args.suggestions)
     elif args.export:
         success = batch_export_by_criteria(
@@ -336,7 +539,12 @@ if __name__ == "__main__":
             quality_threshold=args.quality_threshold,
             model_filter=args.model,
             error_only=args.error_only,
-            low_context_only=args.low_context_only
+            low_context_only=args.low_context_only,
+            offline=args.offline,
+            store=args.store,
+            cluster=args.cluster,
+            cluster_threshold=args.cluster_threshold,
+            embedding_model=args.embedding_model
         )
     else:
         print("❌ Please specify --export or --suggestions")
@@ -1,32 +1,32 @@
 #!/usr/bin/env python3
 """
-Script to check Firebase data and verify logging is working
+Script to check Firebase data (or another interaction store) and verify logging is working
 """
 
 import os
 import sys
+import argparse
 from datetime import datetime
 
 # Add the functions directory to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'functions'))
 
-def check_firebase_data():
-    """Check Firebase data to verify logging is working"""
+sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
+from interaction_store import open_store
+
+def check_firebase_data(store_url=None):
+    """Check the interaction store to verify logging is working"""
     try:
-        from backend_api import db
-        
-        if not db:
-            print("❌ Firebase not initialized")
-            return False
+        store = open_store(store_url)
         
-        print("🔍 Checking Firebase data...")
+        print(f"🔍 Checking {store.kind} data...")
         
         # Query recent interactions
-        interactions = db.collection('interactions').order_by('created_at', direction='DESCENDING').limit(10).stream()
+        interactions = store.recent(10)
+        store.close()
         
         count = 0
-        for doc in interactions:
-            data = doc.to_dict()
+        for doc_id, data in interactions:
             count += 1
             print(f"\n📝 Interaction {count}:")
             print(f"   Question: {data.get('question', 'N/A')[:100]}...")
@@ -37,10 +37,10 @@ def check_firebase_data():
                 print(f"   Error: {data.get('error')}")
         
         if count == 0:
-            print("❌ No interactions found in Firebase")
+            print(f"❌ No interactions found in {store.kind}")
             return False
         else:
-            print(f"\n✅ Found {count} interactions in Firebase")
+            print(f"\n✅ Found {count} interactions in {store.kind}")
             return True
             
     except Exception as e:
@@ -48,13 +48,18 @@ def check_firebase_data():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Show the most recent logged interactions')
+    parser.add_argument('--store', metavar='URL',
+                       help='Interaction store to check: firestore, sqlite[:path] or memory (default: $INTERACTION_STORE or firestore)')
+    args = parser.parse_args()
+    
     print("🔍 Firebase Data Checker")
     print("=" * 50)
     
     # Set environment variable
     os.environ['GOOGLE_CLOUD_PROJECT'] = 'psip-navigator'
     
-    success = check_firebase_data()
+    success = check_firebase_data(args.store)
     
     if success:
         print("\n🎉 Firebase logging is working correctly!")
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+Single-pass export of interactions to several files at once.
+
+One scan over the interactions feeds every sink (xlsx, csv, jsonl,
+parquet), so exporting the same window in two formats no longer reads it
+twice. Rows come either from the local interaction cache (the default:
+only the delta since the last sync is read from Firestore) or straight
+from Firestore, in which case the date range is split into partitions
+that are streamed in parallel with a `select()` field mask, so only the
+exported columns travel over the wire.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Iterator, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    pyarrow_available = True
+except ImportError:
+    pyarrow_available = False
+
+from interaction_cache import interactions_since
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
+from xlsx_stream import StreamingWorkbook, PLAIN_HEADER_STYLE
+
+# Interaction fields the export reads; everything else stays in Firestore
+EXPORT_FIELDS = ['timestamp', 'question', 'answer', 'model', 'contexts_used', 'response_time', 'error', 'user_id']
+
+# Columns left empty for reviewers to fill in
+IMPROVEMENT_COLUMNS = {
+    'improved_answer': '',
+    'improvement_notes': '',
+    'original_quality_score': '',
+    'improved_quality_score': '',
+    'needs_improvement': '',
+    'improved_by': '',
+    'improvement_date': '',
+    'status': 'pending'
+}
+
+INSTRUCTIONS = {
+    'Column': [
+        'improved_answer',
+        'improvement_notes',
+        'original_quality_score',
+        'improved_quality_score',
+        'needs_improvement',
+        'improved_by',
+        'improvement_date',
+        'status'
+    ],
+    'Description': [
+        'Write your improved version of the answer here',
+        'Notes about what you changed and why',
+        'Rate the original response 1-10 (10 = perfect, 1 = needs major work)',
+        'Rate your improved response 1-10 (10 = perfect, 1 = needs major work)',
+        'Y/N - Does this response need improvement?',
+        'Your name/initials',
+        'Date you made the improvement (YYYY-MM-DD)',
+        'pending, improved, approved, rejected'
+    ],
+    'Example': [
+        'Based on your plan documents, your deductible is $1,500...',
+        'Added specific deductible amount and clearer explanation',
+        '3',
+        '8',
+        'Y',
+        'Brett',
+        '2025-10-27',
+        'improved'
+    ]
+}
+
+# Parquet column types; columns not listed are stored as strings
+PARQUET_TYPES = {'contexts_used': 'int', 'response_time': 'float', 'calculated_quality': 'float',
+                 'improvement_priority': 'float'}
+PARQUET_ROW_GROUP = 10000
+
+# Interactions sheet widths for the long text columns
+XLSX_WIDTHS = {'timestamp': 20, 'question': 60, 'original_answer': 80, 'improved_answer': 80,
+               'improvement_notes': 40}
+
+DEFAULT_PARTITIONS = 4
+# Documents per Firestore query page, and pages buffered per partition ahead of the writer
+DEFAULT_PAGE_SIZE = 1000
+PARTITION_QUEUE_PAGES = 2
+
+
+def interaction_row(doc_id: str, doc_data: Dict) -> Dict:
+    """The export row for one interaction."""
+    timestamp = doc_data.get('timestamp')
+    if hasattr(timestamp, 'timestamp'):
+        timestamp = datetime.fromtimestamp(timestamp.timestamp())
+    elif isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+    row = {
+        'id': doc_id,
+        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else '',
+        'question': doc_data.get('question', ''),
+        'original_answer': doc_data.get('answer', ''),
+        'model': doc_data.get('model', ''),
+        'contexts_used': doc_data.get('contexts_used', 0),
+        'response_time': doc_data.get('response_time', ''),
+        'error': doc_data.get('error', ''),
+        'user_id': doc_data.get('user_id', '')
+    }
+    row.update(IMPROVEMENT_COLUMNS)
+    return row
+
+
+def date_partitions(start_date: datetime, end_date: datetime, partitions: int) -> List[Tuple[datetime, Optional[datetime]]]:
+    """Split [start_date, end_date) into (low, high) ranges, newest first.
+
+    The newest range has no upper bound so interactions logged during the
+    export are not cut off.
+    """
+    partitions = max(1, partitions)
+    step = (end_date - start_date) / partitions
+    bounds = [start_date + step * i for i in range(partitions)] + [None]
+    return [(bounds[i], bounds[i + 1]) for i in reversed(range(partitions))]
+
+
+class ScanStats:
+    def __init__(self):
+        self.documents = 0
+        # Approximate payload size of the fetched documents
+        self.bytes_read = 0
+        self.seconds = 0.0
+
+    def report(self) -> str:
+        return (f"{self.documents} documents, ~{self.bytes_read / 1024 / 1024:.2f} MB read "
+                f"in {self.seconds:.1f}s")
+
+
+def scan_firestore(db, start_date: datetime, end_date: datetime, model_filter: str = None,
+                   fields: List[str] = EXPORT_FIELDS, partitions: int = DEFAULT_PARTITIONS,
+                   stats: ScanStats = None, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Tuple[str, Dict]]:
+    """Stream (id, projected document) pairs newest first, one parallel query per date partition.
+
+    Each partition is read page by page (limit/start_after) into its own
+    bounded queue, so only a few pages per partition are held in memory
+    while the newer partitions are being written out.
+    """
+    stop = threading.Event()
+
+    def put(pages, item):
+        # Give up once the consumer has stopped reading
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def fetch(low, high, pages):
+        try:
+            query = db.collection('interactions').select(fields).where('timestamp', '>=', low)
+            if high is not None:
+                query = query.where('timestamp', '<', high)
+            if model_filter:
+                query = query.where('model', '==', model_filter)
+            query = query.order_by('timestamp', direction='DESCENDING').limit(page_size)
+            last = None
+            while not stop.is_set():
+                snapshots = list((query.start_after(last) if last is not None else query).stream())
+                if snapshots:
+                    put(pages, [(doc.id, doc.to_dict()) for doc in snapshots])
+                if len(snapshots) < page_size:
+                    break
+                last = snapshots[-1]
+        except Exception as e:
+            put(pages, e)
+            return
+        put(pages, None)
+
+    started = time.time()
+    ranges = date_partitions(start_date, end_date, partitions)
+    queues = [queue.Queue(maxsize=PARTITION_QUEUE_PAGES) for _ in ranges]
+    executor = ThreadPoolExecutor(max_workers=len(ranges))
+    try:
+        for (low, high), pages in zip(ranges, queues):
+            executor.submit(fetch, low, high, pages)
+        # Partitions are consumed newest first, so the merged stream stays in timestamp order
+        for pages in queues:
+            for page in iter(pages.get, None):
+                if isinstance(page, Exception):
+                    raise page
+                if stats is not None:
+                    stats.documents += len(page)
+                    stats.bytes_read += sum(len(json.dumps(doc_data, default=str)) for _, doc_data in page)
+                yield from page
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+    if stats is not None:
+        stats.seconds = time.time() - started
+
+
+class ExportSummary:
+    def __init__(self):
+        """Running totals for the Summary sheet, collected while rows stream past."""
+        self.count = 0
+        self.questions = set()
+        self.contexts_total = 0
+        self.errors = 0
+        self.models = {}
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def add(self, row: Dict) -> None:
+        self.count += 1
+        self.questions.add(row['question'])
+        self.contexts_total += row['contexts_used'] or 0
+        if row['error'] != '':
+            self.errors += 1
+        self.models[row['model']] = self.models.get(row['model'], 0) + 1
+        timestamp = row['timestamp']
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+    @property
+    def date_range(self) -> str:
+        return f"{self.first_timestamp} to {self.last_timestamp}"
+
+    def rows(self) -> List[List]:
+        """(Metric, Value) rows of the Summary sheet."""
+        most_common = min(self.models, key=lambda model: (-self.models[model], model)) if self.models else 'N/A'
+        return [
+            ['Total Interactions', self.count],
+            ['Unique Questions', len(self.questions)],
+            ['Average Contexts Used', f"{self.contexts_total / self.count:.1f}"],
+            ['Error Rate', f"{self.errors / self.count * 100:.1f}%"],
+            ['Most Common Model', most_common],
+            ['Date Range', self.date_range]
+        ]
+
+
+class Sink:
+    """An output file written to a temporary path and moved into place on close."""
+    format = None
+
+    def __init__(self, path: str):
+        self.path = path
+        # Keep the extension last so the temp file still reads as its format
+        base, ext = os.path.splitext(path)
+        self.tmp_path = f"{base}.tmp{ext}"
+        self.rows = 0
+
+    def write(self, row: Dict) -> None:
+        raise NotImplementedError
+
+    def _finish(self, summary: ExportSummary) -> None:
+        raise NotImplementedError
+
+    def close(self, summary: ExportSummary) -> None:
+        self._finish(summary)
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self) -> None:
+        try:
+            self._finish(None)
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+class CsvSink(Sink):
+    format = 'csv'
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file = open(self.tmp_path, 'w', newline='', encoding='utf-8')
+        self.writer = None
+
+    def write(self, row: Dict) -> None:
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(row))
+            self.writer.writeheader()
+        self.writer.writerow(row)
+        self.rows += 1
+
+    def _finish(self, summary: ExportSummary) -> None:
+        self.file.close()
+
+
+class JsonlSink(Sink):
+    format = 'jsonl'
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+
+    def write(self, row: Dict) -> None:
+        self.file.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+        self.rows += 1
+
+    def _finish(self, summary: ExportSummary) -> None:
+        self.file.close()
+
+
+def _parquet_value(kind: str, value):
+    if value is None or value == '':
+        return None
+    try:
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+class ParquetSink(Sink):
+    format = 'parquet'
+
+    def __init__(self, path: str):
+        if not pyarrow_available:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+        super().__init__(path)
+        self.writer = None
+        self.columns = None
+        self.batch = []
+
+    def write(self, row: Dict) -> None:
+        if self.columns is None:
+            self.columns = {name: PARQUET_TYPES.get(name, 'str') for name in row}
+        self.batch.append(row)
+        self.rows += 1
+        if len(self.batch) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self.batch:
+            return
+        arrow_types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+        schema = pa.schema([(name, arrow_types[kind]) for name, kind in self.columns.items()])
+        table = pa.Table.from_pydict({
+            name: [_parquet_value(kind, row.get(name)) for row in self.batch]
+            for name, kind in self.columns.items()
+        }, schema=schema)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_path, schema)
+        self.writer.write_table(table)
+        self.batch = []
+
+    def _finish(self, summary: ExportSummary) -> None:
+        if summary is not None:
+            self._flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class XlsxSink(Sink):
+    format = 'xlsx'
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.book = StreamingWorkbook(self.tmp_path)
+        self.sheet = None
+
+    def write(self, row: Dict) -> None:
+        if self.sheet is None:
+            # Rows go straight to the sheet XML; only the header layout is kept in memory
+            widths = [XLSX_WIDTHS.get(name) for name in row]
+            self.sheet = self.book.add_sheet('Interactions', list(row), widths, header_style=PLAIN_HEADER_STYLE)
+        self.sheet.append(row.values())
+        self.rows += 1
+
+    def _finish(self, summary: ExportSummary) -> None:
+        if summary is None:
+            return
+        self.book.add_table_sheet('Summary', ['Metric', 'Value'], summary.rows(), [25, 45],
+                                  header_style=PLAIN_HEADER_STYLE)
+        self.book.add_table_sheet('Instructions', list(INSTRUCTIONS), zip(*INSTRUCTIONS.values()), [25, 70, 60],
+                                  header_style=PLAIN_HEADER_STYLE)
+        self.book.workbook.save(self.tmp_path)
+
+
+SINKS = {sink.format: sink for sink in (XlsxSink, CsvSink, JsonlSink, ParquetSink)}
+
+
+def open_sink(path: str, fmt: str = None) -> Sink:
+    """A sink for `path`, chosen by `fmt` or else by the file extension."""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in SINKS:
+        raise ValueError(f"Unsupported export format '{fmt}' for {path} (use {', '.join(SINKS)})")
+    return SINKS[fmt](path)
+
+
+def export_interactions(
+    outputs: List[str],
+    days_back: int = 30,
+    model_filter: str = None,
+    min_contexts: int = 0,
+    include_errors: bool = True,
+    source: str = 'cache',
+    partitions: int = DEFAULT_PARTITIONS,
+    offline: bool = False,
+    fmt: str = None,
+    store: str = None
+) -> Optional[ExportSummary]:
+    """Write the interactions of the last `days_back` days to every output in one pass.
+
+    Returns the summary, or None when nothing matched (no files are written then).
+    """
+    started = time.time()
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days_back)
+
+    stats = None
+    if source == 'firestore':
+        from backend_api import db
+        if not db:
+            raise RuntimeError("Firebase not initialized")
+        stats = ScanStats()
+        interactions = scan_firestore(db, start_date, end_date, model_filter, partitions=partitions, stats=stats)
+    else:
+        # Sync new interactions into the local cache, then scan it (or scan a local store directly)
+        interactions = interactions_since(start_date, model_filter, offline, store=store)
+
+    sinks = []
+    summary = ExportSummary()
+    try:
+        for output in outputs:
+            sinks.append(open_sink(output, fmt))
+        for doc_id, doc_data in interactions:
+            if doc_data.get('contexts_used', 0) < min_contexts:
+                continue
+            if not include_errors and doc_data.get('error'):
+                continue
+            row = interaction_row(doc_id, doc_data)
+            summary.add(row)
+            for sink in sinks:
+                sink.write(row)
+    except BaseException:
+        for sink in sinks:
+            sink.discard()
+        raise
+
+    if summary.count == 0:
+        for sink in sinks:
+            sink.discard()
+        print("❌ No interactions found matching criteria")
+        return None
+
+    for i, sink in enumerate(sinks):
+        try:
+            sink.close(summary)
+        except BaseException:
+            for unfinished in sinks[i:]:
+                unfinished.discard()
+            raise
+        print(f"✅ Exported {sink.rows} interactions to {sink.path} ({sink.format})")
+    if stats is not None:
+        print(f"🔎 Firestore scan ({partitions} partitions, {len(EXPORT_FIELDS)} fields): {stats.report()}")
+    print(f"📊 Date range: {summary.date_range}")
+    print(f"⏱️  Export took {time.time() - started:.1f}s")
+    return summary
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Run the response improvement loop as one cached pipeline:
+
+    export   interactions of the last N days -> data/pipeline/interactions.parquet
+    score    quality score and improvement priority -> data/pipeline/scored.parquet
+    suggest  low-quality rows ranked, with suggestions -> data/pipeline/review.xlsx
+    import   reviewed file -> interaction store (with --reviewed)
+    train    reviewed file -> data/pipeline/training_data.json (with --reviewed)
+
+Stages whose inputs have not changed since a previous run are restored
+from the artifact cache instead of rerun (see scripts/pipeline.py).
+"""
+
+import os
+import sys
+import argparse
+import pandas as pd
+
+# Add the functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'functions'))
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
+
+from export_engine import export_interactions
+from xlsx_stream import StreamingWorkbook
+from quality_scoring import score_frame, suggestion_texts
+from import_improvements import import_improvements, generate_training_data, DEFAULT_BATCH_SIZE
+from pipeline import Stage, Pipeline, ArtifactCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_WORKERS, DEFAULT_KEEP_KEYS
+
+DEFAULT_WORK_DIR = "data/pipeline"
+
+def export_stage(stage):
+    """Snapshot the interactions in the window; always runs, since the store is not a file"""
+    summary = export_interactions(stage.outputs, days_back=stage.params['days_back'],
+                                  model_filter=stage.params['model_filter'],
+                                  offline=stage.params['offline'], store=stage.params['store'])
+    if summary is None:
+        raise RuntimeError("No interactions found matching criteria")
+
+def write_parquet(df, path):
+    """Write a DataFrame to Parquet through a temporary file"""
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def score_stage(stage):
+    """Add calculated_quality and improvement_priority to every interaction of the snapshot"""
+    df = pd.read_parquet(stage.inputs[0])
+    frame = df.rename(columns={'original_answer': 'answer'})
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'], errors='coerce')
+
+    # Recency is measured from the newest interaction rather than the clock, so the scores
+    # (and everything after them) stay cached until new interactions arrive
+    newest = frame['timestamp'].max()
+    now = newest.to_pydatetime() if pd.notna(newest) else None
+    scores = score_frame(frame, now=now)
+    # Same column order as the batch export: scores before the reviewer columns
+    position = df.columns.get_loc('user_id') + 1
+    df.insert(position, 'improvement_priority', scores['improvement_priority'])
+    df.insert(position, 'calculated_quality', scores['calculated_quality'])
+    write_parquet(df, stage.outputs[0])
+
+def suggest_stage(stage):
+    """Write the review workbook: low-quality interactions, most urgent first, with suggestions"""
+    df = pd.read_parquet(stage.inputs[0])
+    df = df[df['calculated_quality'] < stage.params['quality_threshold']]
+    df = df.sort_values('improvement_priority', ascending=False, kind='stable')
+    df['needs_improvement'] = 'Y'
+    df['ai_suggestion'] = suggestion_texts(df.rename(columns={'original_answer': 'answer'}),
+                                           df['calculated_quality'])
+    df = df.astype(object).where(df.notna(), '')
+
+    book = StreamingWorkbook(stage.outputs[0])
+    sheet = book.add_sheet('Improvements', list(df.columns), [20, 20, 60, 80])
+    sheet.write_rows(df.itertuples(index=False, name=None))
+    priorities = df['improvement_priority'].astype(float).round().astype(int).value_counts().sort_index(ascending=False)
+    book.add_table_sheet('Priority_Breakdown', ['Priority', 'Count'], priorities.items())
+    book.save()
+    print(f"✅ {len(df)} interactions to review in {stage.outputs[0]}")
+
+def import_stage(stage):
+    """Write the reviewed improvements to the interaction store"""
+    if not import_improvements(stage.inputs[0], report_path=stage.outputs[0],
+                               batch_size=stage.params['batch_size'], store_url=stage.params['store']):
+        raise RuntimeError(f"Import of {stage.inputs[0]} did not complete")
+
+def train_stage(stage):
+    """Turn the approved improvements of the reviewed file into training examples"""
+    if not generate_training_data(stage.inputs[0], stage.outputs[0]):
+        raise RuntimeError(f"No training data generated from {stage.inputs[0]}")
+
+def build_pipeline(work_dir=DEFAULT_WORK_DIR, days_back=7, model_filter=None, quality_threshold=5,
+                   reviewed=None, store=None, offline=False, batch_size=DEFAULT_BATCH_SIZE,
+                   cache_dir=DEFAULT_CACHE_DIR, max_workers=DEFAULT_MAX_WORKERS):
+    """The improvement pipeline; import and train are only added when a reviewed file is given"""
+    os.makedirs(work_dir, exist_ok=True)
+    snapshot = os.path.join(work_dir, 'interactions.parquet')
+    scored = os.path.join(work_dir, 'scored.parquet')
+
+    stages = [
+        Stage('export', export_stage, outputs=[snapshot], cache=False,
+              params={'days_back': days_back, 'model_filter': model_filter, 'offline': offline, 'store': store}),
+        Stage('score', score_stage, inputs=[snapshot], outputs=[scored]),
+        Stage('suggest', suggest_stage, inputs=[scored], outputs=[os.path.join(work_dir, 'review.xlsx')],
+              params={'quality_threshold': quality_threshold}),
+    ]
+    if reviewed:
+        stages += [
+            Stage('import', import_stage, inputs=[reviewed],
+                  outputs=[os.path.join(work_dir, 'import_report.csv')],
+                  params={'store': store or os.environ.get('INTERACTION_STORE'), 'batch_size': batch_size}),
+            Stage('train', train_stage, inputs=[reviewed], outputs=[os.path.join(work_dir, 'training_data.json')]),
+        ]
+    return Pipeline(stages, ArtifactCache(cache_dir), max_workers)
+
+def print_timings(results):
+    """Per-stage status and wall time of one run"""
+    print("\n⏱️  Stage timings:")
+    for name, result in results.items():
+        print(f"   {name:<10} {result['status']:<8} {result['seconds']:8.2f}s")
+    restored = sum(1 for result in results.values() if result['status'] == 'cached')
+    print(f"   {restored}/{len(results)} stages restored from cache")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the cached export/score/suggest/import/train pipeline')
+    parser.add_argument('command', choices=['run', 'history', 'prune'])
+    parser.add_argument('--days', '-d', type=int, default=7,
+                       help='Number of days back to export (default: 7)')
+    parser.add_argument('--model', '-m',
+                       help='Filter by model (nelly-1.0, gpt-4, etc.)')
+    parser.add_argument('--quality-threshold', type=float, default=5,
+                       help='Review interactions scoring below this (default: 5)')
+    parser.add_argument('--reviewed',
+                       help='Reviewed Excel/CSV file to import and turn into training data')
+    parser.add_argument('--store', metavar='URL',
+                       help='Interaction store: firestore, sqlite[:path] or memory (default: $INTERACTION_STORE or firestore)')
+    parser.add_argument('--offline', action='store_true',
+                       help='Use the local interaction cache without syncing from Firebase')
+    parser.add_argument('--stages', nargs='+', metavar='STAGE',
+                       help='Only bring these stages (and what they depend on) up to date')
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE',
+                       help='Rerun these stages even if their inputs are unchanged')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                       help=f'Stages run in parallel (default: {DEFAULT_MAX_WORKERS})')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR,
+                       help=f'Directory for stage outputs (default: {DEFAULT_WORK_DIR})')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                       help=f'Artifact cache and run history (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--limit', type=int, default=20,
+                       help='Stage executions shown by history (default: 20)')
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP_KEYS,
+                       help=f'Cache keys kept per stage by prune (default: {DEFAULT_KEEP_KEYS})')
+
+    args = parser.parse_args()
+
+    # Set environment variable
+    os.environ['GOOGLE_CLOUD_PROJECT'] = 'psip-navigator'
+
+    if args.command == 'history':
+        cache = ArtifactCache(args.cache_dir)
+        for run in cache.history(args.stages[0] if args.stages else None, args.limit):
+            error = f"  {run['error']}" if run['error'] else ''
+            print(f"{run['started_at'][:19]}  {run['run_id']}  {run['stage']:<10} {run['status']:<8} "
+                  f"{run['seconds']:8.2f}s{error}")
+        cache.close()
+        sys.exit(0)
+
+    if args.command == 'prune':
+        cache = ArtifactCache(args.cache_dir)
+        removed = cache.prune(args.keep)
+        print(f"🧹 Removed {removed['keys']} cache keys and {removed['objects']} artifacts")
+        cache.close()
+        sys.exit(0)
+
+    print("🔁 Response Improvement Pipeline")
+    print("=" * 50)
+
+    pipeline = build_pipeline(args.work_dir, args.days, args.model, args.quality_threshold, args.reviewed,
+                              args.store, args.offline, cache_dir=args.cache_dir, max_workers=args.workers)
+    results = pipeline.run(args.stages, force=args.force)
+    print_timings(results)
+    pipeline.cache.close()
+
+    sys.exit(0 if all(result['status'] in ('ran', 'cached') for result in results.values()) else 1)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Local SQLite cache of Firebase interactions, synced incrementally.
+
+Every export, batch-improve and analysis run used to stream all
+interactions of the last N days from Firestore again. The cache keeps a
+copy in data/interactions.db and a persisted `created_at` cursor, so a sync
+only fetches documents created since the last one; the scans themselves
+run against local disk. The cache is a SQLite interaction store
+(scripts/interaction_store.py) plus that cursor; it is only needed while
+interactions live in Firestore.
+
+    python3 interaction_cache.py sync         # fetch the delta
+    python3 interaction_cache.py sync --full  # re-fetch everything (picks up edited documents)
+    python3 interaction_cache.py stats
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime
+from typing import Dict, Iterator, Tuple, Optional
+
+# Add the functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'functions'))
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
+from interaction_store import SQLiteInteractionStore, open_store, store_kind, _to_datetime
+
+DEFAULT_CACHE_PATH = "data/interactions.db"
+
+# Documents fetched per Firestore page; the cursor is saved after each page
+SYNC_PAGE_SIZE = 500
+
+
+class InteractionCache(SQLiteInteractionStore):
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        """Open (or create) the cache database: a SQLite interaction store plus the sync cursor."""
+        super().__init__(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+
+    def _state(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def cursor(self) -> Optional[datetime]:
+        """`created_at` of the newest document synced so far."""
+        value = self._state('created_at_cursor')
+        return datetime.fromisoformat(value) if value else None
+
+    @property
+    def last_synced(self) -> Optional[str]:
+        return self._state('last_synced')
+
+    def sync(self, db, full: bool = False, page_size: int = SYNC_PAGE_SIZE) -> int:
+        """Fetch interactions created since the cursor (all of them with `full`); returns the count.
+
+        The query starts at the cursor inclusively, so documents sharing the
+        last `created_at` are fetched again and simply overwritten.
+        """
+        cursor = None if full else self.cursor
+        query = db.collection('interactions')
+        if cursor is not None:
+            query = query.where('created_at', '>=', cursor)
+        query = query.order_by('created_at').limit(page_size)
+
+        fetched = 0
+        last_doc = None
+        while True:
+            page = list((query.start_after(last_doc) if last_doc is not None else query).stream())
+            for doc in page:
+                self.upsert(doc.id, doc.to_dict())
+            if page:
+                last_doc = page[-1]
+                newest = _to_datetime(last_doc.to_dict().get('created_at'))
+                if newest is not None:
+                    self._set_state('created_at_cursor', newest.isoformat())
+            # Commit per page so an interrupted sync resumes from here
+            self.conn.commit()
+            fetched += len(page)
+            if len(page) < page_size:
+                break
+
+        self._set_state('last_synced', datetime.now().isoformat())
+        self.conn.commit()
+        return fetched
+
+    def query(self, start_date: datetime = None, model_filter: str = None) -> Iterator[Tuple[str, Dict]]:
+        """(id, document) pairs with `timestamp` >= start_date, newest first."""
+        return self.scan(start=start_date, model=model_filter)
+
+
+def interactions_since(start_date: datetime, model_filter: str = None, offline: bool = False,
+                       cache_path: str = DEFAULT_CACHE_PATH, store: str = None) -> Iterator[Tuple[str, Dict]]:
+    """Sync the cache from Firestore (unless `offline`), then scan it locally.
+
+    When `store` (or INTERACTION_STORE) names a local store instead of
+    Firestore, that store is scanned directly; it needs no cache.
+    """
+    if store_kind(store) != 'firestore':
+        local = open_store(store)
+        try:
+            yield from local.scan(start=start_date, model=model_filter)
+        finally:
+            local.close()
+        return
+
+    cache = InteractionCache(cache_path)
+    try:
+        if not offline:
+            from backend_api import db
+            if not db:
+                raise RuntimeError("Firebase not initialized (use --offline to read the local cache only)")
+            fetched = cache.sync(db)
+            print(f"🔄 Synced {fetched} new interaction(s) into {cache_path} ({len(cache)} cached)")
+        yield from cache.query(start_date, model_filter)
+    finally:
+        cache.close()
+
+
+def main():
+    """Sync or inspect the local interaction cache."""
+    parser = argparse.ArgumentParser(description='Local cache of Firebase interactions')
+    parser.add_argument('command', choices=['sync', 'stats'])
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH)
+    parser.add_argument('--full', action='store_true', help='Re-fetch every interaction, not just new ones')
+    args = parser.parse_args()
+
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'psip-navigator')
+    cache = InteractionCache(args.cache)
+
+    if args.command == 'sync':
+        from backend_api import db
+        if not db:
+            print("❌ Firebase not initialized")
+            sys.exit(1)
+        fetched = cache.sync(db, full=args.full)
+        print(f"✅ Synced {fetched} interaction(s); cursor now {cache.cursor}")
+
+    print(f"🗄️  {args.cache}: {len(cache)} interactions, cursor {cache.cursor}, last synced {cache.last_synced}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
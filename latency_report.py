@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Latency SLO report over the logged `response_time` of interactions.
+
+Reads interactions from the local cache (synced first, like the exports)
+or from a local interaction store in one streaming pass. Each
+response_time (ms, as written by the functions) is added to a quantile
+sketch (scripts/quantile_sketch.py) per model, UTC day and contexts_used
+bucket, and per model and UTC hour of day. Naive timestamps are read as
+UTC. Memory depends on the number of groups, not the number of
+interactions. Windows are built by merging daily sketches, so months of
+data cost one scan.
+
+The report gives p50/p90/p99 by model, contexts_used bucket, day and hour
+of day. It flags regressions, where a quantile of the last `--window`
+days is both `--threshold` and `--min-delta` ms above the window before
+it. With `--slo`, it also checks the last window against latency targets.
+
+    python3 latency_report.py --days 28 --window 7
+    python3 latency_report.py --slo p90=5000 p99=15000 --html latency.html --fail-on-regression
+"""
+
+import os
+import sys
+import html
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from interaction_cache import interactions_since
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
+from quantile_sketch import LatencySketch, DEFAULT_RELATIVE_ACCURACY
+
+# Interaction fields the report reads
+LATENCY_FIELDS = ['timestamp', 'model', 'contexts_used', 'response_time']
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+# contexts_used buckets: (label, lowest count in the bucket)
+CONTEXT_BUCKETS = [('0', 0), ('1-2', 1), ('3-5', 3), ('6+', 6)]
+
+DEFAULT_DAYS = 28
+DEFAULT_WINDOW = 7
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+DEFAULT_MIN_DELTA_MS = 100
+DEFAULT_MIN_COUNT = 50
+
+# Interactions turned into one DataFrame and added to the sketches together
+CHUNK_ROWS = 50000
+
+
+def context_buckets(contexts: pd.Series) -> pd.Series:
+    """contexts_used bucket label of each row; missing counts as 0."""
+    values = pd.to_numeric(contexts, errors='coerce').fillna(0).to_numpy()
+    labels = np.array([label for label, _ in CONTEXT_BUCKETS], dtype=object)
+    lows = np.array([low for _, low in CONTEXT_BUCKETS])
+    return pd.Series(labels[np.searchsorted(lows, values, side='right') - 1], index=contexts.index)
+
+
+def quantile_name(q: float) -> str:
+    return f"p{q * 100:g}"
+
+
+class LatencyStats:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        """Latency sketches per (model, day, contexts bucket) and per (model, hour of day)."""
+        self.relative_accuracy = relative_accuracy
+        self.daily = {}
+        self.hourly = {}
+        self.rows = 0
+        self.missing = 0
+
+    def _add(self, table: Dict, key: Tuple, values: np.ndarray) -> None:
+        if key not in table:
+            table[key] = LatencySketch(self.relative_accuracy)
+        table[key].add(values)
+
+    def add_frame(self, df: pd.DataFrame) -> None:
+        """Add a batch of interactions (a DataFrame with LATENCY_FIELDS columns)."""
+        latency = pd.to_numeric(df['response_time'], errors='coerce')
+        moments = pd.to_datetime(df['timestamp'], utc=True, errors='coerce', format='mixed')
+        valid = latency.notna() & (latency >= 0) & moments.notna()
+        self.rows += len(df)
+        self.missing += int((~valid).sum())
+        if not valid.any():
+            return
+
+        moments = moments[valid]
+        frame = pd.DataFrame({
+            'model': df['model'][valid].fillna('unknown').astype(str),
+            'day': moments.dt.strftime('%Y-%m-%d'),
+            'hour': moments.dt.hour,
+            'bucket': context_buckets(df['contexts_used'][valid]),
+            'latency': latency[valid]
+        })
+        for key, values in frame.groupby(['model', 'day', 'bucket'], sort=False)['latency']:
+            self._add(self.daily, key, values.to_numpy())
+        for key, values in frame.groupby(['model', 'hour'], sort=False)['latency']:
+            self._add(self.hourly, key, values.to_numpy())
+
+    @property
+    def measured(self) -> int:
+        return self.rows - self.missing
+
+    def group(self, key: Callable[[str, str, str], Tuple], days: Iterable[str] = None) -> Dict[Tuple, LatencySketch]:
+        """Daily sketches merged by key(model, day, bucket), optionally only for some days."""
+        days = set(days) if days is not None else None
+        merged = {}
+        for (model, day, bucket), sketch in self.daily.items():
+            if days is not None and day not in days:
+                continue
+            target = key(model, day, bucket)
+            if target not in merged:
+                merged[target] = LatencySketch(self.relative_accuracy)
+            merged[target].merge(sketch)
+        return merged
+
+
+def collect_latency(interactions: Iterator[Tuple[str, Dict]], relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                    chunk_rows: int = CHUNK_ROWS) -> LatencyStats:
+    """Stream (id, document) pairs into latency sketches."""
+    stats = LatencyStats(relative_accuracy)
+    batch = []
+    for _, doc_data in interactions:
+        batch.append({field: doc_data.get(field) for field in LATENCY_FIELDS})
+        if len(batch) >= chunk_rows:
+            stats.add_frame(pd.DataFrame.from_records(batch, columns=LATENCY_FIELDS))
+            batch = []
+    if batch:
+        stats.add_frame(pd.DataFrame.from_records(batch, columns=LATENCY_FIELDS))
+    return stats
+
+
+def window_days(end_day: datetime, window: int, windows_back: int = 0) -> List[str]:
+    """The `window` days ending `windows_back` windows before end_day, as YYYY-MM-DD."""
+    last = end_day - timedelta(days=window * windows_back)
+    return [(last - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(window)]
+
+
+def quantile_rows(sketches: Dict[Tuple, LatencySketch]) -> List[List]:
+    """[*key, count, p50, p90, p99] per sketch, in key order."""
+    return [list(key) + [sketch.count] + [sketch.quantile(q) for q in QUANTILES]
+            for key, sketch in sorted(sketches.items())]
+
+
+def find_regressions(stats: LatencyStats, end_day: datetime, window: int = DEFAULT_WINDOW,
+                     threshold: float = DEFAULT_REGRESSION_THRESHOLD, min_delta_ms: float = DEFAULT_MIN_DELTA_MS,
+                     min_count: int = DEFAULT_MIN_COUNT) -> List[Dict]:
+    """Quantiles of the last window that rose by `threshold` and `min_delta_ms` over the window before.
+
+    Checked per model and per model and contexts bucket; groups with fewer
+    than `min_count` interactions in either window are left out.
+    """
+    current_days, baseline_days = window_days(end_day, window), window_days(end_day, window, 1)
+    regressions = []
+    groupings = [lambda model, day, bucket: (model, 'all'), lambda model, day, bucket: (model, bucket)]
+    for key in groupings:
+        current = stats.group(key, current_days)
+        baseline = stats.group(key, baseline_days)
+        for group in sorted(set(current) & set(baseline)):
+            now, before = current[group], baseline[group]
+            if now.count < min_count or before.count < min_count:
+                continue
+            for q in QUANTILES:
+                old, new = before.quantile(q), now.quantile(q)
+                if new - old >= min_delta_ms and new >= old * (1 + threshold):
+                    regressions.append({'model': group[0], 'contexts': group[1], 'quantile': quantile_name(q),
+                                        'baseline': old, 'current': new,
+                                        'change': new / old - 1 if old else float('inf'),
+                                        'baseline_count': before.count, 'current_count': now.count})
+    return regressions
+
+
+def check_slo(stats: LatencyStats, targets: Dict[float, float], end_day: datetime,
+              window: int = DEFAULT_WINDOW) -> List[Dict]:
+    """Each model's quantiles over the last window against `targets` ({quantile: ms}).
+
+    Also counts the days of the window on which the model missed the target.
+    """
+    days = window_days(end_day, window)
+    overall = stats.group(lambda model, day, bucket: model, days)
+    daily = stats.group(lambda model, day, bucket: (model, day), days)
+    results = []
+    for model in sorted(overall):
+        model_days = [sketch for (name, _), sketch in daily.items() if name == model]
+        for q, target in sorted(targets.items()):
+            value = overall[model].quantile(q)
+            results.append({'model': model, 'quantile': quantile_name(q), 'target': target, 'value': value,
+                            'met': value <= target,
+                            'days_missed': sum(1 for sketch in model_days if sketch.quantile(q) > target),
+                            'days': len(model_days)})
+    return results
+
+
+def _ms(value: float) -> str:
+    return '-' if value != value else f"{value:,.0f}"
+
+
+def build_report(stats: LatencyStats, end_day: datetime, days_back: int, window: int = DEFAULT_WINDOW,
+                 regressions: List[Dict] = None, slo: List[Dict] = None) -> Dict:
+    """Report sections as {'title', 'headers', 'rows'} tables of display strings."""
+    quantile_headers = ['n'] + [quantile_name(q) for q in QUANTILES]
+
+    def table(title, headers, rows):
+        return {'title': title, 'headers': headers,
+                'rows': [[value if isinstance(value, str) else _ms(value) if isinstance(value, float) else f"{value:,}"
+                          for value in row] for row in rows]}
+
+    tables = [
+        table('By model', ['model'] + quantile_headers,
+              quantile_rows(stats.group(lambda model, day, bucket: (model,)))),
+        table('By contexts used', ['model', 'contexts'] + quantile_headers,
+              quantile_rows(stats.group(lambda model, day, bucket: (model, bucket)))),
+        table('By day (UTC)', ['model', 'day'] + quantile_headers,
+              quantile_rows(stats.group(lambda model, day, bucket: (model, day)))),
+        table('By hour of day (UTC)', ['model', 'hour'] + quantile_headers,
+              [[model, f"{hour:02d}"] + row for model, hour, *row in quantile_rows(stats.hourly)]),
+    ]
+    if regressions is not None:
+        tables.append(table(
+            f"Regressions: last {window} days vs the {window} days before",
+            ['model', 'contexts', 'quantile', 'before', 'last', 'change', 'n before', 'n last'],
+            [[r['model'], r['contexts'], r['quantile'], r['baseline'], r['current'], f"{r['change']:+.0%}",
+              r['baseline_count'], r['current_count']] for r in regressions]))
+    if slo is not None:
+        tables.append(table(
+            f"SLO: last {window} days",
+            ['model', 'quantile', 'target', 'actual', 'status', 'days missed'],
+            [[s['model'], s['quantile'], s['target'], s['value'], 'met' if s['met'] else 'MISSED',
+              f"{s['days_missed']}/{s['days']}"] for s in slo]))
+
+    start_day = end_day - timedelta(days=days_back)
+    return {
+        'title': f"Latency report {start_day:%Y-%m-%d} to {end_day:%Y-%m-%d} (UTC)",
+        'summary': f"{stats.measured:,} of {stats.rows:,} interactions have a response_time (ms); "
+                   f"quantiles within {stats.relative_accuracy:.0%}",
+        'tables': tables
+    }
+
+
+def text_report(report: Dict) -> str:
+    lines = [report['title'], report['summary']]
+    for section in report['tables']:
+        lines += ['', section['title']]
+        if not section['rows']:
+            lines.append('  (none)')
+            continue
+        widths = [max(len(str(cell)) for cell in column) for column in zip(section['headers'], *section['rows'])]
+        for row in [section['headers']] + section['rows']:
+            # Text columns left-aligned, numbers right-aligned
+            lines.append('  ' + '  '.join(cell.rjust(width) if cell[:1].isdigit() or cell[:1] in '-+' else
+                                          cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+    return '\n'.join(lines) + '\n'
+
+
+def html_report(report: Dict) -> str:
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8">',
+        f"<title>{html.escape(report['title'])}</title>",
+        '<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:2em}'
+        'th,td{border:1px solid #ccc;padding:2px 8px;text-align:right}th{background:#f0f0f0}'
+        'td:first-child{text-align:left}.missed{color:#b00;font-weight:bold}</style></head><body>',
+        f"<h1>{html.escape(report['title'])}</h1><p>{html.escape(report['summary'])}</p>"
+    ]
+    for section in report['tables']:
+        parts.append(f"<h2>{html.escape(section['title'])}</h2>")
+        if not section['rows']:
+            parts.append('<p>None.</p>')
+            continue
+        parts.append('<table><tr>' + ''.join(f"<th>{html.escape(h)}</th>" for h in section['headers']) + '</tr>')
+        for row in section['rows']:
+            parts.append('<tr>' + ''.join(
+                f"<td class=\"missed\">{html.escape(cell)}</td>" if cell == 'MISSED' else f"<td>{html.escape(cell)}</td>"
+                for cell in row) + '</tr>')
+        parts.append('</table>')
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def parse_slo(specs: List[str]) -> Dict[float, float]:
+    """['p90=5000', 'p99=15000'] as {0.9: 5000.0, 0.99: 15000.0}."""
+    targets = {}
+    for spec in specs:
+        name, _, value = spec.partition('=')
+        if not name.startswith('p') or not value:
+            raise ValueError(f"SLO '{spec}' should look like p99=8000")
+        targets[float(name[1:]) / 100] = float(value)
+    return targets
+
+
+def main():
+    """Build the latency report and print or save it."""
+    parser = argparse.ArgumentParser(description='Latency percentiles, regressions and SLOs from logged response_time')
+    parser.add_argument('--days', '-d', type=int, default=DEFAULT_DAYS,
+                        help=f'Days of interactions to read (default: {DEFAULT_DAYS})')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help=f'Days per comparison window (default: {DEFAULT_WINDOW})')
+    parser.add_argument('--model', '-m', help='Only this model')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help=f'Relative rise that counts as a regression (default: {DEFAULT_REGRESSION_THRESHOLD})')
+    parser.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help=f'Smallest rise in ms that counts as a regression (default: {DEFAULT_MIN_DELTA_MS})')
+    parser.add_argument('--min-count', type=int, default=DEFAULT_MIN_COUNT,
+                        help=f'Interactions needed in both windows to compare a group (default: {DEFAULT_MIN_COUNT})')
+    parser.add_argument('--slo', nargs='+', default=[], metavar='pNN=MS',
+                        help='Latency targets for the last window, e.g. p90=5000 p99=15000')
+    parser.add_argument('--accuracy', type=float, default=DEFAULT_RELATIVE_ACCURACY,
+                        help=f'Relative accuracy of the quantiles (default: {DEFAULT_RELATIVE_ACCURACY})')
+    parser.add_argument('--html', metavar='FILE', help='Also write the report as HTML')
+    parser.add_argument('--offline', action='store_true',
+                        help='Use the local interaction cache without syncing from Firebase')
+    parser.add_argument('--store', metavar='URL',
+                        help='Interaction store to read: firestore, sqlite[:path] or memory '
+                             '(default: $INTERACTION_STORE or firestore)')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit with status 1 when a regression or missed SLO is found')
+    args = parser.parse_args()
+
+    try:
+        targets = parse_slo(args.slo)
+    except ValueError as e:
+        parser.error(str(e))
+
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'psip-navigator')
+    end_day = datetime.now(timezone.utc)
+    start_date = datetime.now() - timedelta(days=args.days)
+
+    interactions = interactions_since(start_date, args.model, args.offline, store=args.store)
+    stats = collect_latency(interactions, args.accuracy)
+    if not stats.measured:
+        print("❌ No interactions with a response_time found")
+        sys.exit(1)
+
+    regressions = find_regressions(stats, end_day, args.window, args.threshold, args.min_delta, args.min_count) \
+        if args.days >= 2 * args.window else None
+    slo = check_slo(stats, targets, end_day, args.window) if targets else None
+    report = build_report(stats, end_day, args.days, args.window, regressions, slo)
+
+    print(text_report(report), end='')
+    if regressions is None:
+        print(f"\n💡 Regression checks need --days of at least twice --window ({2 * args.window})")
+    if args.html:
+        with open(args.html, 'w', encoding='utf-8') as f:
+            f.write(html_report(report))
+        print(f"\n📁 HTML report: {args.html}")
+
+    failed = bool(regressions) or any(not s['met'] for s in slo or [])
+    sys.exit(1 if args.fail_on_regression and failed else 0)
+
+
+if __name__ == "__main__":
+    main()
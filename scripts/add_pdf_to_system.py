@@ -1,36 +1,108 @@
 """
 Script to add new PDF documents to the system without reprocessing existing ones.
-This script intelligently checks which PDFs are already in ChromaDB and only adds new ones.
+A content-hash manifest (data/ingestion_manifest.json) tracks every ingested file and
+page, so only new or changed pages are re-extracted and re-embedded.
+
+Changes are applied to a copy of the live index version (collection, chunk store,
+benefit facts, manifest), which is validated and then published through the
+index pointer; running backends switch to it without ever seeing a partial update.
 """
 
 import os
-import json
 import sys
+import time
+import shutil
+import argparse
 from datetime import datetime
-import PyPDF2
-import pdfplumber
 import chromadb
 from sentence_transformers import SentenceTransformer
-import re
 from typing import List, Dict
 
+from adjacency_index import build_adjacency_index, save_adjacency_index
+from ingestion import StreamingIngestor, page_to_chunks
+from pdf_extraction import PageExtractor
+from chunking import (
+    Chunker, DEFAULT_CHUNKER, split_text_into_chunks, add_chunker_arguments, chunker_from_args
+)
+from ingestion_manifest import IngestionManifest, DEFAULT_MANIFEST_PATH, ingestion_lock
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_PATH
+from chunk_store import ChunkStore, DEFAULT_STORE_PATH
+from dedupe import NearDuplicateDetector, DEFAULT_THRESHOLD
+from benefit_facts import BenefitFactStore, ingest_facts, DEFAULT_FACTS_PATH
+from compressed_index import carry_over
+from index_versions import (
+    IndexPointer, new_version_record, record_path, copy_collection, copy_sqlite, validate_collection,
+    prune_versions, DEFAULT_POINTER_PATH
+)
+
 class SmartPDFVectorizer:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        """Initialize the PDF vectorizer with a sentence transformer model."""
-        self.model = SentenceTransformer(model_name)
-        self.client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.client.get_or_create_collection(
-            name="benefits_documents",
-            metadata={"hnsw:space": "cosine"}
-        )
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", manifest_path: str = DEFAULT_MANIFEST_PATH,
+                 embedding_cache_path: str = DEFAULT_CACHE_PATH, chunk_store_path: str = DEFAULT_STORE_PATH,
+                 dedupe_threshold: float = DEFAULT_THRESHOLD, chunker: Chunker = DEFAULT_CHUNKER,
+                 benefit_facts_path: str = DEFAULT_FACTS_PATH, pointer_path: str = DEFAULT_POINTER_PATH):
+        """Initialize the PDF vectorizer; the model and ChromaDB are opened on first use."""
+        self.model_name = model_name
+        self.chunker = chunker
+        self.benefit_facts_path = benefit_facts_path
+        # Each run publishes a new index version built from the live one
+        self.pointer = IndexPointer(pointer_path)
+        self.manifest_path = manifest_path
+        self.embedding_cache_path = embedding_cache_path
+        self.chunk_store_path = chunk_store_path
+        self.dedupe_threshold = dedupe_threshold
+        self._model = None
+        self._client = None
+        self._collection = None
+    
+    @property
+    def model(self) -> SentenceTransformer:
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+    
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = chromadb.PersistentClient(path="./chroma_db")
+        return self._client
+    
+    def open_collection(self, name: str):
+        return self.client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+    
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = self.open_collection(self.pointer.active_collection())
+        return self._collection
         
+    def refresh_index_pointer(self) -> None:
+        """Follow a rebuild or rollback that switched the live index version since the last run."""
+        self.pointer = IndexPointer(self.pointer.path)
+        if self._collection is not None and self._collection.name != self.pointer.active_collection():
+            self._collection = None
+    
+    def version_path(self, key: str, default: str) -> str:
+        """A file of the live index version; the given path when the live index is unversioned."""
+        return record_path(self.pointer.active, key, default)
+    
+    def open_chunk_store(self, path: str) -> ChunkStore:
+        """Open the chunk store, seeding it from a legacy pdf_metadata.json once."""
+        chunk_store = ChunkStore(path)
+        if not len(chunk_store) and os.path.exists('pdf_metadata.json'):
+            count = chunk_store.import_metadata('pdf_metadata.json')
+            print(f"📥 Seeded chunk store with {count} chunks from pdf_metadata.json")
+        return chunk_store
+    
     def get_processed_files(self) -> set:
         """Get list of PDF files that have already been processed."""
-        processed = set()
+        manifest = IngestionManifest.load(self.version_path('manifest', self.manifest_path))
+        if manifest.files:
+            return set(manifest.files)
         
-        # Try to get all documents to see what's already there
+        # No manifest yet: read only metadatas (not documents) from ChromaDB
+        processed = set()
         try:
-            results = self.collection.get()
+            results = self.collection.get(include=["metadatas"])
             if results and results.get('metadatas'):
                 for metadata in results['metadatas']:
                     if metadata and 'source_file' in metadata:
@@ -45,26 +117,14 @@ class SmartPDFVectorizer:
         chunks = []
         
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page_num, page in enumerate(pdf.pages, 1):
-                    text = page.extract_text()
-                    if text:
-                        # Split text into smaller chunks (around 500 characters)
-                        text_chunks = self._split_text_into_chunks(text, chunk_size=500)
-                        
-                        for chunk_idx, chunk_text in enumerate(text_chunks):
-                            chunks.append({
-                                'text': chunk_text.strip(),
-                                'page': page_num,
-                                'chunk': chunk_idx,
-                                'source': os.path.basename(pdf_path),
-                                'metadata': {
-                                    'page_number': page_num,
-                                    'chunk_index': chunk_idx,
-                                    'source_file': os.path.basename(pdf_path),
-                                    'added_at': datetime.now().isoformat()
-                                }
-                            })
+            with PageExtractor(pdf_path) as extractor:
+                for page_num in range(1, len(extractor) + 1):
+                    text = extractor.extract_text(page_num)
+                    # Split text into smaller chunks (around 500 characters)
+                    chunks.extend(page_to_chunks(
+                        text, page_num, os.path.basename(pdf_path),
+                        {'added_at': datetime.now().isoformat()}, self.chunker
+                    ))
         except Exception as e:
             print(f"Error processing {pdf_path}: {str(e)}")
             
@@ -72,102 +132,283 @@ class SmartPDFVectorizer:
     
     def _split_text_into_chunks(self, text: str, chunk_size: int = 500) -> List[str]:
         """Split text into overlapping chunks."""
-        # Clean the text
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        chunks = []
-        words = text.split()
-        
-        for i in range(0, len(words), chunk_size // 6):  # Overlap by ~100 words
-            chunk_words = words[i:i + chunk_size // 6]
-            if chunk_words:
-                chunk_text = ' '.join(chunk_words)
-                if len(chunk_text.strip()) > 50:  # Only include substantial chunks
-                    chunks.append(chunk_text)
-        
-        return chunks
+        return split_text_into_chunks(text, chunk_size)
+    
+    def add_new_documents(self, pdf_directory: str = None, specific_files: List[str] = None, workers: int = 1,
+                          remove_files: List[str] = None, on_progress=None) -> Dict:
+        """Ingest new or changed PDFs, re-embedding only the pages whose content changed.
+
+        `remove_files` names ingested source files to drop (their PDFs are
+        deleted from `pdf_directory`). `on_progress(stage, pages_done,
+        pages_total, stage_seconds)` reports progress. Returns a summary with
+        chunk counts and per-stage seconds. Runs hold the ingestion lock, so
+        concurrent callers wait for each other.
+        """
+        with ingestion_lock():
+            return self._add_new_documents(pdf_directory, specific_files, workers, remove_files, on_progress)
     
-    def add_new_documents(self, pdf_directory: str = None, specific_files: List[str] = None):
-        """Add only new PDF documents that haven't been processed yet."""
+    def _add_new_documents(self, pdf_directory: str, specific_files: List[str], workers: int,
+                           remove_files: List[str], on_progress) -> Dict:
+        started = time.time()
         if pdf_directory is None:
             pdf_directory = os.path.join(os.getcwd(), "assets", "pdfs")
+        self.refresh_index_pointer()
         
-        # Get already processed files
-        processed_files = self.get_processed_files()
+        manifest = IngestionManifest.load(self.version_path('manifest', self.manifest_path))
+        orphaned = []
+        removed_files = []
+        removed_paths = []
         
-        if processed_files:
-            print(f"📋 Already processed files: {', '.join(processed_files)}")
+        if not manifest.is_compatible(self.chunker.version, self.model_name):
+            if manifest.files:
+                print("⚠️  Chunker version or embedding model changed - re-ingesting every file")
+            else:
+                print("📋 No ingestion manifest found. All PDFs will be processed.")
+            orphaned.extend(manifest.reset(self.chunker.version, self.model_name))
         else:
-            print("📋 No previously processed files found. All PDFs will be processed.")
+            print(f"📋 Already ingested files: {', '.join(sorted(manifest.files))}")
         
-        # Determine which files to process
-        if specific_files:
-            # For specific files, keep the full paths
-            files_to_process = [f for f in specific_files if os.path.basename(f) not in processed_files]
+        for source_file in remove_files or []:
+            if source_file not in manifest.files:
+                raise ValueError(f"{source_file} has not been ingested")
+            print(f"  🗑️  Removing {source_file} and its chunks")
+            orphaned.extend(manifest.remove_file(source_file))
+            removed_files.append(source_file)
+            removed_paths.append(os.path.join(pdf_directory, source_file))
+        
+        # Determine which files to check
+        if remove_files and not specific_files:
+            candidates = []
+        elif specific_files:
+            candidates = list(specific_files)
         else:
-            all_pdfs = [f for f in os.listdir(pdf_directory) if f.endswith('.pdf')]
-            files_to_process = [f for f in all_pdfs if f not in processed_files]
-        
-        if not files_to_process:
-            print("✅ No new files to process! All PDFs have already been vectorized.")
-            return
-        
-        print(f"🔄 Processing {len(files_to_process)} new file(s)...")
-        
-        all_chunks = []
-        for pdf_path in files_to_process:
-            print(f"  Processing {os.path.basename(pdf_path)}...")
-            chunks = self.extract_text_from_pdf(pdf_path)
-            all_chunks.extend(chunks)
-            print(f"  ✅ Extracted {len(chunks)} chunks from {os.path.basename(pdf_path)}")
-        
-        if not all_chunks:
-            print("❌ No content extracted from PDFs.")
-            return
-        
-        print(f"📊 Total chunks extracted: {len(all_chunks)}")
-        
-        # Generate embeddings
-        print("🤖 Generating embeddings...")
-        texts = [chunk['text'] for chunk in all_chunks]
-        embeddings = self.model.encode(texts)
-        
-        # Store in ChromaDB
-        ids = [f"{chunk['source']}_page{chunk['page']}_chunk{chunk['chunk']}" for chunk in all_chunks]
-        metadatas = [chunk['metadata'] for chunk in all_chunks]
-        
-        self.collection.add(
-            embeddings=embeddings.tolist(),
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
+            all_pdfs = sorted(f for f in os.listdir(pdf_directory) if f.endswith('.pdf'))
+            candidates = [os.path.join(pdf_directory, f) for f in all_pdfs]
+            
+            # Files deleted from the directory lose their chunks
+            for source_file in sorted(set(manifest.files) - set(all_pdfs)):
+                print(f"  🗑️  {source_file} no longer exists - removing its chunks")
+                orphaned.extend(manifest.remove_file(source_file))
+                removed_files.append(source_file)
+        
+        pending = {}
+        for pdf_path in candidates:
+            if manifest.is_unchanged(pdf_path):
+                continue
+            sha, page_hashes, changed_pages, removed_ids = manifest.diff_file(pdf_path)
+            orphaned.extend(removed_ids)
+            if not changed_pages and not removed_ids:
+                # Touched but byte-identical
+                manifest.touch_file(pdf_path)
+                continue
+            pending[pdf_path] = (sha, page_hashes, changed_pages)
+            print(f"  🔍 {os.path.basename(pdf_path)}: {len(changed_pages)} of {len(page_hashes)} page(s) changed")
+        
+        if not pending and not orphaned:
+            # Only file timestamps changed, which nothing serves from
+            manifest.save()
+            print(f"✅ No new or changed files ({(time.time() - started) * 1000:.0f} ms)")
+            return {'chunks_written': 0, 'chunks_removed': 0, 'stage_seconds': {}}
+        
+        # Re-extract only the changed pages and stream them through embed/upsert batches
+        pages_by_file = {pdf_path: changed for pdf_path, (_, _, changed) in pending.items()}
+        embedding_cache = EmbeddingCache(self.embedding_cache_path) if self.embedding_cache_path else None
+        ingestor = StreamingIngestor(self.model, self.collection, workers=workers,
+                                     embedding_cache=embedding_cache, model_name=self.model_name,
+                                     chunker=self.chunker)
+        
+        build = self.start_build(ingestor, list(pending), pages_by_file)
+        try:
+            summary = self.update_build(build, ingestor, manifest, pending, pages_by_file, orphaned,
+                                        removed_files, on_progress)
+        except Exception:
+            self.drop_build(build)
+            raise
+        
+        # The live index no longer refers to removed files
+        for pdf_path in removed_paths:
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+        return summary
+    
+    def start_build(self, ingestor: StreamingIngestor, pdf_paths: List[str],
+                    pages_by_file: Dict[str, List[int]]) -> Dict:
+        """Copy the live version into a new one for this run, or pick up this run's interrupted build."""
+        build = self.pointer.building
+        checkpoint = ingestor.checkpoint(pdf_paths, pages_by_file)
+        if build and build.get('incremental') and checkpoint.resumed_pages and not checkpoint.invalidated:
+            print(f"🔁 Resuming index build {build['collection']}")
+            self._collection = ingestor.collection = self.open_collection(build['collection'])
+            return build
+        
+        # Pages checkpointed by an abandoned build are not in this one
+        checkpoint.clear()
+        live = self.pointer.active
+        build = dict(new_version_record(), incremental=True)
+        self.pointer.start_build(build)
+        
+        target = self.open_collection(build['collection'])
+        copied = copy_collection(self.collection, target)
+        copy_sqlite(record_path(live, 'chunk_store', self.chunk_store_path), build['chunk_store'])
+        if self.benefit_facts_path:
+            copy_sqlite(record_path(live, 'benefit_facts', self.benefit_facts_path), build['benefit_facts'])
+        self._collection = ingestor.collection = target
+        print(f"🏗️  Building index version {build['collection']} from {copied} live chunks")
+        return build
+    
+    def update_build(self, build: Dict, ingestor: StreamingIngestor, manifest: IngestionManifest, pending: Dict,
+                     pages_by_file: Dict[str, List[int]], orphaned: List[str], removed_files: List[str],
+                     on_progress) -> Dict:
+        """Apply this run's changes to the build, then validate and publish it."""
+        manifest.path = build['manifest']
+        chunk_store = self.open_chunk_store(build['chunk_store'])
+        if self.dedupe_threshold is not None:
+            ingestor.deduper = NearDuplicateDetector(chunk_store, self.dedupe_threshold)
+            # Chunks already known to be going away should not absorb new duplicates
+            ingestor.deduper.forget(orphaned)
+        pages_total = sum(len(pages) for pages in pages_by_file.values())
+        
+        def report_pages(pages_done, stats):
+            if on_progress:
+                on_progress('ingest', pages_done, pages_total, stats.seconds)
+        
+        result = ingestor.run(
+            list(pending), pages_by_file,
+            extra_metadata={'added_at': datetime.now().isoformat()},
+            on_batch=chunk_store.upsert_chunks,
+            on_progress=report_pages
         )
+        if on_progress:
+            on_progress('finalize', pages_total, pages_total, ingestor.stats.seconds)
+        finalize_started = time.perf_counter()
+        ingested = result['chunk_ids_by_page']
+        ids = [chunk_id for pages in ingested.values() for page_ids in pages.values() for chunk_id in page_ids]
+        print(f"✅ Successfully vectorized and stored {len(ids)} chunks")
+        
+        # Chunks that changed pages no longer produce become orphans
+        chunk_ids_by_page = {}
+        for pdf_path, changed_pages in pages_by_file.items():
+            source_file = os.path.basename(pdf_path)
+            file_pages = ingested.get(source_file, {})
+            for page_num in changed_pages:
+                if page_num in file_pages:
+                    stale = set(manifest.page_chunk_ids(source_file, page_num)) - set(file_pages[page_num])
+                    orphaned.extend(sorted(stale))
+            chunk_ids_by_page[pdf_path] = file_pages
+        
+        orphaned = sorted(set(orphaned) - set(ids))
+        if orphaned:
+            self.collection.delete(ids=orphaned)
+            print(f"🗑️  Deleted {len(orphaned)} orphaned chunks")
+        
+        # Orphaned chunks leave the store; re-ingested ones were upserted batch by batch.
+        # Near-duplicates of a deleted chunk get a new canonical chunk, which must be embedded.
+        promoted = chunk_store.promote_aliases(orphaned)
+        chunk_store.delete(orphaned)
+        if promoted:
+            promoted_ids = [chunk['id'] for chunk in promoted]
+            ingestor.embed_and_upsert(promoted, promoted_ids)
+            ingestor.refresh_locations(promoted_ids)
+            print(f"🧬 Re-embedded {len(promoted)} near-duplicate chunk(s) whose original was removed")
+        print(f"💾 Updated chunk store: {len(ids)} chunks written, {len(orphaned)} removed")
+        
+        for pdf_path, (sha, page_hashes, changed_pages) in pending.items():
+            # Pages that failed to extract are stored without a hash, so the next run retries them
+            failed = set(changed_pages) - set(chunk_ids_by_page[pdf_path])
+            page_hashes = {p: (None if p in failed else h) for p, h in page_hashes.items()}
+            manifest.record_file(pdf_path, sha, page_hashes, chunk_ids_by_page[pdf_path])
+        manifest.save()
+        print(f"🧾 Updated ingestion manifest: {manifest.path}")
         
-        print(f"✅ Successfully vectorized and stored {len(all_chunks)} new chunks")
+        # Rebuild neighbor links over the full corpus so the new file is included
+        adjacency = build_adjacency_index(chunk_store.iter_keys(canonical_only=True))
+        save_adjacency_index(adjacency, build['adjacency_index'])
+        print("🔗 Updated chunk adjacency index")
         
-        # Update metadata for reference
-        existing_metadata = []
-        if os.path.exists('pdf_metadata.json'):
-            with open('pdf_metadata.json', 'r') as f:
-                existing_metadata = json.load(f)
+        if self.benefit_facts_path:
+            self.update_benefit_facts(build['benefit_facts'], list(pending), removed_files)
         
-        existing_metadata.extend(all_chunks)
+        # Removing a large file can legitimately shrink the index below the usual floor
+        self.publish_build(build, len(chunk_store) - chunk_store.count_aliases(), check_baseline=not removed_files)
+        chunk_store.close()
         
-        with open('pdf_metadata.json', 'w') as f:
-            json.dump(existing_metadata, f, indent=2)
+        ingestor.stats.add('finalize', time.perf_counter() - finalize_started, len(pending) + len(removed_files))
+        return {
+            'chunks_written': len(ids),
+            'chunks_removed': len(orphaned),
+            'failed_pages': len(result['failed']),
+            'version': build['version'],
+            'stage_seconds': dict(ingestor.stats.seconds)
+        }
+    
+    def publish_build(self, build: Dict, expected_count: int, check_baseline: bool = True) -> None:
+        """Validate the updated version and atomically make it the live index; raises if it is broken."""
+        live_name = self.pointer.active_collection()
+        live_count = None
+        if check_baseline and live_name in [c.name for c in self.client.list_collections()]:
+            live_count = self.client.get_collection(live_name).count()
+        
+        report = validate_collection(self.collection, self.model.encode, expected_count, live_count)
+        if not report['ok']:
+            raise RuntimeError(f"Index version {build['collection']} failed validation, {live_name} stays live: "
+                               + "; ".join(report['problems']))
         
-        print(f"💾 Updated metadata file: {len(all_chunks)} new documents added")
+        if carry_over(self.pointer.active, build, self.collection):
+            print(f"🗜️  Built a compressed index for {build['collection']}")
+        self.pointer.activate(dict(build, chunks=report['count']))
+        print(f"✅ Published {build['collection']} ({report['count']} chunks); previous: {live_name}")
+        removed = prune_versions(self.client, self.pointer)
+        if removed:
+            print(f"🧹 Pruned {len(removed)} old index version(s)")
+    
+    def drop_build(self, build: Dict) -> None:
+        """Discard a failed build; the live version was never touched."""
+        self._collection = None
+        if build['collection'] in [c.name for c in self.client.list_collections()]:
+            self.client.delete_collection(build['collection'])
+        shutil.rmtree(build['files_dir'], ignore_errors=True)
+        self.pointer = IndexPointer(self.pointer.path)
+        if self.pointer.building and self.pointer.building['version'] == build['version']:
+            self.pointer.building = None
+            self.pointer.save()
+    
+    def update_benefit_facts(self, path: str, pdf_paths: List[str], removed_files: List[str]) -> None:
+        """Re-extract the benefit tables of changed files for the /ask fact lookup."""
+        store = BenefitFactStore(path)
+        for source_file in removed_files:
+            store.delete_source(source_file)
+        stored, rejected = ingest_facts(pdf_paths, store)
+        print(f"📋 Updated benefit facts: {stored} from {len(pdf_paths)} file(s), {rejected} rejected, "
+              f"{len(store)} total")
+        store.close()
 
 def main():
     """Main function to add new PDFs to the system."""
-    print("🚀 Smart PDF Vectorizer - Add New Documents Only")
+    print("🚀 Smart PDF Vectorizer - Add New or Changed Documents")
     print("=" * 60)
     
-    vectorizer = SmartPDFVectorizer()
+    parser = argparse.ArgumentParser(description='Add new PDFs to ChromaDB')
+    parser.add_argument('pdf_path', nargs='?', help='Specific PDF to add (default: all new PDFs in assets/pdfs)')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                       help='Processes for extraction and embedding (0 = all cores, default: 1)')
+    parser.add_argument('--no-embedding-cache', action='store_true',
+                       help=f'Re-embed every chunk instead of reusing {DEFAULT_CACHE_PATH}')
+    parser.add_argument('--no-dedupe', action='store_true', help='Embed near-duplicate chunks too')
+    parser.add_argument('--no-benefit-facts', action='store_true',
+                       help=f'Skip extracting benefit tables into {DEFAULT_FACTS_PATH}')
+    add_chunker_arguments(parser)
+    args = parser.parse_args()
+    
+    vectorizer = SmartPDFVectorizer(
+        embedding_cache_path=None if args.no_embedding_cache else DEFAULT_CACHE_PATH,
+        dedupe_threshold=None if args.no_dedupe else DEFAULT_THRESHOLD,
+        chunker=chunker_from_args(args, "all-MiniLM-L6-v2"),
+        benefit_facts_path=None if args.no_benefit_facts else DEFAULT_FACTS_PATH
+    )
     
     # Check if specific file path is provided
-    if len(sys.argv) > 1:
-        pdf_path = sys.argv[1]
+    if args.pdf_path:
+        pdf_path = args.pdf_path
         if not os.path.exists(pdf_path):
             print(f"❌ Error: File not found: {pdf_path}")
             sys.exit(1)
@@ -176,12 +417,12 @@ def main():
             sys.exit(1)
         
         print(f"📄 Processing specific file: {pdf_path}")
-        vectorizer.add_new_documents(specific_files=[pdf_path])
+        vectorizer.add_new_documents(specific_files=[pdf_path], workers=args.workers)
     else:
         # Process all new PDFs in assets/pdfs
         pdf_dir = os.path.join(os.getcwd(), "assets", "pdfs")
         print(f"📁 Looking for new PDFs in: {pdf_dir}")
-        vectorizer.add_new_documents(pdf_dir)
+        vectorizer.add_new_documents(pdf_dir, workers=args.workers)
     
     print("\n✨ Done! Your new documents are now available in the chatbot.")
 
@@ -0,0 +1,189 @@
+"""
+Chunk adjacency index for neighbor-context expansion.
+
+Chunks are cut into windows within a page, so an answer can straddle two
+chunks. This index records, for every chunk ID, its position in its source
+file and the IDs of the previous and next chunks, so /ask can pull neighbors
+with a single lookup instead of widening the vector search.
+"""
+
+import os
+import sys
+import json
+from typing import List, Dict
+
+DEFAULT_INDEX_PATH = "chunk_adjacency.json"
+
+
+def make_chunk_id(source_file: str, page_number: int, chunk_index: int) -> str:
+    """Build the Chroma ID used for a chunk."""
+    return f"{source_file}_page{page_number}_chunk{chunk_index}"
+
+
+def build_adjacency_index(chunks: List[Dict]) -> Dict:
+    """Build the adjacency index from vectorizer chunk dicts."""
+    by_source = {}
+    for chunk in chunks:
+        key = (chunk['source'], chunk['page'], chunk['chunk'])
+        by_source.setdefault(chunk['source'], {})[key] = chunk.get('id') or make_chunk_id(*key)
+
+    entries = {}
+    for keyed in by_source.values():
+        keys = sorted(keyed)
+        ordered = [keyed[key] for key in keys]
+        for pos, chunk_id in enumerate(ordered):
+            source_file, page_number, chunk_index = keys[pos]
+            entries[chunk_id] = {
+                'source_file': source_file,
+                'page_number': page_number,
+                'chunk_index': chunk_index,
+                'position': pos,
+                'prev': ordered[pos - 1] if pos > 0 else None,
+                'next': ordered[pos + 1] if pos + 1 < len(ordered) else None
+            }
+
+    return {'version': 1, 'entries': entries}
+
+
+def save_adjacency_index(index: Dict, path: str = DEFAULT_INDEX_PATH) -> None:
+    """Write the index atomically so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+def _join_overlapping(left: str, right: str, min_overlap: int = 8) -> str:
+    """Join two consecutive chunk texts, dropping the words they overlap on.
+
+    Heading-aware chunks repeat their section heading at the start of every
+    chunk; a heading shared with the left chunk is dropped along with the
+    overlap.
+    """
+    left_words = left.split()
+    right_words = right.split()
+
+    shared_prefix = 0
+    while (shared_prefix < min(len(left_words), len(right_words))
+           and left_words[shared_prefix] == right_words[shared_prefix]):
+        shared_prefix += 1
+
+    for skip in ([0, shared_prefix] if shared_prefix else [0]):
+        rest = right_words[skip:]
+        # Short matches are treated as coincidence rather than chunk overlap
+        for size in range(min(len(left_words), len(rest)), min_overlap - 1, -1):
+            if left_words[-size:] == rest[:size]:
+                return ' '.join(left_words + rest[size:])
+    return ' '.join(left_words + right_words)
+
+
+class AdjacencyIndex:
+    def __init__(self, index: Dict = None):
+        """Wrap a loaded adjacency index (empty if none is available)."""
+        self.entries = (index or {}).get('entries', {})
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH) -> 'AdjacencyIndex':
+        """Load the index from disk, returning an empty index if missing."""
+        if not os.path.exists(path):
+            print(f"Adjacency index not found at {path}; neighbor expansion disabled")
+            return cls()
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def neighbors(self, chunk_id: str, window: int = 1) -> List[str]:
+        """Return up to `window` chunk IDs on each side of a chunk, in order."""
+        entry = self.entries.get(chunk_id)
+        if entry is None:
+            return [chunk_id]
+
+        before = []
+        current = entry
+        for _ in range(window):
+            prev_id = current['prev']
+            if prev_id is None:
+                break
+            before.append(prev_id)
+            current = self.entries[prev_id]
+
+        after = []
+        current = entry
+        for _ in range(window):
+            next_id = current['next']
+            if next_id is None:
+                break
+            after.append(next_id)
+            current = self.entries[next_id]
+
+        return list(reversed(before)) + [chunk_id] + after
+
+    def merge_spans(self, hit_ids: List[str], texts: Dict[str, str], window: int = 1) -> List[Dict]:
+        """
+        Expand each hit with its neighbors and merge contiguous chunks.
+
+        Returns one span per contiguous run, ordered by the rank of the best
+        hit it contains. Chunk IDs missing from `texts` are left out.
+        """
+        rank = {}
+        wanted = set()
+        for i, hit_id in enumerate(hit_ids):
+            rank.setdefault(hit_id, i)
+            wanted.update(cid for cid in self.neighbors(hit_id, window) if cid in texts)
+
+        def sort_key(cid):
+            entry = self.entries.get(cid)
+            if entry is None:
+                return (cid, 0)
+            return (entry['source_file'], entry['position'])
+
+        spans = []
+        for cid in sorted(wanted, key=sort_key):
+            entry = self.entries.get(cid)
+            previous = spans[-1] if spans else None
+            if (previous is not None and entry is not None
+                    and previous['source_file'] == entry['source_file']
+                    and previous['last_position'] + 1 == entry['position']):
+                previous['ids'].append(cid)
+                previous['text'] = _join_overlapping(previous['text'], texts[cid])
+                previous['last_position'] = entry['position']
+            else:
+                spans.append({
+                    'ids': [cid],
+                    'text': texts[cid],
+                    'source_file': entry['source_file'] if entry else None,
+                    'last_position': entry['position'] if entry else -1
+                })
+
+        for span in spans:
+            span['rank'] = min((rank[cid] for cid in span['ids'] if cid in rank), default=len(hit_ids))
+            del span['last_position']
+
+        spans.sort(key=lambda span: span['rank'])
+        return spans
+
+
+def main():
+    """Rebuild the adjacency index from the chunk store (or a legacy metadata file)."""
+    from index_versions import active_path
+    metadata_path = sys.argv[1] if len(sys.argv) > 1 else None
+    # Defaults follow the live index version
+    output_path = sys.argv[2] if len(sys.argv) > 2 else active_path('adjacency_index', DEFAULT_INDEX_PATH)
+
+    if metadata_path and metadata_path.endswith('.json'):
+        with open(metadata_path, 'r') as f:
+            chunks = json.load(f)
+    else:
+        from chunk_store import ChunkStore, DEFAULT_STORE_PATH
+        store = ChunkStore(metadata_path or active_path('chunk_store', DEFAULT_STORE_PATH))
+        chunks = store.iter_keys(canonical_only=True)
+
+    index = build_adjacency_index(chunks)
+    save_adjacency_index(index, output_path)
+    print(f"✅ Built adjacency index for {len(index['entries'])} chunks -> {output_path}")
+
+
+if __name__ == "__main__":
+    main()
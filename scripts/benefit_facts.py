@@ -0,0 +1,523 @@
+"""
+Structured benefit facts extracted from schedule-of-benefits tables.
+
+Cost-sharing questions ("what is the copay for urgent care?") have exact
+answers sitting in the benefit tables of the plan documents. Ingestion parses
+those tables into typed facts (service, network tier, copay, coinsurance,
+deductible applicability, page) kept in data/benefit_facts.db, and the backend
+answers matching questions straight from the fact table with citations instead
+of running retrieval and an LLM call.
+
+Every fact is validated before it is stored: the numbers parsed into typed
+fields must appear among the values `ResponseScorer.extract_numerical_values`
+finds in the cell text.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import argparse
+from typing import List, Dict, Tuple, Optional, Iterable
+
+import pdfplumber
+
+from index_versions import active_path
+
+DEFAULT_FACTS_PATH = "data/benefit_facts.db"
+
+# Typed fields stored for every fact, in column order
+FACT_FIELDS = ('source_file', 'page_number', 'title', 'category', 'service', 'network', 'copay', 'copay_unit',
+               'coinsurance', 'plan_pays', 'amount', 'deductible_applies', 'covered', 'text')
+
+# Points above a table searched for its title line
+_TITLE_MARGIN = 30
+
+_COST_PATTERN = re.compile(r'\$\d|\d+(?:\.\d+)?%|\bno charge\b|\bnot covered\b', re.I)
+_COPAY_PATTERN = re.compile(r'\$([\d,]+(?:\.\d{2})?)\s*(?:copay(?:ment)?)?\s*(?:/|per\s+)?\s*'
+                            r'(visit|stay|trip|admission|prescription|supply|item|day)?', re.I)
+_DRUG_COPAY_PATTERN = re.compile(r'copay/(\w+)[^$]*\$([\d,]+(?:\.\d{2})?)', re.I)
+_AMOUNT_PATTERN = re.compile(r'\$([\d,]+(?:\.\d{2})?)\s*per\s+(?:policy|plan)\s+year', re.I)
+_COINSURANCE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)%\s*coinsurance', re.I)
+_PLAN_PAYS_PATTERN = re.compile(r'(?:plan\s+pays\s+)?(\d+(?:\.\d+)?)%\s*\(?of the', re.I)
+_NO_DEDUCTIBLE_PATTERN = re.compile(r"deductible\s+(?:doesn't|does not)\s+apply|no\s+(?:copayment\s+or\s+)?"
+                                    r"(?:policy\s+year\s+)?deductible\s+applies", re.I)
+_AFTER_DEDUCTIBLE_PATTERN = re.compile(r'after\s+(?:the\s+)?(?:policy\s+year\s+)?deductible', re.I)
+
+# Question words that only say *what kind* of answer is wanted
+_INTENT_PATTERN = re.compile(r"\b(copay\w*|co-pay\w*|coinsurance|deductible|out[- ]of[- ]pocket|oop|cost\w*|"
+                             r"pay|how much|price|charge\w*)\b", re.I)
+_OUT_OF_NETWORK_PATTERN = re.compile(r'\b(?:out[- ]of[- ]network|non[- ]network|non[- ]participating)\b', re.I)
+_IN_NETWORK_PATTERN = re.compile(r'\bin[- ]network\b', re.I)
+
+_STOPWORDS = frozenset("""
+    a an the and or of for to in on at by with without is are be do does i my me we our what whats how much
+    will would can could there this that it if when which who per any much does under plan policy year you your
+    copay copays copayment copayments co pay coinsurance cost costs price charge charges coverage covered cover
+    network out in-network out-of-network non-network provider providers services service get need see amount
+    overall annual name
+""".split())
+
+# Abbreviations and everyday wording mapped onto the wording of the tables
+_SYNONYMS = {
+    'er': ['emergency', 'room'],
+    'pcp': ['primary', 'care'],
+    'oop': ['out-of-pocket'],
+    'moop': ['out-of-pocket'],
+    'individual': ['student'],
+    'doctor': ['physician'],
+    'rx': ['prescription'],
+    'generics': ['generic'],
+    'meds': ['drugs'],
+    'medication': ['drugs'],
+    'medications': ['drugs'],
+    'xray': ['x-ray'],
+    'ambulance': ['emergency', 'medical', 'transportation'],
+    'hospitalization': ['hospital', 'stay'],
+}
+
+# Generic words that break ties but are not required to match
+_WEAK_TOKENS = frozenset(['visit', 'care', 'limit', 'maximum', 'treatment'])
+
+# Facts about one population only answer questions that name it
+_POPULATIONS = frozenset(['student', 'spouse', 'child', 'children', 'dependent', 'family', 'pediatric'])
+
+MIN_COVERAGE = 0.75
+CATEGORY_WEIGHT = 0.5
+MAX_FACTS_PER_ANSWER = 6
+
+
+def _clean(cell: Optional[str]) -> str:
+    return ' '.join((cell or '').split())
+
+
+def _number(value: str) -> float:
+    return float(value.replace(',', ''))
+
+
+def is_cost_text(text: str) -> bool:
+    """Whether a table cell states a cost (dollar amount, percentage, no charge or not covered)."""
+    return bool(_COST_PATTERN.search(text))
+
+
+def parse_cost(text: str) -> Dict:
+    """Typed cost-sharing fields of one table cell.
+
+    `coinsurance` is the member's share; cells that state what the plan pays
+    ("70% (of the recognized charge)") keep that in `plan_pays` and derive the
+    member's share from it.
+    """
+    fields = {'copay': None, 'copay_unit': None, 'coinsurance': None, 'plan_pays': None, 'amount': None,
+              'deductible_applies': None, 'covered': not re.search(r'\bnot covered\b', text, re.I)}
+
+    amount = _AMOUNT_PATTERN.search(text)
+    if amount:
+        fields['amount'] = _number(amount.group(1))
+    else:
+        drug_copay = _DRUG_COPAY_PATTERN.search(text)
+        copay = _COPAY_PATTERN.search(text)
+        if drug_copay:
+            fields['copay'] = _number(drug_copay.group(2))
+            fields['copay_unit'] = drug_copay.group(1).lower()
+        elif copay:
+            fields['copay'] = _number(copay.group(1))
+            fields['copay_unit'] = (copay.group(2) or '').lower() or None
+
+    coinsurance = _COINSURANCE_PATTERN.search(text)
+    plan_pays = _PLAN_PAYS_PATTERN.search(text)
+    if coinsurance:
+        fields['coinsurance'] = _number(coinsurance.group(1))
+    elif plan_pays:
+        fields['plan_pays'] = _number(plan_pays.group(1))
+        fields['coinsurance'] = 100.0 - fields['plan_pays']
+    if re.search(r'\bno charge\b', text, re.I) and fields['copay'] is None and fields['coinsurance'] is None:
+        fields['copay'] = 0.0
+        fields['coinsurance'] = 0.0
+
+    if _NO_DEDUCTIBLE_PATTERN.search(text):
+        fields['deductible_applies'] = False
+    elif _AFTER_DEDUCTIBLE_PATTERN.search(text):
+        fields['deductible_applies'] = True
+    return fields
+
+
+def stated_values(fact: Dict) -> List[float]:
+    """Numbers a fact claims are written in its cell text (not derived or implied)."""
+    if re.search(r'\bno charge\b', fact['text'], re.I) and not re.search(r'\d', fact['text']):
+        return []
+    values = [fact['copay'], fact['plan_pays'], fact['amount']]
+    if fact['plan_pays'] is None:
+        values.append(fact['coinsurance'])
+    return [value for value in values if value is not None]
+
+
+def validate_facts(facts: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Split facts into (valid, rejected) by checking their numbers against the cell text."""
+    from score_responses import ResponseScorer
+    scorer = ResponseScorer()
+    valid, rejected = [], []
+    for fact in facts:
+        found = scorer.extract_numerical_values(fact['text'])
+        (valid if all(value in found for value in stated_values(fact)) else rejected).append(fact)
+    return valid, rejected
+
+
+def _title_above(page, table) -> str:
+    """The text line just above a table, which names the benefit it schedules."""
+    top = table.bbox[1]
+    if top <= 0:
+        return ''
+    text = page.crop((0, max(0, top - _TITLE_MARGIN), page.width, top)).extract_text() or ''
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return lines[-1] if lines else ''
+
+
+def _make_facts(base: Dict, in_text: str, out_text: str) -> List[Dict]:
+    facts = []
+    for network, text in (('in', in_text), ('out', out_text)):
+        if text and is_cost_text(text):
+            facts.append(dict(base, network=network, text=text, **parse_cost(text)))
+    return facts
+
+
+def _coverage_table_facts(rows: List[List], title: str, page_number: int, source_file: str) -> List[Dict]:
+    """Policy tables: Description | In-network coverage | Out-of-network coverage."""
+    header = _clean(rows[0][0])
+    # "Deductible type" tables list one row per covered person
+    category = header[:-len(' type')] if header.lower().endswith(' type') else title
+    facts = []
+    for row in rows[1:]:
+        if len(row) < 3 or not _clean(row[0]):
+            continue
+        base = {'source_file': source_file, 'page_number': page_number, 'title': title,
+                'category': category, 'service': _clean(row[0])}
+        facts.extend(_make_facts(base, _clean(row[1]), _clean(row[2])))
+    return facts
+
+
+def _summary_table_facts(rows: List[List], header_index: int, title: str, page_number: int,
+                         source_file: str) -> List[Dict]:
+    """Summary of Benefits tables: event | service | in-network | out-of-network | limitations.
+
+    Merged cells shift the value columns from page to page, so the first two
+    cost cells after the service are taken as the in- and out-of-network
+    values. Rows with no cost cells continue the previous row's service name.
+    """
+    facts, category, previous, previous_value_index = [], '', [], 0
+    for row in rows[header_index + 1:]:
+        cells = [_clean(cell) for cell in row]
+        if cells and cells[0].startswith('If '):
+            category = cells[0]
+        value_indexes = [i for i, cell in enumerate(cells) if i > 0 and cell and is_cost_text(cell)]
+        filled = [i for i, cell in enumerate(cells) if i > 0 and cell]
+
+        if not value_indexes:
+            if previous and filled and max(filled) < previous_value_index:
+                fragment = ' '.join(cells[i] for i in filled)
+                for fact in previous:
+                    fact['service'] = f"{fact['service']} {fragment}"
+            else:
+                previous = []
+            continue
+
+        first = value_indexes[0]
+        service = ' '.join(cells[i] for i in filled if i < first)
+        if not service:
+            previous = []
+            continue
+        values = [cells[i] for i in value_indexes[:2]] + ['']
+        base = {'source_file': source_file, 'page_number': page_number, 'title': title,
+                'category': category, 'service': service}
+        previous = _make_facts(base, values[0], values[1])
+        previous_value_index = first
+        facts.extend(previous)
+    return facts
+
+
+def extract_page_facts(page, page_number: int, source_file: str) -> List[Dict]:
+    """Benefit facts from the cost-sharing tables on one pdfplumber page."""
+    facts = []
+    for table in page.find_tables():
+        rows = table.extract()
+        if not rows or not rows[0]:
+            continue
+        first_row = [_clean(cell).lower() for cell in rows[0]]
+        if len(first_row) >= 3 and first_row[1] == 'in-network coverage' and first_row[2] == 'out-of-network coverage':
+            facts.extend(_coverage_table_facts(rows, _title_above(page, table), page_number, source_file))
+            continue
+        header_index = next((i for i, row in enumerate(rows[:3])
+                             if any(_clean(cell).startswith('In-Network Provider') for cell in row)), None)
+        if header_index is not None:
+            facts.extend(_summary_table_facts(rows, header_index, _title_above(page, table), page_number,
+                                              source_file))
+    return facts
+
+
+def extract_facts(pdf_path: str) -> List[Dict]:
+    """Benefit facts from every cost-sharing table in a PDF."""
+    source_file = os.path.basename(pdf_path)
+    facts = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_number, page in enumerate(pdf.pages, 1):
+            facts.extend(extract_page_facts(page, page_number, source_file))
+    return facts
+
+
+class BenefitFactStore:
+    def __init__(self, path: str = DEFAULT_FACTS_PATH):
+        """Open (or create) the fact table."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS facts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_file TEXT NOT NULL,
+                page_number INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                category TEXT NOT NULL,
+                service TEXT NOT NULL,
+                network TEXT NOT NULL,
+                copay REAL,
+                copay_unit TEXT,
+                coinsurance REAL,
+                plan_pays REAL,
+                amount REAL,
+                deductible_applies INTEGER,
+                covered INTEGER NOT NULL,
+                text TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_facts_source ON facts (source_file)")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def replace_source(self, source_file: str, facts: List[Dict]) -> None:
+        """Swap in the facts extracted from one source file."""
+        self.conn.execute("DELETE FROM facts WHERE source_file = ?", (source_file,))
+        self.conn.executemany(
+            f"INSERT INTO facts ({', '.join(FACT_FIELDS)}) VALUES ({', '.join('?' * len(FACT_FIELDS))})",
+            [tuple(fact[field] for field in FACT_FIELDS) for fact in facts]
+        )
+        self.conn.commit()
+
+    def delete_source(self, source_file: str) -> None:
+        self.conn.execute("DELETE FROM facts WHERE source_file = ?", (source_file,))
+        self.conn.commit()
+
+    def iter_facts(self) -> Iterable[Dict]:
+        for row in self.conn.execute(f"SELECT {', '.join(FACT_FIELDS)} FROM facts ORDER BY id"):
+            fact = dict(zip(FACT_FIELDS, row))
+            for flag in ('deductible_applies', 'covered'):
+                if fact[flag] is not None:
+                    fact[flag] = bool(fact[flag])
+            yield fact
+
+    def sources(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT source_file FROM facts ORDER BY source_file")]
+
+
+def ingest_facts(pdf_paths: List[str], store: BenefitFactStore) -> Tuple[int, int]:
+    """Extract, validate and store the facts of each PDF; returns (stored, rejected) counts."""
+    stored = rejected = 0
+    for pdf_path in pdf_paths:
+        valid, invalid = validate_facts(extract_facts(pdf_path))
+        store.replace_source(os.path.basename(pdf_path), valid)
+        stored += len(valid)
+        rejected += len(invalid)
+        for fact in invalid:
+            print(f"  ⚠️  Rejected fact {fact['source_file']} p{fact['page_number']}: "
+                  f"{fact['service'][:50]!r} -> {fact['text'][:60]!r}")
+    return stored, rejected
+
+
+def _tokens(text: str, drop_stopwords: bool = False) -> List[str]:
+    words = re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", re.sub(r"['’]s\b", '', text.lower()))
+    tokens = []
+    for word in words:
+        for token in _SYNONYMS.get(word, [word]):
+            if drop_stopwords and token in _STOPWORDS:
+                continue
+            # Cheap plural folding so "visits" matches "visit"
+            if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+                token = token[:-1]
+            tokens.append(token)
+    return tokens
+
+
+def _content_tokens(text: str) -> set:
+    return set(_tokens(text, drop_stopwords=True))
+
+
+def _populations(tokens: set) -> set:
+    return {'child' if token == 'children' else token for token in tokens & _POPULATIONS}
+
+
+def question_network(question: str) -> Optional[str]:
+    """'in', 'out' or None when the question does not name a network tier."""
+    if _OUT_OF_NETWORK_PATTERN.search(question):
+        return 'out'
+    if _IN_NETWORK_PATTERN.search(question):
+        return 'in'
+    return None
+
+
+class FactIndex:
+    def __init__(self, facts: List[Dict]):
+        """In-memory lookup over the fact table (a few hundred rows)."""
+        self.facts = facts
+        self.groups = {}
+        for fact in facts:
+            key = (fact['source_file'], fact['page_number'], fact['category'], fact['service'])
+            group = self.groups.setdefault(key, [])
+            # Tables repeated on a page yield the same row twice
+            if not any(f['network'] == fact['network'] and f['text'] == fact['text'] for f in group):
+                group.append(fact)
+        self.service_tokens = {key: _content_tokens(key[3]) for key in self.groups}
+        self.category_tokens = {key: _content_tokens(key[2]) - self.service_tokens[key] for key in self.groups}
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_FACTS_PATH) -> "FactIndex":
+        if not os.path.exists(path):
+            return cls([])
+        store = BenefitFactStore(path)
+        try:
+            return cls(list(store.iter_facts()))
+        finally:
+            store.close()
+
+    def __len__(self) -> int:
+        return len(self.facts)
+
+    def match(self, question: str) -> List[Dict]:
+        """Facts that answer a cost-sharing question, or [] when no table row clearly does."""
+        if not self.facts or not _INTENT_PATTERN.search(question):
+            return []
+        # Deductible and out-of-pocket words name the benefit as well as the intent
+        query = _content_tokens(question) | {token for token in ('deductible', 'out-of-pocket')
+                                             if token in _tokens(question)}
+        if not query:
+            return []
+        asked_populations = _populations(query)
+        required = query - _WEAK_TOKENS or query
+        network = question_network(question)
+
+        scored = []
+        for key, service_tokens in self.service_tokens.items():
+            if network is not None and not any(f['network'] == network for f in self.groups[key]):
+                continue
+            category_weight = CATEGORY_WEIGHT
+            populations = _populations(service_tokens)
+            if service_tokens <= _POPULATIONS | {'each'}:
+                # Rows of a per-person table (Deductible type | Student, Spouse, ...) are
+                # named by their table; a question naming nobody gets every row
+                category_weight = 1.0
+                if asked_populations and not populations <= asked_populations:
+                    continue
+            elif not populations <= asked_populations:
+                # A row scoped to a population only answers questions naming it
+                continue
+            # Words only found in the table title or event column count less
+            category_tokens = self.category_tokens[key]
+            matched = len(required & service_tokens) + category_weight * len(required & category_tokens)
+            coverage = matched / len(required)
+            if coverage < MIN_COVERAGE:
+                continue
+            tokens = service_tokens | category_tokens
+            scored.append(((coverage, len(query & tokens), len(query & service_tokens) / max(len(service_tokens), 1)),
+                           key))
+        if not scored:
+            return []
+
+        best = max(score for score, _ in scored)
+        keys = [key for score, key in scored if score == best]
+        # Several rows scoring alike (e.g. deductible per covered person) are all cited
+        facts = [fact for key in keys for fact in self.groups[key] if network is None or fact['network'] == network]
+        return facts[:MAX_FACTS_PER_ANSWER]
+
+    def answer(self, question: str) -> Optional[Dict]:
+        """{'answer', 'facts', 'sources'} for a question the fact table answers exactly, else None."""
+        facts = self.match(question)
+        if not facts:
+            return None
+        return {'answer': format_answer(facts), 'facts': facts,
+                'sources': sorted({(f['source_file'], f['page_number']) for f in facts})}
+
+
+def format_answer(facts: List[Dict]) -> str:
+    """Quote each matching table row with its network tier and page citation."""
+    labels = {'in': 'In-network', 'out': 'Out-of-network'}
+    lines, rows = [], {}
+    for fact in facts:
+        rows.setdefault((fact['source_file'], fact['page_number'], fact['category'], fact['service']), []).append(fact)
+    for (source_file, page_number, category, service), row_facts in rows.items():
+        name = service if category in ('', service) or len(category) > 60 else f"{category} – {service}"
+        values = '; '.join(f"{labels[f['network']]}: {f['text']}" for f in row_facts)
+        lines.append(f"• {name}: {values} [{source_file}, page {page_number}]")
+    return "According to your plan's schedule of benefits:\n" + "\n".join(lines)
+
+
+def main():
+    """Build the benefit fact table, look up a question, or check it against the eval set."""
+    parser = argparse.ArgumentParser(description='Structured benefit fact table')
+    parser.add_argument('command', choices=['build', 'lookup', 'eval', 'stats'])
+    parser.add_argument('args', nargs='*', help='build: PDF files (default: assets/pdfs); lookup: question')
+    parser.add_argument('--store', default=active_path('benefit_facts', DEFAULT_FACTS_PATH),
+                        help='Fact table (default: the live index version\'s)')
+    parser.add_argument('--dataset', default=None, help='eval: evaluation QA dataset')
+    args = parser.parse_intermixed_args()
+
+    if args.command == 'build':
+        pdf_paths = args.args or sorted(os.path.join('assets/pdfs', name) for name in os.listdir('assets/pdfs')
+                                        if name.lower().endswith('.pdf'))
+        store = BenefitFactStore(args.store)
+        started = time.time()
+        stored, rejected = ingest_facts(pdf_paths, store)
+        print(f"📋 {stored} benefit facts from {len(pdf_paths)} file(s) ({rejected} rejected) "
+              f"in {time.time() - started:.1f}s -> {args.store}")
+    elif args.command == 'stats':
+        store = BenefitFactStore(args.store)
+        print(f"📋 {args.store}: {len(store)} facts")
+        for source_file in store.sources():
+            count = store.conn.execute("SELECT COUNT(*) FROM facts WHERE source_file = ?",
+                                       (source_file,)).fetchone()[0]
+            print(f"   {source_file}: {count}")
+    elif args.command == 'lookup':
+        index = FactIndex.load(args.store)
+        question = ' '.join(args.args)
+        started = time.perf_counter()
+        result = index.answer(question)
+        elapsed = (time.perf_counter() - started) * 1000
+        if result is None:
+            print(f"No exact fact match ({elapsed:.2f} ms) - falls back to retrieval")
+        else:
+            print(f"{result['answer']}\n({len(result['facts'])} facts, {elapsed:.2f} ms)")
+    else:
+        from score_responses import ResponseScorer
+        from retrieval_eval import load_eval_questions, DEFAULT_DATASET_PATH
+        scorer = ResponseScorer()
+        index = FactIndex.load(args.store)
+        answered = agreeing = 0
+        for qa in load_eval_questions(args.dataset or DEFAULT_DATASET_PATH):
+            result = index.answer(qa['question'])
+            if result is None:
+                continue
+            answered += 1
+            expected = set(scorer.extract_numerical_values(qa['answer']))
+            given = set(scorer.extract_numerical_values(result['answer']))
+            agrees = bool(expected & given) or not expected
+            agreeing += agrees
+            print(f"{'✅' if agrees else '❌'} {qa['question']}\n{result['answer']}\n")
+        print(f"📊 Fast path answered {answered} question(s); {agreeing} share a number with the expected answer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Canonical chunk store.
+
+Every ingested chunk lives once in a SQLite table keyed by chunk ID, so the
+vectorizers can upsert or delete a handful of chunks without rewriting the
+whole corpus. Reads stream in ingestion order. Near-duplicate chunks are kept
+as aliases (`canonical_id` set) of the chunk that is actually embedded. The
+legacy JSON files (pdf_metadata.json and chroma_export.json) are generated
+from the store on demand with `python scripts/chunk_store.py export`.
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+import textwrap
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
+
+from adjacency_index import make_chunk_id
+from index_versions import active_path
+
+DEFAULT_STORE_PATH = "data/chunks.db"
+
+# SQLite caps the number of bound parameters per statement
+_ID_BATCH = 500
+
+_COLUMNS = "id, source_file, page_number, chunk_index, text, metadata, canonical_id"
+
+
+class ChunkStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        """Open (or create) the chunk store."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                source_file TEXT NOT NULL,
+                page_number INTEGER NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                canonical_id TEXT
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(chunks)")]
+        if 'canonical_id' not in columns:
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN canonical_id TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source_file)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_canonical ON chunks (canonical_id)")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def upsert_chunks(self, chunks: List[Dict], ids: List[str] = None) -> None:
+        """Insert or replace vectorizer chunk dicts; replaced chunks move to the end.
+
+        A chunk with a `canonical_id` key is stored as an alias of that chunk.
+        """
+        if ids is None:
+            ids = [make_chunk_id(c['source'], c['page'], c['chunk']) for c in chunks]
+        # Delete first so a replaced chunk takes a new sequence number, like an append
+        self._delete(ids)
+        self.conn.executemany(
+            "INSERT INTO chunks (id, source_file, page_number, chunk_index, text, metadata, canonical_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(chunk_id, c['source'], c['page'], c['chunk'], c['text'], json.dumps(c['metadata']),
+              c.get('canonical_id')) for chunk_id, c in zip(ids, chunks)]
+        )
+        self.conn.commit()
+
+    def _delete(self, ids: List[str]) -> None:
+        for i in range(0, len(ids), _ID_BATCH):
+            batch = ids[i:i + _ID_BATCH]
+            self.conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        self._delete(list(ids))
+        self.conn.commit()
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM chunks")
+        self.conn.commit()
+
+    @staticmethod
+    def _row_to_chunk(row) -> Dict:
+        chunk_id, source_file, page_number, chunk_index, text, metadata, canonical_id = row
+        return {
+            'id': chunk_id,
+            'text': text,
+            'page': page_number,
+            'chunk': chunk_index,
+            'source': source_file,
+            'metadata': json.loads(metadata),
+            'canonical_id': canonical_id
+        }
+
+    def get(self, chunk_id: str) -> Optional[Dict]:
+        """Look up one chunk by ID."""
+        row = self.conn.execute(f"SELECT {_COLUMNS} FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+        return self._row_to_chunk(row) if row else None
+
+    def iter_chunks(self, source_file: str = None, canonical_only: bool = False) -> Iterator[Dict]:
+        """Stream chunks in ingestion order, optionally for one source file or without aliases."""
+        clauses, params = [], []
+        if source_file is not None:
+            clauses.append("source_file = ?")
+            params.append(source_file)
+        if canonical_only:
+            clauses.append("canonical_id IS NULL")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        for row in self.conn.execute(f"SELECT {_COLUMNS} FROM chunks{where} ORDER BY seq", params):
+            yield self._row_to_chunk(row)
+
+    def aliases(self, canonical_ids: Iterable[str]) -> Dict[str, List[Dict]]:
+        """Near-duplicate chunks collapsed into each canonical chunk, in ingestion order."""
+        canonical_ids = list(canonical_ids)
+        found = {cid: [] for cid in canonical_ids}
+        for i in range(0, len(canonical_ids), _ID_BATCH):
+            batch = canonical_ids[i:i + _ID_BATCH]
+            rows = self.conn.execute(
+                f"SELECT {_COLUMNS} FROM chunks WHERE canonical_id IN ({','.join('?' * len(batch))}) ORDER BY seq",
+                batch
+            )
+            for row in rows:
+                chunk = self._row_to_chunk(row)
+                found[chunk['canonical_id']].append(chunk)
+        return found
+
+    def chroma_metadata(self, canonical_ids: Iterable[str]) -> Tuple[List[str], List[Dict]]:
+        """Chroma metadata for canonical chunks, listing every source location.
+
+        Chroma only accepts scalar metadata, so `source_locations` is a JSON string.
+        """
+        ids, metadatas = [], []
+        for canonical_id, aliases in self.aliases(canonical_ids).items():
+            chunk = self.get(canonical_id)
+            if chunk is None:
+                continue
+            metadata = dict(chunk['metadata'])
+            if aliases:
+                metadata['source_locations'] = json.dumps([
+                    {'source_file': c['source'], 'page_number': c['page'], 'chunk_index': c['chunk']}
+                    for c in [chunk] + aliases
+                ])
+                metadata['duplicate_count'] = len(aliases)
+            ids.append(canonical_id)
+            metadatas.append(metadata)
+        return ids, metadatas
+
+    def promote_aliases(self, removed_ids: Iterable[str]) -> List[Dict]:
+        """Re-home aliases of canonical chunks that are being removed.
+
+        For each removed canonical chunk, its first surviving alias becomes
+        canonical and the remaining aliases point at it. Returns the promoted
+        chunks, which still need to be embedded.
+        """
+        removed = set(removed_ids)
+        promoted = []
+        for aliases in self.aliases(removed).values():
+            survivors = [c for c in aliases if c['id'] not in removed]
+            if not survivors:
+                continue
+            head = survivors[0]
+            self.conn.execute("UPDATE chunks SET canonical_id = NULL WHERE id = ?", (head['id'],))
+            self.conn.executemany("UPDATE chunks SET canonical_id = ? WHERE id = ?",
+                                  [(head['id'], c['id']) for c in survivors[1:]])
+            head['canonical_id'] = None
+            promoted.append(head)
+        self.conn.commit()
+        return promoted
+
+    def iter_keys(self, canonical_only: bool = False) -> Iterator[Dict]:
+        """Stream (source, page, chunk, id) records without loading chunk text, optionally without aliases."""
+        where = " WHERE canonical_id IS NULL" if canonical_only else ""
+        for chunk_id, source_file, page_number, chunk_index in self.conn.execute(
+                f"SELECT id, source_file, page_number, chunk_index FROM chunks{where} ORDER BY seq"):
+            yield {'source': source_file, 'page': page_number, 'chunk': chunk_index, 'id': chunk_id}
+
+    def count_aliases(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM chunks WHERE canonical_id IS NOT NULL").fetchone()[0]
+
+    def sources(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT source_file FROM chunks ORDER BY source_file")]
+
+    def import_metadata(self, metadata_path: str) -> int:
+        """Load chunks from a legacy pdf_metadata.json file."""
+        with open(metadata_path, 'r') as f:
+            chunks = json.load(f)
+        self.upsert_chunks(chunks)
+        return len(chunks)
+
+    def export_metadata(self, output_path: str) -> int:
+        """Write the pdf_metadata.json array (vectorizer chunk dicts)."""
+        return _write_json_array(
+            output_path,
+            ({key: chunk[key] for key in ('text', 'page', 'chunk', 'source', 'metadata')}
+             for chunk in self.iter_chunks())
+        )
+
+    def export_chroma(self, output_path: str) -> int:
+        """Write the chroma_export.json array ({text, metadata, id}) of embedded chunks."""
+        def items():
+            for chunk in self.iter_chunks(canonical_only=True):
+                _, metadatas = self.chroma_metadata([chunk['id']])
+                yield {'text': chunk['text'], 'metadata': metadatas[0], 'id': chunk['id']}
+        return _write_json_array(output_path, items())
+
+
+def _write_json_array(output_path: str, items: Iterable[Dict]) -> int:
+    """Stream items into an indent=2 JSON array, written atomically."""
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = 0
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w') as out:
+        out.write("[")
+        for item in items:
+            out.write(",\n" if count else "\n")
+            out.write(textwrap.indent(json.dumps(item, indent=2), "  "))
+            count += 1
+        out.write("\n]" if count else "]")
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def main():
+    """Export, import or inspect the chunk store."""
+    parser = argparse.ArgumentParser(description='Canonical chunk store')
+    parser.add_argument('command', choices=['export', 'import', 'stats', 'get'])
+    parser.add_argument('args', nargs='*', help='import: metadata file; get: chunk IDs')
+    parser.add_argument('--store', default=active_path('chunk_store', DEFAULT_STORE_PATH),
+                        help='Chunk store (default: the live index version\'s)')
+    parser.add_argument('--metadata', nargs='+', default=['pdf_metadata.json', 'data/pdf_metadata.json'],
+                        help='pdf_metadata.json outputs for export')
+    parser.add_argument('--chroma', nargs='+', default=['data/chroma_export.json', 'functions/chroma_export.json'],
+                        help='chroma_export.json outputs for export')
+    args = parser.parse_args()
+
+    store = ChunkStore(args.store)
+
+    if args.command == 'export':
+        for path in args.metadata:
+            print(f"💾 {path}: {store.export_metadata(path)} chunks")
+        for path in args.chroma:
+            print(f"💾 {path}: {store.export_chroma(path)} chunks")
+    elif args.command == 'import':
+        metadata_path = args.args[0] if args.args else 'pdf_metadata.json'
+        print(f"📥 Imported {store.import_metadata(metadata_path)} chunks from {metadata_path}")
+    elif args.command == 'get':
+        for chunk_id in args.args:
+            print(json.dumps(store.get(chunk_id), indent=2))
+    else:
+        print(f"📦 {args.store}: {len(store)} chunks ({store.count_aliases()} collapsed as near-duplicates)")
+        for source_file in store.sources():
+            count = store.conn.execute("SELECT COUNT(*) FROM chunks WHERE source_file = ?",
+                                       (source_file,)).fetchone()[0]
+            print(f"   {source_file}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Pluggable chunkers shared by the vectorizer scripts.
+
+- words:    the original fixed 83-word windows (no overlap), kept so existing
+            chunk IDs and manifests stay valid
+- sentence: packs whole sentences and bullets into windows measured in model
+            tokens, carrying trailing sentences into the next chunk as overlap
+- heading:  like sentence, but starts a new chunk at every section heading,
+            keeps benefit-table rows whole and prefixes each chunk with its
+            heading so table rows keep their context
+
+Every chunker has a version string that is stored in chunk metadata and in the
+ingestion manifest, so changing strategy or sizes forces a rebuild.
+"""
+
+import os
+import re
+import argparse
+from functools import lru_cache
+from typing import List, Dict, Callable
+
+DEFAULT_MAX_TOKENS = 200
+DEFAULT_OVERLAP_TOKENS = 40
+STRATEGIES = ('words', 'sentence', 'heading')
+
+# Chunks this short are dropped, as the original chunker did
+MIN_CHUNK_CHARS = 50
+
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"“(•-])|\s+(?=• )')
+_APPROX_TOKEN = re.compile(r'\w+|[^\w\s]')
+_AMOUNT = re.compile(r'\$\s?\d|\d%|\bcovered\b', re.IGNORECASE)
+
+
+def tokenizer_name_for(model_name: str) -> str:
+    """Hugging Face tokenizer name for a sentence-transformers model name."""
+    return model_name if '/' in model_name else f"sentence-transformers/{model_name}"
+
+
+@lru_cache(maxsize=None)
+def token_counter(tokenizer_name: str = None) -> Callable[[str], int]:
+    """Count tokens with the model's tokenizer, or approximate if it is unavailable."""
+    if tokenizer_name:
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            print(f"⚠️  Tokenizer {tokenizer_name} unavailable ({e}); approximating token counts")
+    return lambda text: len(_APPROX_TOKEN.findall(text))
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split prose into sentences and bullet items."""
+    text = re.sub(r'\s+', ' ', text).strip()
+    return [s.strip() for s in _SENTENCE_BREAK.split(text) if s.strip()]
+
+
+def is_heading(line: str, next_line: str = '') -> bool:
+    """Short title-like line with no amounts or sentence punctuation, starting a new block.
+
+    Table cells wrap onto short lines too, so the following line must start
+    a new block (capital letter or bullet) rather than continue a cell.
+    """
+    if next_line and not (next_line[0].isupper() or next_line.startswith('•')):
+        return False
+    words = line.split()
+    if not words or len(words) > 8:
+        return False
+    if line[0].islower() or line.startswith(('•', '-', 'Description ')):
+        return False
+    if line.rstrip()[-1] in '.,;:' or _AMOUNT.search(line) or re.search(r'\d', line):
+        return False
+    return True
+
+
+class Chunker:
+    strategy = None
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                 tokenizer_name: str = None):
+        """Window and overlap sizes are in tokens of `tokenizer_name`."""
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer_name = tokenizer_name
+
+    @property
+    def count_tokens(self) -> Callable[[str], int]:
+        # Looked up lazily so chunkers stay picklable for worker processes
+        return token_counter(self.tokenizer_name)
+
+    @property
+    def version(self) -> str:
+        exact = "" if self.tokenizer_name else "-approx"
+        return f"{self.strategy}-t{self.max_tokens}-o{self.overlap_tokens}{exact}-v1"
+
+    def split(self, text: str) -> List[str]:
+        raise NotImplementedError
+
+    def _split_long(self, unit: str) -> List[str]:
+        """Cut a unit longer than the window into overlapping word windows."""
+        words = unit.split()
+        pieces, start = [], 0
+        while start < len(words):
+            end = start + 1
+            while end < len(words) and self.count_tokens(' '.join(words[start:end + 1])) <= self.max_tokens:
+                end += 1
+            pieces.append(' '.join(words[start:end]))
+            if end >= len(words):
+                break
+            back = end
+            while back > start + 1 and self.count_tokens(' '.join(words[back - 1:end])) <= self.overlap_tokens:
+                back -= 1
+            start = max(back, start + 1)
+        return pieces
+
+    def _pack(self, units: List[str], prefix: str = '') -> List[str]:
+        """Greedily pack units into windows, repeating trailing units as overlap."""
+        budget = self.max_tokens - (self.count_tokens(prefix) if prefix else 0)
+        if budget <= self.overlap_tokens:
+            prefix, budget = '', self.max_tokens
+
+        sized = []
+        for unit in units:
+            tokens = self.count_tokens(unit)
+            if tokens > budget:
+                sized.extend((piece, self.count_tokens(piece)) for piece in self._split_long(unit))
+            else:
+                sized.append((unit, tokens))
+
+        chunks, current, current_tokens = [], [], 0
+        for unit, tokens in sized:
+            if current and current_tokens + tokens > budget:
+                chunks.append(current)
+                # Carry trailing units forward while they fit in the overlap budget
+                tail, tail_tokens = [], 0
+                for prev_unit, prev_tokens in reversed(current):
+                    if tail_tokens + prev_tokens > self.overlap_tokens:
+                        break
+                    tail.insert(0, (prev_unit, prev_tokens))
+                    tail_tokens += prev_tokens
+                if tail_tokens + tokens > budget or len(tail) == len(current):
+                    tail, tail_tokens = [], 0
+                current, current_tokens = tail, tail_tokens
+            current.append((unit, tokens))
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+
+        texts = []
+        for chunk in chunks:
+            body = ' '.join(unit for unit, _ in chunk)
+            texts.append(f"{prefix} {body}" if prefix and not body.startswith(prefix) else body)
+        return texts
+
+
+def split_text_into_chunks(text: str, chunk_size: int = 500) -> List[str]:
+    """Split text into consecutive windows of chunk_size // 6 words.
+
+    The step equals the window, so despite its history this does not overlap.
+    """
+    # Clean the text
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    chunks = []
+    words = text.split()
+    window = chunk_size // 6
+
+    for i in range(0, len(words), window):
+        chunk_words = words[i:i + window]
+        if chunk_words:
+            chunk_text = ' '.join(chunk_words)
+            if len(chunk_text.strip()) > MIN_CHUNK_CHARS:  # Only include substantial chunks
+                chunks.append(chunk_text)
+
+    return chunks
+
+
+class WordWindowChunker(Chunker):
+    strategy = 'words'
+
+    @property
+    def version(self) -> str:
+        return "words-83-v1"
+
+    def split(self, text: str) -> List[str]:
+        return split_text_into_chunks(text, chunk_size=500)
+
+
+class SentenceChunker(Chunker):
+    strategy = 'sentence'
+
+    def split(self, text: str) -> List[str]:
+        return [c for c in self._pack(split_sentences(text)) if len(c) > MIN_CHUNK_CHARS]
+
+
+class HeadingChunker(Chunker):
+    strategy = 'heading'
+
+    def _sections(self, text: str) -> List[Dict]:
+        """Group lines under headings; table rows stay whole, prose is split into sentences."""
+        sections = [{'heading': '', 'units': []}]
+        prose = []
+
+        def flush_prose():
+            if prose:
+                sections[-1]['units'].extend(split_sentences(' '.join(prose)))
+                prose.clear()
+
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        for i, line in enumerate(lines):
+            if is_heading(line, lines[i + 1] if i + 1 < len(lines) else ''):
+                flush_prose()
+                if sections[-1]['units']:
+                    sections.append({'heading': line, 'units': []})
+                else:
+                    # Consecutive headings (section, then subsection) read as one
+                    sections[-1]['heading'] = f"{sections[-1]['heading']} {line}".strip()
+            elif _AMOUNT.search(line):
+                flush_prose()
+                sections[-1]['units'].append(line)
+            else:
+                prose.append(line)
+        flush_prose()
+        return sections
+
+    def split(self, text: str) -> List[str]:
+        chunks = []
+        for section in self._sections(text):
+            if not section['units']:
+                continue
+            chunks.extend(self._pack(section['units'], prefix=section['heading']))
+        return [c for c in chunks if len(c) > MIN_CHUNK_CHARS]
+
+
+_CHUNKERS = {cls.strategy: cls for cls in (WordWindowChunker, SentenceChunker, HeadingChunker)}
+
+
+def get_chunker(strategy: str = 'words', max_tokens: int = DEFAULT_MAX_TOKENS,
+                overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, model_name: str = None) -> Chunker:
+    """Build a chunker; sizes are measured with `model_name`'s tokenizer."""
+    if strategy not in _CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+    tokenizer_name = tokenizer_name_for(model_name) if model_name else None
+    return _CHUNKERS[strategy](max_tokens, overlap_tokens, tokenizer_name)
+
+
+DEFAULT_CHUNKER = WordWindowChunker()
+
+
+def add_chunker_arguments(parser: argparse.ArgumentParser) -> None:
+    """Shared --chunker/--chunk-tokens/--chunk-overlap options for the vectorizers."""
+    parser.add_argument('--chunker', choices=STRATEGIES, default='words',
+                        help='Chunking strategy (default: words, the original 83-word windows)')
+    parser.add_argument('--chunk-tokens', type=int, default=DEFAULT_MAX_TOKENS,
+                        help=f'Window size in model tokens for sentence/heading (default: {DEFAULT_MAX_TOKENS})')
+    parser.add_argument('--chunk-overlap', type=int, default=DEFAULT_OVERLAP_TOKENS,
+                        help=f'Overlap in model tokens for sentence/heading (default: {DEFAULT_OVERLAP_TOKENS})')
+
+
+def chunker_from_args(args, model_name: str) -> Chunker:
+    return get_chunker(args.chunker, args.chunk_tokens, args.chunk_overlap, model_name)
+
+
+def answer_found(answer_values: List[float], context_values: List[float]) -> bool:
+    """True if every number in the reference answer appears in the retrieved context."""
+    return set(answer_values) <= set(context_values)
+
+
+def main():
+    """Compare chunking strategies on the PDFs and the evaluation questions."""
+    parser = argparse.ArgumentParser(description='Benchmark chunking strategies')
+    parser.add_argument('--pdf-dir', default=os.path.join("assets", "pdfs"))
+    parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[DEFAULT_MAX_TOKENS],
+                        help='Window sizes (tokens) to try for sentence/heading')
+    parser.add_argument('--overlap', type=int, default=DEFAULT_OVERLAP_TOKENS)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--dataset', default="data/evaluation_qa_dataset.json")
+    parser.add_argument('--model', default="all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    from embedding_cache import EmbeddingCache
+    from ingestion import iter_pages
+    from retrieval_eval import load_eval_questions
+    from score_responses import ResponseScorer
+
+    pdf_paths = sorted(os.path.join(args.pdf_dir, f) for f in os.listdir(args.pdf_dir) if f.endswith('.pdf'))
+    print(f"📄 Extracting {len(pdf_paths)} PDF(s)...")
+    pages = [text for _, _, text in iter_pages(pdf_paths) if text]
+
+    questions = load_eval_questions(args.dataset)
+    scorer = ResponseScorer()
+    answer_values = [scorer.extract_numerical_values(qa['answer']) for qa in questions]
+    scored = [i for i, values in enumerate(answer_values) if values]
+
+    model = SentenceTransformer(args.model)
+    cache = EmbeddingCache()
+    query_embeddings = cache.encode([qa['question'] for qa in questions], args.model, model.encode)
+    query_embeddings /= np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    count_tokens = token_counter(tokenizer_name_for(args.model))
+
+    configs = []
+    for strategy in args.strategies:
+        sizes = [None] if strategy == 'words' else args.sizes
+        configs.extend((strategy, size) for size in sizes)
+
+    rows = []
+    for strategy, size in configs:
+        chunker = get_chunker(strategy, size or DEFAULT_MAX_TOKENS, args.overlap, args.model)
+        texts = [chunk for text in pages for chunk in chunker.split(text)]
+        embeddings = cache.encode(texts, args.model, model.encode)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+        top = np.argsort(-(query_embeddings @ embeddings.T), axis=1)[:, :args.k]
+        contexts = [' '.join(texts[j] for j in row) for row in top]
+        hits = sum(answer_found(answer_values[i], scorer.extract_numerical_values(contexts[i])) for i in scored)
+        rows.append({
+            'chunker': chunker.version,
+            'chunks': len(texts),
+            'index_kb': (embeddings.nbytes + sum(len(t.encode('utf-8')) for t in texts)) / 1024,
+            'max_tokens': max(count_tokens(t) for t in texts),
+            f'recall@{args.k}': hits / len(scored) if scored else 0.0,
+            'prompt_tokens': sum(count_tokens(c) for c in contexts) / len(contexts)
+        })
+
+    print(f"\n📊 Chunking benchmark ({len(scored)} of {len(questions)} questions have numeric answers)")
+    print(f"   {cache.report()}")
+    print(f"{'chunker':<28}{'chunks':>8}{'index KB':>10}{'max tok':>9}{f'recall@{args.k}':>11}{'prompt tok':>12}")
+    for row in rows:
+        print(f"{row['chunker']:<28}{row['chunks']:>8}{row['index_kb']:>10.0f}{row['max_tokens']:>9}"
+              f"{row[f'recall@{args.k}']:>11.3f}{row['prompt_tokens']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Compressed embedding index with exact float rescoring.
+
+Embeddings are projected with a PCA learned from the corpus and stored as
+int8 or binary codes for a cheap first-pass search. The shortlist is then
+rescored against the original float vectors, which stay on disk and are
+memory-mapped so only the shortlisted rows are read.
+"""
+
+import os
+import json
+import argparse
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+from retrieval_eval import load_eval_questions, recall_at_k
+from embedding_cache import EmbeddingCache
+from index_versions import IndexPointer, COMPRESSED_INDEX_DIR, DEFAULT_POINTER_PATH
+
+DEFAULT_INDEX_DIR = "data/compressed_index"
+
+# Number of set bits for every byte value, used for Hamming distances
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class CompressedIndex:
+    def __init__(self, mode: str = "int8", n_components: int = None):
+        """Create an empty index; `mode` is 'int8' or 'binary'."""
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"Unknown compression mode: {mode}")
+        self.mode = mode
+        self.n_components = n_components
+        self.ids = []
+        self.mean = None
+        self.components = None
+        self.scale = None
+        self.codes = None
+        self.full = None
+
+    def fit(self, ids: List[str], embeddings) -> 'CompressedIndex':
+        """Learn the projection and encode the corpus."""
+        full = _normalize(np.asarray(embeddings, dtype=np.float32))
+        self.ids = list(ids)
+        self.full = full
+
+        self.mean = full.mean(axis=0)
+        if self.n_components and self.n_components < full.shape[1]:
+            _, _, vt = np.linalg.svd(full - self.mean, full_matrices=False)
+            self.components = vt[:self.n_components].astype(np.float32)
+        else:
+            self.components = None
+
+        projected = self._project(full)
+        if self.mode == "int8":
+            max_abs = np.abs(projected).max(axis=0)
+            max_abs[max_abs == 0] = 1.0
+            self.scale = (max_abs / 127.0).astype(np.float32)
+            self.codes = np.clip(np.round(projected / self.scale), -127, 127).astype(np.int8)
+        else:
+            self.codes = np.packbits(projected > 0, axis=1)
+
+        return self
+
+    def _project(self, vectors: np.ndarray) -> np.ndarray:
+        """Center and (optionally) PCA-project vectors."""
+        centered = vectors - self.mean
+        if self.components is None:
+            return centered
+        return centered @ self.components.T
+
+    def search(self, query_embedding, k: int = 5, shortlist: int = 50) -> List[Tuple[str, float]]:
+        """Return the top-k (id, cosine distance) pairs for a query."""
+        if self.codes is None or not len(self.ids):
+            return []
+
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        projected = self._project(query)
+        shortlist = min(max(shortlist, k), len(self.ids))
+
+        if self.mode == "int8":
+            approx = self.codes.astype(np.float32) @ (projected * self.scale)
+            candidates = np.argpartition(-approx, shortlist - 1)[:shortlist]
+        else:
+            query_bits = np.packbits(projected > 0)
+            hamming = _POPCOUNT[np.bitwise_xor(self.codes, query_bits)].sum(axis=1)
+            candidates = np.argpartition(hamming, shortlist - 1)[:shortlist]
+
+        # Exact rescoring touches only the shortlisted float rows
+        exact = np.asarray(self.full[candidates]) @ query
+        order = np.argsort(-exact)[:k]
+        return [(self.ids[candidates[i]], float(1.0 - exact[i])) for i in order]
+
+    def memory_report(self) -> Dict[str, int]:
+        """Bytes held in memory for first-pass search versus plain float32."""
+        projection_bytes = self.mean.nbytes
+        if self.components is not None:
+            projection_bytes += self.components.nbytes
+        if self.scale is not None:
+            projection_bytes += self.scale.nbytes
+        return {
+            'float32_bytes': len(self.ids) * self.full.shape[1] * 4,
+            'code_bytes': int(self.codes.nbytes),
+            'projection_bytes': int(projection_bytes)
+        }
+
+    def save(self, index_dir: str = DEFAULT_INDEX_DIR) -> None:
+        """Write codes, projection and float vectors to a directory."""
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, "codes.npy"), self.codes)
+        np.save(os.path.join(index_dir, "full.npy"), np.asarray(self.full, dtype=np.float32))
+        np.savez(
+            os.path.join(index_dir, "projection.npz"),
+            mean=self.mean,
+            components=self.components if self.components is not None else np.empty(0, dtype=np.float32),
+            scale=self.scale if self.scale is not None else np.empty(0, dtype=np.float32)
+        )
+        with open(os.path.join(index_dir, "index.json"), 'w') as f:
+            json.dump({'mode': self.mode, 'n_components': self.n_components, 'ids': self.ids}, f)
+
+    @classmethod
+    def load(cls, index_dir: str = DEFAULT_INDEX_DIR) -> 'CompressedIndex':
+        """Load a saved index; float vectors are memory-mapped, not read."""
+        with open(os.path.join(index_dir, "index.json"), 'r') as f:
+            info = json.load(f)
+
+        index = cls(mode=info['mode'], n_components=info['n_components'])
+        index.ids = info['ids']
+        index.codes = np.load(os.path.join(index_dir, "codes.npy"))
+        index.full = np.load(os.path.join(index_dir, "full.npy"), mmap_mode='r')
+
+        projection = np.load(os.path.join(index_dir, "projection.npz"))
+        index.mean = projection['mean']
+        index.components = projection['components'] if projection['components'].size else None
+        index.scale = projection['scale'] if projection['scale'].size else None
+        return index
+
+
+def collection_embeddings(collection):
+    """IDs and embeddings of every chunk in a Chroma collection."""
+    results = collection.get(include=["embeddings"])
+    return results['ids'], np.asarray(results['embeddings'], dtype=np.float32)
+
+
+def load_collection_embeddings(chroma_path: str = "./chroma_db", collection_name: str = "benefits_documents"):
+    """Read IDs and embeddings from the Chroma collection."""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    return collection_embeddings(
+        client.get_or_create_collection(name=collection_name, metadata={"hnsw:space": "cosine"}))
+
+
+def carry_over(previous: Optional[Dict], build: Dict, collection) -> Optional[str]:
+    """Give a new index version a compressed index if the version it replaces had one.
+
+    The index is fitted on the new collection with the previous index's mode
+    and projection size and saved with the build's files. Returns its
+    directory (recorded as `compressed_index`), or None.
+    """
+    previous_dir = (previous or {}).get('compressed_index')
+    if not previous_dir or not os.path.exists(os.path.join(previous_dir, "index.json")):
+        return None
+    with open(os.path.join(previous_dir, "index.json"), 'r') as f:
+        info = json.load(f)
+    index_dir = os.path.join(build['files_dir'], COMPRESSED_INDEX_DIR)
+    ids, embeddings = collection_embeddings(collection)
+    CompressedIndex(mode=info['mode'], n_components=info['n_components']).fit(ids, embeddings).save(index_dir)
+    build['compressed_index'] = index_dir
+    return index_dir
+
+
+def build_report(ids: List[str], embeddings: np.ndarray, query_embeddings: np.ndarray,
+                 configs: List[Tuple[str, int]], k: int = 5, shortlist: int = 50) -> List[Dict]:
+    """Measure memory and recall@k against exact float search for each config."""
+    full = _normalize(embeddings)
+    queries = _normalize(query_embeddings)
+    exact_scores = queries @ full.T
+    reference = [[ids[i] for i in np.argsort(-row)[:k]] for row in exact_scores]
+
+    rows = []
+    for mode, n_components in configs:
+        index = CompressedIndex(mode=mode, n_components=n_components).fit(ids, embeddings)
+        candidate = [[cid for cid, _ in index.search(q, k=k, shortlist=shortlist)] for q in queries]
+        memory = index.memory_report()
+        compressed = memory['code_bytes'] + memory['projection_bytes']
+        rows.append({
+            'mode': mode,
+            'n_components': n_components or embeddings.shape[1],
+            'float32_bytes': memory['float32_bytes'],
+            'compressed_bytes': compressed,
+            'memory_saved': 1 - compressed / memory['float32_bytes'],
+            f'recall@{k}': recall_at_k(reference, candidate, k)
+        })
+    return rows
+
+
+def main():
+    """Build a compressed index or report its memory savings and recall."""
+    parser = argparse.ArgumentParser(description='Compressed embedding index')
+    parser.add_argument('command', choices=['build', 'report'])
+    parser.add_argument('--mode', choices=['int8', 'binary'], default='int8')
+    parser.add_argument('--components', type=int, default=None,
+                        help='PCA dimensions to keep (default: no projection)')
+    parser.add_argument('--output', default=None,
+                        help=f'Index directory (default: with the live index version, else {DEFAULT_INDEX_DIR})')
+    parser.add_argument('--pointer', default=DEFAULT_POINTER_PATH)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--shortlist', type=int, default=50,
+                        help='Candidates rescored with float vectors')
+    parser.add_argument('--dataset', default="data/evaluation_qa_dataset.json")
+    parser.add_argument('--model', default="all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    pointer = IndexPointer(args.pointer)
+    record = pointer.active or {}
+    print(f"📦 Loading embeddings from ChromaDB ({pointer.active_collection()})...")
+    ids, embeddings = load_collection_embeddings(record.get('chroma_path', "./chroma_db"), pointer.active_collection())
+    print(f"   {len(ids)} chunks, {embeddings.shape[1]} dimensions")
+
+    if args.command == 'build':
+        output = args.output
+        if output is None:
+            output = os.path.join(record['files_dir'], COMPRESSED_INDEX_DIR) if 'files_dir' in record else DEFAULT_INDEX_DIR
+        index = CompressedIndex(mode=args.mode, n_components=args.components).fit(ids, embeddings)
+        index.save(output)
+        if 'files_dir' in record and args.output is None:
+            # Running backends reload the version with its new compressed index; later builds carry it over
+            pointer.touch(compressed_index=output)
+        memory = index.memory_report()
+        print(f"✅ Saved {args.mode} index to {output}")
+        print(f"   In-memory codes: {memory['code_bytes'] + memory['projection_bytes']:,} bytes "
+              f"(float32: {memory['float32_bytes']:,} bytes)")
+        return
+
+    from sentence_transformers import SentenceTransformer
+
+    questions = [qa['question'] for qa in load_eval_questions(args.dataset)]
+    model = SentenceTransformer(args.model)
+    cache = EmbeddingCache()
+    query_embeddings = cache.encode(questions, args.model, model.encode)
+    print(f"   {cache.report()}")
+
+    dims = embeddings.shape[1]
+    configs = [('int8', None), ('int8', dims // 2), ('int8', dims // 4),
+               ('binary', None), ('binary', dims // 2)]
+    rows = build_report(ids, embeddings, query_embeddings, configs, k=args.k, shortlist=args.shortlist)
+
+    print(f"\n📊 Compression report ({len(questions)} eval questions, shortlist={args.shortlist})")
+    print(f"{'mode':<8}{'dims':>6}{'float32':>12}{'compressed':>12}{'saved':>8}{f'recall@{args.k}':>11}")
+    for row in rows:
+        print(f"{row['mode']:<8}{row['n_components']:>6}{row['float32_bytes']:>12,}"
+              f"{row['compressed_bytes']:>12,}{row['memory_saved']:>8.1%}{row[f'recall@{args.k}']:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,13 @@
-import pandas as pd
 import json
-from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.worksheet.table import Table, TableStyleInfo
 import os
 
+from xlsx_stream import StreamingWorkbook
+
 class ExcelEvaluationGenerator:
     def __init__(self):
-        self.workbook = Workbook()
+        # Created per output file in generate_excel_file; sheets are streamed in write-only mode
+        self.workbook = None
         self.setup_styles()
     
     def setup_styles(self):
@@ -26,6 +25,12 @@ class ExcelEvaluationGenerator:
         )
         self.center_alignment = Alignment(horizontal='center', vertical='center')
         self.wrap_alignment = Alignment(wrap_text=True, vertical='top')
+        self.header_style = {
+            'font': self.header_font,
+            'fill': self.header_fill,
+            'alignment': self.center_alignment,
+            'border': self.border
+        }
     
     def load_evaluation_data(self, json_file="evaluation_qa_dataset.json"):
         """Load the evaluation data from JSON"""
@@ -34,128 +39,92 @@ class ExcelEvaluationGenerator:
     
     def create_main_evaluation_sheet(self, data):
         """Create the main evaluation sheet"""
-        ws = self.workbook.active
-        ws.title = "LLM Evaluation Results"
+        headers = [
+            'Question #', 'Category', 'Difficulty', 'Question', 'Correct Answer', 'Source Files',
+            'Can Answer', 'Notes',
+            'LLM 1 Score', 'LLM 1 Response', 'LLM 1 Notes',
+            'LLM 2 Score', 'LLM 2 Response', 'LLM 2 Notes',
+            'LLM 3 Score', 'LLM 3 Response', 'LLM 3 Notes'
+        ]
+        ws = self.workbook.add_sheet("LLM Evaluation Results", headers, self.evaluation_column_widths(),
+                                     column_styles=self.evaluation_column_styles(), header_style=self.header_style)
         
-        # Prepare data for DataFrame
-        rows = []
         for i, qa in enumerate(data['questions'], 1):
-            row = {
-                'Question #': i,
-                'Category': qa['category'].replace('_', ' ').title(),
-                'Difficulty': qa['difficulty'].title(),
-                'Question': qa['question'],
-                'Correct Answer': qa['answer'],
-                'Source Files': ', '.join(qa['source_files']),
-                'Can Answer': 'Yes' if 'note' not in qa else 'No',
-                'Notes': qa.get('note', ''),
-                'LLM 1 Score': '',  # Empty for manual entry
-                'LLM 1 Response': '',  # Empty for manual entry
-                'LLM 1 Notes': '',  # Empty for manual entry
-                'LLM 2 Score': '',  # Empty for manual entry
-                'LLM 2 Response': '',  # Empty for manual entry
-                'LLM 2 Notes': '',  # Empty for manual entry
-                'LLM 3 Score': '',  # Empty for manual entry
-                'LLM 3 Response': '',  # Empty for manual entry
-                'LLM 3 Notes': '',  # Empty for manual entry
-            }
-            rows.append(row)
+            ws.append([
+                i,
+                qa['category'].replace('_', ' ').title(),
+                qa['difficulty'].title(),
+                qa['question'],
+                qa['answer'],
+                ', '.join(qa['source_files']),
+                'Yes' if 'note' not in qa else 'No',
+                qa.get('note', ''),
+                # LLM score, response and notes columns are left empty for manual entry
+                '', '', '',
+                '', '', '',
+                '', '', ''
+            ])
         
-        # Convert to DataFrame
-        df = pd.DataFrame(rows)
+        return ws
+    
+    def evaluation_column_widths(self):
+        """Column widths of the evaluation sheet, A to Q"""
+        return [
+            12,  # Question #
+            20,  # Category
+            12,  # Difficulty
+            60,  # Question
+            80,  # Correct Answer
+            30,  # Source Files
+            12,  # Can Answer
+            30,  # Notes
+            12,  # LLM 1 Score
+            60,  # LLM 1 Response
+            30,  # LLM 1 Notes
+            12,  # LLM 2 Score
+            60,  # LLM 2 Response
+            30,  # LLM 2 Notes
+            12,  # LLM 3 Score
+            60,  # LLM 3 Response
+            30,  # LLM 3 Notes
+        ]
+    
+    def evaluation_column_styles(self):
+        """Per-column styling of the evaluation sheet's data rows"""
+        styles = {column: {'border': self.border} for column in range(1, 18)}  # A to Q
         
-        # Add data to worksheet
-        for r in dataframe_to_rows(df, index=False, header=True):
-            ws.append(r)
+        # Question number
+        styles[1].update(font=self.question_font, alignment=self.center_alignment)
         
-        # Style the worksheet
-        self.style_evaluation_sheet(ws, len(data['questions']))
+        # Category
+        styles[2].update(font=self.category_font)
         
-        return ws
-    
-    def style_evaluation_sheet(self, ws, num_questions):
-        """Apply styling to the evaluation sheet"""
-        # Header row styling
-        for cell in ws[1]:
-            cell.font = self.header_font
-            cell.fill = self.header_fill
-            cell.alignment = self.center_alignment
-            cell.border = self.border
+        # Difficulty
+        styles[3].update(alignment=self.center_alignment)
         
-        # Column widths
-        column_widths = {
-            'A': 12,  # Question #
-            'B': 20,  # Category
-            'C': 12,  # Difficulty
-            'D': 60,  # Question
-            'E': 80,  # Correct Answer
-            'F': 30,  # Source Files
-            'G': 12,  # Can Answer
-            'H': 30,  # Notes
-            'I': 12,  # LLM 1 Score
-            'J': 60,  # LLM 1 Response
-            'K': 30,  # LLM 1 Notes
-            'L': 12,  # LLM 2 Score
-            'M': 60,  # LLM 2 Response
-            'N': 30,  # LLM 2 Notes
-            'O': 12,  # LLM 3 Score
-            'P': 60,  # LLM 3 Response
-            'Q': 30,  # LLM 3 Notes
-        }
+        # Question
+        styles[4].update(font=self.question_font, alignment=self.wrap_alignment)
         
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
+        # Answer, source files and notes
+        for column in [5, 6, 8]:
+            styles[column].update(alignment=self.wrap_alignment)
         
-        # Apply styling to data rows
-        for row in range(2, num_questions + 2):
-            # Question number
-            ws[f'A{row}'].font = self.question_font
-            ws[f'A{row}'].alignment = self.center_alignment
-            
-            # Category
-            ws[f'B{row}'].font = self.category_font
-            
-            # Difficulty
-            ws[f'C{row}'].alignment = self.center_alignment
-            
-            # Question
-            ws[f'D{row}'].font = self.question_font
-            ws[f'D{row}'].alignment = self.wrap_alignment
-            
-            # Answer
-            ws[f'E{row}'].alignment = self.wrap_alignment
-            
-            # Source files
-            ws[f'F{row}'].alignment = self.wrap_alignment
-            
-            # Can Answer
-            ws[f'G{row}'].alignment = self.center_alignment
-            
-            # Notes
-            ws[f'H{row}'].alignment = self.wrap_alignment
-            
-            # LLM response columns
-            for col in ['J', 'M', 'P']:  # Response columns
-                ws[f'{col}{row}'].alignment = self.wrap_alignment
-            
-            # LLM notes columns
-            for col in ['K', 'N', 'Q']:  # Notes columns
-                ws[f'{col}{row}'].alignment = self.wrap_alignment
-            
-            # Score columns
-            for col in ['I', 'L', 'O']:  # Score columns
-                ws[f'{col}{row}'].alignment = self.center_alignment
-            
-            # Apply borders to all cells
-            for col in range(1, 18):  # A to Q
-                ws.cell(row=row, column=col).border = self.border
+        # Can Answer
+        styles[7].update(alignment=self.center_alignment)
+        
+        # LLM response and notes columns
+        for column in [10, 13, 16, 11, 14, 17]:
+            styles[column].update(alignment=self.wrap_alignment)
         
-        # Freeze panes
-        ws.freeze_panes = 'A2'
+        # Score columns
+        for column in [9, 12, 15]:
+            styles[column].update(alignment=self.center_alignment)
+        
+        return styles
     
     def create_summary_sheet(self, data):
         """Create a summary sheet with statistics"""
-        ws = self.workbook.create_sheet("Summary & Instructions")
+        ws = self.workbook.add_sheet("Summary & Instructions", widths=[80])
         
         # Instructions
         instructions = [
@@ -208,21 +177,17 @@ class ExcelEvaluationGenerator:
         
         # Write instructions to sheet
         for i, instruction in enumerate(instructions, 1):
-            ws[f'A{i}'] = instruction
             if i == 1:  # Title
-                ws[f'A{i}'].font = Font(bold=True, size=16)
+                ws.append([instruction], style={'font': Font(bold=True, size=16)})
             elif instruction and instruction.startswith(('HOW TO', 'SCORING', 'EVALUATION', 'DATASET', 'CATEGORY')):
-                ws[f'A{i}'].font = Font(bold=True)
-        
-        # Set column width
-        ws.column_dimensions['A'].width = 80
+                ws.append([instruction], style={'font': Font(bold=True)})
+            else:
+                ws.append([instruction])
         
         return ws
     
     def create_performance_summary_sheet(self, data):
         """Create a performance summary sheet"""
-        ws = self.workbook.create_sheet("Performance Summary")
-        
         # Headers
         headers = [
             "LLM Name", "Total Questions", "Average Score", "Accuracy Rate", 
@@ -231,12 +196,14 @@ class ExcelEvaluationGenerator:
             "Notes"
         ]
         
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = self.header_font
-            cell.fill = self.header_fill
-            cell.alignment = self.center_alignment
-            cell.border = self.border
+        # Numeric columns are centered
+        column_styles = {col: {'border': self.border} for col in range(1, 11)}
+        for col in [2, 3, 4, 5, 6, 7, 8, 9]:
+            column_styles[col]['alignment'] = self.center_alignment
+        
+        ws = self.workbook.add_sheet("Performance Summary", headers, [20, 15, 15, 15, 20, 20, 20, 25, 25, 30],
+                                     column_styles=column_styles, header_style=self.header_style,
+                                     freeze_header=False)
         
         # Add sample rows for 3 LLMs
         sample_data = [
@@ -244,34 +211,23 @@ class ExcelEvaluationGenerator:
             ["LLM 2", "", "", "", "", "", "", "", "", "Enter LLM name and results"],
             ["LLM 3", "", "", "", "", "", "", "", "", "Enter LLM name and results"],
         ]
-        
-        for row_idx, row_data in enumerate(sample_data, 2):
-            for col_idx, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.border = self.border
-                if col_idx in [2, 3, 4, 5, 6, 7, 8, 9]:  # Numeric columns
-                    cell.alignment = self.center_alignment
-        
-        # Set column widths
-        column_widths = [20, 15, 15, 15, 20, 20, 20, 25, 25, 30]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[chr(64 + i)].width = width
+        ws.write_rows(sample_data)
         
         return ws
     
     def create_category_breakdown_sheet(self, data):
         """Create a category breakdown sheet"""
-        ws = self.workbook.create_sheet("Category Breakdown")
-        
         # Headers
         headers = ["Category", "Total Questions", "Answerable", "Unanswerable", "Easy", "Medium", "Hard"]
         
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = self.header_font
-            cell.fill = self.header_fill
-            cell.alignment = self.center_alignment
-            cell.border = self.border
+        # Numeric columns are centered
+        column_styles = {col: {'border': self.border} for col in range(1, 8)}
+        for col in range(2, 8):
+            column_styles[col]['alignment'] = self.center_alignment
+        
+        ws = self.workbook.add_sheet("Category Breakdown", headers, [25, 15, 12, 12, 8, 10, 8],
+                                     column_styles=column_styles, header_style=self.header_style,
+                                     freeze_header=False)
         
         # Calculate category statistics
         categories = {}
@@ -292,8 +248,8 @@ class ExcelEvaluationGenerator:
             categories[cat][qa['difficulty']] += 1
         
         # Add data rows
-        for row_idx, (cat, stats) in enumerate(categories.items(), 2):
-            row_data = [
+        for cat, stats in categories.items():
+            ws.append([
                 cat.replace('_', ' ').title(),
                 stats['total'],
                 stats['answerable'],
@@ -301,18 +257,7 @@ class ExcelEvaluationGenerator:
                 stats['easy'],
                 stats['medium'],
                 stats['hard']
-            ]
-            
-            for col_idx, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.border = self.border
-                if col_idx > 1:  # Numeric columns
-                    cell.alignment = self.center_alignment
-        
-        # Set column widths
-        column_widths = [25, 15, 12, 12, 8, 10, 8]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[chr(64 + i)].width = width
+            ])
         
         return ws
     
@@ -320,6 +265,7 @@ class ExcelEvaluationGenerator:
         """Generate the complete Excel workbook"""
         # Load data
         data = self.load_evaluation_data(json_file)
+        self.workbook = StreamingWorkbook(output_file)
         
         # Create sheets
         self.create_main_evaluation_sheet(data)
@@ -328,7 +274,7 @@ class ExcelEvaluationGenerator:
         self.create_category_breakdown_sheet(data)
         
         # Save workbook
-        self.workbook.save(output_file)
+        self.workbook.save()
         print(f"Excel workbook saved as: {output_file}")
         
         return output_file
@@ -0,0 +1,238 @@
+"""
+MinHash/LSH near-duplicate detection for chunks.
+
+Schedule headers, coverage legends and glossary definitions repeat across
+pages and files. Each chunk gets a MinHash signature over its word shingles;
+LSH banding finds candidate matches and the estimated Jaccard similarity
+confirms them; chunks quoting different numbers are never merged. A
+near-duplicate is not embedded: it is stored as an alias of the first
+(canonical) chunk, whose Chroma metadata lists every source location.
+"""
+
+import re
+import zlib
+import argparse
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from chunk_store import ChunkStore, DEFAULT_STORE_PATH
+from retrieval_eval import load_eval_questions, recall_at_k, DEFAULT_DATASET_PATH
+from index_versions import active_path
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_NUMBER_PATTERN = re.compile(r'\$?\d[\d,]*(?:\.\d+)?%?')
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """32-bit hashes of the word shingles in a text."""
+    words = text.lower().split()
+    if len(words) <= size:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.array([zlib.crc32(s.encode('utf-8')) for s in set(shingles)], dtype=np.uint64)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        """Fixed random permutations so signatures are stable across runs."""
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text)
+        # uint64 arithmetic wraps; the wrapped products still behave as random permutations
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME
+        return (permuted & np.uint64(0xFFFFFFFF)).min(axis=0).astype(np.uint32)
+
+
+def numeric_tokens(text: str) -> frozenset:
+    """Dollar amounts, percentages and other numbers mentioned in a text."""
+    return frozenset(_NUMBER_PATTERN.findall(text))
+
+
+def estimate_jaccard(left: np.ndarray, right: np.ndarray) -> float:
+    return float(np.mean(left == right))
+
+
+class LSHIndex:
+    def __init__(self, bands: int = BANDS):
+        """Band signatures into buckets; chunks sharing any bucket are candidates."""
+        self.bands = bands
+        self.buckets = {}
+        self.signatures = {}
+
+    def _keys(self, signature: np.ndarray):
+        rows = len(signature) // self.bands
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, chunk_id: str, signature: np.ndarray) -> None:
+        self.signatures[chunk_id] = signature
+        for key in self._keys(signature):
+            self.buckets.setdefault(key, []).append(chunk_id)
+
+    def remove(self, chunk_id: str) -> None:
+        signature = self.signatures.pop(chunk_id, None)
+        if signature is None:
+            return
+        for key in self._keys(signature):
+            bucket = self.buckets.get(key, [])
+            if chunk_id in bucket:
+                bucket.remove(chunk_id)
+
+    def query(self, signature: np.ndarray, threshold: float) -> List[str]:
+        """Indexed chunks at or above `threshold`, most similar first."""
+        candidates = {cid for key in self._keys(signature) for cid in self.buckets.get(key, ())}
+        scored = [(estimate_jaccard(signature, self.signatures[cid]), cid) for cid in candidates]
+        return [cid for score, cid in sorted(scored, key=lambda item: (-item[0], item[1])) if score >= threshold]
+
+
+class NearDuplicateDetector:
+    def __init__(self, store: ChunkStore = None, threshold: float = DEFAULT_THRESHOLD):
+        """Index the canonical chunks already in `store`."""
+        self.store = store
+        self.threshold = threshold
+        self.hasher = MinHasher()
+        self.index = LSHIndex()
+        self.numbers = {}
+        self.collapsed = 0
+        if store is not None:
+            for chunk in store.iter_chunks(canonical_only=True):
+                self._add(chunk['id'], chunk['text'], self.hasher.signature(chunk['text']))
+
+    def _add(self, chunk_id: str, text: str, signature: np.ndarray) -> None:
+        self.index.add(chunk_id, signature)
+        self.numbers[chunk_id] = numeric_tokens(text)
+
+    def assign(self, chunks: List[Dict], ids: List[str]) -> None:
+        """Set chunk['canonical_id'] on near-duplicates; index the rest as canonical."""
+        # Re-ingested chunks are matched on their new text
+        self.forget(ids)
+
+        for chunk, chunk_id in zip(chunks, ids):
+            signature = self.hasher.signature(chunk['text'])
+            # Similar wording with different amounts (e.g. two copay rows) is not a duplicate
+            numbers = numeric_tokens(chunk['text'])
+            match = next((cid for cid in self.index.query(signature, self.threshold)
+                          if self.numbers[cid] == numbers), None)
+            if match is None:
+                chunk['canonical_id'] = None
+                self._add(chunk_id, chunk['text'], signature)
+            else:
+                chunk['canonical_id'] = match
+                self.collapsed += 1
+
+    def forget(self, chunk_ids: List[str]) -> None:
+        for chunk_id in chunk_ids:
+            self.index.remove(chunk_id)
+            self.numbers.pop(chunk_id, None)
+
+
+def cluster_chunks(chunks: List[Dict], threshold: float = DEFAULT_THRESHOLD) -> List[Optional[str]]:
+    """Canonical ID for every chunk (None for canonical chunks), in order."""
+    detector = NearDuplicateDetector(threshold=threshold)
+    ids = [chunk['id'] for chunk in chunks]
+    detector.assign(chunks, ids)
+    return [chunk.pop('canonical_id') for chunk in chunks]
+
+
+def build_report(chunks: List[Dict], embeddings: np.ndarray, query_embeddings: np.ndarray,
+                 thresholds: List[float], k: int = 5) -> List[Dict]:
+    """Index size and retrieval effect of collapsing near-duplicates at each threshold.
+
+    recall@k is measured on distinct content: the full index's top-k, with each
+    hit mapped to its canonical chunk, against the deduplicated index's top-k.
+    `distinct@k` is the average number of distinct chunks in the top-k.
+    """
+    ids = [chunk['id'] for chunk in chunks]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    full = embeddings / np.where(norms == 0, 1.0, norms)
+    queries = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    scores = queries @ full.T
+    bytes_per_chunk = embeddings.shape[1] * 4
+
+    rows = []
+    for threshold in thresholds:
+        canonical_ids = cluster_chunks(chunks, threshold)
+        canonical_of = {cid: canonical or cid for cid, canonical in zip(ids, canonical_ids)}
+        keep = np.array([canonical is None for canonical in canonical_ids])
+
+        reference, candidate, distinct_before, distinct_after = [], [], 0, 0
+        for row in scores:
+            ranked = np.argsort(-row)
+            top_full = [ids[i] for i in ranked[:k]]
+            distinct_before += len({canonical_of[cid] for cid in top_full})
+            # Distinct canonical chunks in full-index rank order
+            reference.append(list(dict.fromkeys(canonical_of[cid] for cid in top_full)))
+            top_dedup = [ids[i] for i in ranked[keep[ranked]][:k]]
+            distinct_after += len(top_dedup)
+            candidate.append(top_dedup)
+
+        n_queries = max(len(scores), 1)
+        rows.append({
+            'threshold': threshold,
+            'chunks': len(ids),
+            'indexed': int(keep.sum()),
+            'index_bytes_saved': int((len(ids) - keep.sum()) * bytes_per_chunk),
+            f'recall@{k}': recall_at_k(reference, candidate, k),
+            'distinct_before': distinct_before / n_queries,
+            'distinct_after': distinct_after / n_queries
+        })
+    return rows
+
+
+def main():
+    """Report how much near-duplicate collapsing shrinks the index and changes recall."""
+    parser = argparse.ArgumentParser(description='Near-duplicate chunk report')
+    parser.add_argument('--store', default=active_path('chunk_store', DEFAULT_STORE_PATH),
+                        help='Chunk store (default: the live index version\'s)')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.95, 0.9, DEFAULT_THRESHOLD, 0.7])
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--dataset', default=DEFAULT_DATASET_PATH)
+    parser.add_argument('--model', default="all-MiniLM-L6-v2")
+    parser.add_argument('--examples', type=int, default=5, help='Duplicate pairs to print')
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    from embedding_cache import EmbeddingCache
+
+    # Every location, including aliases, so the report reflects an undeduplicated corpus
+    chunks = [{'id': c['id'], 'text': c['text']} for c in ChunkStore(args.store).iter_chunks()]
+    print(f"📦 {len(chunks)} chunks from {args.store}")
+
+    model = SentenceTransformer(args.model)
+    cache = EmbeddingCache()
+    embeddings = cache.encode([c['text'] for c in chunks], args.model, model.encode)
+    questions = [qa['question'] for qa in load_eval_questions(args.dataset)]
+    query_embeddings = cache.encode(questions, args.model, model.encode)
+    print(f"   {cache.report()}")
+
+    rows = build_report(chunks, embeddings, query_embeddings, args.thresholds, k=args.k)
+
+    print(f"\n📊 Near-duplicate report ({len(questions)} eval questions)")
+    print(f"{'threshold':>10}{'indexed':>9}{'removed':>9}{'saved KB':>10}"
+          f"{f'recall@{args.k}':>11}{f'distinct@{args.k}':>14}")
+    for row in rows:
+        removed = row['chunks'] - row['indexed']
+        print(f"{row['threshold']:>10.2f}{row['indexed']:>9}{removed:>9}{row['index_bytes_saved'] / 1024:>10.1f}"
+              f"{row[f'recall@{args.k}']:>11.3f}{row['distinct_before']:>7.2f} -> {row['distinct_after']:.2f}")
+
+    if args.examples:
+        texts = {c['id']: c['text'] for c in chunks}
+        pairs = [(cid, canonical) for cid, canonical in
+                 zip([c['id'] for c in chunks], cluster_chunks(chunks, DEFAULT_THRESHOLD)) if canonical]
+        print(f"\nExamples at threshold {DEFAULT_THRESHOLD}:")
+        for cid, canonical in pairs[:args.examples]:
+            print(f"  {cid}  ~  {canonical}\n    {texts[cid][:100]}...")
+
+
+if __name__ == "__main__":
+    main()
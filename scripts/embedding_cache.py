@@ -0,0 +1,181 @@
+"""
+Persistent chunk-embedding cache keyed by (model name, sha256 of text).
+
+Re-running ingestion after a chunker tweak or on byte-identical PDFs only
+pays for text that has never been embedded with that model. The cache is a
+single SQLite file with least-recently-used eviction once it grows past a
+size bound, and it keeps hit/miss counts for reporting.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import argparse
+from typing import List, Callable
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = "data/embedding_cache.db"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Open (or create) the cache database."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Shared by request threads in the backend; statements are serialized on self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _lookup(self, model_name: str, hashes: List[str]) -> dict:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[i:i + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT text_hash, dim, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [model_name] + batch
+            )
+            for row_hash, dim, blob in rows:
+                found[row_hash] = np.frombuffer(blob, dtype=np.float32, count=dim)
+        return found
+
+    def encode(self, texts: List[str], model_name: str, encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return embeddings for `texts`, calling `encode_fn` only for cache misses."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        with self.lock:
+            return self._encode(texts, model_name, encode_fn)
+
+    def _encode(self, texts: List[str], model_name: str, encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        hashes = [text_hash(text) for text in texts]
+        found = self._lookup(model_name, hashes)
+
+        # Encode each distinct missing text once
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in found and h not in missing:
+                missing[h] = text
+
+        now = time.time()
+        if missing:
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            rows = []
+            for h, vector in zip(missing, vectors):
+                found[h] = vector
+                rows.append((model_name, h, vector.shape[0], vector.tobytes(), now))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+        hit_hashes = [h for h in dict.fromkeys(hashes) if h not in missing]
+        if hit_hashes:
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(now, model_name, h) for h in hit_hashes]
+            )
+        self.conn.commit()
+
+        self.misses += sum(1 for h in hashes if h in missing)
+        self.hits += len(hashes) - sum(1 for h in hashes if h in missing)
+
+        if missing:
+            self.evict()
+        return np.stack([found[h] for h in hashes])
+
+    def size_bytes(self) -> int:
+        row = self.conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        return int(row[0])
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries until the cache is under its size bound."""
+        total = self.size_bytes()
+        if total <= self.max_bytes:
+            return 0
+
+        # Evict down to 90% so we don't evict again on the next insert
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        rows = self.conn.execute("SELECT model, text_hash, LENGTH(vector) FROM embeddings ORDER BY last_used")
+        doomed = []
+        for model_name, h, nbytes in rows:
+            if total <= target:
+                break
+            doomed.append((model_name, h))
+            total -= nbytes
+        if doomed:
+            self.conn.executemany("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", doomed)
+            self.conn.commit()
+            removed = len(doomed)
+        return removed
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self) -> str:
+        return (f"Embedding cache: {self.hits} hits, {self.misses} misses "
+                f"({self.hit_rate:.1%} hit rate), {self.size_bytes() / 1024 / 1024:.1f} MB on disk")
+
+
+def main():
+    """Show cache statistics or clear it."""
+    parser = argparse.ArgumentParser(description='Inspect the embedding cache')
+    parser.add_argument('--path', default=DEFAULT_CACHE_PATH)
+    parser.add_argument('--clear', action='store_true', help='Delete every cached embedding')
+    parser.add_argument('--max-mb', type=int, help='Evict down to this size (MB)')
+    args = parser.parse_args()
+
+    cache = EmbeddingCache(args.path)
+    if args.clear:
+        cache.conn.execute("DELETE FROM embeddings")
+        cache.conn.commit()
+        cache.conn.execute("VACUUM")
+        print("🧹 Cleared embedding cache")
+    if args.max_mb:
+        cache.max_bytes = args.max_mb * 1024 * 1024
+        print(f"🧹 Evicted {cache.evict()} entries")
+
+    print(f"📦 {args.path}")
+    for model_name, count, nbytes in cache.conn.execute(
+            "SELECT model, COUNT(*), SUM(LENGTH(vector)) FROM embeddings GROUP BY model"):
+        print(f"   {model_name}: {count} embeddings, {nbytes / 1024 / 1024:.1f} MB")
+    print(f"   Total: {cache.size_bytes() / 1024 / 1024:.1f} MB (limit {cache.max_bytes / 1024 / 1024:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
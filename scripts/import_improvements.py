@@ -1,37 +1,195 @@
 #!/usr/bin/env python3
 """
-Import improved responses from Excel/CSV back to Firebase
+Import improved responses from Excel/CSV back to Firebase (or another interaction store)
 """
 
 import os
 import sys
+import csv
+import time
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 
 # Add the functions directory to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'functions'))
 
-def import_improvements_from_excel(file_path, dry_run=False):
-    """Import improved responses from Excel file"""
+from interaction_store import FirestoreInteractionStore, open_store
+
+# Firestore rejects a WriteBatch with more than 500 writes
+MAX_BATCH_SIZE = 500
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 0.5
+
+# Errors that fail the same way on every attempt; a batch hitting one is split to find the bad rows
+PERMANENT_ERRORS = {'NotFound', 'InvalidArgument', 'FailedPrecondition', 'PermissionDenied', 'Forbidden',
+                    'AlreadyExists', 'Unauthenticated', 'ValueError', 'TypeError'}
+
+REPORT_FIELDS = ['row', 'id', 'status', 'attempts', 'error']
+
+
+def get_store(emulator_host=None, store_url=None):
+    """Interaction store to write to: the configured one, or Firestore on a local emulator."""
+    if emulator_host:
+        # The Firestore client connects to the emulator without credentials when this is set
+        os.environ['FIRESTORE_EMULATOR_HOST'] = emulator_host
+        from google.cloud import firestore
+        return FirestoreInteractionStore(
+            firestore.Client(project=os.environ.get('GOOGLE_CLOUD_PROJECT', 'psip-navigator')))
+    return open_store(store_url)
+
+
+def read_review_sheet(file_path):
+    """All rows of an Excel or CSV review file"""
+    if file_path.endswith('.xlsx'):
+        # Batch exports name the review sheet 'Improvements', full exports 'Interactions'
+        with pd.ExcelFile(file_path) as book:
+            sheet = 'Improvements' if 'Improvements' in book.sheet_names else 'Interactions'
+            return book.parse(sheet)
+    return pd.read_csv(file_path)
+
+
+def load_improvements(file_path):
+    """Rows of an Excel or CSV review file that carry an improved answer ready to import"""
+    df = read_review_sheet(file_path)
+    
+    return df[
+        (df['improved_answer'].notna()) & 
+        (df['improved_answer'] != '') &
+        (df['status'].isin(['improved', 'approved']))
+    ]
+
+
+def _score(value):
+    return int(value) if pd.notna(value) and str(value).isdigit() else None
+
+
+def _text(value):
+    return str(value) if pd.notna(value) else ''
+
+
+def improvement_data(row, imported_at):
+    """Fields written back onto an interaction document"""
+    return {
+        'improved_answer': str(row['improved_answer']),
+        'improvement_notes': _text(row['improvement_notes']),
+        'original_quality_score': _score(row['original_quality_score']),
+        'improved_quality_score': _score(row['improved_quality_score']),
+        'needs_improvement': _text(row['needs_improvement']),
+        'improved_by': _text(row['improved_by']),
+        'improvement_date': _text(row['improvement_date']),
+        'status': str(row['status']),
+        'improvement_imported_at': imported_at
+    }
+
+
+def load_cluster_members(file_path):
+    """{cluster_id: [interaction ids]} from the Cluster_Members sheet of a clustered batch export"""
+    if not file_path.endswith('.xlsx'):
+        return {}
+    with pd.ExcelFile(file_path) as book:
+        if 'Cluster_Members' not in book.sheet_names:
+            return {}
+        members = book.parse('Cluster_Members', dtype={'id': str})
+    return members.groupby('cluster_id')['id'].apply(list).to_dict()
+
+
+def propagate_to_clusters(improved_df, updates, members):
+    """Updates copying each approved improvement onto the other interactions of its question cluster.
+
+    Only 'approved' rows propagate; an interaction that has its own row in
+    the file keeps its own improvement.
+    """
+    if not members or 'cluster_id' not in improved_df:
+        return []
+    reviewed = {update['id'] for update in updates}
+    propagated = []
+    for update, (_, row) in zip(updates, improved_df.iterrows()):
+        if row['status'] != 'approved' or pd.isna(row['cluster_id']):
+            continue
+        for member_id in members.get(int(row['cluster_id']), []):
+            if member_id not in reviewed:
+                reviewed.add(member_id)
+                propagated.append({'row': update['row'], 'id': member_id,
+                                   'data': {**update['data'], 'propagated_from': update['id']}})
+    return propagated
+
+
+def _is_permanent(error):
+    return type(error).__name__ in PERMANENT_ERRORS
+
+
+def _key(update):
+    # Propagated updates share their representative's row, so the row alone is not unique
+    return update['row'], update['id']
+
+
+def _commit_group(store, group, results, max_attempts, sleep=time.sleep):
+    """Commit one group of updates as a single bulk update, retrying transient failures.
+
+    A bulk update is all-or-nothing (a WriteBatch on Firestore, a
+    transaction on SQLite), so when it fails permanently (e.g. one
+    document no longer exists) it is split in half and each half retried,
+    until the failing rows are isolated.
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            store.update_many([(update['id'], update['data']) for update in group])
+            for update in group:
+                results[_key(update)].update(status='updated', attempts=attempt, error='')
+            return
+        except Exception as e:
+            error = e
+            if _is_permanent(e) or attempt == max_attempts:
+                break
+            sleep(RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    
+    if len(group) > 1 and _is_permanent(error):
+        middle = len(group) // 2
+        _commit_group(store, group[:middle], results, max_attempts, sleep)
+        _commit_group(store, group[middle:], results, max_attempts, sleep)
+        return
+    for update in group:
+        results[_key(update)].update(status='failed', attempts=attempt,
+                                      error=f"{type(error).__name__}: {error}")
+
+
+def write_improvements(store, updates, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                       max_attempts=DEFAULT_MAX_ATTEMPTS, sleep=time.sleep):
+    """Apply updates ({'row', 'id', 'data'}) to an interaction store in bulk commits, several in flight at once.
+
+    Returns one result per update, in input order, with its final status,
+    the number of attempts and the error if it failed.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    results = {_key(update): {'row': update['row'], 'id': update['id'], 'status': 'pending',
+                              'attempts': 0, 'error': ''} for update in updates}
+    groups = [updates[i:i + batch_size] for i in range(0, len(updates), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Each group writes only its own rows' results, so the shared dict needs no lock
+        for future in [executor.submit(_commit_group, store, group, results, max_attempts, sleep) for group in groups]:
+            future.result()
+    return [results[_key(update)] for update in updates]
+
+
+def save_report(results, report_path):
+    with open(report_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def import_improvements(file_path, dry_run=False, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                        report_path=None, emulator_host=None, store_url=None):
+    """Import improved responses from an Excel or CSV file in batched interaction store writes"""
     try:
-        from backend_api import db
-        
-        if not db:
-            print("❌ Firebase not initialized")
-            return False
+        store = get_store(emulator_host, store_url)
         
         print(f"📊 Reading improvements from {file_path}...")
-        
-        # Read Excel file
-        df = pd.read_excel(file_path, sheet_name='Interactions')
-        
-        # Filter for rows with improvements
-        improved_df = df[
-            (df['improved_answer'].notna()) & 
-            (df['improved_answer'] != '') &
-            (df['status'].isin(['improved', 'approved']))
-        ]
+        improved_df = load_improvements(file_path)
         
         if improved_df.empty:
             print("❌ No improved responses found in file")
@@ -52,42 +210,35 @@ def import_improvements_from_excel(file_path, dry_run=False):
             print(f"\n... and {len(improved_df) - 5} more rows")
             return True
         
-        # Import improvements to Firebase
-        imported_count = 0
-        error_count = 0
+        # Rows keep their spreadsheet numbering in the report
+        imported_at = datetime.now()
+        updates = [{'row': idx + 1, 'id': str(row['id']), 'data': improvement_data(row, imported_at)}
+                   for idx, row in improved_df.iterrows()]
+        
+        # Approved fixes of a clustered export also go to every paraphrase of the question, in the same batches
+        propagated = propagate_to_clusters(improved_df, updates, load_cluster_members(file_path))
+        if propagated:
+            print(f"🧩 Propagating approved improvements to {len(propagated)} clustered interactions")
+        updates += propagated
         
-        for idx, row in improved_df.iterrows():
-            try:
-                doc_id = row['id']
-                
-                # Prepare improvement data
-                improvement_data = {
-                    'improved_answer': str(row['improved_answer']),
-                    'improvement_notes': str(row['improvement_notes']) if pd.notna(row['improvement_notes']) else '',
-                    'original_quality_score': int(row['original_quality_score']) if pd.notna(row['original_quality_score']) and str(row['original_quality_score']).isdigit() else None,
-                    'improved_quality_score': int(row['improved_quality_score']) if pd.notna(row['improved_quality_score']) and str(row['improved_quality_score']).isdigit() else None,
-                    'needs_improvement': str(row['needs_improvement']) if pd.notna(row['needs_improvement']) else '',
-                    'improved_by': str(row['improved_by']) if pd.notna(row['improved_by']) else '',
-                    'improvement_date': str(row['improvement_date']) if pd.notna(row['improvement_date']) else '',
-                    'status': str(row['status']),
-                    'improvement_imported_at': datetime.now()
-                }
-                
-                # Update the document in Firebase
-                doc_ref = db.collection('interactions').document(doc_id)
-                doc_ref.update(improvement_data)
-                
-                imported_count += 1
-                print(f"✅ Updated interaction {doc_id}")
-                
-            except Exception as e:
-                error_count += 1
-                print(f"❌ Error updating row {idx + 1}: {e}")
+        started = time.time()
+        results = write_improvements(store, updates, batch_size, max_workers)
+        elapsed = time.time() - started
+        
+        imported_count = sum(1 for r in results if r['status'] == 'updated')
+        error_count = len(results) - imported_count
+        for r in results:
+            if r['status'] != 'updated':
+                print(f"❌ Error updating row {r['row']} ({r['id']}): {r['error']}")
+        
+        report_path = report_path or f"{os.path.splitext(file_path)[0]}_import_report.csv"
+        save_report(results, report_path)
         
         print(f"\n📊 Import Summary:")
         print(f"   ✅ Successfully imported: {imported_count}")
         print(f"   ❌ Errors: {error_count}")
-        print(f"   📁 Total processed: {len(improved_df)}")
+        print(f"   📁 Total processed: {len(improved_df)} rows ({len(updates)} interactions) in {elapsed:.1f}s")
+        print(f"   🧾 Per-row report: {report_path}")
         
         return error_count == 0
         
@@ -99,105 +250,21 @@ def import_improvements_from_excel(file_path, dry_run=False):
         print(f"❌ Error importing improvements: {e}")
         return False
 
-def import_improvements_from_csv(file_path, dry_run=False):
+def import_improvements_from_excel(file_path, dry_run=False, **kwargs):
+    """Import improved responses from Excel file"""
+    return import_improvements(file_path, dry_run, **kwargs)
+
+def import_improvements_from_csv(file_path, dry_run=False, **kwargs):
     """Import improved responses from CSV file"""
-    try:
-        from backend_api import db
-        
-        if not db:
-            print("❌ Firebase not initialized")
-            return False
-        
-        print(f"📊 Reading improvements from {file_path}...")
-        
-        # Read CSV file
-        df = pd.read_csv(file_path)
-        
-        # Filter for rows with improvements
-        improved_df = df[
-            (df['improved_answer'].notna()) & 
-            (df['improved_answer'] != '') &
-            (df['status'].isin(['improved', 'approved']))
-        ]
-        
-        if improved_df.empty:
-            print("❌ No improved responses found in file")
-            print("💡 Make sure to fill in 'improved_answer' column and set 'status' to 'improved' or 'approved'")
-            return False
-        
-        print(f"📝 Found {len(improved_df)} improved responses to import")
-        
-        if dry_run:
-            print("\n🔍 DRY RUN - Preview of changes:")
-            for idx, row in improved_df.head(5).iterrows():
-                print(f"\n--- Row {idx + 1} ---")
-                print(f"Question: {row['question'][:100]}...")
-                print(f"Original: {row['original_answer'][:100]}...")
-                print(f"Improved: {row['improved_answer'][:100]}...")
-                print(f"Notes: {row['improvement_notes']}")
-                print(f"Quality Score: {row['quality_score']}")
-            print(f"\n... and {len(improved_df) - 5} more rows")
-            return True
-        
-        # Import improvements to Firebase
-        imported_count = 0
-        error_count = 0
-        
-        for idx, row in improved_df.iterrows():
-            try:
-                doc_id = row['id']
-                
-                # Prepare improvement data
-                improvement_data = {
-                    'improved_answer': str(row['improved_answer']),
-                    'improvement_notes': str(row['improvement_notes']) if pd.notna(row['improvement_notes']) else '',
-                    'original_quality_score': int(row['original_quality_score']) if pd.notna(row['original_quality_score']) and str(row['original_quality_score']).isdigit() else None,
-                    'improved_quality_score': int(row['improved_quality_score']) if pd.notna(row['improved_quality_score']) and str(row['improved_quality_score']).isdigit() else None,
-                    'needs_improvement': str(row['needs_improvement']) if pd.notna(row['needs_improvement']) else '',
-                    'improved_by': str(row['improved_by']) if pd.notna(row['improved_by']) else '',
-                    'improvement_date': str(row['improvement_date']) if pd.notna(row['improvement_date']) else '',
-                    'status': str(row['status']),
-                    'improvement_imported_at': datetime.now()
-                }
-                
-                # Update the document in Firebase
-                doc_ref = db.collection('interactions').document(doc_id)
-                doc_ref.update(improvement_data)
-                
-                imported_count += 1
-                print(f"✅ Updated interaction {doc_id}")
-                
-            except Exception as e:
-                error_count += 1
-                print(f"❌ Error updating row {idx + 1}: {e}")
-        
-        print(f"\n📊 Import Summary:")
-        print(f"   ✅ Successfully imported: {imported_count}")
-        print(f"   ❌ Errors: {error_count}")
-        print(f"   📁 Total processed: {len(improved_df)}")
-        
-        return error_count == 0
-        
-    except Exception as e:
-        print(f"❌ Error importing improvements: {e}")
-        return False
+    return import_improvements(file_path, dry_run, **kwargs)
 
 def generate_training_data(file_path, output_file="training_data.json"):
     """Generate training data from improved responses"""
     try:
-        from backend_api import db
-        
-        if not db:
-            print("❌ Firebase not initialized")
-            return False
-        
         print(f"📊 Generating training data from {file_path}...")
         
-        # Read file
-        if file_path.endswith('.xlsx'):
-            df = pd.read_excel(file_path, sheet_name='Interactions')
-        else:
-            df = pd.read_csv(file_path)
+        # Read file (only the review file is read, so no Firebase connection is needed)
+        df = read_review_sheet(file_path)
         
         # Filter for approved improvements (include ALL improvements regardless of original quality)
         training_df = df[
@@ -219,7 +286,7 @@ def generate_training_data(file_path, output_file="training_data.json"):
                 'question': row['question'],
                 'original_answer': row['original_answer'],
                 'improved_answer': row['improved_answer'],
-                'improvement_notes': row['improvement_notes'],
+                'improvement_notes': row['improvement_notes'] if pd.notna(row['improvement_notes']) else '',
                 'original_quality_score': int(row['original_quality_score']) if pd.notna(row['original_quality_score']) and str(row['original_quality_score']).isdigit() else None,
                 'improved_quality_score': int(row['improved_quality_score']) if pd.notna(row['improved_quality_score']) and str(row['improved_quality_score']).isdigit() else None,
                 'improvement_magnitude': int(row['improved_quality_score']) - int(row['original_quality_score']) if pd.notna(row['improved_quality_score']) and pd.notna(row['original_quality_score']) and str(row['improved_quality_score']).isdigit() and str(row['original_quality_score']).isdigit() else None,
@@ -232,7 +299,8 @@ def generate_training_data(file_path, output_file="training_data.json"):
         # Save training data
         import json
         with open(output_file, 'w') as f:
-            json.dump(training_data, f, indent=2)
+            # Spreadsheet timestamps come back as pandas Timestamps
+            json.dump(training_data, f, indent=2, default=str)
         
         print(f"✅ Generated training data with {len(training_data)} examples")
         print(f"📁 Saved to: {output_file}")
@@ -252,6 +320,15 @@ if __name__ == "__main__":
                        help='Generate training data from approved improvements')
     parser.add_argument('--training-output', default='training_data.json',
                        help='Output file for training data (default: training_data.json)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help=f'Updates per Firestore WriteBatch (max {MAX_BATCH_SIZE}, default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                       help=f'Batches committed in parallel (default: {DEFAULT_MAX_WORKERS})')
+    parser.add_argument('--report', help='Per-row result CSV (default: <file>_import_report.csv)')
+    parser.add_argument('--emulator', metavar='HOST:PORT',
+                       help='Write to a Firestore emulator instead of the live project, e.g. localhost:8080')
+    parser.add_argument('--store', metavar='URL',
+                       help='Interaction store to update: firestore, sqlite[:path] or memory (default: $INTERACTION_STORE or firestore)')
     
     args = parser.parse_args()
     
@@ -264,10 +341,9 @@ if __name__ == "__main__":
     if args.generate_training:
         success = generate_training_data(args.file, args.training_output)
     else:
-        if args.file.endswith('.xlsx'):
-            success = import_improvements_from_excel(args.file, args.dry_run)
-        else:
-            success = import_improvements_from_csv(args.file, args.dry_run)
+        success = import_improvements(args.file, args.dry_run, batch_size=args.batch_size,
+                                      max_workers=args.workers, report_path=args.report,
+                                      emulator_host=args.emulator, store_url=args.store)
     
     if success:
         if args.dry_run:
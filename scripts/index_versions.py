@@ -0,0 +1,282 @@
+"""
+Blue/green versions of the Chroma index.
+
+A full rebuild writes into a fresh, versioned collection (e.g.
+benefits_documents_20261019T101500) while the backend keeps serving the
+current one. The build is validated (chunk count and sample queries) and then
+published by atomically rewriting a small pointer file,
+data/active_index.json, which the backend watches and reloads. The previous
+versions stay in Chroma for instant rollback until they are pruned.
+Incremental updates (add_pdf_to_system.py, upload jobs, the PDF watcher)
+copy the live version into a new one, apply their changes there and
+publish it the same way, so no process ever writes the collection being
+served.
+
+Everything derived from a build lives next to it under
+data/index_versions/<version>/ (chunk store, adjacency index, benefit
+facts, ingestion manifest and, when built, the compressed index), so the
+pointer switches all of it at once and a rollback restores all of it.
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import argparse
+from datetime import datetime
+from typing import List, Dict, Optional, Callable
+
+DEFAULT_POINTER_PATH = "data/active_index.json"
+DEFAULT_VERSIONS_DIR = "data/index_versions"
+DEFAULT_CHROMA_PATH = "./chroma_db"
+BASE_COLLECTION = "benefits_documents"
+
+# Versions kept for rollback, besides the active one
+KEEP_PREVIOUS = 2
+
+# A new build losing more than half the chunks of the live one is almost certainly broken
+MIN_COUNT_RATIO = 0.5
+
+SAMPLE_QUERIES = [
+    "What is the deductible?",
+    "What is the copayment for emergency room visits?",
+    "Do I need a referral to see a specialist?",
+    "Are prescription drugs covered?"
+]
+
+
+def new_version_id() -> str:
+    return datetime.now().strftime("%Y%m%dT%H%M%S")
+
+
+def collection_name(version: str) -> str:
+    return f"{BASE_COLLECTION}_{version}"
+
+
+# Per-version files, by record key
+VERSION_FILES = {
+    'adjacency_index': 'chunk_adjacency.json',
+    'chunk_store': 'chunks.db',
+    'benefit_facts': 'benefit_facts.db',
+    'manifest': 'ingestion_manifest.json'
+}
+COMPRESSED_INDEX_DIR = 'compressed_index'
+
+
+def new_version_record(version: str = None, chroma_path: str = DEFAULT_CHROMA_PATH,
+                       versions_dir: str = DEFAULT_VERSIONS_DIR) -> Dict:
+    """Describe a new index version: its collection and its per-version files."""
+    version = version or new_version_id()
+    record = {
+        'version': version,
+        'collection': collection_name(version),
+        'chroma_path': chroma_path,
+        'files_dir': os.path.join(versions_dir, version),
+        'created_at': datetime.now().isoformat()
+    }
+    for key, name in VERSION_FILES.items():
+        record[key] = os.path.join(versions_dir, version, name)
+    return record
+
+
+def record_path(record: Optional[Dict], key: str, default: str) -> str:
+    """A per-version file of `record`, or `default` for the unversioned index (and older records)."""
+    return (record or {}).get(key) or default
+
+
+def active_path(key: str, default: str, pointer_path: str = DEFAULT_POINTER_PATH) -> str:
+    """A per-version file of the live index version; CLI tools default to it."""
+    return record_path(IndexPointer(pointer_path).active, key, default)
+
+
+def copy_collection(source, target, batch_size: int = 1000) -> int:
+    """Copy the embeddings, documents and metadata of one collection into another, a page at a time."""
+    copied = 0
+    while True:
+        page = source.get(include=['embeddings', 'documents', 'metadatas'], limit=batch_size, offset=copied)
+        if not page['ids']:
+            return copied
+        target.add(ids=page['ids'], embeddings=page['embeddings'], documents=page['documents'],
+                   metadatas=page['metadatas'])
+        copied += len(page['ids'])
+
+
+def copy_sqlite(source: str, destination: str) -> bool:
+    """Copy a SQLite database through the backup API, so pending WAL pages come along; False if none exists."""
+    if not os.path.exists(source):
+        return False
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    source_conn = sqlite3.connect(source)
+    destination_conn = sqlite3.connect(destination)
+    try:
+        source_conn.backup(destination_conn)
+    finally:
+        destination_conn.close()
+        source_conn.close()
+    return True
+
+
+class IndexPointer:
+    def __init__(self, path: str = DEFAULT_POINTER_PATH):
+        """The active index version, the versions kept for rollback and any build in progress."""
+        self.path = path
+        self.active = None
+        self.previous = []
+        self.building = None
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.active = data.get('active')
+            self.previous = data.get('previous', [])
+            self.building = data.get('building')
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.active['version'] if self.active else None
+
+    def active_collection(self, default: str = BASE_COLLECTION) -> str:
+        """Collection to read and write; the legacy single collection until a version is published."""
+        return self.active['collection'] if self.active else default
+
+    def save(self) -> None:
+        """Rewrite the pointer atomically so readers never see a partial file."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'active': self.active, 'previous': self.previous, 'building': self.building}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def start_build(self, record: Dict) -> None:
+        self.building = record
+        self.save()
+
+    def activate(self, record: Dict) -> None:
+        """Publish a validated version; the one it replaces is kept for rollback."""
+        if self.active and self.active['version'] != record['version']:
+            self.previous.insert(0, self.active)
+        self.previous = [r for r in self.previous if r['version'] != record['version']]
+        self.active = dict(record, activated_at=datetime.now().isoformat())
+        if self.building and self.building['version'] == record['version']:
+            self.building = None
+        self.save()
+
+    def rollback(self) -> Dict:
+        """Re-activate the most recent previous version; the current one is dropped."""
+        if not self.previous:
+            raise ValueError("No previous index version to roll back to")
+        self.active = dict(self.previous.pop(0), activated_at=datetime.now().isoformat())
+        self.save()
+        return self.active
+
+    def touch(self, **updates) -> None:
+        """Record an in-place update of the active version so watchers reload it."""
+        if self.active:
+            self.active.update(updates, updated_at=datetime.now().isoformat())
+            self.save()
+
+    def kept_versions(self) -> List[str]:
+        records = [self.active, self.building] + self.previous[:KEEP_PREVIOUS]
+        return [r['version'] for r in records if r]
+
+
+def validate_collection(collection, encode_fn: Callable[[List[str]], List], expected_count: int = None,
+                        baseline_count: int = None, sample_queries: List[str] = SAMPLE_QUERIES,
+                        n_results: int = 3) -> Dict:
+    """Check a built collection before it is published.
+
+    The chunk count must match what the build upserted (and not collapse
+    against the live version), and every sample query must return results
+    whose documents can be fetched.
+    """
+    problems = []
+    count = collection.count()
+    if count == 0:
+        problems.append("collection is empty")
+    if expected_count is not None and count != expected_count:
+        problems.append(f"collection has {count} chunks, build wrote {expected_count}")
+    if baseline_count and count < baseline_count * MIN_COUNT_RATIO:
+        problems.append(f"collection has {count} chunks, live version has {baseline_count}")
+
+    queries = []
+    if count:
+        embeddings = encode_fn(sample_queries)
+        for query, embedding in zip(sample_queries, embeddings):
+            results = collection.query(query_embeddings=[list(map(float, embedding))],
+                                       n_results=min(n_results, count))
+            documents = [doc for doc in results['documents'][0] if doc]
+            queries.append({'query': query, 'results': len(documents),
+                            'top_distance': results['distances'][0][0] if results['distances'][0] else None})
+            if len(documents) < min(n_results, count):
+                problems.append(f"sample query {query!r} returned {len(documents)} result(s)")
+
+    return {'ok': not problems, 'count': count, 'problems': problems, 'queries': queries}
+
+
+def prune_versions(client, pointer: IndexPointer, versions_dir: str = DEFAULT_VERSIONS_DIR) -> List[str]:
+    """Delete versioned collections (and their files) that are neither live nor kept for rollback."""
+    kept = set(pointer.kept_versions())
+    pointer.previous = pointer.previous[:KEEP_PREVIOUS]
+    pointer.save()
+
+    removed = []
+    prefix = f"{BASE_COLLECTION}_"
+    for collection in client.list_collections():
+        name = collection.name
+        if name.startswith(prefix) and name[len(prefix):] not in kept:
+            client.delete_collection(name)
+            removed.append(name[len(prefix):])
+    if os.path.isdir(versions_dir):
+        for version in os.listdir(versions_dir):
+            if version not in kept:
+                shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
+    return removed
+
+
+def main():
+    """Show, validate, roll back or prune index versions."""
+    parser = argparse.ArgumentParser(description='Blue/green index versions')
+    parser.add_argument('command', choices=['status', 'validate', 'rollback', 'prune'])
+    parser.add_argument('--pointer', default=DEFAULT_POINTER_PATH)
+    parser.add_argument('--model', default="all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    pointer = IndexPointer(args.pointer)
+
+    if args.command == 'status':
+        print(f"📌 {args.pointer}")
+        print(f"   Active: {pointer.active['collection'] if pointer.active else f'{BASE_COLLECTION} (unversioned)'}")
+        if pointer.building:
+            print(f"   Building: {pointer.building['collection']} (started {pointer.building['created_at']})")
+        for record in pointer.previous:
+            print(f"   Previous: {record['collection']} ({record.get('chunks', '?')} chunks)")
+        return
+
+    if args.command == 'rollback':
+        record = pointer.rollback()
+        print(f"⏪ Active index is now {record['collection']}; running backends reload it automatically")
+        return
+
+    import chromadb
+    record = pointer.active or {'collection': BASE_COLLECTION, 'chroma_path': DEFAULT_CHROMA_PATH}
+    client = chromadb.PersistentClient(path=record['chroma_path'])
+
+    if args.command == 'prune':
+        removed = prune_versions(client, pointer)
+        print(f"🧹 Removed {len(removed)} old index version(s): {', '.join(removed) or 'none'}")
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+        report = validate_collection(client.get_collection(record['collection']), model.encode,
+                                     expected_count=record.get('chunks'))
+        print(f"{'✅' if report['ok'] else '❌'} {record['collection']}: {report['count']} chunks")
+        for query in report['queries']:
+            distance = 'n/a' if query['top_distance'] is None else f"{query['top_distance']:.3f}"
+            print(f"   {query['query']!r}: {query['results']} results, top distance {distance}")
+        for problem in report['problems']:
+            print(f"   ⚠️  {problem}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""
+Shared ingestion helpers for the PDF vectorizers.
+
+Page extraction is split into contiguous page blocks that run in a process
+pool, and embeddings can be computed with a sentence-transformers
+multi-process encode pool. Results always come back in (file, page, chunk)
+order so chunk IDs are identical to a serial run.
+
+StreamingIngestor runs extraction, chunking, embedding and upserts as a
+generator pipeline in fixed-size batches, so memory stays flat regardless of
+corpus size. Progress is checkpointed per page so an interrupted run resumes
+where it stopped. An optional EmbeddingCache skips re-embedding chunk text
+the model has already seen, and an optional NearDuplicateDetector keeps
+near-duplicate chunks out of the vector index. Page text comes from
+pdf_extraction.PageExtractor, which only sends layout-heavy pages to
+pdfplumber.
+"""
+
+import os
+import json
+import time
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Iterable, Iterator
+
+from adjacency_index import make_chunk_id
+from ingestion_manifest import file_sha256
+from chunking import Chunker, DEFAULT_CHUNKER
+from pdf_extraction import PageExtractor, ExtractionStats, count_pages
+
+# Pages handed to a worker at a time; each worker opens the PDF once per block
+PAGE_BLOCK_SIZE = 8
+
+DEFAULT_CHECKPOINT_PATH = "data/ingestion_checkpoint.json"
+
+
+def resolve_workers(workers: int) -> int:
+    """Translate a --workers value (0 = all cores) into a process count."""
+    if workers is None or workers < 1:
+        return os.cpu_count() or 1
+    return workers
+
+
+def page_to_chunks(text: str, page_num: int, source: str, extra_metadata: Dict = None,
+                   chunker: Chunker = DEFAULT_CHUNKER) -> List[Dict]:
+    """Turn one page of text into vectorizer chunk dicts."""
+    chunks = []
+    if not text:
+        return chunks
+
+    for chunk_idx, chunk_text in enumerate(chunker.split(text)):
+        metadata = {
+            'page_number': page_num,
+            'chunk_index': chunk_idx,
+            'source_file': source,
+            'chunker': chunker.version
+        }
+        metadata.update(extra_metadata or {})
+        chunks.append({
+            'text': chunk_text.strip(),
+            'page': page_num,
+            'chunk': chunk_idx,
+            'source': source,
+            'metadata': metadata
+        })
+    return chunks
+
+
+def extract_pages(pdf_path: str, page_numbers: List[int] = None, extra_metadata: Dict = None,
+                  chunker: Chunker = DEFAULT_CHUNKER, stats: ExtractionStats = None) -> List[Dict]:
+    """Extract and chunk the given pages of one PDF (all pages if None)."""
+    source = os.path.basename(pdf_path)
+    chunks = []
+    with PageExtractor(pdf_path, stats) as extractor:
+        if page_numbers is None:
+            page_numbers = range(1, len(extractor) + 1)
+        for page_num in page_numbers:
+            text = extractor.extract_text(page_num)
+            chunks.extend(page_to_chunks(text, page_num, source, extra_metadata, chunker))
+    return chunks
+
+
+def _extract_block(pdf_path: str, page_numbers: Tuple[int, ...], chunker: Chunker) -> Tuple[List[Dict], Dict]:
+    """Worker entry point: a block's chunks plus its per-engine extraction stats."""
+    stats = ExtractionStats()
+    chunks = extract_pages(pdf_path, page_numbers, None, chunker, stats)
+    return chunks, stats.as_dict()
+
+
+def plan_page_blocks(pdf_paths: List[str], extra_metadata: Dict = None,
+                     pages_by_file: Dict[str, List[int]] = None) -> List[Tuple[str, Tuple[int, ...], Dict]]:
+    """Split PDFs into ordered page blocks for the worker pool.
+
+    `pages_by_file` limits extraction to specific pages of each file.
+    """
+    tasks = []
+    for pdf_path in pdf_paths:
+        if pages_by_file is not None and pdf_path in pages_by_file:
+            page_numbers = sorted(pages_by_file[pdf_path])
+        else:
+            try:
+                page_numbers = list(range(1, count_pages(pdf_path) + 1))
+            except Exception as e:
+                print(f"Error opening {pdf_path}: {str(e)}")
+                continue
+        for i in range(0, len(page_numbers), PAGE_BLOCK_SIZE):
+            tasks.append((pdf_path, tuple(page_numbers[i:i + PAGE_BLOCK_SIZE]), extra_metadata))
+    return tasks
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """Yield lists of up to `size` items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunk_keys(chunk_ids_by_page: Dict[str, Dict[int, List[str]]]) -> List[Dict]:
+    """Rebuild lightweight (source, page, chunk) records from per-page chunk IDs."""
+    keys = []
+    for source_file, pages in chunk_ids_by_page.items():
+        for page_num, ids in pages.items():
+            for chunk_idx, chunk_id in enumerate(ids):
+                keys.append({'source': source_file, 'page': page_num, 'chunk': chunk_idx, 'id': chunk_id})
+    return keys
+
+
+class StageStats:
+    def __init__(self):
+        """Accumulate wall time and item counts per pipeline stage."""
+        self.seconds = {}
+        self.items = {}
+
+    def add(self, stage: str, seconds: float, items: int) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.items[stage] = self.items.get(stage, 0) + items
+
+    def report(self) -> str:
+        """One line per stage with totals and throughput."""
+        lines = []
+        for stage in self.seconds:
+            seconds = self.seconds[stage]
+            rate = self.items[stage] / seconds if seconds > 0 else float('inf')
+            lines.append(f"  {stage:<8} {self.items[stage]:>7} items  {seconds:>8.2f}s  {rate:>9.1f}/s")
+        return "\n".join(lines)
+
+
+class IngestionCheckpoint:
+    def __init__(self, path: str, run_key: str, fingerprints: Dict[str, str] = None):
+        """Track pages whose chunks are already upserted for one ingestion run.
+
+        `fingerprints` maps source files to a content hash; pages completed
+        for a file whose content has changed since are dropped (and the file
+        listed in `invalidated`), so an edited PDF is never half-resumed.
+        """
+        self.path = path
+        self.run_key = run_key
+        self.fingerprints = fingerprints or {}
+        self.completed = {}
+        self.invalidated = []
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('run_key') == run_key:
+                self.completed = data['completed']
+                stored = data.get('files', {})
+                for source_file in sorted(self.completed):
+                    if fingerprints is not None and stored.get(source_file) != fingerprints.get(source_file):
+                        del self.completed[source_file]
+                        self.invalidated.append(source_file)
+
+    @property
+    def resumed_pages(self) -> int:
+        return sum(len(pages) for pages in self.completed.values())
+
+    def is_done(self, source_file: str, page_num: int) -> bool:
+        return str(page_num) in self.completed.get(source_file, {})
+
+    def mark_done(self, source_file: str, page_num: int, chunk_ids: List[str]) -> None:
+        self.completed.setdefault(source_file, {})[str(page_num)] = chunk_ids
+
+    def save(self) -> None:
+        """Persist progress atomically after each upserted batch."""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'run_key': self.run_key, 'files': self.fingerprints, 'completed': self.completed}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def iter_pages(pdf_paths: List[str], pages_by_file: Dict[str, List[int]] = None,
+               skip=None, failed: List = None, stats: ExtractionStats = None) -> Iterator[Tuple[str, int, str]]:
+    """Yield (pdf_path, page_number, text) one page at a time.
+
+    Pages for which `skip(source_file, page_num)` is true are not extracted.
+    A page that fails to extract is recorded in `failed` and skipped.
+    Per-engine page counts and timings are added to `stats`.
+    """
+    for pdf_path in pdf_paths:
+        source = os.path.basename(pdf_path)
+        try:
+            extractor = PageExtractor(pdf_path, stats)
+            page_count = len(extractor)
+        except Exception as e:
+            print(f"Error opening {pdf_path}: {str(e)}")
+            if failed is not None:
+                failed.append((source, None, str(e)))
+            continue
+
+        with extractor:
+            page_numbers = pages_by_file.get(pdf_path) if pages_by_file else None
+            if page_numbers is None:
+                page_numbers = range(1, page_count + 1)
+            for page_num in page_numbers:
+                if skip is not None and skip(source, page_num):
+                    continue
+                try:
+                    text = extractor.extract_text(page_num)
+                except Exception as e:
+                    print(f"Error processing {source} page {page_num}: {str(e)}")
+                    if failed is not None:
+                        failed.append((source, page_num, str(e)))
+                    continue
+                yield pdf_path, page_num, text
+
+
+def _iter_parallel_pages(pdf_paths: List[str], workers: int, pages_by_file: Dict[str, List[int]] = None,
+                         skip=None, failed: List = None, chunker: Chunker = DEFAULT_CHUNKER,
+                         stats: ExtractionStats = None) -> Iterator[Tuple[str, int, List[Dict]]]:
+    """Yield (pdf_path, page_number, chunks) using a bounded window of worker futures."""
+    tasks = []
+    for pdf_path, page_numbers, _ in plan_page_blocks(pdf_paths, None, pages_by_file):
+        source = os.path.basename(pdf_path)
+        remaining = tuple(p for p in page_numbers if skip is None or not skip(source, p))
+        if remaining:
+            tasks.append((pdf_path, remaining))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Only a few blocks are in flight, so finished results never pile up
+        window = deque()
+        task_iter = iter(tasks)
+        for pdf_path, page_numbers in itertools.islice(task_iter, workers * 2):
+            window.append((pdf_path, page_numbers, executor.submit(_extract_block, pdf_path, page_numbers, chunker)))
+        while window:
+            pdf_path, page_numbers, future = window.popleft()
+            next_task = next(task_iter, None)
+            if next_task is not None:
+                window.append((*next_task, executor.submit(_extract_block, *next_task, chunker)))
+            try:
+                chunks, block_stats = future.result()
+            except Exception as e:
+                print(f"Error processing {pdf_path} pages {page_numbers[0]}-{page_numbers[-1]}: {str(e)}")
+                if failed is not None:
+                    failed.extend((os.path.basename(pdf_path), p, str(e)) for p in page_numbers)
+                continue
+            if stats is not None:
+                stats.merge(block_stats)
+            for page_num in page_numbers:
+                yield pdf_path, page_num, [c for c in chunks if c['page'] == page_num]
+
+
+class StreamingIngestor:
+    def __init__(self, model, collection, embed_batch_size: int = 64, upsert_batch_size: int = 256,
+                 workers: int = 1, checkpoint_path: str = DEFAULT_CHECKPOINT_PATH,
+                 embedding_cache=None, model_name: str = None, deduper=None,
+                 chunker: Chunker = DEFAULT_CHUNKER):
+        """Extract -> chunk -> embed -> upsert pipeline with bounded memory.
+
+        With a `deduper`, near-duplicate chunks are passed to `on_batch` as
+        aliases (chunk['canonical_id'] set) but not embedded; the canonical
+        chunk's metadata is refreshed from the deduper's chunk store.
+        """
+        self.model = model
+        self.model_name = model_name
+        self.embedding_cache = embedding_cache
+        self.deduper = deduper
+        self.chunker = chunker
+        self.collection = collection
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.workers = resolve_workers(workers)
+        self.checkpoint_path = checkpoint_path
+        self.stats = StageStats()
+        self.extraction_stats = ExtractionStats()
+        self._file_hashes = {}
+
+    def run_key(self, pdf_paths: List[str], pages_by_file: Dict[str, List[int]] = None) -> str:
+        """Identify a run so a checkpoint is only reused for the same work."""
+        digest = hashlib.sha256(self.chunker.version.encode())
+        # A build into a different (versioned) collection starts over
+        digest.update(getattr(self.collection, 'name', '').encode())
+        for pdf_path in pdf_paths:
+            digest.update(os.path.abspath(pdf_path).encode())
+            if pages_by_file and pdf_path in pages_by_file:
+                digest.update(repr(sorted(pages_by_file[pdf_path])).encode())
+        return digest.hexdigest()
+
+    def file_fingerprints(self, pdf_paths: List[str]) -> Dict[str, str]:
+        """Content hash of each PDF by source file, hashed once per size and mtime."""
+        fingerprints = {}
+        for pdf_path in pdf_paths:
+            try:
+                st = os.stat(pdf_path)
+            except FileNotFoundError:
+                continue
+            key = (os.path.abspath(pdf_path), st.st_size, st.st_mtime_ns)
+            if key not in self._file_hashes:
+                self._file_hashes[key] = file_sha256(pdf_path)
+            fingerprints[os.path.basename(pdf_path)] = self._file_hashes[key]
+        return fingerprints
+
+    def checkpoint(self, pdf_paths: List[str], pages_by_file: Dict[str, List[int]] = None) -> IngestionCheckpoint:
+        """The checkpoint of this work, without pages of files edited since they were ingested."""
+        return IngestionCheckpoint(self.checkpoint_path, self.run_key(pdf_paths, pages_by_file),
+                                   self.file_fingerprints(pdf_paths))
+
+    def _iter_page_chunks(self, pdf_paths, pages_by_file, extra_metadata, skip, failed):
+        """Yield (source_file, page_number, chunks) and time the extract/chunk stages."""
+        if self.workers > 1:
+            source = _iter_parallel_pages(pdf_paths, self.workers, pages_by_file, skip, failed, self.chunker,
+                                          self.extraction_stats)
+            while True:
+                started = time.perf_counter()
+                item = next(source, None)
+                if item is None:
+                    return
+                pdf_path, page_num, chunks = item
+                for chunk in chunks:
+                    chunk['metadata'].update(extra_metadata or {})
+                self.stats.add('extract', time.perf_counter() - started, 1)
+                yield os.path.basename(pdf_path), page_num, chunks
+        else:
+            pages = iter_pages(pdf_paths, pages_by_file, skip, failed, self.extraction_stats)
+            while True:
+                started = time.perf_counter()
+                item = next(pages, None)
+                if item is None:
+                    return
+                pdf_path, page_num, text = item
+                self.stats.add('extract', time.perf_counter() - started, 1)
+
+                started = time.perf_counter()
+                source_file = os.path.basename(pdf_path)
+                chunks = page_to_chunks(text, page_num, source_file, extra_metadata, self.chunker)
+                self.stats.add('chunk', time.perf_counter() - started, len(chunks))
+                yield source_file, page_num, chunks
+
+    def _encode(self, texts: List[str], pool):
+        if pool is not None:
+            return self.model.encode_multi_process(texts, pool, batch_size=self.embed_batch_size)
+        return self.model.encode(texts, batch_size=self.embed_batch_size)
+
+    def embed_and_upsert(self, chunks: List[Dict], ids: List[str], pool=None) -> None:
+        """Embed chunk texts (through the cache if any) and upsert them into the collection."""
+        texts = [chunk['text'] for chunk in chunks]
+        started = time.perf_counter()
+        if self.embedding_cache is not None:
+            embeddings = self.embedding_cache.encode(
+                texts, self.model_name, lambda missing: self._encode(missing, pool)).tolist()
+        else:
+            embeddings = self._encode(texts, pool).tolist()
+        self.stats.add('embed', time.perf_counter() - started, len(texts))
+
+        started = time.perf_counter()
+        self.collection.upsert(
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=[chunk['metadata'] for chunk in chunks],
+            ids=ids
+        )
+        self.stats.add('upsert', time.perf_counter() - started, len(chunks))
+
+    def refresh_locations(self, canonical_ids) -> None:
+        """Write merged source locations onto canonical chunks in the collection."""
+        if self.deduper is None or not canonical_ids:
+            return
+        ids, metadatas = self.deduper.store.chroma_metadata(sorted(canonical_ids))
+        if ids:
+            self.collection.update(ids=ids, metadatas=metadatas)
+
+    def _flush(self, pages: List[Tuple[str, int, List[Dict]]], checkpoint: IngestionCheckpoint,
+               pool, on_batch) -> None:
+        """Embed and upsert a group of whole pages, then checkpoint them."""
+        chunks = [chunk for _, _, page_chunks in pages for chunk in page_chunks]
+        ids = [make_chunk_id(c['source'], c['page'], c['chunk']) for c in chunks]
+
+        if chunks:
+            if self.deduper is not None:
+                started = time.perf_counter()
+                self.deduper.assign(chunks, ids)
+                self.stats.add('dedupe', time.perf_counter() - started, len(chunks))
+
+            embedded = [(chunk, cid) for chunk, cid in zip(chunks, ids) if not chunk.get('canonical_id')]
+            if embedded:
+                self.embed_and_upsert([c for c, _ in embedded], [cid for _, cid in embedded], pool)
+            aliased = [cid for chunk, cid in zip(chunks, ids) if chunk.get('canonical_id')]
+            if aliased:
+                # A re-ingested chunk may have been embedded before it became a duplicate
+                self.collection.delete(ids=aliased)
+
+            if on_batch is not None:
+                on_batch(chunks, ids)
+            self.refresh_locations({c['canonical_id'] for c in chunks if c.get('canonical_id')})
+
+        for source_file, page_num, page_chunks in pages:
+            page_ids = [make_chunk_id(c['source'], c['page'], c['chunk']) for c in page_chunks]
+            checkpoint.mark_done(source_file, page_num, page_ids)
+        checkpoint.save()
+
+    def run(self, pdf_paths: List[str], pages_by_file: Dict[str, List[int]] = None,
+            extra_metadata: Dict = None, on_batch=None, on_progress=None) -> Dict:
+        """
+        Stream PDFs through the pipeline.
+
+        `on_batch(chunks, ids)` is called after each upserted batch and
+        `on_progress(pages_done, stats)` after each checkpoint. Returns
+        {'chunk_ids_by_page': {source_file: {page: [ids]}}, 'failed': [...],
+        'resumed_pages': n, 'extraction': per-engine stats}; chunk IDs include
+        pages finished by an earlier, interrupted run of the same work.
+        """
+        checkpoint = self.checkpoint(pdf_paths, pages_by_file)
+        resumed_pages = checkpoint.resumed_pages
+        if resumed_pages:
+            print(f"⏩ Resuming: {resumed_pages} page(s) already ingested by an interrupted run")
+
+        failed = []
+        pool = None
+        if self.workers > 1:
+            pool = self.model.start_multi_process_pool(target_devices=['cpu'] * self.workers)
+
+        try:
+            buffered_pages = []
+            buffered_chunks = 0
+            for source_file, page_num, chunks in self._iter_page_chunks(
+                    pdf_paths, pages_by_file, extra_metadata, checkpoint.is_done, failed):
+                buffered_pages.append((source_file, page_num, chunks))
+                buffered_chunks += len(chunks)
+                if buffered_chunks >= self.upsert_batch_size:
+                    self._flush(buffered_pages, checkpoint, pool, on_batch)
+                    print(f"  ⬆️  Upserted through {source_file} page {page_num}")
+                    buffered_pages = []
+                    buffered_chunks = 0
+                    if on_progress is not None:
+                        on_progress(checkpoint.resumed_pages, self.stats)
+            if buffered_pages:
+                self._flush(buffered_pages, checkpoint, pool, on_batch)
+            if on_progress is not None:
+                on_progress(checkpoint.resumed_pages, self.stats)
+        finally:
+            if pool is not None:
+                self.model.stop_multi_process_pool(pool)
+
+        print("📈 Stage throughput:")
+        print(self.stats.report())
+        if self.extraction_stats.pages:
+            print("📑 Extraction engines:")
+            print(self.extraction_stats.report())
+        if self.embedding_cache is not None:
+            print(f"🗄️  {self.embedding_cache.report()}")
+        if self.deduper is not None:
+            print(f"🧬 Collapsed {self.deduper.collapsed} near-duplicate chunk(s) into existing chunks")
+        if failed:
+            print(f"⚠️  {len(failed)} page(s) failed and were skipped: "
+                  + ", ".join(f"{source} p{page}" for source, page, _ in failed[:10]))
+
+        chunk_ids_by_page = {source: {int(p): ids for p, ids in pages.items()}
+                             for source, pages in checkpoint.completed.items()}
+        if not failed:
+            checkpoint.clear()
+        return {'chunk_ids_by_page': chunk_ids_by_page, 'failed': failed, 'resumed_pages': resumed_pages,
+                'extraction': self.extraction_stats.as_dict()}
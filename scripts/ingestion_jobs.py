@@ -0,0 +1,253 @@
+"""
+Background ingestion jobs for the document upload API.
+
+backend_api queues uploads and deletions as jobs; a single worker process
+runs them one at a time through SmartPDFVectorizer, off the request path and
+at a lower CPU priority, so query serving is never starved. Each job builds a
+new index version from the live one and publishes it through the index
+pointer, which the backend watches, so the worker never writes a collection
+the backend is serving. Jobs are serialized because each builds on the
+version the previous one published.
+
+The worker is this module run as a script (`python scripts/ingestion_jobs.py
+worker`), a fresh interpreter that never imports the backend. The backend
+feeds it job IDs on stdin from a dispatcher thread and reads one line back
+per finished job; a worker that dies is replaced for the next job, and the
+job it was running is marked failed.
+
+Each job is a small JSON file under data/ingestion_jobs/ holding its status,
+progress and per-stage timings, so the status survives backend restarts.
+"""
+
+import os
+import sys
+import json
+import uuid
+import queue
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from typing import List, Dict, Optional
+
+DEFAULT_JOBS_DIR = "data/ingestion_jobs"
+DEFAULT_PDF_DIR = "assets/pdfs"
+DEFAULT_MAX_PENDING = 10
+
+# Added to the worker's nice value so ingestion yields the CPU to query serving
+WORKER_NICENESS = 10
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobStore:
+    def __init__(self, jobs_dir: str = DEFAULT_JOBS_DIR):
+        """Job records as one JSON file per job."""
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.jobs_dir = jobs_dir
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def create(self, kind: str, source_file: str) -> Dict:
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'kind': kind,
+            'source_file': source_file,
+            'status': 'queued',
+            'stage': 'queued',
+            'pages_done': 0,
+            'pages_total': None,
+            'stage_seconds': {},
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        self.save(job)
+        return job
+
+    def save(self, job: Dict) -> None:
+        """Rewrite a job atomically so status readers never see a partial file."""
+        tmp_path = f"{self._path(job['job_id'])}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp_path, self._path(job['job_id']))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        # Job IDs are uuid4 hex; anything else could escape the jobs directory
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def update(self, job_id: str, **fields) -> Dict:
+        job = self.get(job_id)
+        job.update(fields)
+        self.save(job)
+        return job
+
+    def list(self) -> List[Dict]:
+        jobs = [self.get(name[:-len('.json')]) for name in os.listdir(self.jobs_dir) if name.endswith('.json')]
+        return sorted((job for job in jobs if job), key=lambda job: job['created_at'])
+
+    def active(self) -> List[Dict]:
+        return [job for job in self.list() if job['status'] in ACTIVE_STATUSES]
+
+
+_vectorizer = None
+
+
+def run_job(job_id: str, jobs_dir: str, pdf_dir: str, workers: int) -> Dict:
+    """Run one ingestion job inside the worker process."""
+    global _vectorizer
+
+    store = JobStore(jobs_dir)
+    job = store.update(job_id, status='running', stage='starting', started_at=datetime.now().isoformat())
+
+    def on_progress(stage, pages_done, pages_total, stage_seconds):
+        store.update(job_id, stage=stage, pages_done=pages_done, pages_total=pages_total,
+                     stage_seconds={name: round(seconds, 3) for name, seconds in stage_seconds.items()})
+
+    try:
+        # The embedding model stays loaded in the worker between jobs
+        if _vectorizer is None:
+            from add_pdf_to_system import SmartPDFVectorizer
+            _vectorizer = SmartPDFVectorizer()
+        if job['kind'] == 'delete':
+            result = _vectorizer.add_new_documents(pdf_dir, remove_files=[job['source_file']], workers=workers,
+                                                   on_progress=on_progress)
+        else:
+            pdf_path = os.path.join(pdf_dir, job['source_file'])
+            result = _vectorizer.add_new_documents(pdf_dir, specific_files=[pdf_path], workers=workers,
+                                                   on_progress=on_progress)
+        stage_seconds = {name: round(seconds, 3) for name, seconds in result.pop('stage_seconds').items()}
+        return store.update(job_id, status='succeeded', stage='done', result=result, stage_seconds=stage_seconds,
+                            finished_at=datetime.now().isoformat())
+    except Exception as e:
+        return store.update(job_id, status='failed', stage='failed', error=str(e),
+                            finished_at=datetime.now().isoformat())
+
+
+def worker_main(jobs_dir: str, pdf_dir: str, workers: int) -> None:
+    """Run the job IDs read from stdin one at a time, answering each with a line on stdout."""
+    try:
+        os.nice(WORKER_NICENESS)
+    except (AttributeError, OSError):
+        pass
+    # Progress output goes to stderr; stdout only carries the replies
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    for line in sys.stdin:
+        job_id = line.strip()
+        if job_id:
+            job = run_job(job_id, jobs_dir, pdf_dir, workers)
+            replies.write(f"{job_id} {job['status']}\n")
+            replies.flush()
+
+
+class IngestionJobRunner:
+    def __init__(self, jobs_dir: str = DEFAULT_JOBS_DIR, pdf_dir: str = DEFAULT_PDF_DIR,
+                 max_pending: int = DEFAULT_MAX_PENDING, workers: int = 1):
+        """Queue jobs for one low-priority worker process.
+
+        `max_pending` bounds queued plus running jobs; `workers` is the
+        extraction/embedding parallelism inside a job.
+        """
+        self.store = JobStore(jobs_dir)
+        self.pdf_dir = pdf_dir
+        self.max_pending = max_pending
+        self.workers = workers
+        self.queue = queue.Queue()
+        self.process = None
+        self.dispatcher = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def _worker(self) -> subprocess.Popen:
+        """The worker process, started again if it is not running."""
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), 'worker', '--jobs-dir', self.store.jobs_dir,
+                 '--pdf-dir', self.pdf_dir, '--workers', str(self.workers)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+            )
+        return self.process
+
+    def _dispatch(self) -> None:
+        while True:
+            job_id = self.queue.get()
+            if job_id is None:
+                return
+            process = self._worker()
+            try:
+                process.stdin.write(f"{job_id}\n")
+                process.stdin.flush()
+                reply = process.stdout.readline()
+            except (BrokenPipeError, OSError, ValueError):
+                reply = ''
+            if reply:
+                continue
+            if self.stopped.is_set():
+                return
+
+            # The worker died mid-job (crash, OOM kill); the next job gets a new one
+            process.kill()
+            returncode = process.wait()
+            job = self.store.get(job_id)
+            if job and job['status'] in ACTIVE_STATUSES:
+                self.store.update(job_id, status='failed', stage='failed',
+                                  error=f"Ingestion worker exited with code {returncode}",
+                                  finished_at=datetime.now().isoformat())
+
+    def _enqueue(self, job_id: str) -> None:
+        with self.lock:
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+                self.dispatcher.start()
+        self.queue.put(job_id)
+
+    def is_full(self) -> bool:
+        return len(self.store.active()) >= self.max_pending
+
+    def submit(self, kind: str, source_file: str) -> Dict:
+        job = self.store.create(kind, source_file)
+        self._enqueue(job['job_id'])
+        return job
+
+    def resume_interrupted(self) -> List[Dict]:
+        """Requeue jobs left queued or running by a previous backend process."""
+        resumed = []
+        for job in self.store.active():
+            self.store.update(job['job_id'], status='queued', stage='queued')
+            self._enqueue(job['job_id'])
+            resumed.append(job)
+        return resumed
+
+    def shutdown(self) -> None:
+        """Stop the worker; its current job stays active and is requeued by the next backend process."""
+        self.stopped.set()
+        self.queue.put(None)
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+def main():
+    """Run the ingestion worker (started by the backend, not by hand)."""
+    parser = argparse.ArgumentParser(description='Ingestion job worker')
+    parser.add_argument('command', choices=['worker'])
+    parser.add_argument('--jobs-dir', default=DEFAULT_JOBS_DIR)
+    parser.add_argument('--pdf-dir', default=DEFAULT_PDF_DIR)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    worker_main(args.jobs_dir, args.pdf_dir, args.workers)
+
+
+if __name__ == "__main__":
+    main()
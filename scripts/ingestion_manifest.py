@@ -0,0 +1,193 @@
+"""
+Persistent content-hash manifest for incremental ingestion.
+
+The manifest records, for every ingested PDF, its size, mtime and sha256,
+plus a hash of each page's raw content streams and the chunk IDs that page
+produced. It also pins the chunker version and embedding model, so a change
+to either forces a rebuild. Unchanged files are skipped on size/mtime alone,
+which keeps a no-op run to a few milliseconds.
+
+Writers of the manifest (the CLI, background upload jobs, the folder
+watcher, full rebuilds) serialize on ingestion_lock().
+"""
+
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+from typing import List, Dict, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_MANIFEST_PATH = "data/ingestion_manifest.json"
+DEFAULT_LOCK_PATH = "data/ingestion.lock"
+
+
+@contextmanager
+def ingestion_lock(path: str = DEFAULT_LOCK_PATH):
+    """Hold an exclusive lock across processes while the manifest, chunk store and index are updated."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def file_sha256(path: str) -> str:
+    """Hash a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_content_hash(page) -> str:
+    """Hash a pdfplumber page's raw content streams (no text extraction)."""
+    from pdfminer.pdftypes import resolve1
+
+    digest = hashlib.sha256()
+    try:
+        page_obj = page.page_obj
+        digest.update(repr(page_obj.mediabox).encode())
+        for stream in page_obj.contents:
+            digest.update(resolve1(stream).get_data())
+    except Exception:
+        # Unusual page structure: fall back to hashing the extracted text
+        digest.update((page.extract_text() or '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+def hash_pdf_pages(pdf_path: str) -> Dict[int, str]:
+    """Return {page_number: content hash} for every page in a PDF."""
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        return {page_num: page_content_hash(page) for page_num, page in enumerate(pdf.pages, 1)}
+
+
+class IngestionManifest:
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH, data: Dict = None):
+        """Wrap manifest data loaded from `path`."""
+        self.path = path
+        self.data = data or {'version': 1, 'chunker_version': None, 'model_name': None, 'files': {}}
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MANIFEST_PATH) -> 'IngestionManifest':
+        """Load the manifest, or start an empty one if none exists."""
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, 'r') as f:
+            return cls(path, json.load(f))
+
+    def save(self) -> None:
+        """Write the manifest atomically."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def files(self) -> Dict[str, Dict]:
+        return self.data['files']
+
+    def is_compatible(self, chunker_version: str, model_name: str) -> bool:
+        """True if existing chunks were built with the same chunker and model."""
+        return (self.data.get('chunker_version') == chunker_version
+                and self.data.get('model_name') == model_name)
+
+    def reset(self, chunker_version: str, model_name: str) -> List[str]:
+        """Forget all files (returns their chunk IDs) and pin a new chunker/model."""
+        orphaned = self.all_chunk_ids()
+        self.data = {'version': 1, 'chunker_version': chunker_version, 'model_name': model_name, 'files': {}}
+        return orphaned
+
+    def all_chunk_ids(self) -> List[str]:
+        """Every chunk ID recorded in the manifest."""
+        return [cid for entry in self.files.values()
+                for page in entry['pages'].values() for cid in page['chunk_ids']]
+
+    def is_unchanged(self, pdf_path: str) -> bool:
+        """Cheap check: same size and mtime as when last ingested."""
+        entry = self.files.get(os.path.basename(pdf_path))
+        if entry is None:
+            return False
+        stat = os.stat(pdf_path)
+        return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+
+    def diff_file(self, pdf_path: str) -> Tuple[str, Dict[int, str], List[int], List[str]]:
+        """
+        Compare a PDF against the manifest.
+
+        Returns (file hash, page hashes, page numbers that need re-extraction,
+        chunk IDs of pages that no longer exist).
+        """
+        entry = self.files.get(os.path.basename(pdf_path), {'sha256': None, 'pages': {}})
+        sha = file_sha256(pdf_path)
+        if sha == entry['sha256']:
+            return sha, {int(p): page['sha256'] for p, page in entry['pages'].items()}, [], []
+
+        page_hashes = hash_pdf_pages(pdf_path)
+        changed = [page_num for page_num, page_hash in page_hashes.items()
+                   if entry['pages'].get(str(page_num), {}).get('sha256') != page_hash]
+        removed = [cid for p, page in entry['pages'].items()
+                   if int(p) not in page_hashes for cid in page['chunk_ids']]
+        return sha, page_hashes, changed, removed
+
+    def page_chunk_ids(self, source_file: str, page_num: int) -> List[str]:
+        """Chunk IDs previously produced by one page."""
+        entry = self.files.get(source_file, {'pages': {}})
+        return entry['pages'].get(str(page_num), {}).get('chunk_ids', [])
+
+    def record_file(self, pdf_path: str, sha: str, page_hashes: Dict[int, str],
+                    chunk_ids_by_page: Dict[int, List[str]]) -> None:
+        """Store the state of a file after (re)ingestion.
+
+        Pages missing from `chunk_ids_by_page` keep their previous chunk IDs.
+        A page hash of None marks a page that failed to extract; the file is
+        then stored without its hash, size and mtime so the next run diffs
+        its pages again and retries that page.
+        """
+        source_file = os.path.basename(pdf_path)
+        stat = os.stat(pdf_path)
+        pages = {}
+        for page_num, page_hash in page_hashes.items():
+            if page_num in chunk_ids_by_page:
+                chunk_ids = chunk_ids_by_page[page_num]
+            else:
+                chunk_ids = self.page_chunk_ids(source_file, page_num)
+            pages[str(page_num)] = {'sha256': page_hash, 'chunk_ids': chunk_ids}
+
+        complete = all(page_hash is not None for page_hash in page_hashes.values())
+        self.files[source_file] = {
+            'sha256': sha if complete else None,
+            'size': stat.st_size if complete else None,
+            'mtime': stat.st_mtime if complete else None,
+            'pages': pages
+        }
+
+    def touch_file(self, pdf_path: str) -> None:
+        """Refresh size/mtime for a file whose content hash did not change."""
+        entry = self.files[os.path.basename(pdf_path)]
+        stat = os.stat(pdf_path)
+        entry['size'] = stat.st_size
+        entry['mtime'] = stat.st_mtime
+
+    def remove_file(self, source_file: str) -> List[str]:
+        """Drop a file from the manifest and return its chunk IDs."""
+        entry = self.files.pop(source_file, None)
+        if entry is None:
+            return []
+        return [cid for page in entry['pages'].values() for cid in page['chunk_ids']]
@@ -0,0 +1,354 @@
+"""
+Rotating, per-worker CSV log of interactions.
+
+Every backend process used to append to one data/interaction_log.csv with
+no locking, deciding whether to write the header with os.path.exists (a
+race between workers) and letting the file grow forever. Instead, each
+process now writes its own segment inside a date partition:
+
+    data/interaction_log/segments/date=2025-10-27/<host>-<pid>-0003.csv.open
+
+A segment is only ever written by the process that created it, so rows
+from different workers can never interleave and the header is written
+exactly once. When the date changes, the segment reaches its size limit or
+the process shuts down, it is sealed by an atomic rename to `.csv` (or
+gzipped to `.csv.gz`). Readers never see a half-rotated file.
+
+The compactor merges the sealed segments of finished days into one Parquet
+file per batch under archive/date=.../, and read_log() streams archives
+and segments in chunks, so analysis runs in constant memory whatever the
+size of the log.
+
+    python scripts/interaction_log.py compact
+    python scripts/interaction_log.py stats
+"""
+
+import io
+import os
+import csv
+import gzip
+import time
+import socket
+import shutil
+import hashlib
+import argparse
+import threading
+from datetime import date
+from typing import Dict, List, Iterator, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    pyarrow_available = True
+except ImportError:
+    pyarrow_available = False
+
+DEFAULT_LOG_DIR = "data/interaction_log"
+DEFAULT_MAX_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_CHUNK_ROWS = 50000
+
+# An open segment untouched this long belongs to a process that died without sealing it
+STALE_SEGMENT_SECONDS = 24 * 3600
+
+LOG_FIELDS = [
+    'timestamp', 'question', 'answer', 'model', 'error',
+    'contexts_used', 'improved_response', 'improvement_notes',
+    'category', 'priority'
+]
+
+OPEN_SUFFIX = '.csv.open'
+SEALED_SUFFIXES = ('.csv', '.csv.gz')
+ARCHIVE_SUFFIX = '.parquet'
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _partition(root: str, day: date) -> str:
+    return os.path.join(root, f"date={day.isoformat()}")
+
+
+def _partition_day(name: str) -> Optional[date]:
+    if not name.startswith('date='):
+        return None
+    try:
+        return date.fromisoformat(name[len('date='):])
+    except ValueError:
+        return None
+
+
+def _partitions(root: str) -> List[tuple]:
+    """(day, directory) for each date partition under `root`, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    days = [(_partition_day(name), os.path.join(root, name)) for name in os.listdir(root)]
+    return sorted((day, path) for day, path in days if day is not None)
+
+
+def seal_segment(path: str, compress: bool = False) -> str:
+    """Atomically turn an open segment into a sealed one; returns the sealed path."""
+    base = path[:-len(OPEN_SUFFIX)]
+    if not compress:
+        os.replace(path, base + '.csv')
+        return base + '.csv'
+    tmp_path = base + '.csv.gz.tmp'
+    with open(path, 'rb') as source, gzip.open(tmp_path, 'wb') as target:
+        shutil.copyfileobj(source, target)
+    os.replace(tmp_path, base + '.csv.gz')
+    os.remove(path)
+    return base + '.csv.gz'
+
+
+class InteractionLogWriter:
+    def __init__(self, log_dir: str = DEFAULT_LOG_DIR, max_bytes: int = DEFAULT_MAX_SEGMENT_BYTES,
+                 compress: bool = False):
+        """Append interactions to this process's own segment, rotating by day and size."""
+        self.segments_dir = os.path.join(log_dir, 'segments')
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.file = None
+        self.writer = None
+        self.path = None
+        self.day = None
+        self.pid = None
+
+    def _open(self, day: date) -> None:
+        directory = _partition(self.segments_dir, day)
+        os.makedirs(directory, exist_ok=True)
+        worker = worker_name()
+        # Numbering continues after any segment this worker name left before (e.g. a reused pid)
+        numbers = [int(name[len(worker) + 1:].split('.', 1)[0]) for name in os.listdir(directory)
+                   if name.startswith(worker + '-') and name[len(worker) + 1:].split('.', 1)[0].isdigit()]
+        self.path = os.path.join(directory, f"{worker}-{max(numbers, default=0) + 1:04d}{OPEN_SUFFIX}")
+        # 'x' fails rather than append to a segment some other process owns
+        self.file = open(self.path, 'x', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=LOG_FIELDS, extrasaction='ignore')
+        self.writer.writeheader()
+        self.day = day
+        self.pid = os.getpid()
+
+    def _seal(self) -> None:
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if self.pid == os.getpid() and os.path.exists(self.path):
+            seal_segment(self.path, self.compress)
+
+    def write(self, row: Dict) -> None:
+        """Append one row (LOG_FIELDS keys) and flush it to disk."""
+        with self.lock:
+            today = date.today()
+            if self.file is not None and self.pid != os.getpid():
+                # Forked after opening: the segment belongs to the parent, start our own
+                self.file.close()
+                self.file = None
+            if self.file is not None and (self.day != today or self.file.tell() >= self.max_bytes):
+                self._seal()
+            if self.file is None:
+                self._open(today)
+            self.writer.writerow(row)
+            self.file.flush()
+
+    def close(self) -> None:
+        """Seal the current segment."""
+        with self.lock:
+            self._seal()
+
+
+def segment_paths(log_dir: str = DEFAULT_LOG_DIR, start_date: date = None, end_date: date = None,
+                  include_open: bool = False) -> List[str]:
+    """Segment files in date order (within a day, by name), optionally including open ones."""
+    suffixes = SEALED_SUFFIXES + ((OPEN_SUFFIX,) if include_open else ())
+    paths = []
+    for day, directory in _partitions(os.path.join(log_dir, 'segments')):
+        if (start_date and day < start_date) or (end_date and day > end_date):
+            continue
+        paths.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                     if name.endswith(suffixes))
+    return paths
+
+
+def archive_paths(log_dir: str = DEFAULT_LOG_DIR, start_date: date = None, end_date: date = None) -> List[str]:
+    paths = []
+    for day, directory in _partitions(os.path.join(log_dir, 'archive')):
+        if (start_date and day < start_date) or (end_date and day > end_date):
+            continue
+        paths.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                     if name.endswith(ARCHIVE_SUFFIX))
+    return paths
+
+
+def _complete_rows(path: str) -> io.StringIO:
+    """An open segment up to the end of its last complete row.
+
+    The writer may be halfway through a row, which must not be read as a
+    (truncated) row of its own. Open segments are at most one rotation in
+    size, so this reads the file into memory.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        text = f.read()
+    consumed = complete = 0
+
+    def track():
+        nonlocal consumed
+        for line in io.StringIO(text, newline=''):
+            consumed += len(line)
+            yield line
+
+    reader = csv.reader(track(), strict=True)
+    try:
+        for row in reader:
+            if len(row) == len(LOG_FIELDS) and text[consumed - 1:consumed] == '\n':
+                complete = consumed
+    except csv.Error:
+        pass
+    return io.StringIO(text[:complete])
+
+
+def _read_csv_chunks(path: str, chunksize: int, columns: List[str] = None) -> Iterator[pd.DataFrame]:
+    source = path
+    if path.endswith(OPEN_SUFFIX):
+        try:
+            source = _complete_rows(path)
+        except FileNotFoundError:
+            # Sealed since it was listed
+            base = path[:-len(OPEN_SUFFIX)]
+            source = next((base + suffix for suffix in SEALED_SUFFIXES if os.path.exists(base + suffix)), None)
+            if source is None:
+                return
+    text_fields = {field: str for field in LOG_FIELDS if field != 'contexts_used' and (not columns or field in columns)}
+    with pd.read_csv(source, chunksize=chunksize, usecols=columns, dtype=text_fields) as reader:
+        yield from reader
+
+
+def read_log(source: str = DEFAULT_LOG_DIR, chunksize: int = DEFAULT_CHUNK_ROWS, columns: List[str] = None,
+             start_date: date = None, end_date: date = None, include_open: bool = True) -> Iterator[pd.DataFrame]:
+    """Stream the log as DataFrames of at most `chunksize` rows.
+
+    `source` is a log directory (the archives, then the segments, each in
+    date order) or a single CSV file such as the old data/interaction_log.csv.
+    """
+    if os.path.isfile(source):
+        yield from _read_csv_chunks(source, chunksize, columns)
+        return
+    for path in archive_paths(source, start_date, end_date):
+        if not pyarrow_available:
+            raise RuntimeError("Reading archived log segments needs pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    for path in segment_paths(source, start_date, end_date, include_open):
+        yield from _read_csv_chunks(path, chunksize, columns)
+
+
+def seal_stale_segments(log_dir: str = DEFAULT_LOG_DIR, compress: bool = False,
+                        max_age: float = STALE_SEGMENT_SECONDS) -> List[str]:
+    """Seal open segments of past days that nobody has written to for `max_age` seconds."""
+    sealed = []
+    today = date.today()
+    for path in segment_paths(log_dir, include_open=True):
+        if not path.endswith(OPEN_SUFFIX):
+            continue
+        day = _partition_day(os.path.basename(os.path.dirname(path)))
+        # A live writer rolls over to a new segment before writing on a new day, so these are safe to seal
+        if day < today and time.time() - os.path.getmtime(path) > max_age:
+            sealed.append(seal_segment(path, compress))
+    return sealed
+
+
+def _archive_schema():
+    return pa.schema([(field, pa.int64() if field == 'contexts_used' else pa.string()) for field in LOG_FIELDS])
+
+
+def compact(log_dir: str = DEFAULT_LOG_DIR, before: date = None, chunksize: int = DEFAULT_CHUNK_ROWS) -> Dict[str, int]:
+    """Merge the sealed segments of each day before `before` (default: today) into a Parquet archive.
+
+    The archive file is named after the segments it holds and written
+    atomically before they are deleted, so an interrupted run is simply
+    repeated: a batch whose archive already exists only has its segments
+    removed.
+    """
+    if not pyarrow_available:
+        raise RuntimeError("Compaction needs pyarrow: pip install pyarrow")
+    before = before or date.today()
+    schema = _archive_schema()
+    parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+    convert_options = pa_csv.ConvertOptions(column_types=schema, include_columns=LOG_FIELDS,
+                                            include_missing_columns=True, strings_can_be_null=True)
+    totals = {'days': 0, 'segments': 0, 'rows': 0}
+
+    for day, directory in _partitions(os.path.join(log_dir, 'segments')):
+        if day >= before:
+            continue
+        segments = sorted(name for name in os.listdir(directory) if name.endswith(SEALED_SUFFIXES))
+        if not segments:
+            continue
+        digest = hashlib.sha1("\n".join(segments).encode()).hexdigest()[:16]
+        archive_dir = _partition(os.path.join(log_dir, 'archive'), day)
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_path = os.path.join(archive_dir, f"part-{digest}{ARCHIVE_SUFFIX}")
+
+        if not os.path.exists(archive_path):
+            tmp_path = archive_path + '.tmp'
+            try:
+                with pq.ParquetWriter(tmp_path, schema) as writer:
+                    for name in segments:
+                        stream = pa.input_stream(os.path.join(directory, name), compression='detect')
+                        reader = pa_csv.open_csv(stream, parse_options=parse_options,
+                                                 convert_options=convert_options,
+                                                 read_options=pa_csv.ReadOptions(block_size=1 << 22))
+                        for batch in reader:
+                            writer.write_table(pa.Table.from_batches([batch]).select(LOG_FIELDS).cast(schema),
+                                               row_group_size=chunksize)
+                            totals['rows'] += batch.num_rows
+                os.replace(tmp_path, archive_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        for name in segments:
+            os.remove(os.path.join(directory, name))
+        totals['days'] += 1
+        totals['segments'] += len(segments)
+    return totals
+
+
+def log_stats(log_dir: str = DEFAULT_LOG_DIR) -> Dict[str, int]:
+    paths = {
+        'open_segments': [p for p in segment_paths(log_dir, include_open=True) if p.endswith(OPEN_SUFFIX)],
+        'sealed_segments': segment_paths(log_dir),
+        'archives': archive_paths(log_dir)
+    }
+    stats = {name: len(files) for name, files in paths.items()}
+    stats['bytes'] = sum(os.path.getsize(p) for files in paths.values() for p in files)
+    return stats
+
+
+def main():
+    """Compact or inspect the interaction log."""
+    parser = argparse.ArgumentParser(description='Rotating interaction log maintenance')
+    parser.add_argument('command', choices=['compact', 'stats'])
+    parser.add_argument('--log-dir', default=DEFAULT_LOG_DIR)
+    parser.add_argument('--compress', action='store_true', help='Gzip segments sealed on behalf of dead workers')
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        sealed = seal_stale_segments(args.log_dir, args.compress)
+        if sealed:
+            print(f"🔒 Sealed {len(sealed)} abandoned segment(s)")
+        totals = compact(args.log_dir)
+        print(f"🗜️  Compacted {totals['segments']} segment(s) from {totals['days']} day(s), "
+              f"{totals['rows']} rows, into {os.path.join(args.log_dir, 'archive')}")
+
+    stats = log_stats(args.log_dir)
+    print(f"🗂️  {args.log_dir}: {stats['open_segments']} open and {stats['sealed_segments']} sealed segment(s), "
+          f"{stats['archives']} archive file(s), {stats['bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+"""
+Pluggable storage for logged interactions.
+
+Logging, exports, imports and the data checks all talk to an
+InteractionStore instead of a Firestore client, so the same code runs
+against the live collection, a local SQLite file (offline development,
+analytics without Firestore reads) or a process-local dict (load tests).
+Documents are plain dicts with the Firestore field names; every backend
+supports bulk insert, a timestamp range scan (newest first, optionally
+filtered by model and status) and bulk field updates.
+
+The backend is chosen by a store URL, usually from INTERACTION_STORE:
+
+    firestore                 the `interactions` collection (default)
+    sqlite                    data/interaction_store.db
+    sqlite:path/to/file.db    a SQLite file of your choice
+    memory                    an in-process dict, gone on exit
+
+    python scripts/interaction_store.py benchmark --rows 50000
+    python scripts/interaction_store.py benchmark --stores memory sqlite firestore --emulator localhost:8080
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Iterable, Iterator, Tuple, Optional
+
+DEFAULT_SQLITE_PATH = "data/interaction_store.db"
+STORE_ENV = "INTERACTION_STORE"
+COLLECTION = "interactions"
+
+# Firestore rejects a WriteBatch with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+
+# SQLite caps the number of bound parameters per statement
+_ID_BATCH = 500
+
+
+class NotFound(KeyError):
+    """An update named an interaction the store does not have (same name as Firestore's error)."""
+
+
+def _to_datetime(value) -> Optional[datetime]:
+    """Firestore timestamp, datetime or ISO string as a datetime."""
+    if value is None:
+        return None
+    if hasattr(value, 'timestamp') and not isinstance(value, datetime):
+        return datetime.fromtimestamp(value.timestamp(), tz=timezone.utc)
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return None
+
+
+def _epoch(value) -> Optional[float]:
+    moment = _to_datetime(value)
+    return moment.timestamp() if moment else None
+
+
+def _encode(value):
+    if isinstance(value, datetime) or hasattr(value, 'isoformat'):
+        return {'$datetime': value.isoformat()}
+    return str(value)
+
+
+def _decode(obj):
+    if set(obj) == {'$datetime'}:
+        return datetime.fromisoformat(obj['$datetime'])
+    return obj
+
+
+def _new_id() -> str:
+    # Same length as Firestore's auto-generated IDs
+    return uuid.uuid4().hex[:20]
+
+
+def _project(doc_data: Dict, fields: Optional[List[str]]) -> Dict:
+    if fields is None:
+        return doc_data
+    return {field: doc_data[field] for field in fields if field in doc_data}
+
+
+def _chunks(items: List, size: int) -> Iterator[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class InteractionStore:
+    """Where interactions live. Subclasses implement the bulk operations; the rest is shared."""
+
+    kind = None
+
+    def insert_many(self, docs: Iterable[Dict], ids: Iterable[str] = None) -> List[str]:
+        """Add documents (stamping `created_at` when missing); returns their IDs."""
+        raise NotImplementedError
+
+    def update_many(self, updates: Iterable[Tuple[str, Dict]]) -> int:
+        """Merge fields into existing documents, all or nothing; raises NotFound for an unknown ID."""
+        raise NotImplementedError
+
+    def scan(self, start: datetime = None, end: datetime = None, model: str = None, status: str = None,
+             fields: List[str] = None) -> Iterator[Tuple[str, Dict]]:
+        """(id, document) pairs with start <= `timestamp` < end, newest first."""
+        raise NotImplementedError
+
+    def recent(self, limit: int = 10) -> List[Tuple[str, Dict]]:
+        """The `limit` most recently created interactions, newest first."""
+        raise NotImplementedError
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def insert(self, doc: Dict) -> str:
+        return self.insert_many([doc])[0]
+
+    def update(self, doc_id: str, data: Dict) -> None:
+        self.update_many([(doc_id, data)])
+
+    def close(self) -> None:
+        pass
+
+
+class FirestoreInteractionStore(InteractionStore):
+    kind = 'firestore'
+
+    def __init__(self, db, collection: str = COLLECTION):
+        """The `interactions` collection of a Firestore client."""
+        self.db = db
+        self.collection = db.collection(collection)
+
+    def insert_many(self, docs: Iterable[Dict], ids: Iterable[str] = None) -> List[str]:
+        from google.cloud.firestore import SERVER_TIMESTAMP
+        docs = list(docs)
+        ids = list(ids) if ids is not None else [None] * len(docs)
+        refs = [self.collection.document(doc_id) if doc_id else self.collection.document() for doc_id in ids]
+        for group in _chunks(list(zip(refs, docs)), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for ref, doc in group:
+                batch.set(ref, {**doc, 'created_at': doc.get('created_at', SERVER_TIMESTAMP)})
+            batch.commit()
+        return [ref.id for ref in refs]
+
+    def update_many(self, updates: Iterable[Tuple[str, Dict]]) -> int:
+        """Updates are atomic per WriteBatch, i.e. per 500 documents."""
+        updates = list(updates)
+        for group in _chunks(updates, FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for doc_id, data in group:
+                batch.update(self.collection.document(doc_id), data)
+            batch.commit()
+        return len(updates)
+
+    def scan(self, start: datetime = None, end: datetime = None, model: str = None, status: str = None,
+             fields: List[str] = None) -> Iterator[Tuple[str, Dict]]:
+        query = self.collection
+        if fields is not None:
+            query = query.select(fields)
+        if start is not None:
+            query = query.where('timestamp', '>=', start)
+        if end is not None:
+            query = query.where('timestamp', '<', end)
+        if model:
+            query = query.where('model', '==', model)
+        if status:
+            query = query.where('status', '==', status)
+        for doc in query.order_by('timestamp', direction='DESCENDING').stream():
+            yield doc.id, doc.to_dict()
+
+    def recent(self, limit: int = 10) -> List[Tuple[str, Dict]]:
+        query = self.collection.order_by('created_at', direction='DESCENDING').limit(limit)
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        snapshot = self.collection.document(doc_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def count(self) -> int:
+        # An aggregation query is billed as one read per 1000 documents, not one per document
+        return int(self.collection.count().get()[0][0].value)
+
+
+class MemoryInteractionStore(InteractionStore):
+    kind = 'memory'
+
+    def __init__(self):
+        """Interactions in a dict, for tests and load tests; nothing is persisted."""
+        self.docs = {}
+        self.lock = threading.Lock()
+
+    def insert_many(self, docs: Iterable[Dict], ids: Iterable[str] = None) -> List[str]:
+        now = datetime.now(timezone.utc)
+        docs = list(docs)
+        ids = list(ids) if ids is not None else [None] * len(docs)
+        inserted = []
+        with self.lock:
+            for doc_id, doc in zip(ids, docs):
+                doc_id = doc_id or _new_id()
+                self.docs[doc_id] = {**doc, 'created_at': doc.get('created_at', now)}
+                inserted.append(doc_id)
+        return inserted
+
+    def update_many(self, updates: Iterable[Tuple[str, Dict]]) -> int:
+        updates = list(updates)
+        with self.lock:
+            missing = [doc_id for doc_id, _ in updates if doc_id not in self.docs]
+            if missing:
+                raise NotFound(f"No interaction {missing[0]}")
+            for doc_id, data in updates:
+                self.docs[doc_id] = {**self.docs[doc_id], **data}
+        return len(updates)
+
+    def scan(self, start: datetime = None, end: datetime = None, model: str = None, status: str = None,
+             fields: List[str] = None) -> Iterator[Tuple[str, Dict]]:
+        low = start.timestamp() if start is not None else None
+        high = end.timestamp() if end is not None else None
+        with self.lock:
+            matches = []
+            for doc_id, doc_data in self.docs.items():
+                ts = _epoch(doc_data.get('timestamp'))
+                if (low is not None or high is not None) and ts is None:
+                    continue
+                if (low is not None and ts < low) or (high is not None and ts >= high):
+                    continue
+                if (model and doc_data.get('model') != model) or (status and doc_data.get('status') != status):
+                    continue
+                matches.append((ts if ts is not None else float('-inf'), doc_id, doc_data))
+        matches.sort(key=lambda match: match[0], reverse=True)
+        for _, doc_id, doc_data in matches:
+            yield doc_id, _project(dict(doc_data), fields)
+
+    def recent(self, limit: int = 10) -> List[Tuple[str, Dict]]:
+        with self.lock:
+            docs = sorted(self.docs.items(), key=lambda item: _epoch(item[1].get('created_at')) or 0, reverse=True)
+        return [(doc_id, dict(doc_data)) for doc_id, doc_data in docs[:limit]]
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        with self.lock:
+            doc_data = self.docs.get(doc_id)
+        return dict(doc_data) if doc_data is not None else None
+
+    def count(self) -> int:
+        return len(self.docs)
+
+    def __len__(self) -> int:
+        return self.count()
+
+
+class SQLiteInteractionStore(InteractionStore):
+    kind = 'sqlite'
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        """Open (or create) a SQLite interaction store.
+
+        Documents are kept as JSON, with the fields that queries filter on
+        (timestamp, created_at, model, status) copied into indexed columns.
+        One connection serves writes, shared between threads under a lock;
+        each scan reads through its own connection, which WAL mode lets run
+        alongside the writer.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS interactions (
+                id TEXT PRIMARY KEY,
+                created_at REAL,
+                ts REAL,
+                model TEXT,
+                status TEXT,
+                data TEXT NOT NULL
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(interactions)")]
+        if 'status' not in columns:
+            self.conn.execute("ALTER TABLE interactions ADD COLUMN status TEXT")
+            self.conn.execute("UPDATE interactions SET status = json_extract(data, '$.status')")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_ts ON interactions (ts)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_created ON interactions (created_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_model_ts ON interactions (model, ts)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_status_ts ON interactions (status, ts)")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self.count()
+
+    @staticmethod
+    def _row(doc_id: str, doc_data: Dict) -> Tuple:
+        status = doc_data.get('status')
+        return (doc_id, _epoch(doc_data.get('created_at')), _epoch(doc_data.get('timestamp')),
+                doc_data.get('model'), str(status) if status is not None else None,
+                json.dumps(doc_data, default=_encode))
+
+    def _put(self, rows: List[Tuple]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO interactions (id, created_at, ts, model, status, data) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def upsert(self, doc_id: str, doc_data: Dict) -> None:
+        """Write a document as-is under `doc_id`; the caller commits."""
+        with self.lock:
+            self._put([self._row(doc_id, doc_data)])
+
+    def insert_many(self, docs: Iterable[Dict], ids: Iterable[str] = None) -> List[str]:
+        now = datetime.now(timezone.utc)
+        docs = list(docs)
+        ids = [doc_id or _new_id() for doc_id in ids] if ids is not None else [_new_id() for _ in docs]
+        rows = [self._row(doc_id, {**doc, 'created_at': doc.get('created_at', now)})
+                for doc_id, doc in zip(ids, docs)]
+        with self.lock, self.conn:
+            self._put(rows)
+        return ids
+
+    def update_many(self, updates: Iterable[Tuple[str, Dict]]) -> int:
+        updates = list(updates)
+        with self.lock, self.conn:
+            current = {}
+            for group in _chunks([doc_id for doc_id, _ in updates], _ID_BATCH):
+                placeholders = ",".join("?" * len(group))
+                for doc_id, data in self.conn.execute(
+                        f"SELECT id, data FROM interactions WHERE id IN ({placeholders})", group):
+                    current[doc_id] = json.loads(data, object_hook=_decode)
+            missing = [doc_id for doc_id, _ in updates if doc_id not in current]
+            if missing:
+                raise NotFound(f"No interaction {missing[0]}")
+            for doc_id, data in updates:
+                current[doc_id].update(data)
+            self._put([self._row(doc_id, current[doc_id]) for doc_id in dict(updates)])
+        return len(updates)
+
+    def scan(self, start: datetime = None, end: datetime = None, model: str = None, status: str = None,
+             fields: List[str] = None) -> Iterator[Tuple[str, Dict]]:
+        sql = "SELECT id, data FROM interactions"
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start.timestamp())
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end.timestamp())
+        if model:
+            clauses.append("model = ?")
+            params.append(model)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC"
+        reader = sqlite3.connect(self.path)
+        try:
+            for doc_id, data in reader.execute(sql, params):
+                yield doc_id, _project(json.loads(data, object_hook=_decode), fields)
+        finally:
+            reader.close()
+
+    def recent(self, limit: int = 10) -> List[Tuple[str, Dict]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, data FROM interactions ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [(doc_id, json.loads(data, object_hook=_decode)) for doc_id, data in rows]
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM interactions WHERE id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0], object_hook=_decode) if row else None
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+
+
+def store_kind(url: str = None) -> str:
+    """'firestore', 'sqlite' or 'memory' for a store URL (INTERACTION_STORE when None)."""
+    url = url if url is not None else os.environ.get(STORE_ENV, '')
+    if not url or url == 'firestore':
+        return 'firestore'
+    if url == 'memory':
+        return 'memory'
+    if url == 'sqlite' or url.startswith('sqlite:') or url.endswith('.db'):
+        return 'sqlite'
+    raise ValueError(f"Unknown interaction store '{url}' (use firestore, sqlite[:path] or memory)")
+
+
+def open_store(url: str = None, db=None) -> InteractionStore:
+    """The store a URL names (INTERACTION_STORE when None).
+
+    Firestore uses `db`, or the backend's client when it is not given.
+    """
+    url = url if url is not None else os.environ.get(STORE_ENV, '')
+    kind = store_kind(url)
+    if kind == 'memory':
+        return MemoryInteractionStore()
+    if kind == 'sqlite':
+        path = url.split(':', 1)[1] if url.startswith('sqlite:') else url
+        return SQLiteInteractionStore(path if path and path != 'sqlite' else DEFAULT_SQLITE_PATH)
+    if db is None:
+        from backend_api import db
+    if not db:
+        raise RuntimeError("Firebase not initialized")
+    return FirestoreInteractionStore(db)
+
+
+def synthetic_interactions(count: int, days: int = 30, seed: int = 0) -> List[Dict]:
+    """Logged-interaction-shaped documents spread over the last `days` days."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    models = ['nelly-1.0', 'gpt-4', 'gpt-4o-mini']
+    return [{
+        'question': f"What is covered for service {rng.randrange(500)}?",
+        'answer': "Based on your plan documents, " + "coverage details " * rng.randrange(1, 40),
+        'model': rng.choice(models),
+        'error': None if rng.random() > 0.05 else "Timeout",
+        'contexts_used': rng.randrange(6),
+        'response_time': rng.randrange(300, 12000),
+        'timestamp': now - timedelta(seconds=rng.randrange(days * 86400)),
+        'user_id': 'anonymous',
+        'status': 'pending'
+    } for _ in range(count)]
+
+
+def benchmark_store(store: InteractionStore, rows: int = 20000, batch_size: int = 500) -> Dict[str, float]:
+    """Rows per second for bulk insert, full and filtered range scans, and bulk update."""
+    docs = synthetic_interactions(rows)
+    results = {}
+
+    started = time.perf_counter()
+    ids = []
+    for group in _chunks(docs, batch_size):
+        ids.extend(store.insert_many(group))
+    results['insert'] = rows / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    scanned = sum(1 for _ in store.scan())
+    results['full_scan'] = scanned / (time.perf_counter() - started)
+
+    # The common export query: one model over the last week
+    started = time.perf_counter()
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    scanned = sum(1 for _ in store.scan(start=since, model='nelly-1.0'))
+    results['range_scan'] = scanned / max(time.perf_counter() - started, 1e-9)
+
+    started = time.perf_counter()
+    for group in _chunks(ids, batch_size):
+        store.update_many([(doc_id, {'status': 'improved', 'improved_answer': 'Reviewed'}) for doc_id in group])
+    results['update'] = rows / (time.perf_counter() - started)
+    return results
+
+
+def main():
+    """Benchmark interaction store backends."""
+    parser = argparse.ArgumentParser(description='Interaction store tools')
+    parser.add_argument('command', choices=['benchmark'])
+    parser.add_argument('--stores', nargs='+', choices=['memory', 'sqlite', 'firestore'],
+                        default=['memory', 'sqlite'])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=FIRESTORE_BATCH_LIMIT)
+    parser.add_argument('--emulator', metavar='HOST:PORT',
+                        help='Firestore emulator to benchmark against (required for the firestore store)')
+    args = parser.parse_args()
+
+    print(f"⏱️  {args.rows} interactions, batches of {args.batch_size} (rows/s)")
+    print(f"{'store':<10} {'insert':>10} {'full_scan':>10} {'range_scan':>11} {'update':>10}")
+    for name in args.stores:
+        with tempfile.TemporaryDirectory() as tmp:
+            if name == 'sqlite':
+                store = SQLiteInteractionStore(os.path.join(tmp, 'interactions.db'))
+            elif name == 'memory':
+                store = MemoryInteractionStore()
+            else:
+                if not args.emulator:
+                    print("⚠️  Skipping firestore: pass --emulator, benchmarks never write to the live project")
+                    continue
+                # The Firestore client connects to the emulator without credentials when this is set
+                os.environ['FIRESTORE_EMULATOR_HOST'] = args.emulator
+                from google.cloud import firestore
+                client = firestore.Client(project=os.environ.get('GOOGLE_CLOUD_PROJECT', 'psip-navigator'))
+                store = FirestoreInteractionStore(client, collection=f"benchmark_{_new_id()}")
+            try:
+                results = benchmark_store(store, args.rows, args.batch_size)
+            finally:
+                store.close()
+        print(f"{name:<10} {results['insert']:>10,.0f} {results['full_scan']:>10,.0f} "
+              f"{results['range_scan']:>11,.0f} {results['update']:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,117 @@
 #!/usr/bin/env python3
 """
 LLM Evaluation Runner
-Compares performance of our RAG-based LLM vs general LLM on evaluation questions
+Compares performance of our RAG-based LLM vs general LLM on evaluation questions.
+
+Questions are evaluated several at a time, with the RAG and general LLM calls
+of each question in parallel, under token-bucket limits on requests and tokens
+per minute. Each result is appended to a JSONL file as it arrives, so a rerun
+after a crash only asks the questions that are missing.
+
+    python3 scripts/llm_evaluation_runner.py --concurrency 8 --openai-tpm 200000
 """
 
 import json
 import requests
 import time
+import random
+import asyncio
+import hashlib
+import argparse
 import openpyxl
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 import os
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RESULTS_PATH = "evaluation_results.jsonl"
+
+# Rate limits per minute; the OpenAI ones apply to the general-LLM arm
+DEFAULT_RAG_RPM = 120
+DEFAULT_OPENAI_RPM = 500
+DEFAULT_OPENAI_TPM = 200000
+
+GENERAL_MODEL = "gpt-4o-mini"
+GENERAL_SYSTEM_PROMPT = "You are a helpful assistant answering questions about health insurance. Be honest if you don't have specific information."
+GENERAL_MAX_TOKENS = 500
+
+# Attempts per arm when the backend or OpenAI reports a rate limit
+MAX_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 2.0
+RATE_LIMIT_MARKERS = ('429', 'rate limit', 'rate_limit', 'ratelimit')
+
+class TokenBucket:
+    """Async token bucket refilled at `per_minute` units a minute, holding at most a minute's worth"""
+    
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        # Waiters queue on the lock, so they are served in arrival order
+        self.lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, amount: float = 1):
+        """Wait until `amount` units are available and take them"""
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+    
+    def settle(self, amount: float):
+        """Charge (or refund, if negative) the difference between an estimate and actual usage"""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+    
+    def pause(self, seconds: float):
+        """Hold back every waiter for `seconds`, e.g. after the server reported a rate limit"""
+        self._refill()
+        self.level = min(self.level, 0) - seconds * self.rate
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough prompt size (about 4 characters per token) plus the completion budget"""
+    return sum(len(text) for text in texts) // 4 + GENERAL_MAX_TOKENS
+
+def is_rate_limited(result: Dict[str, Any]) -> bool:
+    error = str(result.get("error", "")).lower()
+    return any(marker in error for marker in RATE_LIMIT_MARKERS)
+
+def question_key(question: str) -> str:
+    return hashlib.sha1(question.encode('utf-8')).hexdigest()
+
+def load_partial_results(results_path: str) -> Dict[int, Dict[str, Any]]:
+    """Results saved by an earlier, interrupted run: {question index: record}
+    
+    A line cut off by a crash is dropped (and truncated away, so new results append cleanly).
+    """
+    if not os.path.exists(results_path):
+        return {}
+    with open(results_path, 'rb') as f:
+        data = f.read()
+    complete = data[:data.rfind(b'\n') + 1]
+    if len(complete) != len(data):
+        with open(results_path, 'r+b') as f:
+            f.truncate(len(complete))
+    records = {}
+    for line in complete.decode('utf-8').splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        records[record["index"]] = record
+    return records
 
 class LLMEvaluator:
     def __init__(self, backend_url: str = "http://localhost:8000"):
@@ -40,38 +140,42 @@ class LLMEvaluator:
             openai.api_key = self.openai_api_key
             
             response = openai.ChatCompletion.create(
-                model="gpt-4o-mini",
+                model=GENERAL_MODEL,
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant answering questions about health insurance. Be honest if you don't have specific information."},
+                    {"role": "system", "content": GENERAL_SYSTEM_PROMPT},
                     {"role": "user", "content": question}
                 ],
                 temperature=0.2,
-                max_tokens=500
+                max_tokens=GENERAL_MAX_TOKENS
             )
             
+            usage = getattr(response, "usage", None)
             return {
                 "answer": response.choices[0].message.content,
-                "model": "gpt-4o-mini"
+                "model": GENERAL_MODEL,
+                "total_tokens": getattr(usage, "total_tokens", None)
             }
         except Exception as e:
             return {"error": f"OpenAI call failed: {str(e)}"}
     
     def evaluate_question(self, qa_item: Dict[str, Any]) -> Dict[str, Any]:
-        """Evaluate a single question with both LLMs"""
+        """Evaluate a single question with both LLMs, one after the other"""
+        question = qa_item["question"]
+        return self.evaluation_result(qa_item, self.test_rag_llm(question), self.test_general_llm(question))
+    
+    def evaluation_result(self, qa_item: Dict[str, Any], rag_result: Dict[str, Any],
+                          general_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Result row for one question from the answers of both LLMs"""
         question = qa_item["question"]
         expected_answer = qa_item.get("answer", "")
         category = qa_item.get("category", "")
         difficulty = qa_item.get("difficulty", "")
         
-        print(f"Evaluating: {question[:60]}...")
-        
         # Test RAG LLM
-        rag_result = self.test_rag_llm(question)
         rag_answer = rag_result.get("answer", "No answer provided")
         rag_error = rag_result.get("error", "")
         
         # Test General LLM
-        general_result = self.test_general_llm(question)
         general_answer = general_result.get("answer", "No answer provided")
         general_error = general_result.get("error", "")
         
@@ -89,24 +193,86 @@ class LLMEvaluator:
             "general_model": general_result.get("model", "gpt-4o-mini")
         }
     
-    def run_evaluation(self, dataset_path: str = "evaluation_qa_dataset.json") -> List[Dict[str, Any]]:
-        """Run evaluation on all questions"""
+    async def _call_with_limits(self, call, question: str, buckets: List[TokenBucket],
+                                tokens: Optional[TokenBucket] = None) -> Dict[str, Any]:
+        """Run a blocking LLM call in a worker thread once the rate limiters allow it, retrying on rate limits"""
+        estimate = estimate_tokens(GENERAL_SYSTEM_PROMPT, question)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            for bucket in buckets:
+                await bucket.acquire()
+            if tokens:
+                await tokens.acquire(estimate)
+            result = await asyncio.get_running_loop().run_in_executor(None, call, question)
+            if tokens and result.get("total_tokens"):
+                tokens.settle(result["total_tokens"] - estimate)
+            if not is_rate_limited(result) or attempt == MAX_ATTEMPTS:
+                return result
+            # Back off, and make every other request through the same limiters wait too
+            delay = RETRY_BASE_SECONDS * 2 ** (attempt - 1) * (1 + random.random())
+            for bucket in buckets:
+                bucket.pause(delay)
+            await asyncio.sleep(delay)
+    
+    async def evaluate_question_async(self, qa_item: Dict[str, Any], limits: Dict[str, TokenBucket]) -> Dict[str, Any]:
+        """Evaluate a single question with both LLMs at the same time"""
+        question = qa_item["question"]
+        rag_buckets = [limits["rag_rpm"]] if limits.get("rag_rpm") else []
+        general_buckets = [limits["openai_rpm"]] if limits.get("openai_rpm") else []
+        rag_result, general_result = await asyncio.gather(
+            self._call_with_limits(self.test_rag_llm, question, rag_buckets),
+            self._call_with_limits(self.test_general_llm, question, general_buckets, limits.get("openai_tpm"))
+        )
+        return self.evaluation_result(qa_item, rag_result, general_result)
+    
+    async def run_evaluation_async(self, questions: List[Dict[str, Any]], concurrency: int = DEFAULT_CONCURRENCY,
+                                   results_path: str = DEFAULT_RESULTS_PATH, rag_rpm: float = DEFAULT_RAG_RPM,
+                                   openai_rpm: float = DEFAULT_OPENAI_RPM, openai_tpm: float = DEFAULT_OPENAI_TPM,
+                                   retry_errors: bool = False) -> List[Dict[str, Any]]:
+        """Evaluate questions `concurrency` at a time, saving each result to `results_path` as it completes
+        
+        Questions already in `results_path` (same position, same text) are not asked again, so an
+        interrupted run picks up where it stopped. Results come back in dataset order.
+        """
+        done = {index: record for index, record in load_partial_results(results_path).items()
+                if index < len(questions) and record.get("key") == question_key(questions[index]["question"])
+                and not (retry_errors and (record["result"]["rag_error"] or record["result"]["general_error"]))}
+        pending = [index for index in range(len(questions)) if index not in done]
+        if done:
+            print(f"♻️  Resuming: {len(done)} of {len(questions)} questions already evaluated in {results_path}")
+        
+        limits = {name: TokenBucket(per_minute) for name, per_minute in
+                  [("rag_rpm", rag_rpm), ("openai_rpm", openai_rpm), ("openai_tpm", openai_tpm)] if per_minute}
+        semaphore = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+        # Two blocking calls (RAG and general) per question in flight
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=2 * concurrency))
+        
+        with open(results_path, 'a', encoding='utf-8') as out:
+            async def evaluate(index):
+                async with semaphore:
+                    result = await self.evaluate_question_async(questions[index], limits)
+                record = {"index": index, "key": question_key(questions[index]["question"]), "result": result}
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+                done[index] = record
+                print(f"[{len(done)}/{len(questions)}] Q{index + 1}: {questions[index]['question'][:60]}")
+            
+            await asyncio.gather(*(evaluate(index) for index in pending))
+        
+        return [done[index]["result"] for index in range(len(questions))]
+    
+    def run_evaluation(self, dataset_path: str = "evaluation_qa_dataset.json", **kwargs) -> List[Dict[str, Any]]:
+        """Run evaluation on all questions (see run_evaluation_async for the options)"""
         print("Loading evaluation dataset...")
         with open(dataset_path, 'r') as f:
             dataset = json.load(f)
         
         questions = dataset["questions"]
-        results = []
         
         print(f"Evaluating {len(questions)} questions...")
-        
-        for i, qa_item in enumerate(questions, 1):
-            print(f"\n--- Question {i}/{len(questions)} ---")
-            result = self.evaluate_question(qa_item)
-            results.append(result)
-            
-            # Add delay to avoid rate limiting
-            time.sleep(1)
+        started = time.time()
+        results = asyncio.run(self.run_evaluation_async(questions, **kwargs))
+        print(f"⏱️  Evaluation took {time.time() - started:.1f}s")
         
         return results
     
@@ -244,11 +410,34 @@ class LLMEvaluator:
 
 def main():
     """Main evaluation function"""
+    parser = argparse.ArgumentParser(description='Compare the RAG LLM with a general LLM on the evaluation dataset')
+    parser.add_argument('--dataset', default='evaluation_qa_dataset.json',
+                       help='Evaluation questions (default: evaluation_qa_dataset.json)')
+    parser.add_argument('--output', default='LLM_Evaluation_Results.xlsx',
+                       help='Results workbook (default: LLM_Evaluation_Results.xlsx)')
+    parser.add_argument('--backend-url', default='http://localhost:8000',
+                       help='Backend serving /ask (default: http://localhost:8000)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                       help=f'Questions evaluated at the same time (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--rag-rpm', type=float, default=DEFAULT_RAG_RPM,
+                       help=f'Requests per minute to /ask, 0 for no limit (default: {DEFAULT_RAG_RPM})')
+    parser.add_argument('--openai-rpm', type=float, default=DEFAULT_OPENAI_RPM,
+                       help=f'OpenAI requests per minute, 0 for no limit (default: {DEFAULT_OPENAI_RPM})')
+    parser.add_argument('--openai-tpm', type=float, default=DEFAULT_OPENAI_TPM,
+                       help=f'OpenAI tokens per minute, 0 for no limit (default: {DEFAULT_OPENAI_TPM})')
+    parser.add_argument('--results', default=DEFAULT_RESULTS_PATH,
+                       help=f'Per-question results, kept so an interrupted run resumes (default: {DEFAULT_RESULTS_PATH})')
+    parser.add_argument('--fresh', action='store_true',
+                       help='Discard saved results and evaluate every question again')
+    parser.add_argument('--retry-errors', action='store_true',
+                       help='Evaluate again the saved questions where either LLM returned an error')
+    args = parser.parse_args()
+    
     print("🚀 Starting LLM Evaluation...")
     
     # Check if backend is running
     try:
-        response = requests.get("http://localhost:8000/health", timeout=5)
+        response = requests.get(f"{args.backend_url}/health", timeout=5)
         if response.status_code != 200:
             print("❌ Backend not running. Please start the backend first:")
             print("   python3 -m uvicorn backend_api:app --host 0.0.0.0 --port 8000")
@@ -264,16 +453,27 @@ def main():
         print("   export OPENAI_API_KEY=your_key_here")
         return
     
+    if args.fresh and os.path.exists(args.results):
+        os.remove(args.results)
+    
     # Initialize evaluator
-    evaluator = LLMEvaluator()
+    evaluator = LLMEvaluator(args.backend_url)
     
     # Run evaluation
     print("📊 Running evaluation on all questions...")
-    results = evaluator.run_evaluation()
+    results = evaluator.run_evaluation(
+        args.dataset,
+        concurrency=args.concurrency,
+        results_path=args.results,
+        rag_rpm=args.rag_rpm,
+        openai_rpm=args.openai_rpm,
+        openai_tpm=args.openai_tpm,
+        retry_errors=args.retry_errors
+    )
     
     # Create workbook
     print("📝 Creating evaluation workbook...")
-    output_path = evaluator.create_evaluation_workbook(results)
+    output_path = evaluator.create_evaluation_workbook(results, args.output)
     
     print(f"\n✅ Evaluation complete!")
     print(f"📁 Results saved to: {output_path}")
@@ -0,0 +1,351 @@
+"""
+Fast page text extraction with a pdfplumber fallback for layout-heavy pages.
+
+pdfplumber spends almost all of its time in pdfminer's layout analysis
+building character objects; turning those characters into text is cheap.
+PageExtractor reads the character boxes from pdfium instead (pypdfium2,
+which pdfplumber already depends on) and feeds them to pdfplumber's own
+text assembly, so ordinary pages come out with the same text as
+page.extract_text() at a fraction of the cost.
+
+Pages where the fast path is not trustworthy are sent to pdfplumber:
+ruled tables, rotated text, non-Latin scripts, pages whose word spacing
+pdfium had to infer, broken Unicode maps and pages with almost no text.
+Per-engine page counts and timings are collected in ExtractionStats.
+
+    python3 scripts/pdf_extraction.py benchmark assets/pdfs
+"""
+
+import os
+import time
+import ctypes
+import argparse
+from typing import List, Dict, Tuple, Optional
+
+import pdfplumber
+from pdfplumber.utils import extract_text as assemble_text
+
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_raw
+    pdfium_available = True
+except ImportError:
+    pdfium_available = False
+
+FAST_ENGINE = "pdfium"
+LAYOUT_ENGINE = "pdfplumber"
+
+# A page with at least this many horizontal AND vertical rules is treated as a table
+MIN_TABLE_RULES = 6
+# Path objects thinner than this (in points) and at least RULE_MIN_LENGTH long are rules
+RULE_MAX_THICKNESS = 2.0
+RULE_MIN_LENGTH = 10.0
+
+# Characters per 1000 square points below which a page is mostly images or drawings
+MIN_CHAR_DENSITY = 0.5
+# Share of word breaks pdfium inferred from glyph gaps rather than read as real spaces
+MAX_GENERATED_SPACE_RATIO = 0.5
+# Share of characters outside Latin, punctuation and symbols (RTL, CJK, Indic, ...)
+MAX_FOREIGN_SCRIPT_RATIO = 0.02
+
+_UNICODE_SKIP = {0, 10, 13, 0xFFFE, 0xFFFF}
+_SOFT_HYPHEN = 2  # pdfium's marker for a hyphen at a line break
+
+
+def _is_foreign_script(codepoint: int) -> bool:
+    """Outside Latin, general punctuation/symbols, ligatures and private-use glyphs."""
+    if codepoint < 0x0370 or 0x2000 <= codepoint < 0x2E80:
+        return False
+    if 0xE000 <= codepoint < 0xF900 or 0xFB00 <= codepoint <= 0xFB06:
+        return False
+    return True
+
+
+class ExtractionStats:
+    def __init__(self):
+        """Pages and seconds per extraction engine, and why pages fell back."""
+        self.pages = {}
+        self.seconds = {}
+        self.reasons = {}
+
+    def add(self, engine: str, seconds: float, reason: str = None) -> None:
+        self.pages[engine] = self.pages.get(engine, 0) + 1
+        self.seconds[engine] = self.seconds.get(engine, 0.0) + seconds
+        if reason:
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def merge(self, other: Dict) -> None:
+        """Fold in another run's as_dict(), e.g. from a worker process."""
+        for engine, pages in other['pages'].items():
+            self.pages[engine] = self.pages.get(engine, 0) + pages
+            self.seconds[engine] = self.seconds.get(engine, 0.0) + other['seconds'][engine]
+        for reason, count in other['reasons'].items():
+            self.reasons[reason] = self.reasons.get(reason, 0) + count
+
+    def as_dict(self) -> Dict:
+        return {'pages': dict(self.pages), 'seconds': dict(self.seconds), 'reasons': dict(self.reasons)}
+
+    def report(self) -> str:
+        lines = []
+        for engine in sorted(self.pages):
+            seconds = self.seconds[engine]
+            rate = self.pages[engine] / seconds if seconds > 0 else float('inf')
+            lines.append(f"  {engine:<10} {self.pages[engine]:>6} pages  {seconds:>8.2f}s  {rate:>8.1f}/s")
+        if self.reasons:
+            lines.append("  fallback: " + ", ".join(f"{reason} {count}" for reason, count in
+                                                      sorted(self.reasons.items(), key=lambda kv: -kv[1])))
+        return "\n".join(lines)
+
+
+def _rule_counts(page) -> Tuple[int, int]:
+    """Horizontal and vertical rules (thin path objects) drawn on a pdfium page."""
+    horizontal = vertical = 0
+    for obj in page.get_objects(filter=[pdfium_raw.FPDF_PAGEOBJ_PATH]):
+        left, bottom, right, top = obj.get_bounds()
+        width, height = right - left, top - bottom
+        if height <= RULE_MAX_THICKNESS and width >= RULE_MIN_LENGTH:
+            horizontal += 1
+        elif width <= RULE_MAX_THICKNESS and height >= RULE_MIN_LENGTH:
+            vertical += 1
+    return horizontal, vertical
+
+
+def _pdfium_chars(page, textpage) -> Tuple[List[Dict], Dict]:
+    """pdfplumber-style char dicts from pdfium, plus signals about their quality.
+
+    Geometry follows pdfminer: x0 is the glyph origin, x1 the end of its
+    advance, top/bottom the font's ascent and descent. Spaces pdfium
+    generates between words get the geometry of the character before them.
+    """
+    height = page.get_height()
+    count = pdfium_raw.FPDFText_CountChars(textpage)
+    origin_x, origin_y = ctypes.c_double(), ctypes.c_double()
+    box = pdfium_raw.FS_RECTF()
+
+    chars = []
+    generated_spaces = real_spaces = foreign = rotated = 0
+    for i in range(count):
+        codepoint = pdfium_raw.FPDFText_GetUnicode(textpage, i)
+        if codepoint in _UNICODE_SKIP:
+            continue
+        if codepoint == _SOFT_HYPHEN:
+            codepoint = ord('-')
+        generated = pdfium_raw.FPDFText_IsGenerated(textpage, i)
+        if generated and codepoint != 32:
+            continue
+
+        pdfium_raw.FPDFText_GetCharOrigin(textpage, i, origin_x, origin_y)
+        pdfium_raw.FPDFText_GetLooseCharBox(textpage, i, box)
+        top, bottom = height - box.top, height - box.bottom
+        if codepoint == 32:
+            if generated:
+                generated_spaces += 1
+                if chars:
+                    top, bottom = chars[-1]['top'], chars[-1]['bottom']
+            else:
+                real_spaces += 1
+        elif _is_foreign_script(codepoint):
+            foreign += 1
+        if pdfium_raw.FPDFText_GetCharAngle(textpage, i) > 0.01:
+            rotated += 1
+
+        chars.append({'text': chr(codepoint), 'x0': origin_x.value, 'x1': box.right,
+                      'top': top, 'bottom': bottom, 'doctop': top, 'upright': True})
+
+    signals = {
+        'chars': len(chars),
+        'density': len(chars) * 1000.0 / max(page.get_width() * height, 1.0),
+        'generated_space_ratio': generated_spaces / max(generated_spaces + real_spaces, 1),
+        'foreign_ratio': foreign / max(len(chars), 1),
+        'rotated': rotated,
+        'unicode_errors': sum(pdfium_raw.FPDFText_HasUnicodeMapError(textpage, i) == 1 for i in range(count))
+    }
+    return chars, signals
+
+
+def fallback_reason(signals: Dict, route_tables: bool = True) -> Optional[str]:
+    """Why a page should go to pdfplumber, or None if the fast text can be used."""
+    if signals['chars'] == 0 or signals['density'] < MIN_CHAR_DENSITY:
+        return 'sparse_text'
+    if signals['unicode_errors']:
+        return 'unicode_map'
+    if signals['rotated']:
+        return 'rotated_text'
+    if signals['foreign_ratio'] > MAX_FOREIGN_SCRIPT_RATIO:
+        return 'script'
+    if signals['generated_space_ratio'] > MAX_GENERATED_SPACE_RATIO:
+        return 'inferred_spacing'
+    if route_tables and min(signals['rules']) >= MIN_TABLE_RULES:
+        return 'table'
+    return None
+
+
+class PageExtractor:
+    def __init__(self, pdf_path: str, stats: ExtractionStats = None, route_tables: bool = True,
+                 engine: str = "auto"):
+        """Extract text page by page from one PDF.
+
+        `engine` is 'auto' (pdfium with pdfplumber fallback), 'pdfium' or
+        'pdfplumber'. With `route_tables=False`, ruled tables stay on the
+        fast path. Documents pdfium cannot open use pdfplumber throughout.
+        """
+        self.pdf_path = pdf_path
+        self.stats = stats if stats is not None else ExtractionStats()
+        self.route_tables = route_tables
+        self.engine = engine
+        self.last_engine = None
+        self.last_reason = None
+        self._plumber = None
+        self._document = None
+        if engine != LAYOUT_ENGINE and pdfium_available:
+            try:
+                self._document = pdfium.PdfDocument(pdf_path)
+            except pdfium.PdfiumError as e:
+                print(f"Note: falling back to pdfplumber for {pdf_path}: {e}")
+        if self._document is None:
+            self.engine = LAYOUT_ENGINE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        if self._document is not None:
+            self._document.close()
+            self._document = None
+        if self._plumber is not None:
+            self._plumber.close()
+            self._plumber = None
+
+    @property
+    def plumber(self):
+        if self._plumber is None:
+            self._plumber = pdfplumber.open(self.pdf_path)
+        return self._plumber
+
+    def __len__(self) -> int:
+        return len(self._document) if self._document is not None else len(self.plumber.pages)
+
+    def _extract_with_pdfplumber(self, page_num: int) -> str:
+        page = self.plumber.pages[page_num - 1]
+        try:
+            return page.extract_text()
+        finally:
+            # Release the page's parsed layout as soon as we have its text
+            getattr(page, 'close', page.flush_cache)()
+
+    def extract_text(self, page_num: int) -> str:
+        """Text of a 1-based page, identical to pdfplumber's for pages kept on the fast path."""
+        started = time.perf_counter()
+        reason = None
+        if self.engine == LAYOUT_ENGINE:
+            text, engine = self._extract_with_pdfplumber(page_num), LAYOUT_ENGINE
+        else:
+            page = self._document[page_num - 1]
+            textpage = page.get_textpage()
+            try:
+                chars, signals = _pdfium_chars(page, textpage)
+                signals['rules'] = _rule_counts(page) if self.route_tables else (0, 0)
+            finally:
+                textpage.close()
+                page.close()
+            reason = fallback_reason(signals, self.route_tables) if self.engine == "auto" else None
+            if reason:
+                text, engine = self._extract_with_pdfplumber(page_num), LAYOUT_ENGINE
+            else:
+                text, engine = assemble_text(chars) if chars else "", FAST_ENGINE
+        self.stats.add(engine, time.perf_counter() - started, reason)
+        self.last_engine, self.last_reason = engine, reason
+        return text
+
+
+def count_pages(pdf_path: str) -> int:
+    """Page count without any layout analysis."""
+    with PageExtractor(pdf_path) as extractor:
+        return len(extractor)
+
+
+def extract_all(pdf_path: str, engine: str = "auto", stats: ExtractionStats = None,
+                route_tables: bool = True) -> List[Tuple[str, str]]:
+    """(text, engine) for every page of one PDF."""
+    with PageExtractor(pdf_path, stats, route_tables, engine) as extractor:
+        pages = []
+        for page_num in range(1, len(extractor) + 1):
+            pages.append((extractor.extract_text(page_num), extractor.last_engine))
+        return pages
+
+
+def benchmark(pdf_paths: List[str], route_tables: bool = True) -> Dict:
+    """Time pdfplumber-only against the routed extractor and compare chunk text page by page."""
+    from chunking import DEFAULT_CHUNKER
+
+    started = time.perf_counter()
+    baseline = {path: extract_all(path, LAYOUT_ENGINE) for path in pdf_paths}
+    baseline_seconds = time.perf_counter() - started
+
+    stats = ExtractionStats()
+    started = time.perf_counter()
+    routed = {path: extract_all(path, "auto", stats, route_tables) for path in pdf_paths}
+    routed_seconds = time.perf_counter() - started
+
+    fast_pages = identical = 0
+    mismatched = []
+    for path in pdf_paths:
+        for page_num, ((expected, _), (text, engine)) in enumerate(zip(baseline[path], routed[path]), 1):
+            if engine != FAST_ENGINE:
+                continue
+            fast_pages += 1
+            if DEFAULT_CHUNKER.split(expected or "") == DEFAULT_CHUNKER.split(text or ""):
+                identical += 1
+            else:
+                mismatched.append((os.path.basename(path), page_num))
+
+    return {
+        'pages': sum(len(pages) for pages in baseline.values()),
+        'baseline_seconds': baseline_seconds,
+        'routed_seconds': routed_seconds,
+        'speedup': baseline_seconds / routed_seconds if routed_seconds > 0 else float('inf'),
+        'fast_pages': fast_pages,
+        'identical_fast_pages': identical,
+        'mismatched': mismatched,
+        'stats': stats
+    }
+
+
+def main():
+    """Extract one PDF with the routed engine or benchmark it against pdfplumber."""
+    parser = argparse.ArgumentParser(description='Fast PDF text extraction with pdfplumber fallback')
+    parser.add_argument('command', choices=['benchmark', 'extract'])
+    parser.add_argument('path', help='PDF directory (benchmark) or PDF file (extract)')
+    parser.add_argument('--fast-tables', action='store_true',
+                        help='Keep ruled tables on the fast path instead of sending them to pdfplumber')
+    args = parser.parse_args()
+
+    if not pdfium_available:
+        print("⚠️  pypdfium2 is not installed; every page will use pdfplumber")
+
+    if args.command == 'extract':
+        stats = ExtractionStats()
+        for page_num, (text, engine) in enumerate(extract_all(args.path, stats=stats,
+                                                              route_tables=not args.fast_tables), 1):
+            print(f"--- page {page_num} ({engine}) ---")
+            print(text)
+        print(stats.report())
+        return
+
+    pdf_paths = sorted(os.path.join(args.path, f) for f in os.listdir(args.path) if f.endswith('.pdf'))
+    print(f"⏱️  Extracting {len(pdf_paths)} PDF(s) with pdfplumber only, then with the routed extractor...")
+    result = benchmark(pdf_paths, route_tables=not args.fast_tables)
+    print(f"📄 {result['pages']} pages")
+    print(f"   pdfplumber only: {result['baseline_seconds']:.2f}s")
+    print(f"   routed:          {result['routed_seconds']:.2f}s ({result['speedup']:.1f}x faster)")
+    print(result['stats'].report())
+    print(f"✅ Chunk text identical on {result['identical_fast_pages']}/{result['fast_pages']} fast-path pages")
+    for source, page_num in result['mismatched']:
+        print(f"   ⚠️  {source} page {page_num} differs from pdfplumber")
+
+
+if __name__ == "__main__":
+    main()
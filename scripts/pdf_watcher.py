@@ -0,0 +1,322 @@
+"""
+Watch assets/pdfs and ingest new, changed or deleted PDFs automatically.
+
+File events come from inotify (via watchdog) when it is installed, otherwise
+from polling the directory. Bursts of events are debounced, and a file is
+only ingested once its size and mtime have stopped changing and it parses
+as a PDF, so half-synced files are never embedded. Each batch runs the
+incremental SmartPDFVectorizer on just the affected files, which builds a
+new index version from the live one and publishes it through the index
+pointer; the watcher never writes the collection a backend is serving.
+Backends pick the new version up on their next pointer check, or
+immediately when --backend-url is given.
+
+Hidden files (upload temp files such as .name.pdf.<id>.upload, sync
+partials) are ignored.
+
+    python3 scripts/pdf_watcher.py
+    python3 scripts/pdf_watcher.py --backend-url http://localhost:8000 --poll
+"""
+
+import os
+import time
+import threading
+import argparse
+import urllib.request
+from typing import List, Dict, Tuple, Callable, Optional
+
+from ingestion_manifest import IngestionManifest, DEFAULT_MANIFEST_PATH
+from index_versions import IndexPointer, record_path, DEFAULT_POINTER_PATH
+from pdf_extraction import count_pages
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    watchdog_available = True
+except ImportError:
+    watchdog_available = False
+
+DEFAULT_PDF_DIR = "assets/pdfs"
+
+# Quiet period after the last event for a file before it is looked at
+DEBOUNCE_SECONDS = 2.0
+# How long size and mtime must stay the same before a file is ingested
+STABLE_SECONDS = 3.0
+POLL_INTERVAL = 2.0
+# A file that never becomes a readable PDF is ingested anyway after this long
+MAX_WAIT_SECONDS = 300.0
+# Delay before a failed batch is retried
+RETRY_SECONDS = 60.0
+
+
+def is_watched(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.lower().endswith('.pdf') and not name.startswith('.')
+
+
+def _file_state(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def is_readable_pdf(path: str) -> bool:
+    """A complete PDF: header, end-of-file marker and a page tree that opens."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(5) != b'%PDF-':
+                return False
+            f.seek(max(os.path.getsize(path) - 1024, 0))
+            if b'%%EOF' not in f.read():
+                return False
+        return count_pages(path) > 0
+    except Exception:
+        return False
+
+
+def snapshot(pdf_dir: str) -> Dict[str, Tuple[int, int]]:
+    """(size, mtime) of every watched PDF in the directory."""
+    states = {}
+    for name in os.listdir(pdf_dir):
+        path = os.path.join(pdf_dir, name)
+        if is_watched(path):
+            state = _file_state(path)
+            if state is not None:
+                states[path] = state
+    return states
+
+
+class ChangeTracker:
+    def __init__(self, debounce: float = DEBOUNCE_SECONDS, stable_seconds: float = STABLE_SECONDS,
+                 max_wait: float = MAX_WAIT_SECONDS, clock: Callable[[], float] = time.monotonic):
+        """Debounce file events and hold each path back until its file stops changing."""
+        self.debounce = debounce
+        self.stable_seconds = stable_seconds
+        self.max_wait = max_wait
+        self.clock = clock
+        self.lock = threading.Lock()
+        # path -> {'first': t, 'last_event': t, 'state': (size, mtime), 'stable_since': t}
+        self.pending = {}
+
+    def record(self, path: str) -> None:
+        """Note an event for a path; safe to call from the watcher thread."""
+        now = self.clock()
+        with self.lock:
+            entry = self.pending.setdefault(path, {'first': now, 'state': None, 'stable_since': now})
+            entry['last_event'] = now
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+    def ready(self, readable: Callable[[str], bool] = is_readable_pdf) -> Tuple[List[str], List[str]]:
+        """Pop paths that are settled: (changed files that exist, files that were deleted)."""
+        now = self.clock()
+        changed, deleted = [], []
+        with self.lock:
+            for path, entry in list(self.pending.items()):
+                if now - entry['last_event'] < self.debounce:
+                    continue
+                state = _file_state(path)
+                if state is None:
+                    deleted.append(path)
+                    del self.pending[path]
+                    continue
+                if state != entry['state']:
+                    entry['state'], entry['stable_since'] = state, now
+                    continue
+                if now - entry['stable_since'] < self.stable_seconds:
+                    continue
+                if not readable(path) and now - entry['first'] < self.max_wait:
+                    # Still being written by something that does not touch the mtime; look again later
+                    entry['stable_since'] = now
+                    continue
+                changed.append(path)
+                del self.pending[path]
+        return sorted(changed), sorted(deleted)
+
+    def requeue(self, paths: List[str], delay: float) -> None:
+        """Put paths back so they are retried after `delay` seconds."""
+        now = self.clock()
+        with self.lock:
+            for path in paths:
+                entry = self.pending.setdefault(path, {'first': now, 'state': None, 'stable_since': now})
+                # ready() waits `debounce` after the last event, so the retry lands `delay` from now
+                entry['last_event'] = now + delay - self.debounce
+
+
+if watchdog_available:
+    class _EventHandler(FileSystemEventHandler):
+        def __init__(self, tracker: ChangeTracker):
+            self.tracker = tracker
+
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            for path in (event.src_path, getattr(event, 'dest_path', None)):
+                if path and is_watched(path):
+                    self.tracker.record(os.path.abspath(path))
+
+
+def notify_backend(backend_url: str, admin_token: str = None, timeout: float = 10.0) -> bool:
+    """Ask a running backend to reload the index now instead of on its next pointer check."""
+    request = urllib.request.Request(f"{backend_url.rstrip('/')}/admin/reload", data=b'', method='POST')
+    if admin_token:
+        request.add_header('X-Admin-Token', admin_token)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status == 200
+    except Exception as e:
+        print(f"⚠️  Could not notify backend at {backend_url}: {e}")
+        return False
+
+
+class PDFWatcher:
+    def __init__(self, pdf_dir: str = DEFAULT_PDF_DIR, ingest: Callable = None, use_polling: bool = False,
+                 poll_interval: float = POLL_INTERVAL, tracker: ChangeTracker = None,
+                 backend_url: str = None, admin_token: str = None,
+                 manifest_path: str = DEFAULT_MANIFEST_PATH, pointer_path: str = DEFAULT_POINTER_PATH):
+        """Watch `pdf_dir` and call `ingest(pdf_dir, changed_paths, removed_files)` for settled changes.
+
+        Without `ingest`, batches go through SmartPDFVectorizer.add_new_documents.
+        `manifest_path` is only read while no index version has been published.
+        """
+        self.pdf_dir = os.path.abspath(pdf_dir)
+        self.ingest = ingest or self._ingest_with_vectorizer
+        self.use_polling = use_polling or not watchdog_available
+        self.poll_interval = poll_interval
+        self.tracker = tracker if tracker is not None else ChangeTracker()
+        self.backend_url = backend_url
+        self.admin_token = admin_token
+        self.manifest_path = manifest_path
+        self.pointer_path = pointer_path
+        self.observer = None
+        self.states = {}
+        self.vectorizer = None
+        self.batches = 0
+
+    def _ingest_with_vectorizer(self, pdf_dir: str, changed: List[str], removed_files: List[str]) -> Dict:
+        if self.vectorizer is None:
+            # Imported here so the model and ChromaDB load only once a batch arrives
+            from add_pdf_to_system import SmartPDFVectorizer
+            self.vectorizer = SmartPDFVectorizer(manifest_path=self.manifest_path, pointer_path=self.pointer_path)
+        return self.vectorizer.add_new_documents(pdf_dir, specific_files=changed or None,
+                                                 remove_files=removed_files or None)
+
+    def load_manifest(self) -> IngestionManifest:
+        """The manifest of the live index version, which follows every publish and rollback."""
+        return IngestionManifest.load(record_path(IndexPointer(self.pointer_path).active, 'manifest',
+                                                  self.manifest_path))
+
+    def start(self) -> None:
+        self.states = snapshot(self.pdf_dir)
+        if not self.use_polling:
+            self.observer = Observer()
+            self.observer.schedule(_EventHandler(self.tracker), self.pdf_dir, recursive=False)
+            self.observer.start()
+
+    def stop(self) -> None:
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def poll(self) -> None:
+        """Turn directory differences since the last poll into events."""
+        states = snapshot(self.pdf_dir)
+        for path in set(states) | set(self.states):
+            if states.get(path) != self.states.get(path):
+                self.tracker.record(path)
+        self.states = states
+
+    def catch_up(self) -> None:
+        """Queue whatever changed while the watcher was not running."""
+        manifest = self.load_manifest()
+        on_disk = snapshot(self.pdf_dir)
+        for path in on_disk:
+            if not manifest.is_unchanged(path):
+                self.tracker.record(path)
+        names = {os.path.basename(path) for path in on_disk}
+        for source_file in set(manifest.files) - names:
+            self.tracker.record(os.path.join(self.pdf_dir, source_file))
+
+    def process_ready(self) -> Optional[Dict]:
+        """Ingest settled changes as one batch; returns the ingestion summary, if any ran."""
+        changed, deleted = self.tracker.ready()
+        if not changed and not deleted:
+            return None
+
+        ingested = set(self.load_manifest().files)
+        removed_files = [os.path.basename(path) for path in deleted if os.path.basename(path) in ingested]
+        if not changed and not removed_files:
+            return None
+
+        started = time.time()
+        names = [os.path.basename(path) for path in changed] + [f"-{name}" for name in removed_files]
+        print(f"📥 Ingesting {', '.join(names)}")
+        try:
+            result = self.ingest(self.pdf_dir, changed, removed_files)
+        except Exception as e:
+            print(f"❌ Ingestion failed, retrying in {RETRY_SECONDS:.0f}s: {e}")
+            self.tracker.requeue(changed + deleted, RETRY_SECONDS)
+            return None
+        self.batches += 1
+        print(f"✅ Batch done in {time.time() - started:.1f}s: {result.get('chunks_written', 0)} chunks written, "
+              f"{result.get('chunks_removed', 0)} removed")
+        if self.backend_url:
+            notify_backend(self.backend_url, self.admin_token)
+        return result
+
+    def run(self, tick: float = 0.5, max_batches: int = None) -> None:
+        """Watch until interrupted (or until `max_batches` batches have run)."""
+        self.start()
+        self.catch_up()
+        mode = 'polling' if self.use_polling else 'inotify'
+        print(f"👀 Watching {self.pdf_dir} ({mode}); debounce {self.tracker.debounce:g}s, "
+              f"stable for {self.tracker.stable_seconds:g}s")
+        last_poll = 0.0
+        try:
+            while max_batches is None or self.batches < max_batches:
+                if self.use_polling and time.monotonic() - last_poll >= self.poll_interval:
+                    self.poll()
+                    last_poll = time.monotonic()
+                self.process_ready()
+                time.sleep(tick)
+        except KeyboardInterrupt:
+            print("\n👋 Stopping watcher")
+        finally:
+            self.stop()
+
+
+def main():
+    """Watch the PDF directory and keep the index up to date."""
+    parser = argparse.ArgumentParser(description='Ingest PDFs automatically as they change')
+    parser.add_argument('--pdf-dir', default=DEFAULT_PDF_DIR)
+    parser.add_argument('--poll', action='store_true', help='Poll the directory instead of using inotify')
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS,
+                        help=f'Quiet seconds after the last event (default: {DEBOUNCE_SECONDS})')
+    parser.add_argument('--stable-seconds', type=float, default=STABLE_SECONDS,
+                        help=f'Seconds a file must stay unchanged before ingestion (default: {STABLE_SECONDS})')
+    parser.add_argument('--backend-url', default=os.environ.get('BACKEND_URL'),
+                        help='Backend to ask for an immediate reload after each batch')
+    args = parser.parse_args()
+
+    if not args.poll and not watchdog_available:
+        print("Note: watchdog is not installed (pip install watchdog); falling back to polling")
+
+    watcher = PDFWatcher(
+        args.pdf_dir,
+        use_polling=args.poll,
+        poll_interval=args.poll_interval,
+        tracker=ChangeTracker(args.debounce, args.stable_seconds),
+        backend_url=args.backend_url,
+        admin_token=os.environ.get('ADMIN_TOKEN')
+    )
+    watcher.run()
+
+
+if __name__ == "__main__":
+    main()
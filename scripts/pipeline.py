@@ -0,0 +1,340 @@
+"""
+Small DAG runner with content-hash caching of stage artifacts.
+
+A pipeline is a set of stages, each declaring the files it reads, the
+files it writes and the parameters that affect its result. A stage that
+reads a file another stage writes runs after it; stages with no path
+between them run in parallel on a thread pool.
+
+Before running a stage, its cache key is computed from its name, version,
+parameters and the sha256 of every input. If that key was seen before
+and its outputs are in the object store, the outputs are restored from
+there and the stage is skipped. Outputs are kept by content hash under
+data/pipeline_cache/objects/, so downstream keys depend on what an
+upstream stage produced, not on whether it ran. A stage whose inputs
+live outside the filesystem (the interaction store) is marked
+`cache=False`. It always runs, but if its output comes out byte-identical
+the stages after it still hit the cache.
+
+Every stage execution is recorded with its status and timing in
+data/pipeline_cache/cache.db. File hashes are memoized on size and mtime,
+as the ingestion manifest does, so unchanged inputs are not reread.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ingestion_manifest import file_sha256
+
+DEFAULT_CACHE_DIR = "data/pipeline_cache"
+DEFAULT_MAX_WORKERS = 4
+
+# Cache keys kept per stage by prune(); older keys and unreferenced objects are deleted
+DEFAULT_KEEP_KEYS = 5
+
+
+class Stage:
+    def __init__(self, name: str, run: Callable[['Stage'], None], inputs: Iterable[str] = (),
+                 outputs: Iterable[str] = (), params: Dict = None, cache: bool = True, version: str = '1'):
+        """A pipeline step: `run(stage)` reads `inputs` and must write every path in `outputs`.
+
+        Bump `version` when the stage's code changes in a way that alters its outputs.
+        """
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = dict(params or {})
+        self.cache = cache
+        self.version = version
+
+
+def _write_atomic(source: str, path: str) -> None:
+    """Copy `source` to `path` through a temporary file, so readers never see half a file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ArtifactCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        """Stage results by cache key, artifact objects by content hash, and the run history."""
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'cache.db'), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS stage_cache (
+                stage TEXT NOT NULL,
+                key TEXT NOT NULL,
+                outputs TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (stage, key)
+            );
+            CREATE TABLE IF NOT EXISTS stage_runs (
+                run_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                key TEXT,
+                status TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                started_at TEXT NOT NULL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_stage_runs_stage ON stage_runs (stage, started_at);
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def file_hash(self, path: str) -> str:
+        """sha256 of a file, reread only when its size or mtime changed."""
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        with self._lock:
+            row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?",
+                                    (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = file_sha256(path)
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                              (path, stat.st_size, stat.st_mtime_ns, digest))
+            self.conn.commit()
+        return digest
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def has_object(self, digest: str) -> bool:
+        return os.path.exists(self._object_path(digest))
+
+    def put_object(self, path: str, digest: str) -> None:
+        """Keep a copy of an output under its content hash (a copy, not a link: outputs get edited)."""
+        if not self.has_object(digest):
+            _write_atomic(path, self._object_path(digest))
+
+    def restore(self, path: str, digest: str) -> bool:
+        """Make `path` hold the object `digest`; False if it already did."""
+        if os.path.exists(path) and self.file_hash(path) == digest:
+            return False
+        _write_atomic(self._object_path(digest), path)
+        return True
+
+    def lookup(self, stage: str, key: str) -> Optional[Dict[str, str]]:
+        """{output path: sha256} recorded for a stage key, if every object is still stored."""
+        with self._lock:
+            row = self.conn.execute("SELECT outputs FROM stage_cache WHERE stage = ? AND key = ?",
+                                    (stage, key)).fetchone()
+        if row is None:
+            return None
+        outputs = json.loads(row[0])
+        if not all(self.has_object(digest) for digest in outputs.values()):
+            return None
+        return outputs
+
+    def save(self, stage: str, key: str, outputs: Dict[str, str], seconds: float) -> None:
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO stage_cache VALUES (?, ?, ?, ?, ?)",
+                              (stage, key, json.dumps(outputs), seconds, datetime.now().isoformat()))
+            self.conn.commit()
+
+    def record_run(self, run_id: str, result: Dict) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO stage_runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, result['stage'], result.get('key'), result['status'], result['seconds'],
+                 result['started_at'], result.get('error')))
+            self.conn.commit()
+
+    def history(self, stage: str = None, limit: int = 20) -> List[Dict]:
+        """Most recent stage executions, newest first."""
+        sql = "SELECT run_id, stage, status, seconds, started_at, error FROM stage_runs"
+        args = []
+        if stage:
+            sql += " WHERE stage = ?"
+            args.append(stage)
+        sql += " ORDER BY started_at DESC, rowid DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        return [dict(zip(['run_id', 'stage', 'status', 'seconds', 'started_at', 'error'], row)) for row in rows]
+
+    def prune(self, keep: int = DEFAULT_KEEP_KEYS) -> Dict[str, int]:
+        """Drop all but the newest `keep` keys of each stage, then the objects no key refers to."""
+        with self._lock:
+            stale = self.conn.execute("""
+                SELECT stage, key FROM (
+                    SELECT stage, key, ROW_NUMBER() OVER (PARTITION BY stage ORDER BY created_at DESC) AS age
+                    FROM stage_cache)
+                WHERE age > ?
+            """, (keep,)).fetchall()
+            self.conn.executemany("DELETE FROM stage_cache WHERE stage = ? AND key = ?", stale)
+            self.conn.commit()
+            referenced = set()
+            for (outputs,) in self.conn.execute("SELECT outputs FROM stage_cache"):
+                referenced.update(json.loads(outputs).values())
+        removed = 0
+        for directory, _, files in os.walk(self.objects_dir):
+            for name in files:
+                if name not in referenced:
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+        return {'keys': len(stale), 'objects': removed}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def stage_key(stage: Stage, input_hashes: Dict[str, str]) -> str:
+    """Cache key of a stage for the given input contents."""
+    payload = {
+        'stage': stage.name,
+        'version': stage.version,
+        'params': stage.params,
+        'inputs': input_hashes,
+        'outputs': sorted(stage.outputs)
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], cache: ArtifactCache = None, max_workers: int = DEFAULT_MAX_WORKERS):
+        """Order `stages` by the files they exchange; raises ValueError on duplicates or cycles."""
+        self.stages = {}
+        producers = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name '{stage.name}'")
+            self.stages[stage.name] = stage
+            for path in stage.outputs:
+                if path in producers:
+                    raise ValueError(f"'{path}' is written by both '{producers[path]}' and '{stage.name}'")
+                producers[path] = stage.name
+        self.producers = producers
+        self.dependencies = {
+            stage.name: {producers[path] for path in stage.inputs if path in producers} - {stage.name}
+            for stage in stages
+        }
+        self.order = self._topological_order()
+        self.cache = cache or ArtifactCache()
+        self.max_workers = max_workers
+
+    def _topological_order(self) -> List[str]:
+        order, remaining = [], dict(self.dependencies)
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps - set(order)]
+            if not ready:
+                raise ValueError(f"Stages depend on each other in a cycle: {', '.join(sorted(remaining))}")
+            order.extend(ready)
+            for name in ready:
+                del remaining[name]
+        return order
+
+    def upstream(self, targets: Iterable[str]) -> List[str]:
+        """The targets and every stage they depend on, in run order."""
+        selected, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}' (stages: {', '.join(self.order)})")
+            if name not in selected:
+                selected.add(name)
+                todo.extend(self.dependencies[name])
+        return [name for name in self.order if name in selected]
+
+    def _execute(self, stage: Stage, hashes: Dict[str, str], force: bool) -> Dict:
+        """Run or restore one stage; fills `hashes` with its output hashes."""
+        started = time.perf_counter()
+        result = {'stage': stage.name, 'started_at': datetime.now().isoformat()}
+        try:
+            input_hashes = {path: hashes[path] if path in hashes else self.cache.file_hash(path)
+                            for path in stage.inputs}
+            key = result['key'] = stage_key(stage, input_hashes)
+            cached = self.cache.lookup(stage.name, key) if stage.cache and not force else None
+            if cached is not None:
+                for path, digest in cached.items():
+                    self.cache.restore(path, digest)
+                outputs = cached
+                result['status'] = 'cached'
+            else:
+                stage.run(stage)
+                missing = [path for path in stage.outputs if not os.path.exists(path)]
+                if missing:
+                    raise RuntimeError(f"Stage did not write {', '.join(missing)}")
+                outputs = {path: self.cache.file_hash(path) for path in stage.outputs}
+                for path, digest in outputs.items():
+                    self.cache.put_object(path, digest)
+                self.cache.save(stage.name, key, outputs, time.perf_counter() - started)
+                result['status'] = 'ran'
+            hashes.update(outputs)
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = f"{type(e).__name__}: {e}"
+        result['seconds'] = time.perf_counter() - started
+        return result
+
+    def run(self, targets: Iterable[str] = None, force: Iterable[str] = ()) -> Dict[str, Dict]:
+        """Bring the targets (default: every stage) up to date.
+
+        Stages run as soon as the stages they read from have finished.
+        Stages named in `force` run even on a cache hit. A failed stage
+        skips everything downstream of it, but stages that do not depend
+        on it still run. Returns {stage: result} with status ran, cached,
+        failed or skipped, plus seconds and the error text.
+        """
+        names = self.upstream(targets or self.order)
+        force = set(force)
+        run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        pending = {name: self.dependencies[name] & set(names) for name in names}
+        hashes, results, running = {}, {}, {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in [name for name, deps in pending.items() if deps <= set(results)]:
+                    deps = pending.pop(name)
+                    blocked = sorted(dep for dep in deps if results[dep]['status'] in ('failed', 'skipped'))
+                    if blocked:
+                        results[name] = {'stage': name, 'status': 'skipped', 'seconds': 0.0,
+                                         'started_at': datetime.now().isoformat(),
+                                         'error': f"upstream failed: {', '.join(blocked)}"}
+                        self.cache.record_run(run_id, results[name])
+                        print(f"⏭️  {name}: skipped ({results[name]['error']})")
+                        continue
+                    running[pool.submit(self._execute, self.stages[name], hashes, name in force)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result = results[name] = future.result()
+                    self.cache.record_run(run_id, result)
+                    if result['status'] == 'failed':
+                        print(f"❌ {name}: failed after {result['seconds']:.1f}s ({result['error']})")
+                    elif result['status'] == 'cached':
+                        print(f"♻️  {name}: unchanged, restored from cache ({result['seconds']:.2f}s)")
+                    else:
+                        print(f"✅ {name}: ran in {result['seconds']:.1f}s")
+        return {name: results[name] for name in names}
@@ -0,0 +1,242 @@
+"""
+Columnar quality scoring for interaction batches.
+
+Vectorized equivalents of calculate_quality_score, get_improvement_priority
+and generate_single_suggestion (batch_improve_responses.py) and of the
+keyword checks in suggest_improvements_for_question
+(response_improvement_tool.py). They take a DataFrame with one row per
+interaction, using the Firestore field names (answer, question, model,
+contexts_used, response_time, error, timestamp), and return Series aligned
+with it; the results are identical to calling the per-document functions
+row by row. A missing field, or NaN where a DataFrame was built from
+documents lacking it, counts as absent, as `.get()` does there.
+
+Keyword checks run as one precompiled alternation per rule over the
+lowercased column instead of a Python substring scan per row.
+"""
+
+import re
+from datetime import datetime, timezone
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# Interaction fields the scores read
+SCORING_FIELDS = ['answer', 'question', 'model', 'contexts_used', 'response_time', 'error', 'timestamp']
+
+# DST transitions fall on quarter hours, so one UTC offset lookup per quarter hour is exact
+OFFSET_BUCKET_SECONDS = 900
+
+URGENT_PATTERN = re.compile('specialist|urgent|emergency|frostbite|chest pain|severe')
+COST_PATTERN = re.compile('cost|pay|deductible|copay|expensive')
+COVERAGE_PATTERN = re.compile('covered|coverage|benefits|include')
+GENERIC_ANSWER_PATTERN = re.compile(re.escape("I don't have specific information") + '|' +
+                                    re.escape("contact your insurance"))
+
+# (answer pattern, suggestion) checked against the lowercased answer by generate_single_suggestion.
+# "I don't have" is capitalised there, so it can never match the lowercased text; kept identical.
+ANSWER_SUGGESTIONS = [
+    (re.compile(re.escape("I don't have")), "- Try to provide helpful information even if not in plan documents"),
+    (re.compile(re.escape("contact your insurance")),
+     "- Provide more specific guidance before suggesting to contact insurance"),
+]
+QUESTION_SUGGESTIONS = [
+    (re.compile("deductible"), "- Include specific deductible amounts and examples"),
+    (re.compile("copay"), "- List specific copay amounts for different services"),
+    (re.compile("specialist"), "- Explain the referral process and requirements"),
+]
+
+
+def _column(df: pd.DataFrame, name: str, default) -> pd.Series:
+    if name not in df:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[name]
+
+
+def _text(df: pd.DataFrame, name: str) -> pd.Series:
+    return _column(df, name, '').fillna('').astype(str)
+
+
+def _number(df: pd.DataFrame, name: str) -> pd.Series:
+    return pd.to_numeric(_column(df, name, 0), errors='coerce').fillna(0)
+
+
+def _truthy(series: pd.Series) -> pd.Series:
+    """Python truthiness of each value, with NaN/None as false."""
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.fillna(0).astype(bool)
+    if isinstance(series.dtype, pd.StringDtype):
+        return (series.notna() & series.ne('')).fillna(False).astype(bool)
+    return series.notna() & series.ne('') & series.ne(0)
+
+
+def _contains(text: pd.Series, pattern: re.Pattern) -> pd.Series:
+    return text.str.contains(pattern, regex=True).fillna(False).astype(bool)
+
+
+def _distinct(text: pd.Series):
+    """(distinct values, index of each row's value among them).
+
+    Questions and canned answers repeat a lot, so text checks run once per
+    distinct value and are spread back over the rows with the index.
+    """
+    codes, uniques = pd.factorize(text)
+    return pd.Series(uniques, dtype=object).astype(str), codes
+
+
+def _scoring_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """The per-row inputs both scores share, computed once."""
+    return {
+        'answer_length': _text(df, 'answer').str.len().to_numpy(),
+        'question_length': _text(df, 'question').str.len().to_numpy(),
+        'contexts_used': _number(df, 'contexts_used').to_numpy(),
+        'response_time': _number(df, 'response_time').to_numpy(),
+        'has_error': _truthy(_column(df, 'error', None)).to_numpy(),
+        'is_rag': (_column(df, 'model', '') == 'nelly-1.0').fillna(False).to_numpy(dtype=bool)
+    }
+
+
+def _quality(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    answer_length = columns['answer_length']
+    contexts_used = columns['contexts_used']
+    response_time = columns['response_time']
+
+    score = np.full(len(answer_length), 5.0)
+    score += np.where(answer_length > 200, 1, np.where(answer_length < 50, -2, 0))
+    score += np.where(contexts_used >= 3, 1, np.where(contexts_used == 0, -2, 0))
+    score -= np.where(columns['has_error'], 3, 0)
+    score += np.where((response_time != 0) & (response_time < 2000), 1,
+                      np.where((response_time != 0) & (response_time > 10000), -1, 0))
+    score += np.where(columns['is_rag'], 1, 0)
+    score += np.where(columns['question_length'] > 100, 0.5, 0)
+    return np.clip(score, 1, 10)
+
+
+def quality_scores(df: pd.DataFrame) -> pd.Series:
+    """calculate_quality_score for every row."""
+    return pd.Series(_quality(_scoring_columns(df)), index=df.index)
+
+
+def _local_offset(epoch_seconds: float) -> float:
+    """Seconds the local wall clock is ahead of UTC at a moment."""
+    moment = datetime.fromtimestamp(epoch_seconds, timezone.utc)
+    return (datetime.fromtimestamp(epoch_seconds) - moment.replace(tzinfo=None)).total_seconds()
+
+
+def _hours_ago(timestamps: pd.Series, now: datetime) -> pd.Series:
+    """Hours between `now` and each timestamp in local wall-clock time, as get_improvement_priority measures it.
+
+    Values without a .timestamp() method count as a day old.
+    """
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        if timestamps.dt.tz is None:
+            # Naive datetimes already are local wall-clock time
+            return (pd.Timestamp(now) - timestamps).dt.total_seconds() / 3600
+        # datetime.fromtimestamp() gives local wall-clock time; the UTC offset only changes at
+        # DST transitions, so it is looked up once per quarter hour rather than per row
+        epoch = (timestamps - pd.Timestamp(0, tz='UTC')).dt.total_seconds()
+        quarters = (epoch // OFFSET_BUCKET_SECONDS)
+        offsets = {quarter: _local_offset(quarter * OFFSET_BUCKET_SECONDS) for quarter in quarters.dropna().unique()}
+        local = epoch + quarters.map(offsets)
+        return ((now - datetime(1970, 1, 1)).total_seconds() - local) / 3600
+    # Mixed columns (strings, datetimes of different zones) are rare; convert them one by one
+    return timestamps.map(
+        lambda value: (now - datetime.fromtimestamp(value.timestamp())).total_seconds() / 3600
+        if hasattr(value, 'timestamp') else 24
+    ).astype(float)
+
+
+def _priority(df: pd.DataFrame, columns: Dict[str, np.ndarray], quality: np.ndarray, now: datetime) -> np.ndarray:
+    priority = 5 + (10 - quality) * 0.5
+    priority += np.where(columns['has_error'], 3, 0)
+    priority += np.where(columns['contexts_used'] < 2, 2, 0)
+    priority += np.where(columns['answer_length'] < 30, 2, 0)
+
+    timestamps = _column(df, 'timestamp', None)
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        present = timestamps.notna()
+    else:
+        present = _truthy(timestamps)
+    hours_ago = _hours_ago(timestamps.where(present), now)
+    priority += np.where(present & (hours_ago < 24), 2, np.where(present & (hours_ago < 168), 1, 0))
+    return np.clip(priority, 1, 10)
+
+
+def improvement_priorities(df: pd.DataFrame, quality: pd.Series = None, now: datetime = None) -> pd.Series:
+    """get_improvement_priority for every row; `quality` defaults to quality_scores(df)."""
+    columns = _scoring_columns(df)
+    quality = _quality(columns) if quality is None else quality.to_numpy(dtype=float)
+    return pd.Series(_priority(df, columns, quality, now or datetime.now()), index=df.index)
+
+
+QUALITY_OPENINGS = [
+    "This response needs major improvement. Consider:",
+    "This response needs improvement. Consider:",
+    "This response could be enhanced. Consider:",
+    "This response is good but could be refined. Consider:"
+]
+
+
+def suggestion_texts(df: pd.DataFrame, quality: pd.Series) -> pd.Series:
+    """generate_single_suggestion(question, answer, quality) for every row.
+
+    Each row's checks are packed into a small integer code and every
+    distinct code is turned into text once.
+    """
+    answers, answer_rows = _distinct(_text(df, 'answer'))
+    questions, question_rows = _distinct(_text(df, 'question'))
+    answer_lower = answers.str.lower()
+    question_lower = questions.str.lower()
+    answer_length = answers.str.len()
+    quality = pd.to_numeric(quality, errors='coerce').to_numpy(dtype=float)
+
+    answer_checks = [
+        (answer_length < 50, "- Provide more detailed information"),
+        (answer_length > 500, "- Make the response more concise"),
+    ]
+    answer_checks += [(_contains(answer_lower, pattern), suggestion) for pattern, suggestion in ANSWER_SUGGESTIONS]
+    answer_checks.append((answer_lower.str.contains("based on your plan documents", regex=False) &
+                          (answer_length < 100), "- Include more specific details from the plan documents"))
+    question_checks = [(_contains(question_lower, pattern), suggestion) for pattern, suggestion in QUESTION_SUGGESTIONS]
+    checks = ([(np.asarray(mask)[answer_rows], suggestion) for mask, suggestion in answer_checks] +
+              [(np.asarray(mask)[question_rows], suggestion) for mask, suggestion in question_checks])
+
+    # NaN quality falls through to the last opening, as the comparisons there are all false
+    opening = np.select([quality < 3, quality < 5, quality < 7], [0, 1, 2], 3)
+    codes = opening.astype(np.int64)
+    for bit, (mask, _) in enumerate(checks):
+        codes |= np.asarray(mask, dtype=np.int64) << (bit + 2)
+
+    def render(code):
+        parts = [QUALITY_OPENINGS[code & 3]]
+        parts += [suggestion for bit, (_, suggestion) in enumerate(checks) if code >> (bit + 2) & 1]
+        return " ".join(parts)
+
+    texts = {code: render(code) for code in np.unique(codes)}
+    return pd.Series(codes, index=df.index).map(texts)
+
+
+def question_flags(df: pd.DataFrame) -> pd.DataFrame:
+    """The keyword checks of suggest_improvements_for_question as boolean columns."""
+    questions, question_rows = _distinct(_text(df, 'question'))
+    answers, answer_rows = _distinct(_text(df, 'answer'))
+    question_lower = questions.str.lower()
+    return pd.DataFrame({
+        'urgent': _contains(question_lower, URGENT_PATTERN).to_numpy()[question_rows],
+        'cost': _contains(question_lower, COST_PATTERN).to_numpy()[question_rows],
+        'coverage': _contains(question_lower, COVERAGE_PATTERN).to_numpy()[question_rows],
+        'generic_answer': _contains(answers, GENERIC_ANSWER_PATTERN).to_numpy()[answer_rows]
+    }, index=df.index)
+
+
+def score_frame(df, now: datetime = None) -> Dict[str, pd.Series]:
+    """Quality score and improvement priority columns for a batch (a DataFrame or an Arrow table)."""
+    if hasattr(df, 'to_pandas'):
+        df = df.to_pandas()
+    columns = _scoring_columns(df)
+    quality = _quality(columns)
+    return {
+        'calculated_quality': pd.Series(quality, index=df.index),
+        'improvement_priority': pd.Series(_priority(df, columns, quality, now or datetime.now()), index=df.index)
+    }
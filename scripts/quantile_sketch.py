@@ -0,0 +1,172 @@
+"""
+Mergeable streaming quantile sketch for latencies (DDSketch-style).
+
+Values are counted in logarithmic buckets: bucket i holds values in
+(gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a), so any quantile
+read back is within a relative error `a` of the exact value. Memory grows
+with the log of the value range, not with the number of values. At 1%
+accuracy, 1 ms to 10 minutes is about 670 buckets. Two sketches merge by
+adding bucket counts, so per-day sketches can be combined into windows
+without going back to the raw rows.
+
+    python scripts/quantile_sketch.py benchmark --values 5000000
+"""
+
+import math
+import time
+import argparse
+from typing import Dict, Iterable
+
+import numpy as np
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Values below this (including 0 ms) share one bucket reported as 0
+MIN_VALUE = 1e-3
+
+
+class LatencySketch:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        """An empty sketch answering quantiles within `relative_accuracy` of the exact value."""
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _grow(self, low: int, high: int) -> None:
+        """Make room for bucket keys low..high."""
+        if not len(self.counts):
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        start = min(low, self.offset)
+        end = max(high, self.offset + len(self.counts) - 1)
+        if start == self.offset and end == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(end - start + 1, dtype=np.int64)
+        counts[self.offset - start:self.offset - start + len(self.counts)] = self.counts
+        self.offset, self.counts = start, counts
+
+    def add(self, values) -> None:
+        """Add values (a scalar or any array-like); NaN and negative values are ignored."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[values >= 0]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values >= MIN_VALUE]
+        self.zero_count += len(values) - len(positive)
+        if not len(positive):
+            return
+        keys = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        low, high = int(keys.min()), int(keys.max())
+        self._grow(low, high)
+        self.counts[low - self.offset:high - self.offset + 1] += np.bincount(keys - low, minlength=high - low + 1)
+
+    def merge(self, other: 'LatencySketch') -> 'LatencySketch':
+        """Add another sketch's counts into this one (both need the same accuracy)."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        if len(other.counts):
+            self._grow(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start:start + len(other.counts)] += other.counts
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (0 <= q <= 1); NaN for an empty sketch."""
+        if not self.count:
+            return float('nan')
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = np.cumsum(self.counts) + self.zero_count
+        index = int(np.searchsorted(cumulative, rank, side='right'))
+        index = min(index, len(self.counts) - 1)
+        value = 2 * self.gamma ** (self.offset + index) / (self.gamma + 1)
+        return min(max(value, self.min), self.max)
+
+    def quantiles(self, qs: Iterable[float]) -> Dict[float, float]:
+        return {q: self.quantile(q) for q in qs}
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float('nan')
+
+    def to_dict(self) -> Dict:
+        """JSON-serializable state."""
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'bins': {str(int(self.offset + i)): int(self.counts[i]) for i in nonzero},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencySketch':
+        sketch = cls(data['relative_accuracy'])
+        if data['bins']:
+            keys = [int(key) for key in data['bins']]
+            sketch._grow(min(keys), max(keys))
+            for key, count in data['bins'].items():
+                sketch.counts[int(key) - sketch.offset] = count
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.total = data['total']
+        sketch.min = data['min'] if data['min'] is not None else math.inf
+        sketch.max = data['max'] if data['max'] is not None else -math.inf
+        return sketch
+
+
+def main():
+    """Compare sketch quantiles and throughput with exact quantiles on lognormal latencies."""
+    parser = argparse.ArgumentParser(description='Quantile sketch tools')
+    parser.add_argument('command', choices=['benchmark'])
+    parser.add_argument('--values', type=int, default=5000000)
+    parser.add_argument('--chunk', type=int, default=50000)
+    parser.add_argument('--accuracy', type=float, default=DEFAULT_RELATIVE_ACCURACY)
+    args = parser.parse_args()
+
+    # Response times in ms: median around 2.5 s with a long tail
+    values = np.random.default_rng(0).lognormal(mean=math.log(2500), sigma=0.8, size=args.values)
+
+    started = time.perf_counter()
+    sketch = LatencySketch(args.accuracy)
+    for start in range(0, len(values), args.chunk):
+        sketch.add(values[start:start + args.chunk])
+    sketch_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    exact = np.quantile(values, [0.5, 0.9, 0.99])
+    exact_seconds = time.perf_counter() - started
+
+    print(f"⏱️  {args.values:,} values: sketch {sketch_seconds:.2f}s ({args.values / sketch_seconds:,.0f} values/s, "
+          f"{np.count_nonzero(sketch.counts)} buckets), exact quantiles {exact_seconds:.2f}s with every value in memory")
+    for q, truth in zip([0.5, 0.9, 0.99], exact):
+        estimate = sketch.quantile(q)
+        print(f"   p{q * 100:g}: {estimate:10.1f} ms (exact {truth:10.1f}, error {abs(estimate - truth) / truth:.3%})")
+
+
+if __name__ == "__main__":
+    main()
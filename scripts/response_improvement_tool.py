@@ -9,26 +9,71 @@ import pandas as pd
 from datetime import datetime
 import os
 
-def analyze_interaction_log(csv_file="interaction_log.csv"):
-    """Analyze the interaction log and identify responses that need improvement"""
+from quality_scoring import URGENT_PATTERN, COST_PATTERN, COVERAGE_PATTERN, GENERIC_ANSWER_PATTERN
+from interaction_log import read_log, DEFAULT_LOG_DIR, DEFAULT_CHUNK_ROWS
+
+# Example rows printed per category; the counts cover the whole log
+MAX_EXAMPLES = 10
+
+def analyze_interaction_log(log_source=DEFAULT_LOG_DIR, chunksize=DEFAULT_CHUNK_ROWS):
+    """Analyze the interaction log and identify responses that need improvement.
+
+    The log (a segment directory or a single CSV file) is read in chunks, so
+    memory stays flat however large it gets. Returns the number of
+    interactions and a few sample rows, or None when there is no log.
+    """
     
-    if not os.path.exists(csv_file):
-        print(f"❌ {csv_file} not found. Please run some interactions first.")
+    if not os.path.exists(log_source):
+        print(f"❌ {log_source} not found. Please run some interactions first.")
         return
     
-    # Read the CSV
-    df = pd.read_csv(csv_file)
+    total = 0
+    first_seen = last_seen = None
+    model_counts = {}
+    categories = {
+        'short': {'count': 0, 'examples': []},
+        'generic': {'count': 0, 'examples': []},
+        'specialist': {'count': 0, 'examples': []}
+    }
+    sample = None
+    
+    for df in read_log(log_source, chunksize=chunksize, columns=['timestamp', 'question', 'answer', 'model']):
+        if sample is None:
+            sample = df.head(3)
+        total += len(df)
+        
+        timestamps = df['timestamp'].dropna()
+        if len(timestamps):
+            first_seen = min(filter(None, [first_seen, timestamps.min()]))
+            last_seen = max(filter(None, [last_seen, timestamps.max()]))
+        
+        for model, count in df['model'].value_counts().items():
+            model_counts[model] = model_counts.get(model, 0) + count
+        
+        answers = df['answer'].fillna('')
+        matches = {
+            # Responses that are too short or generic
+            'short': df[answers.str.len() < 100],
+            # Responses that don't provide actionable advice
+            'generic': df[answers.str.contains("I don't have specific information|contact your insurance|check your plan", case=False, na=False)],
+            # Specialist/urgent care questions that might need better responses
+            'specialist': df[df['question'].str.contains("specialist|urgent|emergency|frostbite|chest pain", case=False, na=False)]
+        }
+        for name, rows in matches.items():
+            categories[name]['count'] += len(rows)
+            room = MAX_EXAMPLES - len(categories[name]['examples'])
+            if room > 0:
+                categories[name]['examples'].extend(rows.head(room).to_dict('records'))
     
     print("📊 INTERACTION LOG ANALYSIS")
     print("=" * 50)
-    print(f"Total interactions: {len(df)}")
-    print(f"Date range: {df['date'].min()} to {df['date'].max()}")
+    print(f"Total interactions: {total}")
+    print(f"Date range: {first_seen} to {last_seen}")
     print()
     
     # Analyze by model
-    model_counts = df['model'].value_counts()
     print("📈 MODEL USAGE:")
-    for model, count in model_counts.items():
+    for model, count in sorted(model_counts.items(), key=lambda item: item[1], reverse=True):
         print(f"  {model}: {count} interactions")
     print()
     
@@ -36,62 +81,55 @@ def analyze_interaction_log(csv_file="interaction_log.csv"):
     print("🔍 RESPONSES THAT MIGHT NEED IMPROVEMENT:")
     print("-" * 50)
     
-    # Look for responses that are too short or generic
-    short_responses = df[df['answer'].str.len() < 100]
-    if len(short_responses) > 0:
-        print(f"📝 Short responses (< 100 chars): {len(short_responses)}")
-        for idx, row in short_responses.iterrows():
-            print(f"  • {row['question'][:50]}...")
-            print(f"    Response: {row['answer'][:80]}...")
-            print()
-    
-    # Look for responses that don't provide actionable advice
-    generic_responses = df[df['answer'].str.contains("I don't have specific information|contact your insurance|check your plan", case=False, na=False)]
-    if len(generic_responses) > 0:
-        print(f"🤔 Generic responses: {len(generic_responses)}")
-        for idx, row in generic_responses.iterrows():
-            print(f"  • {row['question'][:50]}...")
-            print(f"    Response: {row['answer'][:80]}...")
+    headings = {
+        'short': "📝 Short responses (< 100 chars)",
+        'generic': "🤔 Generic responses",
+        'specialist': "🏥 Specialist/Urgent care questions"
+    }
+    for name, heading in headings.items():
+        category = categories[name]
+        if category['count'] == 0:
+            continue
+        print(f"{heading}: {category['count']}")
+        for row in category['examples']:
+            if name == 'specialist':
+                print(f"  • {row['question']}")
+                print(f"    Current response: {str(row['answer'])[:100]}...")
+                print(f"    Model: {row['model']}")
+            else:
+                print(f"  • {str(row['question'])[:50]}...")
+                print(f"    Response: {str(row['answer'])[:80]}...")
             print()
-    
-    # Look for specialist/urgent care questions that might need better responses
-    specialist_questions = df[df['question'].str.contains("specialist|urgent|emergency|frostbite|chest pain", case=False, na=False)]
-    if len(specialist_questions) > 0:
-        print(f"🏥 Specialist/Urgent care questions: {len(specialist_questions)}")
-        for idx, row in specialist_questions.iterrows():
-            print(f"  • {row['question']}")
-            print(f"    Current response: {row['answer'][:100]}...")
-            print(f"    Model: {row['model']}")
+        if category['count'] > len(category['examples']):
+            print(f"  ... and {category['count'] - len(category['examples'])} more")
             print()
     
-    return df
+    return {'total': total, 'sample': sample if sample is not None else pd.DataFrame()}
 
-def create_improvement_template(csv_file="interaction_log.csv", output_file="response_improvements.csv"):
-    """Create a template for improving responses"""
-    
-    df = pd.read_csv(csv_file)
-    
-    # Create improvement template
-    improvement_data = []
-    
-    for idx, row in df.iterrows():
-        improvement_data.append({
-            'original_question': row['question'],
-            'original_answer': row['answer'],
-            'model_used': row['model'],
-            'improved_response': '',  # Empty for manual filling
-            'improvement_notes': '',  # Notes about what was improved
-            'category': '',  # Question category (specialist, cost, coverage, etc.)
-            'priority': '',  # High, Medium, Low
-            'timestamp': row['timestamp']
-        })
-    
-    # Save to new CSV
-    improvement_df = pd.DataFrame(improvement_data)
-    improvement_df.to_csv(output_file, index=False)
+def create_improvement_template(log_source=DEFAULT_LOG_DIR, output_file="response_improvements.csv",
+                                chunksize=DEFAULT_CHUNK_ROWS):
+    """Create a template for improving responses, streaming the log chunk by chunk"""
+    
+    count = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        for df in read_log(log_source, chunksize=chunksize,
+                           columns=['timestamp', 'question', 'answer', 'model']):
+            # Create improvement template
+            improvement_df = pd.DataFrame({
+                'original_question': df['question'],
+                'original_answer': df['answer'],
+                'model_used': df['model'],
+                'improved_response': '',  # Empty for manual filling
+                'improvement_notes': '',  # Notes about what was improved
+                'category': '',  # Question category (specialist, cost, coverage, etc.)
+                'priority': '',  # High, Medium, Low
+                'timestamp': df['timestamp']
+            })
+            improvement_df.to_csv(f, index=False, header=count == 0)
+            count += len(improvement_df)
     
     print(f"✅ Created improvement template: {output_file}")
-    print(f"📝 {len(improvement_data)} responses ready for improvement")
+    print(f"📝 {count} responses ready for improvement")
     print()
     print("📋 INSTRUCTIONS:")
     print("1. Open the CSV file in Excel or Google Sheets")
@@ -101,7 +139,7 @@ def create_improvement_template(csv_file="interaction_log.csv", output_file="res
     print("5. Set priority levels (High/Medium/Low)")
     print("6. Save the file when done")
     
-    return improvement_df
+    return count
 
 def generate_training_examples(improvement_file="response_improvements.csv"):
     """Generate training examples from improved responses"""
@@ -123,21 +161,13 @@ def generate_training_examples(improvement_file="response_improvements.csv"):
     print()
     
     # Generate training examples
-    training_examples = []
-    
-    for idx, row in improved_responses.iterrows():
-        example = {
-            'question': row['original_question'],
-            'original_response': row['original_answer'],
-            'improved_response': row['improved_response'],
-            'category': row['category'],
-            'improvement_notes': row['improvement_notes'],
-            'model_used': row['model_used']
-        }
-        training_examples.append(example)
+    training_df = improved_responses.rename(columns={
+        'original_question': 'question',
+        'original_answer': 'original_response'
+    })[['question', 'original_response', 'improved_response', 'category', 'improvement_notes', 'model_used']]
+    training_examples = training_df.to_dict('records')
     
     # Save training examples
-    training_df = pd.DataFrame(training_examples)
     training_df.to_csv("training_examples.csv", index=False)
     
     print("📚 TRAINING EXAMPLES GENERATED:")
@@ -162,26 +192,28 @@ def suggest_improvements_for_question(question, current_response):
     
     suggestions = []
     
+    question_lower = question.lower()
+    
     # Check for specialist/urgent care questions
-    if any(keyword in question.lower() for keyword in ['specialist', 'urgent', 'emergency', 'frostbite', 'chest pain', 'severe']):
+    if URGENT_PATTERN.search(question_lower):
         suggestions.append("🏥 URGENT CARE SUGGESTION: Add emergency care options and urgency considerations")
         suggestions.append("📋 REFERRAL PROCESS: Explain referral requirements and next steps")
         suggestions.append("⚡ IMMEDIATE ACTION: Suggest ER visit for urgent conditions")
     
     # Check for cost questions
-    if any(keyword in question.lower() for keyword in ['cost', 'pay', 'deductible', 'copay', 'expensive']):
+    if COST_PATTERN.search(question_lower):
         suggestions.append("💰 COST BREAKDOWN: Provide specific costs and payment structure")
         suggestions.append("📊 COST COMPARISON: Compare in-network vs out-of-network costs")
         suggestions.append("💡 COST SAVINGS: Suggest ways to reduce costs")
     
     # Check for coverage questions
-    if any(keyword in question.lower() for keyword in ['covered', 'coverage', 'benefits', 'include']):
+    if COVERAGE_PATTERN.search(question_lower):
         suggestions.append("✅ COVERAGE CONFIRMATION: Clearly state what's covered")
         suggestions.append("📋 REQUIREMENTS: List any requirements or conditions")
         suggestions.append("🔍 ALTERNATIVES: Suggest alternative covered services")
     
     # Check for generic responses
-    if "I don't have specific information" in current_response or "contact your insurance" in current_response:
+    if GENERIC_ANSWER_PATTERN.search(current_response):
         suggestions.append("🎯 SPECIFICITY: Provide more specific information from plan documents")
         suggestions.append("📚 CONTEXT: Use more context from retrieved documents")
         suggestions.append("💡 GUIDANCE: Give actionable next steps")
@@ -196,19 +228,19 @@ def main():
     print()
     
     # Step 1: Analyze current interactions
-    df = analyze_interaction_log()
+    analysis = analyze_interaction_log()
     
-    if df is not None and len(df) > 0:
+    if analysis is not None and analysis['total'] > 0:
         print()
         print("📝 CREATING IMPROVEMENT TEMPLATE...")
-        improvement_df = create_improvement_template()
+        create_improvement_template()
         
         print()
         print("💡 SUGGESTIONS FOR IMPROVEMENT:")
         print("-" * 30)
         
         # Show suggestions for a few examples
-        for idx, row in df.head(3).iterrows():
+        for idx, row in analysis['sample'].iterrows():
             suggestions = suggest_improvements_for_question(row['question'], row['answer'])
             if suggestions:
                 print(f"\nQuestion: {row['question'][:60]}...")
@@ -0,0 +1,28 @@
+"""
+Shared helpers for measuring retrieval quality on the evaluation dataset.
+"""
+
+import json
+from typing import List, Dict
+
+DEFAULT_DATASET_PATH = "data/evaluation_qa_dataset.json"
+
+
+def load_eval_questions(dataset_path: str = DEFAULT_DATASET_PATH) -> List[Dict]:
+    """Load the question/answer items from the evaluation dataset."""
+    with open(dataset_path, 'r') as f:
+        dataset = json.load(f)
+    return dataset["questions"]
+
+
+def recall_at_k(reference: List[List[str]], candidate: List[List[str]], k: int) -> float:
+    """Average fraction of each reference top-k that also appears in the candidate top-k."""
+    if not reference:
+        return 0.0
+
+    total = 0.0
+    for ref_ids, cand_ids in zip(reference, candidate):
+        ref_top = set(ref_ids[:k])
+        if ref_top:
+            total += len(ref_top & set(cand_ids[:k])) / len(ref_top)
+    return total / len(reference)
@@ -6,10 +6,12 @@ Analyzes responses and provides scores based on accuracy, completeness, and spec
 
 import json
 import re
+import itertools
 from typing import Dict, List, Any, Tuple
 import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.styles import Font, Alignment
+
+from xlsx_stream import StreamingWorkbook, HEADER_STYLE, text_widths
 
 class ResponseScorer:
     def __init__(self):
@@ -264,21 +266,65 @@ class ResponseScorer:
             "criteria_explanation": self.scoring_criteria
         }
     
+    @staticmethod
+    def _parse_contexts(contexts_str: str) -> List[Dict]:
+        """Parse "file (page); file (page)" context sources (simplified)"""
+        contexts = []
+        if contexts_str:
+            context_parts = contexts_str.split("; ")
+            for part in context_parts:
+                if "(" in part and ")" in part:
+                    source = part.split(" (")[0]
+                    page_info = part.split(" (")[1].rstrip(")")
+                    contexts.append({
+                        "metadata": {
+                            "source_file": source,
+                            "page_number": page_info
+                        }
+                    })
+        return contexts
+    
+    @staticmethod
+    def _source_fields(values: Tuple) -> Dict[str, Any]:
+        """The columns of an "LLM Evaluation Results" row that scoring uses"""
+        values = tuple(values) + (None,) * (16 - len(values))
+        return {
+            "question": values[1] or "",
+            "expected": values[2] or "",
+            "category": values[3] or "",
+            "difficulty": values[4],
+            "rag_answer": values[5] or "",
+            "rag_error": values[6] or "",
+            "general_answer": values[7] or "",
+            "general_error": values[8] or "",
+            "contexts_str": values[15] or ""
+        }
+    
+    @staticmethod
+    def _scored_row(number: int, fields: Dict[str, Any], rag_overall: int, general_overall: int,
+                    rag_scores: Dict[str, int], general_scores: Dict[str, int]) -> List:
+        criteria = ["accuracy", "completeness", "specificity", "source_attribution", "clarity", "honesty"]
+        return (
+            [number, fields["question"], fields["expected"], fields["category"], fields["difficulty"],
+             fields["rag_answer"], fields["rag_error"], fields["general_answer"], fields["general_error"],
+             rag_overall, general_overall]
+            + [rag_scores.get(name, 1) for name in criteria]
+            + [general_scores.get(name, 1) for name in criteria]
+            + ["", "", "Nelly 1.0", "GPT-4o-mini", fields["contexts_str"]]
+        )
+    
     def create_scored_workbook(self, results_file: str = "LLM_Evaluation_Results.xlsx", 
                              output_file: str = "LLM_Evaluation_Scored.xlsx"):
-        """Create a new workbook with automated scores"""
+        """Create a new workbook with automated scores
+        
+        The results are read in read-only mode and the scored sheet is
+        streamed out, so memory stays flat however many rows there are.
+        """
         
         # Load the results workbook
-        wb = openpyxl.load_workbook(results_file)
+        wb = openpyxl.load_workbook(results_file, read_only=True)
         ws = wb["LLM Evaluation Results"]
         
-        # Create new workbook with scores
-        new_wb = Workbook()
-        new_wb.remove(new_wb.active)
-        
-        # Create main results sheet
-        ws_scored = new_wb.create_sheet("Scored Results")
-        
         # Headers with additional score columns
         headers = [
             "Question #", "Question", "Expected Answer", "Category", "Difficulty",
@@ -289,114 +335,52 @@ class ResponseScorer:
             "Nelly 1.0 Notes", "GPT-4o-mini Notes", "Nelly 1.0 Model", "GPT-4o-mini Model", "Context Sources"
         ]
         
-        # Style headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        # Column widths must be set before the first row of a streamed sheet, so
+        # size them in a cheap first pass; scores are single digits
+        layout_rows = (
+            self._scored_row(number, self._source_fields(values), 1, 1, {}, {})
+            for number, values in enumerate(ws.iter_rows(min_row=2, values_only=True), 1)
+        )
+        widths = text_widths(itertools.chain([headers], layout_rows), len(headers))
         
-        for col, header in enumerate(headers, 1):
-            cell = ws_scored.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal="center")
+        # Create new workbook with scores
+        new_wb = StreamingWorkbook(output_file)
+        ws_scored = new_wb.add_sheet("Scored Results", headers, widths, freeze_header=False,
+                                     header_style={**HEADER_STYLE, "alignment": Alignment(horizontal="center")})
         
         # Process each row
         scorer = ResponseScorer()
         
-        for row in range(2, ws.max_row + 1):
+        for number, values in enumerate(ws.iter_rows(min_row=2, values_only=True), 1):
             # Get data from original sheet
-            question = ws.cell(row=row, column=2).value or ""
-            expected = ws.cell(row=row, column=3).value or ""
-            category = ws.cell(row=row, column=4).value or ""
-            rag_answer = ws.cell(row=row, column=6).value or ""
-            rag_error = ws.cell(row=row, column=7).value or ""
-            general_answer = ws.cell(row=row, column=8).value or ""
-            general_error = ws.cell(row=row, column=9).value or ""
-            contexts_str = ws.cell(row=row, column=16).value or ""
-            
-            # Parse contexts (simplified)
-            contexts = []
-            if contexts_str:
-                context_parts = contexts_str.split("; ")
-                for part in context_parts:
-                    if "(" in part and ")" in part:
-                        source = part.split(" (")[0]
-                        page_info = part.split(" (")[1].rstrip(")")
-                        contexts.append({
-                            "metadata": {
-                                "source_file": source,
-                                "page_number": page_info
-                            }
-                        })
+            fields = self._source_fields(values)
+            contexts = self._parse_contexts(fields["contexts_str"])
             
             # Score RAG response
             rag_scores = {}
             rag_overall = 1
-            if rag_answer and not rag_error:
-                rag_scoring = scorer.score_response(rag_answer, expected, question, category, contexts)
+            if fields["rag_answer"] and not fields["rag_error"]:
+                rag_scoring = scorer.score_response(fields["rag_answer"], fields["expected"], fields["question"],
+                                                    fields["category"], contexts)
                 rag_scores = rag_scoring["scores"]
                 rag_overall = rag_scoring["overall_score"]
             
             # Score General LLM response
             general_scores = {}
             general_overall = 1
-            if general_answer and not general_error:
-                general_scoring = scorer.score_response(general_answer, expected, question, category, [])
+            if fields["general_answer"] and not fields["general_error"]:
+                general_scoring = scorer.score_response(fields["general_answer"], fields["expected"],
+                                                        fields["question"], fields["category"], [])
                 general_scores = general_scoring["scores"]
                 general_overall = general_scoring["overall_score"]
             
             # Write data to new sheet
-            ws_scored.cell(row=row, column=1, value=row-1)  # Question #
-            ws_scored.cell(row=row, column=2, value=question)
-            ws_scored.cell(row=row, column=3, value=expected)
-            ws_scored.cell(row=row, column=4, value=category)
-            ws_scored.cell(row=row, column=5, value=ws.cell(row=row, column=5).value)  # Difficulty
-            ws_scored.cell(row=row, column=6, value=rag_answer)
-            ws_scored.cell(row=row, column=7, value=rag_error)
-            ws_scored.cell(row=row, column=8, value=general_answer)
-            ws_scored.cell(row=row, column=9, value=general_error)
-            
-            # Overall scores
-            ws_scored.cell(row=row, column=10, value=rag_overall)
-            ws_scored.cell(row=row, column=11, value=general_overall)
-            
-            # Detailed RAG scores
-            ws_scored.cell(row=row, column=12, value=rag_scores.get("accuracy", 1))
-            ws_scored.cell(row=row, column=13, value=rag_scores.get("completeness", 1))
-            ws_scored.cell(row=row, column=14, value=rag_scores.get("specificity", 1))
-            ws_scored.cell(row=row, column=15, value=rag_scores.get("source_attribution", 1))
-            ws_scored.cell(row=row, column=16, value=rag_scores.get("clarity", 1))
-            ws_scored.cell(row=row, column=17, value=rag_scores.get("honesty", 1))
-            
-            # Detailed General LLM scores
-            ws_scored.cell(row=row, column=18, value=general_scores.get("accuracy", 1))
-            ws_scored.cell(row=row, column=19, value=general_scores.get("completeness", 1))
-            ws_scored.cell(row=row, column=20, value=general_scores.get("specificity", 1))
-            ws_scored.cell(row=row, column=21, value=general_scores.get("source_attribution", 1))
-            ws_scored.cell(row=row, column=22, value=general_scores.get("clarity", 1))
-            ws_scored.cell(row=row, column=23, value=general_scores.get("honesty", 1))
-            
-            # Notes and other columns
-            ws_scored.cell(row=row, column=24, value="")  # RAG Notes
-            ws_scored.cell(row=row, column=25, value="")  # General LLM Notes
-            ws_scored.cell(row=row, column=26, value="Nelly 1.0")  # RAG Model - Updated name
-            ws_scored.cell(row=row, column=27, value="GPT-4o-mini")  # General Model - Updated name
-            ws_scored.cell(row=row, column=28, value=contexts_str)  # Context Sources
-        
-        # Auto-adjust column widths
-        for column in ws_scored.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws_scored.column_dimensions[column_letter].width = adjusted_width
+            ws_scored.append(self._scored_row(number, fields, rag_overall, general_overall,
+                                              rag_scores, general_scores))
+        wb.close()
         
         # Create summary sheet
-        ws_summary = new_wb.create_sheet("Scoring Summary")
+        ws_summary = new_wb.add_sheet("Scoring Summary", widths=[100])
         
         summary_content = [
             "AUTOMATED SCORING SUMMARY",
@@ -436,15 +420,15 @@ class ResponseScorer:
         ]
         
         for i, content in enumerate(summary_content, 1):
-            ws_summary[f'A{i}'] = content
             if i == 1:  # Title
-                ws_summary[f'A{i}'].font = Font(bold=True, size=14)
+                ws_summary.append([content], style={"font": Font(bold=True, size=14)})
             elif i in [3, 9, 15]:  # Section headers
-                ws_summary[f'A{i}'].font = Font(bold=True)
-            ws_summary.column_dimensions['A'].width = 100
+                ws_summary.append([content], style={"font": Font(bold=True)})
+            else:
+                ws_summary.append([content])
         
         # Save workbook
-        new_wb.save(output_file)
+        new_wb.save()
         print(f"Scored evaluation results saved to: {output_file}")
         
         return output_file
@@ -1,47 +1,64 @@
 import os
-import PyPDF2
-import pdfplumber
 import chromadb
 from sentence_transformers import SentenceTransformer
 import numpy as np
-import json
 from typing import List, Dict, Tuple
-import re
+import argparse
+
+from adjacency_index import build_adjacency_index, save_adjacency_index, DEFAULT_INDEX_PATH
+from ingestion import StreamingIngestor, page_to_chunks
+from pdf_extraction import PageExtractor
+from chunking import (
+    Chunker, DEFAULT_CHUNKER, split_text_into_chunks, add_chunker_arguments, chunker_from_args
+)
+from ingestion_manifest import IngestionManifest, file_sha256, hash_pdf_pages, ingestion_lock, DEFAULT_MANIFEST_PATH
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_PATH
+from chunk_store import ChunkStore, DEFAULT_STORE_PATH
+from dedupe import NearDuplicateDetector, DEFAULT_THRESHOLD
+from benefit_facts import BenefitFactStore, ingest_facts, DEFAULT_FACTS_PATH
+from compressed_index import carry_over
+from index_versions import (
+    IndexPointer, new_version_record, record_path, validate_collection, prune_versions, DEFAULT_POINTER_PATH
+)
 
 class PDFVectorizer:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        """Initialize the PDF vectorizer with a sentence transformer model."""
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", embedding_cache_path: str = DEFAULT_CACHE_PATH,
+                 chunk_store_path: str = DEFAULT_STORE_PATH, chunker: Chunker = DEFAULT_CHUNKER,
+                 benefit_facts_path: str = DEFAULT_FACTS_PATH, pointer_path: str = DEFAULT_POINTER_PATH,
+                 manifest_path: str = DEFAULT_MANIFEST_PATH):
+        """Initialize the PDF vectorizer with a sentence transformer model.
+
+        With a `pointer_path`, each run builds a new index version next to the
+        live one, writes its chunk store, adjacency index, benefit facts and
+        manifest under the version's directory, and publishes it only once it
+        validates; pass None to rebuild the live collection and the files at
+        the given paths in place. `benefit_facts_path=None` skips the facts.
+        """
+        self.model_name = model_name
+        self.chunker = chunker
+        self.benefit_facts_path = benefit_facts_path
+        self.chunk_store_path = chunk_store_path
+        self.manifest_path = manifest_path
         self.model = SentenceTransformer(model_name)
+        self.embedding_cache = EmbeddingCache(embedding_cache_path) if embedding_cache_path else None
+        self.chunk_store = None
+        self.pointer = IndexPointer(pointer_path) if pointer_path else None
         self.client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.client.get_or_create_collection(
-            name="benefits_documents",
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.collection = self.open_collection((self.pointer or IndexPointer()).active_collection())
+    
+    def open_collection(self, name: str):
+        return self.client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
         
     def extract_text_from_pdf(self, pdf_path: str) -> List[Dict]:
         """Extract text from PDF and return structured chunks."""
         chunks = []
         
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page_num, page in enumerate(pdf.pages, 1):
-                    text = page.extract_text()
-                    if text:
-                        # Split text into smaller chunks (around 500 characters)
-                        text_chunks = self._split_text_into_chunks(text, chunk_size=500)
-                        
-                        for chunk_idx, chunk_text in enumerate(text_chunks):
-                            chunks.append({
-                                'text': chunk_text.strip(),
-                                'page': page_num,
-                                'chunk': chunk_idx,
-                                'source': os.path.basename(pdf_path),
-                                'metadata': {
-                                    'page_number': page_num,
-                                    'chunk_index': chunk_idx,
-                                    'source_file': os.path.basename(pdf_path)
-                                }
-                            })
+            with PageExtractor(pdf_path) as extractor:
+                for page_num in range(1, len(extractor) + 1):
+                    text = extractor.extract_text(page_num)
+                    # Split text into smaller chunks (around 500 characters)
+                    chunks.extend(page_to_chunks(text, page_num, os.path.basename(pdf_path), chunker=self.chunker))
         except Exception as e:
             print(f"Error processing {pdf_path}: {str(e)}")
             
@@ -49,59 +66,166 @@ class PDFVectorizer:
     
     def _split_text_into_chunks(self, text: str, chunk_size: int = 500) -> List[str]:
         """Split text into overlapping chunks."""
-        # Clean the text
-        text = re.sub(r'\s+', ' ', text).strip()
+        return split_text_into_chunks(text, chunk_size)
+    
+    def vectorize_pdfs(self, pdf_directory: str, workers: int = 1,
+                       embed_batch_size: int = 64, upsert_batch_size: int = 256,
+                       dedupe_threshold: float = DEFAULT_THRESHOLD) -> None:
+        """Vectorize all PDFs in the directory as a streaming, resumable pipeline.
+
+        Near-duplicate chunks (MinHash similarity >= `dedupe_threshold`) are
+        collapsed into the first occurrence; pass None to embed every chunk.
+        """
+        pdf_files = sorted(f for f in os.listdir(pdf_directory) if f.endswith('.pdf'))
+        pdf_paths = [os.path.join(pdf_directory, f) for f in pdf_files]
         
-        chunks = []
-        words = text.split()
+        ingestor = StreamingIngestor(
+            self.model, self.collection,
+            embed_batch_size=embed_batch_size,
+            upsert_batch_size=upsert_batch_size,
+            workers=workers,
+            embedding_cache=self.embedding_cache,
+            model_name=self.model_name,
+            chunker=self.chunker
+        )
         
-        for i in range(0, len(words), chunk_size // 6):  # Overlap by ~100 words
-            chunk_words = words[i:i + chunk_size // 6]
-            if chunk_words:
-                chunk_text = ' '.join(chunk_words)
-                if len(chunk_text.strip()) > 50:  # Only include substantial chunks
-                    chunks.append(chunk_text)
+        build = self.start_build(ingestor, pdf_paths) if self.pointer else None
+        # A build writes its own copy of every derived file; in place, those of the live version are rewritten
+        live = None if build else IndexPointer().active
+        files = build or {
+            'chunk_store': record_path(live, 'chunk_store', self.chunk_store_path),
+            'adjacency_index': record_path(live, 'adjacency_index', DEFAULT_INDEX_PATH),
+            'benefit_facts': record_path(live, 'benefit_facts', self.benefit_facts_path),
+            'manifest': record_path(live, 'manifest', self.manifest_path)
+        }
+        self.chunk_store = ChunkStore(files['chunk_store'])
         
-        return chunks
+        # Chunks go to the canonical store as each batch is upserted
+        checkpoint = ingestor.checkpoint(pdf_paths)
+        if not checkpoint.resumed_pages:
+            self.chunk_store.clear()
+        elif checkpoint.invalidated:
+            # Files edited since the interrupted run are ingested again from scratch
+            self.forget_sources(checkpoint.invalidated)
+        if dedupe_threshold is not None:
+            ingestor.deduper = NearDuplicateDetector(self.chunk_store, dedupe_threshold)
+        
+        print(f"Processing {len(pdf_files)} PDF(s)...")
+        result = ingestor.run(pdf_paths, on_batch=self.chunk_store.upsert_chunks)
+        chunk_ids_by_page = result['chunk_ids_by_page']
+        
+        total_chunks = sum(len(ids) for pages in chunk_ids_by_page.values() for ids in pages.values())
+        print(f"Successfully vectorized and stored {total_chunks} chunks")
+        print(f"Chunk store: {self.chunk_store.path} (run 'python3 scripts/chunk_store.py export' for JSON files)")
+        
+        # Record chunk neighbors so /ask can expand hits without re-searching
+        os.makedirs(os.path.dirname(files['adjacency_index']) or '.', exist_ok=True)
+        save_adjacency_index(build_adjacency_index(self.chunk_store.iter_keys(canonical_only=True)),
+                             files['adjacency_index'])
+        
+        if self.benefit_facts_path:
+            self.write_benefit_facts(pdf_paths, files['benefit_facts'])
+        
+        # Record content hashes so add_pdf_to_system.py only re-ingests changes
+        self.write_manifest(pdf_paths, chunk_ids_by_page, files['manifest'])
+        
+        if build:
+            self.publish_build(build, len(self.chunk_store) - self.chunk_store.count_aliases())
+        else:
+            self.delete_stale_ids()
     
-    def vectorize_pdfs(self, pdf_directory: str) -> None:
-        """Vectorize all PDFs in the directory."""
-        pdf_files = [f for f in os.listdir(pdf_directory) if f.endswith('.pdf')]
-        
-        all_chunks = []
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(pdf_directory, pdf_file)
-            print(f"Processing {pdf_file}...")
-            chunks = self.extract_text_from_pdf(pdf_path)
-            all_chunks.extend(chunks)
-            print(f"Extracted {len(chunks)} chunks from {pdf_file}")
-        
-        print(f"Total chunks extracted: {len(all_chunks)}")
-        
-        # Generate embeddings
-        texts = [chunk['text'] for chunk in all_chunks]
-        embeddings = self.model.encode(texts)
-        
-        # Store in ChromaDB
-        ids = [f"{chunk['source']}_page{chunk['page']}_chunk{chunk['chunk']}" for chunk in all_chunks]
-        metadatas = [chunk['metadata'] for chunk in all_chunks]
-        
-        self.collection.add(
-            embeddings=embeddings.tolist(),
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
+    def delete_stale_ids(self, batch_size: int = 1000) -> int:
+        """Drop embeddings of chunks the rebuild no longer produced (removed files, shorter pages, new aliases)."""
+        canonical_ids = {key['id'] for key in self.chunk_store.iter_keys(canonical_only=True)}
+        stale = [chunk_id for chunk_id in self.collection.get(include=[])['ids'] if chunk_id not in canonical_ids]
+        for i in range(0, len(stale), batch_size):
+            self.collection.delete(ids=stale[i:i + batch_size])
+        if stale:
+            print(f"Deleted {len(stale)} stale chunk(s) from {self.collection.name}")
+        return len(stale)
+    
+    def forget_sources(self, source_files: List[str]) -> None:
+        """Drop the stored and embedded chunks of files, so none of their old chunks outlive a re-ingest."""
+        for source_file in source_files:
+            ids = [chunk['id'] for chunk in self.chunk_store.iter_chunks(source_file)]
+            if ids:
+                self.collection.delete(ids=ids)
+                self.chunk_store.delete(ids)
+                print(f"Re-ingesting {source_file}: it changed since the interrupted run")
+    
+    def start_build(self, ingestor: StreamingIngestor, pdf_paths: List[str]) -> Dict:
+        """Point the ingestor at a new side collection, or at the interrupted build being resumed."""
+        build = self.pointer.building
+        if build:
+            ingestor.collection = self.open_collection(build['collection'])
+            if ingestor.checkpoint(pdf_paths).resumed_pages:
+                print(f"Resuming index build {build['collection']}")
+                self.collection = ingestor.collection
+                return build
+            # Left over from a different run; its partial collection is useless
+            self.client.delete_collection(build['collection'])
+        
+        build = new_version_record()
+        self.pointer.start_build(build)
+        self.collection = ingestor.collection = self.open_collection(build['collection'])
+        print(f"Building index version {build['collection']} (live: {self.pointer.active_collection()})")
+        return build
+    
+    def publish_build(self, build: Dict, expected_count: int) -> bool:
+        """Validate the new version and atomically make it the live index."""
+        live_name = self.pointer.active_collection()
+        live_count = None
+        if live_name in [c.name for c in self.client.list_collections()]:
+            live_count = self.client.get_collection(live_name).count()
         
-        print(f"Successfully vectorized and stored {len(all_chunks)} chunks")
+        report = validate_collection(self.collection, self.model.encode, expected_count, live_count)
+        if not report['ok']:
+            print(f"❌ Index version {build['collection']} failed validation; {live_name} stays live:")
+            for problem in report['problems']:
+                print(f"   - {problem}")
+            return False
         
-        # Save metadata for reference
-        with open('pdf_metadata.json', 'w') as f:
-            json.dump(all_chunks, f, indent=2)
+        if carry_over(self.pointer.active, build, self.collection):
+            print(f"Built a compressed index for {build['collection']} like the one of {live_name}")
+        self.pointer.activate(dict(build, chunks=report['count']))
+        print(f"✅ Published {build['collection']} ({report['count']} chunks); previous: {live_name}")
+        removed = prune_versions(self.client, self.pointer)
+        if removed:
+            print(f"Pruned {len(removed)} old index version(s)")
+        return True
+    
+    def write_benefit_facts(self, pdf_paths: List[str], path: str) -> None:
+        """Rebuild the benefit fact table that answers exact cost questions in /ask."""
+        store = BenefitFactStore(path)
+        for source_file in set(store.sources()) - {os.path.basename(p) for p in pdf_paths}:
+            store.delete_source(source_file)
+        stored, rejected = ingest_facts(pdf_paths, store)
+        print(f"Saved {stored} benefit facts to {path} ({rejected} rejected by validation)")
+        store.close()
+    
+    def write_manifest(self, pdf_paths: List[str], chunk_ids_by_page: Dict[str, Dict[int, List[str]]],
+                       path: str) -> None:
+        """Rebuild the ingestion manifest after a full vectorization."""
+        manifest = IngestionManifest.load(path)
+        manifest.reset(self.chunker.version, self.model_name)
+        
+        for pdf_path in pdf_paths:
+            source_file = os.path.basename(pdf_path)
+            file_pages = chunk_ids_by_page.get(source_file, {})
+            # Pages that failed to extract are stored without a hash, so the next run retries them
+            page_hashes = {page_num: (page_hash if page_num in file_pages else None)
+                           for page_num, page_hash in hash_pdf_pages(pdf_path).items()}
+            manifest.record_file(pdf_path, file_sha256(pdf_path), page_hashes, file_pages)
+        
+        manifest.save()
+        print(f"Saved ingestion manifest for {len(pdf_paths)} file(s)")
     
     def search(self, query: str, n_results: int = 5) -> List[Dict]:
         """Search for relevant chunks based on query."""
-        query_embedding = self.model.encode([query])
+        if self.embedding_cache:
+            query_embedding = self.embedding_cache.encode([query], self.model_name, self.model.encode)
+        else:
+            query_embedding = self.model.encode([query])
         
         results = self.collection.query(
             query_embeddings=query_embedding.tolist(),
@@ -120,14 +244,45 @@ class PDFVectorizer:
 
 def main():
     """Main function to vectorize the PDFs."""
-    vectorizer = PDFVectorizer()
+    parser = argparse.ArgumentParser(description='Vectorize all PDFs in assets/pdfs')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                       help='Processes for extraction and embedding (0 = all cores, default: 1)')
+    parser.add_argument('--embed-batch-size', type=int, default=64,
+                       help='Chunks per embedding batch (default: 64)')
+    parser.add_argument('--upsert-batch-size', type=int, default=256,
+                       help='Chunks per ChromaDB upsert (default: 256)')
+    parser.add_argument('--no-embedding-cache', action='store_true',
+                       help=f'Re-embed every chunk instead of reusing {DEFAULT_CACHE_PATH}')
+    parser.add_argument('--dedupe-threshold', type=float, default=DEFAULT_THRESHOLD,
+                       help=f'Similarity at which chunks are collapsed as near-duplicates (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--no-dedupe', action='store_true', help='Embed near-duplicate chunks too')
+    parser.add_argument('--no-benefit-facts', action='store_true',
+                       help=f'Skip extracting benefit tables into {DEFAULT_FACTS_PATH}')
+    parser.add_argument('--in-place', action='store_true',
+                       help='Rebuild the live collection directly instead of a validated side version')
+    add_chunker_arguments(parser)
+    args = parser.parse_args()
+    
+    vectorizer = PDFVectorizer(
+        embedding_cache_path=None if args.no_embedding_cache else DEFAULT_CACHE_PATH,
+        chunker=chunker_from_args(args, "all-MiniLM-L6-v2"),
+        benefit_facts_path=None if args.no_benefit_facts else DEFAULT_FACTS_PATH,
+        pointer_path=None if args.in_place else DEFAULT_POINTER_PATH
+    )
     
     # Look for PDFs in the assets/pdfs directory
     pdf_dir = os.path.join(os.getcwd(), "assets", "pdfs")
     
     print("Starting PDF vectorization...")
     print(f"Looking for PDFs in: {pdf_dir}")
-    vectorizer.vectorize_pdfs(pdf_dir)
+    with ingestion_lock():
+        vectorizer.vectorize_pdfs(
+            pdf_dir,
+            workers=args.workers,
+            embed_batch_size=args.embed_batch_size,
+            upsert_batch_size=args.upsert_batch_size,
+            dedupe_threshold=None if args.no_dedupe else args.dedupe_threshold
+        )
     print("Vectorization complete!")
     
     # Test search functionality
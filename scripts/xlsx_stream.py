@@ -0,0 +1,115 @@
+"""
+Constant-memory xlsx writing on top of openpyxl's write-only mode.
+
+Rows are serialized to the sheet's XML as they are appended instead of
+being held as cell objects (or a DataFrame) until save, so peak memory no
+longer grows with the number of rows. The trade-off of write-only mode is
+that column widths, frozen panes and per-column styles must be known up
+front; StreamingWorkbook.add_sheet takes them all before the first row.
+Summary sheets are built from totals gathered while the rows stream past.
+"""
+
+import os
+from typing import Dict, List, Iterable, Optional
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+HEADER_STYLE = {
+    'font': Font(bold=True, color="FFFFFF"),
+    'fill': PatternFill(start_color="366092", end_color="366092", fill_type="solid"),
+    'alignment': Alignment(horizontal='center', vertical='center')
+}
+THIN_BORDER = Border(left=Side(style='thin'), right=Side(style='thin'),
+                     top=Side(style='thin'), bottom=Side(style='thin'))
+# The header pandas' to_excel writes
+PLAIN_HEADER_STYLE = {
+    'font': Font(bold=True),
+    'border': THIN_BORDER,
+    'alignment': Alignment(horizontal='center', vertical='top')
+}
+
+
+class StreamingSheet:
+    def __init__(self, worksheet, column_styles: Dict[int, Dict] = None):
+        """A write-only worksheet; `column_styles` maps 1-based column numbers to cell attributes."""
+        self.worksheet = worksheet
+        self.column_styles = column_styles or {}
+        self.rows = 0
+
+    def _cell(self, value, style: Optional[Dict]):
+        if not style:
+            return value
+        cell = WriteOnlyCell(self.worksheet, value=value)
+        for attribute, setting in style.items():
+            setattr(cell, attribute, setting)
+        return cell
+
+    def append(self, values: Iterable, style: Dict = None) -> None:
+        """Write one row; `style` applies to every cell of it, on top of the column styles."""
+        cells = []
+        for column, value in enumerate(values, 1):
+            cell_style = self.column_styles.get(column)
+            if style:
+                cell_style = {**(cell_style or {}), **style}
+            cells.append(self._cell(value, cell_style))
+        self.worksheet.append(cells)
+        self.rows += 1
+
+    def write_rows(self, rows: Iterable[Iterable]) -> int:
+        for values in rows:
+            self.append(values)
+        return self.rows
+
+
+class StreamingWorkbook:
+    def __init__(self, path: str):
+        """A write-only workbook saved atomically to `path`."""
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheets = []
+
+    def add_sheet(self, title: str, headers: List[str] = None, widths: List[float] = None,
+                  column_styles: Dict[int, Dict] = None, header_style: Dict = HEADER_STYLE,
+                  freeze_header: bool = True) -> StreamingSheet:
+        """Create a sheet, set its layout and write the header row."""
+        worksheet = self.workbook.create_sheet(title)
+        for column, width in enumerate(widths or [], 1):
+            if width:
+                worksheet.column_dimensions[get_column_letter(column)].width = width
+        if headers and freeze_header:
+            worksheet.freeze_panes = 'A2'
+        sheet = StreamingSheet(worksheet, column_styles)
+        if headers:
+            sheet.append(headers, style=header_style)
+        self.sheets.append(sheet)
+        return sheet
+
+    def add_table_sheet(self, title: str, headers: List[str], rows: Iterable[Iterable],
+                        widths: List[float] = None, **kwargs) -> StreamingSheet:
+        sheet = self.add_sheet(title, headers, widths, **kwargs)
+        sheet.write_rows(rows)
+        return sheet
+
+    def save(self) -> None:
+        # Keep the extension last so tools that sniff it still recognise the temp file
+        base, ext = os.path.splitext(self.path)
+        tmp_path = f"{base}.tmp{ext}"
+        try:
+            self.workbook.save(tmp_path)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def text_widths(rows: Iterable[Iterable], columns: int, cap: float = 50) -> List[float]:
+    """Column widths fitted to the longest value in each column, capped at `cap`."""
+    longest = [0] * columns
+    for values in rows:
+        for column, value in enumerate(values):
+            if column < columns and value is not None:
+                longest[column] = max(longest[column], len(str(value)))
+    return [min(length + 2, cap) for length in longest]
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the tools the same way they import each other
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'scripts'))
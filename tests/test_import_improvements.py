@@ -0,0 +1,90 @@
+"""Bulk improvement writes: bisection around permanent errors and retry of transient ones."""
+
+import threading
+
+from interaction_store import MemoryInteractionStore
+from import_improvements import write_improvements
+
+
+class InvalidArgument(Exception):
+    """Same name as the Firestore error for a document the server rejects."""
+
+
+class ServiceUnavailable(Exception):
+    """Same name as the transient Firestore error."""
+
+
+class FlakyStore(MemoryInteractionStore):
+    def __init__(self, rejected=(), transient_failures=0):
+        """A memory store rejecting some document IDs on every commit and failing the first few commits."""
+        super().__init__()
+        self.rejected = set(rejected)
+        self.transient_failures = transient_failures
+        self.commits = []
+        self.calls = threading.Lock()
+
+    def update_many(self, updates):
+        updates = list(updates)
+        with self.calls:
+            self.commits.append(len(updates))
+            if self.transient_failures:
+                self.transient_failures -= 1
+                raise ServiceUnavailable("try again")
+        bad = [doc_id for doc_id, _ in updates if doc_id in self.rejected]
+        if bad:
+            raise InvalidArgument(f"Rejected {bad[0]}")
+        return super().update_many(updates)
+
+
+def make_updates(store, count):
+    ids = store.insert_many([{'question': f'q{i}', 'answer': f'a{i}'} for i in range(count)],
+                            [f'doc{i}' for i in range(count)])
+    return [{'row': i + 2, 'id': doc_id, 'data': {'improved_answer': f'better a{i}'}}
+            for i, doc_id in enumerate(ids)]
+
+
+def test_permanent_errors_are_isolated_by_bisection():
+    store = FlakyStore(rejected={'doc5', 'doc37'})
+    updates = make_updates(store, 64)
+    # A missing document fails with the store's own NotFound
+    updates.append({'row': 66, 'id': 'gone', 'data': {'improved_answer': 'x'}})
+    sleeps = []
+
+    results = write_improvements(store, updates, batch_size=16, max_workers=4, sleep=sleeps.append)
+
+    failed = {r['id']: r['error'] for r in results if r['status'] == 'failed'}
+    assert set(failed) == {'doc5', 'doc37', 'gone'}
+    assert failed['doc5'].startswith('InvalidArgument') and failed['gone'].startswith('NotFound')
+    assert [r['row'] for r in results] == [u['row'] for u in updates]
+    for update in updates:
+        if update['id'] not in failed:
+            assert store.docs[update['id']]['improved_answer'] == update['data']['improved_answer']
+    assert 'improved_answer' not in store.docs['doc5']
+    # Permanent errors are split, not retried
+    assert sleeps == []
+    # A group with one bad row takes log2(16) splits down to it, not one commit per row
+    assert len(store.commits) < 40
+
+
+def test_transient_errors_are_retried_with_backoff():
+    store = FlakyStore(transient_failures=2)
+    updates = make_updates(store, 10)
+    sleeps = []
+
+    results = write_improvements(store, updates, batch_size=10, max_workers=1, sleep=sleeps.append)
+
+    assert all(r['status'] == 'updated' and r['attempts'] == 3 for r in results)
+    assert sleeps == [0.5, 1.0]
+    assert store.commits == [10, 10, 10]
+
+
+def test_transient_errors_give_up_after_max_attempts():
+    store = FlakyStore(transient_failures=10)
+    updates = make_updates(store, 4)
+
+    results = write_improvements(store, updates, batch_size=4, max_workers=1, max_attempts=3, sleep=lambda s: None)
+
+    assert all(r['status'] == 'failed' and r['attempts'] == 3 for r in results)
+    assert results[0]['error'] == 'ServiceUnavailable: try again'
+    # Transient failures are not bisected
+    assert store.commits == [4, 4, 4]
@@ -0,0 +1,91 @@
+"""A resumed ingestion run never keeps pages of a PDF that was edited after the interrupted run."""
+
+import os
+
+import numpy as np
+
+import ingestion
+from ingestion import StreamingIngestor
+
+
+class FakeModel:
+    def encode(self, texts, batch_size=None):
+        return np.zeros((len(texts), 3))
+
+
+class FakeCollection:
+    name = 'benefits_documents'
+
+    def __init__(self):
+        self.documents = {}
+
+    def upsert(self, embeddings, documents, metadatas, ids):
+        self.documents.update(zip(ids, documents))
+
+
+def fake_iter_pages(pdf_paths, pages_by_file=None, skip=None, failed=None, stats=None):
+    """Each line of a fake PDF is a page; a page reading FAIL cannot be extracted."""
+    for pdf_path in pdf_paths:
+        source = os.path.basename(pdf_path)
+        with open(pdf_path) as f:
+            pages = f.read().splitlines()
+        for page_num, text in enumerate(pages, start=1):
+            if skip is not None and skip(source, page_num):
+                continue
+            if text == 'FAIL':
+                failed.append((source, page_num, 'unreadable'))
+                continue
+            extracted.append((source, page_num))
+            yield pdf_path, page_num, f"{text}. {FILLER}"
+
+
+extracted = []
+# Pages need enough text to produce a chunk
+FILLER = "See the schedule of benefits for the cost sharing that applies to in-network providers."
+
+
+def run(pdf_paths, checkpoint_path, collection):
+    ingestor = StreamingIngestor(FakeModel(), collection, checkpoint_path=checkpoint_path)
+    return ingestor.run(pdf_paths)
+
+
+def test_edited_pdf_is_not_resumed(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, 'iter_pages', fake_iter_pages)
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    policy = tmp_path / 'policy.pdf'
+    summary = tmp_path / 'summary.pdf'
+    policy.write_text('deductible is $500\nFAIL\n')
+    summary.write_text('generic drugs cost $10\nbrand drugs cost $25\n')
+    pdf_paths = [str(policy), str(summary)]
+    collection = FakeCollection()
+
+    # A page that fails keeps the checkpoint around for the next run
+    result = run(pdf_paths, checkpoint_path, collection)
+    assert [page for _, page, _ in result['failed']] == [2]
+    assert os.path.exists(checkpoint_path)
+
+    summary.write_text('generic drugs cost $20\nbrand drugs cost $50\n')
+    extracted.clear()
+    result = run(pdf_paths, checkpoint_path, collection)
+
+    # The unchanged file resumes; the edited one is extracted again and its new text is served
+    assert extracted == [('summary.pdf', 1), ('summary.pdf', 2)]
+    assert result['resumed_pages'] == 1
+    texts = ' '.join(collection.documents.values())
+    assert '$20' in texts and '$50' in texts
+    assert '$10' not in texts and '$25' not in texts
+    assert sorted(result['chunk_ids_by_page']['summary.pdf']) == [1, 2]
+
+
+def test_unchanged_pdfs_resume(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, 'iter_pages', fake_iter_pages)
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    policy = tmp_path / 'policy.pdf'
+    policy.write_text('deductible is $500\nFAIL\n')
+
+    run([str(policy)], checkpoint_path, FakeCollection())
+    extracted.clear()
+    result = run([str(policy)], checkpoint_path, FakeCollection())
+
+    assert extracted == []
+    assert result['resumed_pages'] == 1
@@ -0,0 +1,32 @@
+"""A page that failed to extract is retried on the next incremental run."""
+
+import ingestion_manifest
+from ingestion_manifest import IngestionManifest
+
+PAGE_HASHES = {1: 'hash-1', 2: 'hash-2', 3: 'hash-3'}
+
+
+def test_failed_page_is_retried(tmp_path, monkeypatch):
+    pdf_path = tmp_path / 'plan.pdf'
+    pdf_path.write_bytes(b'%PDF-1.4 three pages')
+    monkeypatch.setattr(ingestion_manifest, 'hash_pdf_pages', lambda path: dict(PAGE_HASHES))
+    manifest = IngestionManifest(str(tmp_path / 'manifest.json'))
+
+    # First run: page 2 fails to extract, so it is stored without a hash
+    sha, page_hashes, changed, removed = manifest.diff_file(str(pdf_path))
+    assert changed == [1, 2, 3] and removed == []
+    chunk_ids = {1: ['plan.pdf_page1_chunk0'], 3: ['plan.pdf_page3_chunk0']}
+    page_hashes[2] = None
+    manifest.record_file(str(pdf_path), sha, page_hashes, chunk_ids)
+    manifest.save()
+
+    # Second run on the untouched file: only the failed page is re-extracted
+    manifest = IngestionManifest.load(manifest.path)
+    assert not manifest.is_unchanged(str(pdf_path))
+    sha, page_hashes, changed, removed = manifest.diff_file(str(pdf_path))
+    assert changed == [2] and removed == []
+
+    manifest.record_file(str(pdf_path), sha, page_hashes, {2: ['plan.pdf_page2_chunk0']})
+    assert manifest.is_unchanged(str(pdf_path))
+    assert manifest.page_chunk_ids('plan.pdf', 1) == ['plan.pdf_page1_chunk0']
+    assert manifest.all_chunk_ids() == ['plan.pdf_page1_chunk0', 'plan.pdf_page2_chunk0', 'plan.pdf_page3_chunk0']
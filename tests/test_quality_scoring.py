@@ -0,0 +1,87 @@
+"""The vectorized scores match the per-document functions of batch_improve_responses.py."""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_improve_responses import calculate_quality_score, get_improvement_priority, generate_single_suggestion
+from quality_scoring import SCORING_FIELDS, score_frame, suggestion_texts
+
+DOCS = 5000
+
+WORDS = ['deductible', 'Copay', 'specialist', 'covered', 'urgent', 'plan', 'the', 'is', 'my', 'what', 'how much']
+PHRASES = ["I don't have specific information", "i don't have", 'Please contact your insurance',
+           'CONTACT YOUR INSURANCE', 'Based on your plan documents,', '']
+
+
+def random_text(rng, max_words):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(0, max_words))]
+    if rng.random() < 0.4:
+        words.insert(rng.randint(0, len(words)), rng.choice(PHRASES))
+    return ' '.join(words)
+
+
+def random_docs(seed, timestamps):
+    """Documents with every field sometimes missing; `timestamps` picks one timestamp value."""
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(DOCS):
+        doc = {
+            'answer': random_text(rng, rng.choice([5, 40, 120])),
+            'question': random_text(rng, rng.choice([4, 30])),
+            'model': rng.choice(['nelly-1.0', 'gpt-4', 'gpt-4o-mini', '']),
+            'contexts_used': rng.choice([0, 1, 2, 3, 4, 5, 2.5]),
+            'response_time': rng.choice([0, 1, 800, 1999, 2000, 5000, 10000, 10001, 30000, 1500.5]),
+            'error': rng.choice(['', '', 'timeout', None, 0]),
+            'timestamp': timestamps(rng)
+        }
+        for field in list(doc):
+            if rng.random() < 0.05:
+                del doc[field]
+        docs.append(doc)
+    return docs
+
+
+NOW = datetime(2026, 3, 29, 12, 0)
+
+
+def aware(rng):
+    return datetime(2026, 3, 29, 12, 0, tzinfo=timezone.utc) - timedelta(hours=rng.uniform(-5, 400))
+
+
+def mixed(rng):
+    return rng.choice([
+        aware(rng),
+        NOW - timedelta(hours=rng.uniform(0, 400)),
+        aware(rng).astimezone(timezone(timedelta(hours=-7))),
+        '2026-03-28T10:00:00',
+        None
+    ])
+
+
+@pytest.mark.parametrize('timestamps', [aware, mixed])
+def test_scores_match_per_document_functions(timestamps):
+    docs = random_docs(len(timestamps.__name__), timestamps)
+    df = pd.DataFrame.from_records(docs, columns=SCORING_FIELDS)
+
+    expected_quality = [calculate_quality_score(doc) for doc in docs]
+    expected_priority = [get_improvement_priority(doc, q, NOW) for doc, q in zip(docs, expected_quality)]
+    scores = score_frame(df, now=NOW)
+
+    np.testing.assert_array_equal(scores['calculated_quality'].to_numpy(), np.array(expected_quality, dtype=float))
+    np.testing.assert_array_equal(scores['improvement_priority'].to_numpy(), np.array(expected_priority, dtype=float))
+
+
+def test_suggestions_match_per_document_function():
+    docs = random_docs(7, aware)
+    df = pd.DataFrame.from_records(docs, columns=SCORING_FIELDS)
+    # Qualities across every opening, including the boundaries
+    quality = pd.Series([random.Random(i).choice([1, 2.5, 3, 4.5, 5, 6, 7, 9.5]) for i in range(len(docs))])
+
+    expected = [generate_single_suggestion(doc.get('question', ''), doc.get('answer', ''), q)
+                for doc, q in zip(docs, quality)]
+
+    assert suggestion_texts(df, quality).tolist() == expected